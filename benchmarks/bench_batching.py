@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк пакетной отправки запросов к LLM на локальном фиктивном сервере
+
+Сервер имитирует модель на одном GPU: пачки обрабатываются по одной,
+время обработки пачки - фиксированная часть плюс небольшая добавка
+на каждый запрос. Бенчмарк отправляет волны одновременных запросов
+с разными окнами сбора и размерами пачек и печатает пропускную
+способность и перцентили задержки: пачки повышают пропускную способность,
+а окно сбора добавляется к задержке каждого запроса.
+
+Запуск: python -m benchmarks.bench_batching
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import metrics
+from src.llm import batching_backend, post_batch
+
+# Время обработки пачки: фиксированная часть и добавка на запрос (в секундах)
+BATCH_BASE_SECONDS = 0.04
+PER_REQUEST_SECONDS = 0.004
+
+# Количество запросов и средний интервал между ними (всплеск сообщений из Telegram)
+REQUESTS = 200
+MEAN_INTERVAL = 0.004
+
+# Варианты (окно сбора в секундах, максимальный размер пачки); (0, 1) - без пачек
+VARIANTS = [(0.0, 1), (0.002, 8), (0.005, 8), (0.01, 16), (0.02, 32)]
+
+
+class FakeBatchServer(BaseHTTPRequestHandler):
+    """Фиктивный сервер, принимающий пачки запросов"""
+
+    # Модель обрабатывает одну пачку за раз
+    model_lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        requests = body["requests"]
+        with self.model_lock:
+            time.sleep(BATCH_BASE_SECONDS + PER_REQUEST_SECONDS * len(requests))
+        data = json.dumps({"responses": [
+            {"content": "Ответ", "usage": {"completion_tokens": request["max_tokens"]}}
+            for request in requests
+        ]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+async def run(url: str, window: float, max_batch: int) -> None:
+    """Отправляет запросы со случайными интервалами через пакетный бэкенд"""
+    metrics.reset_metrics()
+    submit = post_batch(url)
+    if window > 0:
+        backend = batching_backend(window=window, max_batch=max_batch, submit_batch=submit)
+    else:
+        async def backend(request):
+            return (await submit([request]))[0]
+
+    generator = random.Random(42)
+    request = {"model": "local", "messages": [{"role": "user", "content": "Привет"}],
+               "temperature": 0.7, "max_tokens": 100}
+
+    async def timed_request(delay: float) -> None:
+        await asyncio.sleep(delay)
+        started = time.monotonic()
+        await backend(request)
+        metrics.observe("bench_request_seconds", time.monotonic() - started)
+
+    delays = []
+    moment = 0.0
+    for _ in range(REQUESTS):
+        moment += generator.expovariate(1 / MEAN_INTERVAL)
+        delays.append(moment)
+
+    started = time.monotonic()
+    await asyncio.gather(*(timed_request(delay) for delay in delays))
+    elapsed = time.monotonic() - started
+
+    summary = metrics.get_metrics()["summaries"]["bench_request_seconds"]
+    batch = metrics.get_metrics()["summaries"].get("llm_batch_size", {"avg": 1.0})
+    print(f"окно={window * 1000:>4.0f} мс  пачка<={max_batch:>2}: {REQUESTS / elapsed:6.1f} запросов/с  "
+          f"средняя пачка={batch['avg']:5.1f}  p50={summary['p50'] * 1000:6.0f} мс  "
+          f"p95={summary['p95'] * 1000:6.0f} мс")
+
+
+def main() -> None:
+    """Запускает фиктивный сервер и сравнивает варианты пакетной отправки"""
+    logging.disable(logging.CRITICAL)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBatchServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/batch"
+    try:
+        for window, max_batch in VARIANTS:
+            asyncio.run(run(url, window, max_batch))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк подготовки запроса к LLM при разной глубине истории
+
+Сравнивает процессорное время на один ход диалога: прежний способ
+(список сообщений собирается из истории заново, ключ запроса и тело
+запроса сериализуются целиком) и контекст чата (в JSON кодируется
+только новое сообщение, ключ и тело собираются из готовых байтов).
+
+Запуск: python -m benchmarks.bench_context
+"""
+import json
+import logging
+import time
+
+from src import memory
+from src.context import build_messages
+from src.llm import encode_request_body, make_request_key
+from src.styles import STYLE_NORMAL, load_style_prompt
+
+# Глубина истории (количество сообщений в запросе)
+DEPTHS = [10, 50, 200]
+
+# Количество измеряемых ходов диалога на каждую глубину
+TURNS = 2000
+
+# Параметры запроса
+MODEL = "qwen/qwen3-30b-a3b:free"
+TEMPERATURE = 0.7
+MAX_TOKENS = 1000
+
+# Реплики пользователя и ассистента типичной длины
+USER_TEXT = "Расскажите подробнее о разработке мобильного приложения для нашей компании? " * 2
+ASSISTANT_TEXT = (
+    "ООО \"ТехноСервис\" разрабатывает мобильные приложения для iOS и Android: "
+    "от прототипа и дизайна до публикации и поддержки.\n\n"
+) * 4
+
+
+def legacy_messages(chat_id: int, user_message: str, depth: int) -> list:
+    """Собирает сообщения прежним способом: системный промпт, история и новое сообщение"""
+    messages = [{"role": "system", "content": load_style_prompt(STYLE_NORMAL)}]
+    for message in memory.get_dialog_messages_for_llm(chat_id, depth):
+        if message["role"] in ["user", "assistant"]:
+            messages.append(message)
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+def prepare(chat_id: int, depth: int, incremental: bool) -> bytes:
+    """Выполняет один ход диалога: подготовку запроса и запись ответа в историю"""
+    memory.add_message(chat_id, "user", USER_TEXT)
+    if incremental:
+        messages = build_messages(chat_id, USER_TEXT, depth)
+    else:
+        messages = legacy_messages(chat_id, USER_TEXT, depth)
+    make_request_key(messages, MODEL, TEMPERATURE, MAX_TOKENS)
+    request = {"model": MODEL, "messages": messages, "temperature": TEMPERATURE, "max_tokens": MAX_TOKENS}
+    body = encode_request_body(request)
+    if body is None:
+        # Так клиент OpenAI сериализует тело запроса
+        body = json.dumps(request).encode("utf-8")
+    memory.add_message(chat_id, "assistant", ASSISTANT_TEXT)
+    return body
+
+
+def measure(chat_id: int, depth: int, incremental: bool) -> float:
+    """Возвращает процессорное время на один ход диалога в микросекундах"""
+    memory.clear_dialog_history(chat_id)
+    for i in range(depth):
+        memory.add_message(chat_id, "user" if i % 2 == 0 else "assistant", USER_TEXT if i % 2 == 0 else ASSISTANT_TEXT)
+    # Первый ход строит контекст из истории и не входит в измерение
+    prepare(chat_id, depth, incremental)
+
+    started = time.process_time()
+    for _ in range(TURNS):
+        prepare(chat_id, depth, incremental)
+    return (time.process_time() - started) / TURNS * 1e6
+
+
+def main() -> None:
+    """Сравнивает подготовку запроса прежним способом и через контекст чата"""
+    logging.disable(logging.CRITICAL)
+    for depth in DEPTHS:
+        legacy = measure(1, depth, incremental=False)
+        incremental = measure(2, depth, incremental=True)
+        print(f"история={depth:>3}: прежний способ {legacy:8.1f} мкс/запрос  "
+              f"контекст чата {incremental:8.1f} мкс/запрос  ускорение x{legacy / incremental:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк накладных расходов A/B-экспериментов на запрос
+
+Измеряет время, которое эксперименты добавляют к одному запросу к LLM:
+выбор вариантов (дважды - при сборке сообщений и в generate_response),
+учет запроса и учет сообщений пользователя и ассистента. Также выводит
+размер скетча времени ответа после большого количества запросов.
+
+Запуск: python -m benchmarks.bench_experiments
+"""
+import json
+import logging
+import random
+import time
+
+from src import experiments
+from src.experiments import get_overrides, init_experiments, on_message_added, record_request
+
+# Количество запросов и разных чатов
+REQUESTS = 100000
+CHATS = 10000
+
+
+def one_request(chat_id: int, latency: float) -> None:
+    """Вызовы модуля экспериментов на пути одного запроса"""
+    get_overrides(chat_id)
+    on_message_added(chat_id, "user", "")
+    get_overrides(chat_id)
+    record_request(chat_id, latency, {"prompt_tokens": 900, "completion_tokens": 150})
+    on_message_added(chat_id, "assistant", "")
+
+
+def measure(latencies: list) -> float:
+    """Возвращает время на запрос в микросекундах"""
+    started = time.perf_counter()
+    for i in range(REQUESTS):
+        one_request(i % CHATS, latencies[i])
+    return (time.perf_counter() - started) / REQUESTS * 1e6
+
+
+def main() -> None:
+    """Сравнивает накладные расходы без экспериментов и с двумя экспериментами"""
+    logging.disable(logging.CRITICAL)
+    random.seed(0)
+    latencies = [random.lognormvariate(1.0, 0.6) for _ in range(REQUESTS)]
+
+    idle = measure(latencies)
+    init_experiments({
+        "model": {"variants": [{"name": "control"}, {"name": "small", "model": "qwen/qwen3-8b:free"}]},
+        "answer_length": {"variants": [{"name": "control", "weight": 2}, {"name": "short", "max_tokens": 300}]}
+    })
+    active = measure(latencies)
+
+    sketch = experiments.variant_stats[("model", "control")]["latency"]
+    size = len(json.dumps(sketch.to_dict()))
+    print(f"без экспериментов {idle:6.2f} мкс/запрос  два эксперимента {active:6.2f} мкс/запрос")
+    print(f"скетч времени ответа: {sketch.count} значений, {len(sketch.bins)} корзин, {size} байт JSON, "
+          f"p50 {sketch.quantile(0.5):.2f} с, p99 {sketch.quantile(0.99):.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк подготовки ответа в обработчике сообщений
+
+Сравнивает прежний путь (сборка словаря меток и импорт стилей внутри
+обработчика, чтение промпта с диска) с таблицами реестра стилей.
+
+Запуск: python -m benchmarks.bench_handlers
+"""
+import asyncio
+import logging
+import os
+import timeit
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src import styles
+from src.styles import STYLE_BADGES, STYLE_CAT, load_style_prompt
+
+ITERATIONS = 20000
+
+
+def old_badge_lookup(style: str) -> str:
+    """Прежний путь: импорт внутри функции и сборка словаря на каждый вызов"""
+    from src.styles import STYLE_NORMAL, STYLE_CAT, STYLE_VILLAIN, STYLE_DRAMATIC
+    style_badges = {
+        STYLE_NORMAL: "🔹 <b>Обычный режим</b>",
+        STYLE_CAT: "🐱 <b>Кошачий режим</b>",
+        STYLE_VILLAIN: "😈 <b>Злодейский режим</b>",
+        STYLE_DRAMATIC: "🎭 <b>Драматический режим</b>"
+    }
+    return style_badges.get(style, style_badges[STYLE_NORMAL])
+
+
+def new_badge_lookup(style: str) -> str:
+    """Новый путь: поиск в готовой таблице"""
+    return STYLE_BADGES[style]
+
+
+def old_prompt_load(style: str) -> str:
+    """Прежний путь: чтение промпта с диска на каждое сообщение"""
+    prompt_path = os.path.join(styles.PROMPTS_DIR, f"{style}_mode.txt")
+    with open(prompt_path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def report(name: str, old_seconds: float, new_seconds: float, iterations: int) -> None:
+    """Печатает результат сравнения"""
+    old_us = old_seconds / iterations * 1e6
+    new_us = new_seconds / iterations * 1e6
+    print(f"{name:<28} было {old_us:9.2f} мкс   стало {new_us:9.2f} мкс   ускорение x{old_us / new_us:.1f}")
+
+
+async def bench_process_user_text(iterations: int) -> float:
+    """Время обработки сообщения без учета LLM и отправки"""
+    from src.bot import process_user_text
+    
+    message = AsyncMock()
+    message.from_user = MagicMock()
+    message.from_user.id = 1
+    message.chat = MagicMock()
+    message.chat.id = 1
+    
+    with patch("src.bot.generate_response", AsyncMock(return_value="Ответ")), \
+         patch("src.bot.send_answer", AsyncMock()), \
+         patch("src.bot.keep_typing", MagicMock()), \
+         patch("src.bot.add_message"):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(iterations):
+            await process_user_text(message, "Расскажи что-нибудь")
+        return loop.time() - started
+
+
+def main() -> None:
+    """Запускает бенчмарки"""
+    logging.disable(logging.CRITICAL)
+    
+    old = timeit.timeit(lambda: old_badge_lookup(STYLE_CAT), number=ITERATIONS)
+    new = timeit.timeit(lambda: new_badge_lookup(STYLE_CAT), number=ITERATIONS)
+    report("Метка стиля", old, new, ITERATIONS)
+    
+    load_style_prompt(STYLE_CAT)
+    old = timeit.timeit(lambda: old_prompt_load(STYLE_CAT), number=ITERATIONS)
+    new = timeit.timeit(lambda: load_style_prompt(STYLE_CAT), number=ITERATIONS)
+    report("Промпт стиля", old, new, ITERATIONS)
+    
+    handler_iterations = ITERATIONS // 10
+    elapsed = asyncio.run(bench_process_user_text(handler_iterations))
+    print(f"{'process_user_text без LLM':<28} {elapsed / handler_iterations * 1e6:9.2f} мкс на сообщение")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк задержки команд при заполненной полосе LLM
+
+Через диспетчер бота проходит поток обычных сообщений, ответ на каждое
+из которых ждет медленную LLM, и вперемешку с ними - команды выбора
+стиля. Полоса llm заполнена, а команды выполняются в полосе fast.
+Бенчмарк печатает перцентили задержки по полосам из метрик.
+
+Запуск: python -m benchmarks.bench_lanes
+"""
+import asyncio
+import datetime
+import logging
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from aiogram import types
+
+from src import bot as telegram_bot
+from src import metrics
+from src.lanes import LANE_FAST, LANE_LLM, init_lanes
+
+# Количество сообщений для LLM и команд
+LLM_MESSAGES = 200
+COMMANDS = 200
+
+# Время ответа LLM (в секундах)
+LLM_LATENCY = 0.2
+
+# Лимит полосы llm (меньше количества сообщений, чтобы полоса была заполнена)
+LLM_LIMIT = 8
+
+
+def make_update(update_id: int, text: str) -> types.Update:
+    """Создает обновление с текстовым сообщением"""
+    return types.Update(
+        update_id=update_id,
+        message=types.Message(
+            message_id=update_id,
+            date=datetime.datetime.now(),
+            chat=types.Chat(id=update_id, type="private"),
+            from_user=types.User(id=update_id, is_bot=False, first_name="Тест"),
+            text=text
+        )
+    )
+
+
+async def slow_llm(*args, **kwargs) -> str:
+    """Имитирует долгий ответ LLM"""
+    await asyncio.sleep(LLM_LATENCY)
+    return "Ответ"
+
+
+async def run() -> None:
+    """Отправляет вперемешку сообщения для LLM и команды через диспетчер"""
+    metrics.reset_metrics()
+    init_lanes({LANE_LLM: {"limit": LLM_LIMIT}})
+    await telegram_bot.init_bot("42:TEST")
+
+    updates = []
+    for i in range(LLM_MESSAGES + COMMANDS):
+        text = "/cat" if i % 2 else "Расскажите о компании"
+        updates.append(make_update(i + 1, text))
+
+    with patch("src.coalescer.coalesce_window", 0.0), \
+         patch("src.bot.generate_response", slow_llm), \
+         patch("src.bot.send_answer", AsyncMock()), \
+         patch("src.bot.send_typing", AsyncMock()), \
+         patch("src.bot.keep_typing", MagicMock()):
+        tasks = []
+        for update in updates:
+            tasks.append(asyncio.create_task(telegram_bot.dp.feed_update(telegram_bot.bot, update)))
+            await asyncio.sleep(0.001)
+        await asyncio.gather(*tasks)
+    await telegram_bot.bot.session.close()
+
+    summaries = metrics.get_metrics()["summaries"]
+    for lane in (LANE_FAST, LANE_LLM):
+        latency = summaries[metrics.metric_key("lane_latency_seconds", lane=lane)]
+        wait = summaries[metrics.metric_key("lane_wait_seconds", lane=lane)]
+        print(f"полоса {lane:<5}: ожидание p95={wait['p95'] * 1000:8.3f} мс  "
+              f"задержка p50={latency['p50'] * 1000:8.3f} мс  p95={latency['p95'] * 1000:8.3f} мс")
+
+
+def main() -> None:
+    """Запускает бенчмарк"""
+    logging.disable(logging.CRITICAL)
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк пропускной способности локальной модели на CPU
+
+Запускает пул процессов с разным количеством процессов и отправляет
+одновременные запросы через очередь с пачками. Печатает запросы в секунду,
+токены в секунду и перцентили задержки. Без пути к модели используется
+синтетическая нагрузка на CPU с фиксированным объемом вычислений на токен.
+
+Запуск: python -m benchmarks.bench_local_llm [путь_к_модели.gguf] [потоков_на_процесс]
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from src import metrics
+from src.local_llm import SYNTHETIC_MODEL, local_completion, start_local_llm, stop_local_llm
+
+# Количество запросов и токенов в ответе
+REQUESTS = 64
+MAX_TOKENS = 64
+
+PROMPT = [
+    {"role": "system", "content": "Ты ассистент компании ООО \"ТехноСервис\". Отвечай кратко."},
+    {"role": "user", "content": "Сколько стоит разработка мобильного приложения?"}
+]
+
+
+async def run(model_path: str, workers: int, threads: int) -> None:
+    """Отправляет одновременные запросы в пул из workers процессов"""
+    metrics.reset_metrics()
+    await start_local_llm({
+        "model_path": model_path,
+        "workers": workers,
+        "threads": threads,
+        "queue_size": REQUESTS
+    })
+    request = {"model": "local", "messages": PROMPT, "temperature": 0.7, "max_tokens": MAX_TOKENS}
+
+    async def timed_request() -> None:
+        started = time.monotonic()
+        await local_completion(request)
+        metrics.observe("bench_request_seconds", time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(timed_request() for _ in range(REQUESTS)))
+    elapsed = time.monotonic() - started
+    await stop_local_llm()
+
+    tokens = metrics.get_counter("local_llm_tokens_total")
+    summary = metrics.get_metrics()["summaries"]["bench_request_seconds"]
+    print(f"процессов={workers}: {REQUESTS / elapsed:.1f} запросов/с  {tokens / elapsed:.0f} токенов/с  "
+          f"p50={summary['p50']:.2f} с  p95={summary['p95']:.2f} с")
+
+
+def main() -> None:
+    """Запускает бенчмарк для 1, 2, 4, ... процессов до числа ядер"""
+    logging.disable(logging.CRITICAL)
+    model_path = sys.argv[1] if len(sys.argv) > 1 else SYNTHETIC_MODEL
+    cpus = os.cpu_count() or 1
+    workers = 1
+    while workers <= cpus:
+        # Потоки делятся между процессами, чтобы не перегружать ядра
+        threads = int(sys.argv[2]) if len(sys.argv) > 2 else max(1, cpus // workers)
+        asyncio.run(run(model_path, workers, threads))
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк сценариев бота без сети на кассете LLM
+
+Запускает сценарии приветствия, вопросов об услугах и обычного диалога
+на бэкенде replay (если передан путь к кассете) или synthetic и печатает
+пропускную способность и перцентили времени обработки.
+
+Запуск: python -m benchmarks.bench_scenarios [путь_к_кассете] [масштаб_задержки]
+"""
+import asyncio
+import logging
+import sys
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+from src import llm, metrics
+from src.sender import start_sender
+from src.cassette import replay_backend, synthetic_backend
+
+# Количество одновременных пользователей и сообщений на пользователя
+USERS = 50
+MESSAGES_PER_USER = 4
+
+USER_MESSAGES = [
+    "Здравствуйте, расскажите о компании",
+    "Сколько стоит разработка мобильного приложения?",
+    "А сроки какие?",
+    "Нужна интеграция с CRM",
+]
+
+
+def make_message(chat_id: int, text: str) -> AsyncMock:
+    """Создает мок сообщения Telegram"""
+    message = AsyncMock()
+    message.from_user = MagicMock()
+    message.from_user.id = chat_id
+    message.from_user.first_name = f"Пользователь {chat_id}"
+    message.chat = MagicMock()
+    message.chat.id = chat_id
+    message.text = text
+    return message
+
+
+async def run_user(chat_id: int) -> None:
+    """Имитирует диалог одного пользователя"""
+    from src.bot import cmd_start, process_user_text
+    
+    started = time.monotonic()
+    await cmd_start(make_message(chat_id, "/start"))
+    metrics.observe("bench_handler_seconds", time.monotonic() - started, scenario="start")
+    
+    for text in USER_MESSAGES[:MESSAGES_PER_USER]:
+        started = time.monotonic()
+        await process_user_text(make_message(chat_id, text), text)
+        metrics.observe("bench_handler_seconds", time.monotonic() - started, scenario="message")
+
+
+async def run(backend) -> None:
+    """Запускает всех пользователей одновременно"""
+    from src import bot
+    
+    bot.bot = AsyncMock()
+    llm.set_backend(backend)
+    # Как в рабочем режиме: обработчик только ставит ответ в очередь,
+    # ограничения Telegram на отправку не входят во время обработки
+    start_sender()
+    started = time.monotonic()
+    await asyncio.gather(*(run_user(chat_id) for chat_id in range(1, USERS + 1)))
+    elapsed = time.monotonic() - started
+    
+    handled = USERS * (MESSAGES_PER_USER + 1)
+    print(f"Обработано {handled} сообщений за {elapsed:.2f} с ({handled / elapsed:.1f} сообщений/с)")
+    print(f"Запросов к LLM: {metrics.get_counter('llm_requests_total'):.0f}")
+    for key, summary in metrics.get_metrics()["summaries"].items():
+        if key.startswith("bench_handler_seconds"):
+            print(f"{key}: p50={summary['p50'] * 1000:.1f} мс  p95={summary['p95'] * 1000:.1f} мс  "
+                  f"max={summary['max'] * 1000:.1f} мс")
+
+
+def main() -> None:
+    """Выбирает бэкенд по аргументам и запускает бенчмарк"""
+    logging.disable(logging.CRITICAL)
+    latency_scale = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    if len(sys.argv) > 1:
+        backend = replay_backend(sys.argv[1], latency_scale=latency_scale)
+    else:
+        backend = synthetic_backend(latency_scale=latency_scale, seed=42)
+    asyncio.run(run(backend))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк памяти: N брендов в одном процессе против N отдельных процессов
+
+Каждый процесс-исполнитель загружает бота, добавляет арендаторов
+(с общей сессией aiogram) и заполняет историю диалогов CHATS чатов
+каждого арендатора. Сравнивается пиковая память (maxrss) одного
+процесса с N арендаторами и сумма пиковой памяти N процессов
+с одним ботом (как при запуске N контейнеров), а также количество
+пулов соединений Telegram.
+
+Запуск: python -m benchmarks.bench_tenants
+"""
+import asyncio
+import logging
+import resource
+import subprocess
+import sys
+
+# Количество брендов
+TENANTS = (1, 4, 8)
+
+# Чатов с историей на бренд и сообщений в истории чата
+CHATS = 200
+MESSAGES = 10
+
+
+async def worker(tenant_count: int) -> None:
+    """Запускает арендаторов в текущем процессе и печатает maxrss (КБ) и количество сессий"""
+    from src import bot as telegram_bot
+    from src.memory import add_message
+    from src.tenants import current_tenant, tenant_key
+
+    await telegram_bot.init_bot("100:TEST")
+    names = [f"brand{i}" for i in range(1, tenant_count)]
+    for i, name in enumerate(names, start=1):
+        await telegram_bot.add_tenant_bot(name, f"{100 + i}:TEST", session=telegram_bot.bot.session)
+
+    for tenant in ["default"] + names:
+        token = current_tenant.set(tenant)
+        for chat_id in range(CHATS):
+            for i in range(MESSAGES):
+                add_message(tenant_key(chat_id), "user" if i % 2 == 0 else "assistant", f"Сообщение {i} " * 10)
+        current_tenant.reset(token)
+
+    bots = [telegram_bot.bot] + list(telegram_bot.tenant_bots.values())
+    sessions = len({id(item.session) for item in bots})
+    await telegram_bot.bot.session.close()
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, sessions)
+
+
+def run_worker(tenant_count: int) -> tuple:
+    """Запускает процесс-исполнитель и возвращает (maxrss в КБ, сессий)"""
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_tenants", "--worker", str(tenant_count)],
+        check=True, capture_output=True, text=True
+    ).stdout.split()
+    return int(output[-2]), int(output[-1])
+
+
+def main() -> None:
+    """Запускает бенчмарк"""
+    logging.disable(logging.CRITICAL)
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        asyncio.run(worker(int(sys.argv[2])))
+        return
+
+    single_rss, _ = run_worker(1)
+    for count in TENANTS:
+        shared_rss, shared_sessions = run_worker(count)
+        separate_rss = single_rss * count
+        print(f"брендов {count}: один процесс {shared_rss / 1024:7.1f} МБ (пулов соединений: {shared_sessions})  "
+              f"отдельные процессы {separate_rss / 1024:7.1f} МБ (пулов соединений: {count})  "
+              f"экономия {1 - shared_rss / separate_rss:6.1%}")
+
+
+if __name__ == "__main__":
+    main()
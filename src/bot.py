@@ -3,44 +3,116 @@
 """
 Функции для работы с Telegram API
 """
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import logging
 from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
+from aiogram.utils.markdown import hlink
 
-from src.llm import generate_response
-from src.prompts import create_messages_for_llm
+from src.llm import generate_response, OVERLOADED_RESPONSE
+from src.prompts import create_messages_for_llm, SCENARIO_CHAT
 from src.memory import add_message, clear_dialog_history
-from src.scenarios import handle_start_command, handle_service_inquiry, detect_service_type
-from src.styles import STYLE_NORMAL, STYLE_CAT, STYLE_VILLAIN, STYLE_DRAMATIC, set_user_style, reset_user_style
+from src.scenarios import (
+    handle_start_command, handle_service_inquiry, detect_service_type, add_clickable_links, send_overloaded_reply
+)
+from src.coalescer import coalesce_message, is_chat_busy
+from src.chat_action import send_typing, keep_typing
+from src.sender import send_answer
+from src.lanes import LANE_FAST, LANE_LLM, LaneMiddleware
+from src.flood import FloodMiddleware
+from src import tracing
+from src.tracing import TracingMiddleware
+from src.tenants import DEFAULT_TENANT, TenantMiddleware, current_tenant, register_tenant, tenant_key
+from src.styles import (
+    STYLE_NORMAL, STYLE_BADGES, STYLE_COMMANDS, STYLE_COMMAND_REPLIES, STYLE_HELP_TEXT,
+    get_user_style, set_user_style
+)
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Логгер модуля (логирование настраивается в main.py)
 logger = logging.getLogger(__name__)
 
 # Инициализация бота и диспетчера
 bot = None
 dp = None
 
-async def init_bot(token: str) -> None:
+# Боты арендаторов, которых обслуживает тот же диспетчер: {имя арендатора: бот}
+tenant_bots: Dict[str, Bot] = {}
+
+async def init_bot(token: str, session: Optional[Any] = None) -> None:
     """
     Инициализирует бота с указанным токеном
+    
+    Args:
+        token: Токен Telegram бота
+        session: Сессия aiogram с настроенным пулом соединений (опционально)
     """
     global bot, dp
-    bot = Bot(token=token)
+    if session is not None:
+        bot = Bot(token=token, session=session)
+    else:
+        bot = Bot(token=token)
     dp = Dispatcher()
     
+    # Арендатор определяется по боту до остальных промежуточных обработчиков
+    dp.update.outer_middleware(TenantMiddleware())
+    
+    # Трасса начинается до остальных промежуточных обработчиков,
+    # поэтому в нее попадает вся обработка сообщения
+    dp.message.outer_middleware(TracingMiddleware())
+    
+    # Поток сообщений от одного пользователя или чата отклоняется
+    # до фильтров и обработчиков
+    dp.message.outer_middleware(FloodMiddleware())
+    
+    # Обработчики с флагом lane выполняются в своей полосе: команды,
+    # работающие с памятью, не ждут за обработчиками, ожидающими LLM
+    dp.message.middleware(LaneMiddleware())
+    
     # Регистрация обработчиков
-    dp.message.register(cmd_start, Command("start"))
-    dp.message.register(cmd_style, Command("style"))
-    dp.message.register(cmd_normal, Command("normal"))
-    dp.message.register(cmd_cat, Command("cat"))
-    dp.message.register(cmd_villain, Command("villain"))
-    dp.message.register(cmd_dramatic, Command("dramatic"))
+    dp.message.register(cmd_start, Command("start"), flags={"lane": LANE_LLM})
+    dp.message.register(cmd_style, Command("style"), flags={"lane": LANE_FAST})
+    dp.message.register(cmd_set_style, Command(*STYLE_COMMANDS), flags={"lane": LANE_FAST})
     dp.message.register(echo)
     
     logger.info("Бот инициализирован")
 
+async def add_tenant_bot(
+    name: str,
+    token: str,
+    session: Optional[Any] = None,
+    prompts_dir: Optional[str] = None,
+    links: Optional[Dict[str, str]] = None
+) -> Bot:
+    """
+    Добавляет бота арендатора к диспетчеру основного бота
+    
+    Args:
+        name: Имя арендатора
+        token: Токен Telegram бота арендатора
+        session: Сессия aiogram (общая с основным ботом, чтобы разделять пул соединений)
+        prompts_dir: Директория промптов арендатора
+        links: Таблица ссылок арендатора для add_clickable_links
+        
+    Returns:
+        Бот арендатора
+    """
+    if dp is None:
+        raise RuntimeError("Бот не инициализирован. Вызовите init_bot() сначала.")
+    tenant_bot = Bot(token=token, session=session) if session is not None else Bot(token=token)
+    register_tenant(name, tenant_bot.id, prompts_dir, links)
+    tenant_bots[name] = tenant_bot
+    return tenant_bot
+
+def get_bot() -> Bot:
+    """
+    Возвращает бота текущего арендатора
+    
+    Returns:
+        Бот, получивший обрабатываемое обновление
+    """
+    tenant = current_tenant.get()
+    return bot if tenant == DEFAULT_TENANT else tenant_bots[tenant]
+
 async def cmd_start(message: types.Message) -> None:
     """
     Обработчик команды /start
@@ -49,28 +121,15 @@ async def cmd_start(message: types.Message) -> None:
     chat_id = message.chat.id
     logger.info(f"Пользователь {user_id} запустил бота")
     
-    # Импортируем стили
-    from src.styles import get_user_style, user_styles
-    
     # Определяем случайный стиль для первого сообщения
-    current_style = get_user_style(chat_id, message.text)
-    
-    # Сохраняем стиль для дальнейшего использования
-    user_styles[chat_id] = current_style
-    
-    # Цветные метки для разных стилей
-    style_badges = {
-        STYLE_NORMAL: "🔹 <b>Обычный режим</b>",
-        STYLE_CAT: "🐱 <b>Кошачий режим</b>",
-        STYLE_VILLAIN: "😈 <b>Злодейский режим</b>",
-        STYLE_DRAMATIC: "🎭 <b>Драматический режим</b>"
-    }
+    # (get_user_style сохраняет его для дальнейшего использования)
+    current_style = get_user_style(tenant_key(chat_id), message.text)
     
     # Получаем метку для выбранного стиля
-    style_badge = style_badges.get(current_style, style_badges[STYLE_CAT])
+    style_badge = STYLE_BADGES[current_style]
     
     # Используем сценарий приветствия
-    await handle_start_command(message, style_badge=style_badge)
+    await handle_start_command(message, style_badge=style_badge, style=current_style)
 
 async def echo(message: types.Message) -> None:
     """
@@ -78,73 +137,90 @@ async def echo(message: types.Message) -> None:
     """
     user_id = message.from_user.id
     chat_id = message.chat.id
+    chat_key = tenant_key(chat_id)
     user_text = message.text
     
     logger.info(f"Пользователь {user_id} отправил сообщение: {user_text}")
     
-    # Отправляем индикатор набора текста
-    await bot.send_chat_action(chat_id=chat_id, action="typing")
+    # Отправляем индикатор набора текста только для первого сообщения серии,
+    # для следующих он уже отображается
+    if not is_chat_busy(chat_key):
+        await send_typing(get_bot(), chat_id)
     
-    # Определяем, интересуется ли пользователь конкретной услугой
-    service_type = detect_service_type(user_text)
+    # Серия быстрых сообщений объединяется в один запрос к LLM,
+    # который выполняется в полосе llm
+    await coalesce_message(chat_key, user_text, lambda text: process_user_text(message, text), lane=LANE_LLM)
+
+async def process_user_text(message: types.Message, user_text: str) -> None:
+    """
+    Формирует и отправляет ответ на (возможно, объединенный) текст пользователя
     
-    # Импортируем стили
-    from src.styles import user_styles, STYLE_NORMAL, STYLE_CAT, STYLE_VILLAIN, STYLE_DRAMATIC
+    Args:
+        message: Последнее сообщение пользователя в серии
+        user_text: Текст для обработки
+    """
+    user_id = message.from_user.id
+    chat_id = message.chat.id
+    # Состояние чата хранится отдельно для каждого арендатора
+    chat_key = tenant_key(chat_id)
+    
+    # Определяем, интересуется ли пользователь конкретной услугой
+    with tracing.span("detect_service_type"):
+        service_type = detect_service_type(user_text)
     
     # Определяем стиль для текущего сообщения
     # Важно: вызываем get_user_style перед созданием сообщений для LLM,
     # чтобы badge соответствовал стилю, который будет использован для ответа
-    from src.styles import get_user_style
-    current_style = get_user_style(chat_id, user_text)
-    user_styles[chat_id] = current_style
-    
-    # Цветные метки для разных стилей
-    style_badges = {
-        STYLE_NORMAL: "🔹 <b>Обычный режим</b>",
-        STYLE_CAT: "🐱 <b>Кошачий режим</b>",
-        STYLE_VILLAIN: "😈 <b>Злодейский режим</b>",
-        STYLE_DRAMATIC: "🎭 <b>Драматический режим</b>"
-    }
+    with tracing.span("get_user_style"):
+        current_style = get_user_style(chat_key, user_text)
+        tracing.set_attributes(style=current_style)
+    style_badge = STYLE_BADGES[current_style]
     
     if service_type:
         # Если определили тип услуги, используем специальный сценарий
         logger.info(f"Определен тип услуги: {service_type}")
-        await handle_service_inquiry(message, service_type, style_badge=style_badges[current_style])
+        await handle_service_inquiry(message, service_type, style_badge=style_badge, user_text=user_text)
     else:
         # Если тип услуги не определен, обрабатываем как обычный запрос
         # Сохраняем сообщение пользователя в историю
-        add_message(chat_id, "user", user_text)
+        add_message(chat_key, "user", user_text)
         
         # Создаем сообщения для LLM с учетом истории диалога
-        messages = create_messages_for_llm(user_text, chat_id)
+        with tracing.span("create_messages_for_llm"):
+            messages = create_messages_for_llm(user_text, chat_key)
+            tracing.set_attributes(history_size=len(messages))
         
-        # Получаем ответ от LLM
-        response = await generate_response(messages)
+        # Получаем ответ от LLM, поддерживая индикатор набора текста
+        with tracing.span("generate_response", style=current_style):
+            async with keep_typing(get_bot(), chat_id):
+                response = await generate_response(messages, style=current_style, scenario=SCENARIO_CHAT, chat_id=chat_key)
         
-        if response:
+        if response == OVERLOADED_RESPONSE:
+            # Запрос не отправлен из-за перегрузки: сообщаем об этом, а не об ошибке
+            await send_overloaded_reply(message, chat_key, STYLE_BADGES[STYLE_NORMAL])
+        elif response:
             # Добавляем кликабельные ссылки в ответ
-            from src.scenarios import add_clickable_links
-            formatted_response = add_clickable_links(response)
+            with tracing.span("add_clickable_links"):
+                formatted_response = add_clickable_links(response)
             
             # Добавляем метку стиля в начало сообщения
-            style_badge = style_badges.get(current_style, style_badges[STYLE_NORMAL])
             formatted_response_with_badge = f"{style_badge}\n\n{formatted_response}"
             
             # Отправляем ответ пользователю с поддержкой HTML-форматирования
-            await message.answer(formatted_response_with_badge, parse_mode="HTML")
+            with tracing.span("send_answer", chars=len(formatted_response_with_badge)):
+                await send_answer(message, formatted_response_with_badge, parse_mode="HTML")
             logger.info(f"Отправлен ответ LLM пользователю {user_id} в стиле {current_style}")
             
             # Сохраняем оригинальный ответ ассистента в историю
-            add_message(chat_id, "assistant", response)
+            add_message(chat_key, "assistant", response)
         else:
             # В случае ошибки отправляем стандартный ответ с кликабельной ссылкой
-            from aiogram.utils.markdown import hlink
             contact_link = hlink("обратитесь к менеджеру", "https://t.me/manager_technoservice")
-            error_message = f"{style_badges[STYLE_NORMAL]}\n\nИзвините, произошла ошибка. Попробуйте позже или {contact_link}."
-            await message.answer(error_message, parse_mode="HTML")
+            error_message = f"{STYLE_BADGES[STYLE_NORMAL]}\n\nИзвините, произошла ошибка. Попробуйте позже или {contact_link}."
+            await send_answer(message, error_message, parse_mode="HTML")
             
             # Сохраняем стандартный ответ в историю (без HTML-тегов)
-            add_message(chat_id, "assistant", "Извините, произошла ошибка. Попробуйте позже или обратитесь к менеджеру.")
+            add_message(chat_key, "assistant", "Извините, произошла ошибка. Попробуйте позже или обратитесь к менеджеру.")
             
             logger.error(f"Ошибка при получении ответа от LLM для пользователя {user_id}")
 
@@ -155,62 +231,23 @@ async def cmd_style(message: types.Message) -> None:
     user_id = message.from_user.id
     logger.info(f"Пользователь {user_id} запросил информацию о стилях")
     
-    # Формируем сообщение с информацией о стилях
-    style_info = (
-        "Доступные стили общения:\n\n"
-        "🔹 /normal - Обычный режим\n"
-        "🐱 /cat - Переводчик с технического на кошачий\n"
-        "😈 /villain - Переводчик на язык суперзлодеев\n"
-        "🎭 /dramatic - Драматический технический писатель\n\n"
-        "Вы также можете просто упомянуть стиль в своём сообщении, "
-        "и бот автоматически переключится на него. Например: \"Расскажи о базах данных как кот\""
-    )
-    
-    await message.answer(style_info)
-
-async def cmd_normal(message: types.Message) -> None:
-    """
-    Обработчик команды /normal - устанавливает обычный стиль
-    """
-    user_id = message.from_user.id
-    chat_id = message.chat.id
-    logger.info(f"Пользователь {user_id} выбрал обычный стиль")
-    
-    set_user_style(chat_id, STYLE_NORMAL)
-    await message.answer("Выбран обычный стиль общения.")
+    await send_answer(message, STYLE_HELP_TEXT)
 
-async def cmd_cat(message: types.Message) -> None:
+async def cmd_set_style(message: types.Message, command: CommandObject) -> None:
     """
-    Обработчик команды /cat - устанавливает кошачий стиль
-    """
-    user_id = message.from_user.id
-    chat_id = message.chat.id
-    logger.info(f"Пользователь {user_id} выбрал кошачий стиль")
+    Обработчик команд выбора стиля (/normal, /cat, /villain, /dramatic)
     
-    set_user_style(chat_id, STYLE_CAT)
-    await message.answer("Мяу! Выбран кошачий стиль общения. Мррр... 🐱")
-
-async def cmd_villain(message: types.Message) -> None:
-    """
-    Обработчик команды /villain - устанавливает стиль суперзлодея
-    """
-    user_id = message.from_user.id
-    chat_id = message.chat.id
-    logger.info(f"Пользователь {user_id} выбрал стиль суперзлодея")
-    
-    set_user_style(chat_id, STYLE_VILLAIN)
-    await message.answer("МУАХАХА! Выбран ЗЛОДЕЙСКИЙ стиль общения! Теперь вы в моей ВЛАСТИ! 😈")
-
-async def cmd_dramatic(message: types.Message) -> None:
-    """
-    Обработчик команды /dramatic - устанавливает драматический стиль
+    Args:
+        message: Сообщение пользователя с командой
+        command: Разобранная команда
     """
     user_id = message.from_user.id
     chat_id = message.chat.id
-    logger.info(f"Пользователь {user_id} выбрал драматический стиль")
+    style = STYLE_COMMANDS[command.command]
+    logger.info(f"Пользователь {user_id} выбрал стиль {style}")
     
-    set_user_style(chat_id, STYLE_DRAMATIC)
-    await message.answer("О, благородный собеседник! Вы избрали ЭПИЧЕСКИЙ и ДРАМАТИЧЕСКИЙ стиль общения! Да начнется наша ВЕЛИЧЕСТВЕННАЯ беседа! 🎭")
+    set_user_style(tenant_key(chat_id), style)
+    await send_answer(message, STYLE_COMMAND_REPLIES[style])
 
 async def start_polling() -> None:
     """
@@ -219,5 +256,6 @@ async def start_polling() -> None:
     if bot is None or dp is None:
         raise RuntimeError("Бот не инициализирован. Вызовите init_bot() сначала.")
     
-    logger.info("Запуск бота в режиме polling")
-    await dp.start_polling(bot)
\ No newline at end of file
+    logger.info(f"Запуск бота в режиме polling (арендаторов: {1 + len(tenant_bots)})")
+    # Один диспетчер опрашивает ботов всех арендаторов в одном цикле событий
+    await dp.start_polling(bot, *tenant_bots.values())
\ No newline at end of file
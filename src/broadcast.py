@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для рассылки объявлений всем чатам, которые общались с ботом
+
+Получатели - чаты из истории диалогов и сохраненных стилей основного
+бота (memory.dialogs, styles.user_styles). Сообщения отправляются
+несколькими параллельными отправителями с учетом лимитов:
+- собственная корзина рассылки (rate сообщений в секунду, чуть ниже
+  глобального лимита Telegram, чтобы оставалось место ответам);
+- общая с очередью ответов глобальная корзина sender.global_bucket;
+- корзина чата sender.get_chat_bucket.
+Ответ Telegram RetryAfter приостанавливает всю рассылку на указанное
+время, после чего отправка в тот же чат повторяется.
+
+Текст может зависеть от стиля чата (variants) и начинаться с метки стиля.
+Прогресс периодически сохраняется в файл: после перезапуска рассылка
+продолжается с первого необработанного получателя. Остановка через
+stop_broadcast дожидается текущих отправок, поэтому при продолжении
+сообщения не повторяются; при аварийном завершении процесса повторно
+могут получить сообщение не больше workers чатов.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+
+from src import memory, metrics, sender
+from src.rate_limit import acquire, create_bucket
+from src.styles import STYLE_BADGES, STYLE_NORMAL, user_styles
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Количество ошибок отправки, которые сохраняются в состоянии рассылки
+MAX_SAVED_ERRORS = 100
+
+# Параметры рассылки
+broadcast_config: Dict[str, float] = {
+    # Скорость рассылки (сообщений в секунду)
+    "rate": 25.0,
+    # Количество параллельных отправителей
+    "workers": 16,
+    # Количество попыток отправки в один чат
+    "max_attempts": 5,
+    # Пауза перед повтором после сетевой ошибки (в секундах)
+    "network_retry_delay": 1.0,
+    # Интервал сохранения прогресса (в секундах)
+    "checkpoint_interval": 2.0,
+    # Интервал записи прогресса в лог (в секундах)
+    "progress_interval": 10.0
+}
+
+# Бот, от имени которого отправляется рассылка
+broadcast_bot: Any = None
+
+# Путь к файлу прогресса рассылки
+checkpoint_path: Optional[str] = None
+
+# Состояние текущей рассылки (сохраняется в файл прогресса)
+state: Optional[Dict[str, Any]] = None
+
+# Обработанные получатели после state["cursor"] (порядковые номера)
+done_ahead: Set[int] = set()
+
+# Задача текущей рассылки
+broadcast_task: Optional[asyncio.Task] = None
+
+# Флаг остановки: отправители завершаются после текущей отправки
+stopping = False
+
+# Момент, до которого рассылка приостановлена после RetryAfter (time.monotonic)
+paused_until = 0.0
+
+# Скорость рассылки: корзина и последние замеры [(время, обработано), ...]
+broadcast_bucket = create_bucket(rate=broadcast_config["rate"], capacity=broadcast_config["rate"])
+rate_samples: Deque[Tuple[float, int]] = deque(maxlen=30)
+
+def init_broadcast(bot: Any, path: Optional[str] = None, config: Optional[Dict[str, float]] = None) -> None:
+    """
+    Задает бота, файл прогресса и параметры рассылки
+
+    Args:
+        bot: Бот aiogram
+        path: Путь к файлу прогресса (None или пустая строка - прогресс не сохраняется)
+        config: Параметры в формате broadcast_config
+    """
+    global broadcast_bot, checkpoint_path, broadcast_bucket
+    broadcast_bot = bot
+    # Пустой путь (BROADCAST_CHECKPOINT=) означает рассылку без файла прогресса
+    checkpoint_path = path or None
+    if path and os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    broadcast_config.update(config or {})
+    broadcast_bucket = create_bucket(rate=broadcast_config["rate"], capacity=broadcast_config["rate"])
+    logger.info(f"Рассылка: {broadcast_config}, прогресс: {path or 'не сохраняется'}")
+
+def collect_recipients(style: Optional[str] = None) -> List[int]:
+    """
+    Собирает получателей рассылки из истории диалогов и стилей
+
+    Чаты ботов других арендаторов (ключи (арендатор, chat_id)) не включаются.
+
+    Args:
+        style: Только чаты с этим стилем (None - все чаты)
+
+    Returns:
+        Идентификаторы чатов по возрастанию
+    """
+    chats = {key for key in list(memory.dialogs) + list(user_styles) if isinstance(key, int)}
+    if style is not None:
+        chats = {chat_id for chat_id in chats if user_styles.get(chat_id, STYLE_NORMAL) == style}
+    return sorted(chats)
+
+def render(chat_id: int, text: str, variants: Optional[Dict[str, str]] = None, badges: bool = False) -> str:
+    """
+    Формирует текст рассылки для чата
+
+    Args:
+        chat_id: Идентификатор чата
+        text: Текст по умолчанию
+        variants: Тексты для стилей {стиль: текст}
+        badges: Начинать текст с метки стиля чата
+
+    Returns:
+        Текст сообщения
+    """
+    style = user_styles.get(chat_id, STYLE_NORMAL)
+    body = (variants or {}).get(style, text)
+    return f"{STYLE_BADGES[style]}\n\n{body}" if badges else body
+
+def get_progress() -> Dict[str, Any]:
+    """
+    Возвращает прогресс текущей (или последней) рассылки
+
+    Returns:
+        Словарь {id, total, done, sent, failed, rate, eta_seconds, paused, running, finished}
+    """
+    if state is None:
+        return {"running": False}
+    done = state["cursor"] + len(done_ahead)
+    rate = 0.0
+    if len(rate_samples) > 1:
+        (first_time, first_done), (last_time, last_done) = rate_samples[0], rate_samples[-1]
+        if last_time > first_time:
+            rate = (last_done - first_done) / (last_time - first_time)
+    remaining = len(state["recipients"]) - done
+    return {
+        "id": state["id"],
+        "total": len(state["recipients"]),
+        "done": done,
+        "sent": state["sent"],
+        "failed": state["failed"],
+        "rate": round(rate, 2),
+        "eta_seconds": round(remaining / rate) if rate > 0 else None,
+        "paused": max(0.0, round(paused_until - time.monotonic(), 1)),
+        "running": broadcast_task is not None and not broadcast_task.done(),
+        "finished": state["finished"]
+    }
+
+def _mark_done(index: int) -> None:
+    """
+    Отмечает получателя обработанным и сдвигает курсор
+
+    Args:
+        index: Порядковый номер получателя
+    """
+    done_ahead.add(index)
+    while state["cursor"] in done_ahead:
+        done_ahead.remove(state["cursor"])
+        state["cursor"] += 1
+
+def _write_checkpoint(path: str, data: Dict[str, Any]) -> None:
+    """
+    Записывает прогресс в файл (через временный файл, чтобы не оставить его недописанным)
+
+    Args:
+        path: Путь к файлу прогресса
+        data: Состояние рассылки
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False)
+    os.replace(temporary, path)
+
+async def save_checkpoint() -> None:
+    """
+    Сохраняет прогресс текущей рассылки
+    """
+    if state is None or checkpoint_path is None:
+        return
+    # Снимок состояния собирается в цикле событий, запись - в отдельном потоке
+    data = dict(state, done_ahead=sorted(done_ahead), errors=list(state["errors"]))
+    await asyncio.to_thread(_write_checkpoint, checkpoint_path, data)
+
+async def _wait_pause() -> None:
+    """
+    Ждет окончания паузы после RetryAfter
+    """
+    while True:
+        delay = paused_until - time.monotonic()
+        if delay <= 0:
+            return
+        await asyncio.sleep(delay)
+
+async def _send(chat_id: int, text: str) -> Optional[str]:
+    """
+    Отправляет сообщение рассылки в чат с учетом лимитов и повторов
+
+    Args:
+        chat_id: Идентификатор чата
+        text: Текст сообщения
+
+    Returns:
+        None при успехе или описание ошибки
+    """
+    global paused_until
+    kwargs = {"parse_mode": state["parse_mode"]} if state["parse_mode"] else {}
+    for chunk in sender.split_message(text):
+        attempts = 0
+        while True:
+            await acquire(broadcast_bucket)
+            await acquire(sender.global_bucket)
+            await acquire(sender.get_chat_bucket(chat_id))
+            # Пауза проверяется после ожидания корзин: за это время другой
+            # отправитель мог получить RetryAfter
+            await _wait_pause()
+            try:
+                await broadcast_bot.send_message(chat_id, chunk, **kwargs)
+                break
+            except TelegramRetryAfter as e:
+                attempts += 1
+                metrics.inc("broadcast_retry_total", reason="retry_after")
+                if attempts >= broadcast_config["max_attempts"]:
+                    return f"RetryAfter: {e.retry_after} с"
+                # Превышен общий лимит бота: приостанавливаются все отправители
+                paused_until = max(paused_until, time.monotonic() + e.retry_after)
+                logger.warning(f"Рассылка приостановлена на {e.retry_after} с (превышен лимит Telegram)")
+            except TelegramNetworkError as e:
+                attempts += 1
+                metrics.inc("broadcast_retry_total", reason="network")
+                if attempts >= broadcast_config["max_attempts"]:
+                    return f"{type(e).__name__}: {e}"
+                await asyncio.sleep(broadcast_config["network_retry_delay"] * attempts)
+            except Exception as e:
+                # Бот заблокирован, чат удален и т.п.: повтор не поможет
+                return f"{type(e).__name__}: {e}"
+    return None
+
+async def _worker(positions: List[int]) -> None:
+    """
+    Отправляет сообщения получателям по очереди номеров
+
+    Args:
+        positions: Общая очередь номеров необработанных получателей
+    """
+    recipients = state["recipients"]
+    while positions and not stopping:
+        index = positions.pop()
+        chat_id = recipients[index]
+        error = await _send(chat_id, render(chat_id, state["text"], state["variants"], state["badges"]))
+        if error is None:
+            state["sent"] += 1
+            metrics.inc("broadcast_messages_total", result="sent")
+        else:
+            state["failed"] += 1
+            metrics.inc("broadcast_messages_total", result="failed")
+            if len(state["errors"]) < MAX_SAVED_ERRORS:
+                state["errors"].append({"chat_id": chat_id, "error": error})
+            logger.info(f"Рассылка {state['id']}: чат {chat_id} пропущен ({error})")
+        _mark_done(index)
+
+async def _monitor() -> None:
+    """
+    Периодически сохраняет прогресс и пишет его в лог
+    """
+    logged = time.monotonic()
+    while True:
+        await asyncio.sleep(broadcast_config["checkpoint_interval"])
+        now = time.monotonic()
+        rate_samples.append((now, state["cursor"] + len(done_ahead)))
+        progress = get_progress()
+        metrics.set_gauge("broadcast_done", progress["done"])
+        metrics.set_gauge("broadcast_rate", progress["rate"])
+        try:
+            await save_checkpoint()
+        except OSError as e:
+            logger.error(f"Ошибка при сохранении прогресса рассылки: {e}")
+        if now - logged >= broadcast_config["progress_interval"]:
+            logged = now
+            logger.info(f"Рассылка {progress['id']}: {progress['done']}/{progress['total']}, "
+                        f"{progress['rate']} сообщ./с, осталось около {progress['eta_seconds']} с")
+
+async def _run() -> None:
+    """
+    Выполняет рассылку с текущего курсора
+    """
+    recipients = state["recipients"]
+    # Номера в обратном порядке: отправители берут их с конца списка
+    positions = [index for index in range(len(recipients) - 1, state["cursor"] - 1, -1) if index not in done_ahead]
+    rate_samples.clear()
+    rate_samples.append((time.monotonic(), state["cursor"] + len(done_ahead)))
+    logger.info(f"Рассылка {state['id']}: {len(positions)} из {len(recipients)} получателей")
+    monitor = asyncio.create_task(_monitor())
+    try:
+        workers = min(int(broadcast_config["workers"]), len(positions)) or 1
+        await asyncio.gather(*(_worker(positions) for _ in range(workers)))
+        if not positions and not stopping:
+            state["finished"] = True
+            logger.info(f"Рассылка {state['id']} завершена: отправлено {state['sent']}, ошибок {state['failed']}")
+    finally:
+        monitor.cancel()
+        try:
+            await monitor
+        except asyncio.CancelledError:
+            pass
+        # Ошибка записи прогресса не должна прерывать остановку (stop_broadcast)
+        try:
+            await save_checkpoint()
+        except OSError as e:
+            logger.error(f"Ошибка при сохранении прогресса рассылки: {e}")
+
+def _launch() -> asyncio.Task:
+    """
+    Запускает задачу рассылки для текущего состояния
+
+    Returns:
+        Задача рассылки
+    """
+    global broadcast_task, stopping
+    stopping = False
+    broadcast_task = asyncio.create_task(_run())
+    return broadcast_task
+
+def start_broadcast(
+    text: str,
+    variants: Optional[Dict[str, str]] = None,
+    badges: bool = False,
+    style: Optional[str] = None,
+    parse_mode: Optional[str] = "HTML"
+) -> asyncio.Task:
+    """
+    Начинает новую рассылку
+
+    Args:
+        text: Текст по умолчанию
+        variants: Тексты для стилей {стиль: текст}
+        badges: Начинать текст с метки стиля чата
+        style: Отправить только чатам с этим стилем
+        parse_mode: Режим разметки Telegram (HTML или None)
+
+    Returns:
+        Задача рассылки
+
+    Raises:
+        RuntimeError: Если бот не задан или предыдущая рассылка еще выполняется
+    """
+    global state
+    if broadcast_bot is None:
+        raise RuntimeError("Рассылка не инициализирована. Вызовите init_broadcast() сначала.")
+    if broadcast_task is not None and not broadcast_task.done():
+        raise RuntimeError(f"Рассылка {state['id']} еще выполняется")
+    state = {
+        "id": time.strftime("%Y%m%d-%H%M%S"),
+        "text": text,
+        "variants": variants,
+        "badges": badges,
+        "parse_mode": parse_mode,
+        "recipients": collect_recipients(style),
+        "cursor": 0,
+        "sent": 0,
+        "failed": 0,
+        "errors": [],
+        "finished": False
+    }
+    done_ahead.clear()
+    return _launch()
+
+def resume_broadcast() -> Optional[asyncio.Task]:
+    """
+    Продолжает незавершенную рассылку из файла прогресса
+
+    Returns:
+        Задача рассылки или None, если продолжать нечего
+    """
+    global state
+    if broadcast_bot is None or checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, "r", encoding="utf-8") as file:
+        saved = json.load(file)
+    if saved["finished"]:
+        return None
+    done_ahead.clear()
+    done_ahead.update(saved.pop("done_ahead"))
+    state = saved
+    logger.info(f"Продолжение рассылки {state['id']} с получателя {state['cursor']}")
+    return _launch()
+
+async def stop_broadcast() -> None:
+    """
+    Останавливает рассылку после текущих отправок и сохраняет прогресс
+    """
+    global stopping
+    if broadcast_task is None or broadcast_task.done():
+        return
+    stopping = True
+    await broadcast_task
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для записи и воспроизведения ответов LLM (кассеты)
+
+Кассета - файл JSONL, в который дописываются записи о запросах:
+отпечаток запроса, ответ, количество токенов и время ответа. Кассеты
+позволяют запускать generate_response и сценарии без сети: в тестах,
+бенчмарках и для проверки регрессий.
+
+Режимы:
+- record - запросы идут в API, ответы дописываются в кассету;
+- replay - ответы берутся из кассеты с исходной или масштабированной задержкой;
+- synthetic - ответы генерируются по распределениям длины и задержки.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.llm import make_request_key, openai_completion
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Режимы бэкенда
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+MODE_SYNTHETIC = "synthetic"
+
+# Тип бэкенда LLM: корутина {model, messages, temperature, max_tokens} -> {content, usage}
+Backend = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+# Основные поля запроса; остальные (stop, soft_max_tokens) входят в отпечаток как опции
+REQUEST_FIELDS = ("model", "messages", "temperature", "max_tokens")
+
+# Текст, из которого собираются синтетические ответы
+SYNTHETIC_TEXT = (
+    "ООО \"ТехноСервис\" занимается разработкой веб-приложений, мобильных приложений, "
+    "автоматизацией бизнес-процессов и IT-консалтингом. "
+)
+
+def request_fingerprint(request: Dict[str, Any]) -> str:
+    """
+    Вычисляет отпечаток запроса
+
+    Args:
+        request: Параметры запроса {model, messages, temperature, max_tokens}
+
+    Returns:
+        Хэш нормализованных параметров запроса
+    """
+    options = {key: value for key, value in request.items() if key not in REQUEST_FIELDS}
+    # Обычный список: отпечаток не зависит от того, собраны ли сообщения из контекста чата
+    return make_request_key(
+        list(request["messages"]), request["model"], request["temperature"], request["max_tokens"], options
+    )
+
+def _append_record(path: str, record: Dict[str, Any]) -> None:
+    """
+    Дописывает запись в кассету
+
+    Args:
+        path: Путь к файлу кассеты
+        record: Запись о запросе
+    """
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+def load_cassette(path: str) -> List[Dict[str, Any]]:
+    """
+    Загружает записи кассеты
+
+    Args:
+        path: Путь к файлу кассеты
+
+    Returns:
+        Список записей в порядке записи
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Последняя строка могла быть записана не полностью
+                logger.warning(f"Пропущена поврежденная запись кассеты {path}")
+    logger.info(f"Загружена кассета {path}: {len(records)} записей")
+    return records
+
+def recording_backend(path: str, backend: Backend = openai_completion) -> Backend:
+    """
+    Создает бэкенд, который записывает ответы в кассету
+
+    Args:
+        path: Путь к файлу кассеты
+        backend: Бэкенд, выполняющий запросы (по умолчанию API через клиент)
+
+    Returns:
+        Корутина бэкенда
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    async def record(request: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.monotonic()
+        completion = await backend(request)
+        latency = time.monotonic() - started
+
+        # Сохраняем отпечаток и размеры запроса, а не сами сообщения
+        entry = {
+            "fp": request_fingerprint(request),
+            "model": request["model"],
+            "max_tokens": request["max_tokens"],
+            "prompt_chars": sum(len(message["content"]) for message in request["messages"]),
+            "latency": round(latency, 4),
+            "content": completion["content"],
+            "usage": completion.get("usage", {})
+        }
+        await asyncio.to_thread(_append_record, path, entry)
+        return completion
+
+    return record
+
+def replay_backend(path: str, latency_scale: float = 1.0, strict: bool = False) -> Backend:
+    """
+    Создает бэкенд, который воспроизводит ответы из кассеты
+
+    Ответ ищется по отпечатку запроса; повторные запросы с тем же отпечатком
+    получают записанные ответы по кругу. Если отпечаток не найден, в нестрогом
+    режиме возвращается следующая запись кассеты по порядку, чтобы сохранить
+    реалистичные размеры ответов и задержки.
+
+    Args:
+        path: Путь к файлу кассеты
+        latency_scale: Множитель задержки (0 - без задержки)
+        strict: Вызывать KeyError для запросов, которых нет в кассете
+
+    Returns:
+        Корутина бэкенда
+    """
+    records = load_cassette(path)
+    if not records:
+        raise ValueError(f"Кассета {path} пуста")
+
+    by_fingerprint: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in records:
+        by_fingerprint.setdefault(entry["fp"], []).append(entry)
+    positions: Dict[str, int] = {}
+    state = {"next": 0}
+
+    async def replay(request: Dict[str, Any]) -> Dict[str, Any]:
+        fingerprint = request_fingerprint(request)
+        candidates = by_fingerprint.get(fingerprint)
+        if candidates:
+            position = positions.get(fingerprint, 0)
+            entry = candidates[position % len(candidates)]
+            positions[fingerprint] = position + 1
+        elif strict:
+            raise KeyError(f"Запрос {fingerprint[:12]} не найден в кассете {path}")
+        else:
+            entry = records[state["next"] % len(records)]
+            state["next"] += 1
+
+        if latency_scale > 0:
+            await asyncio.sleep(entry["latency"] * latency_scale)
+        return {"content": entry["content"], "usage": dict(entry.get("usage", {}))}
+
+    return replay
+
+def load_distributions(path: str) -> Tuple[List[float], List[int]]:
+    """
+    Извлекает из кассеты распределения задержки и длины ответа
+
+    Args:
+        path: Путь к файлу кассеты
+
+    Returns:
+        Кортеж (задержки в секундах, длины ответов в символах)
+    """
+    records = load_cassette(path)
+    return [entry["latency"] for entry in records], [len(entry["content"]) for entry in records]
+
+def synthetic_backend(
+    latency_median: float = 2.0,
+    latency_sigma: float = 0.5,
+    length_median: int = 800,
+    length_sigma: float = 0.5,
+    latencies: Optional[List[float]] = None,
+    lengths: Optional[List[int]] = None,
+    latency_scale: float = 1.0,
+    seed: Optional[int] = None
+) -> Backend:
+    """
+    Создает бэкенд, который генерирует ответы по распределениям
+
+    По умолчанию задержка и длина ответа берутся из логнормальных распределений.
+    Если переданы выборки (например, из load_distributions), значения
+    выбираются из них случайно.
+
+    Args:
+        latency_median: Медиана задержки в секундах
+        latency_sigma: Разброс задержки (sigma логнормального распределения)
+        length_median: Медиана длины ответа в символах
+        length_sigma: Разброс длины ответа
+        latencies: Выборка задержек
+        lengths: Выборка длин ответов
+        latency_scale: Множитель задержки (0 - без задержки)
+        seed: Начальное значение генератора случайных чисел
+
+    Returns:
+        Корутина бэкенда
+    """
+    generator = random.Random(seed)
+
+    async def synthetic(request: Dict[str, Any]) -> Dict[str, Any]:
+        if latencies:
+            latency = generator.choice(latencies)
+        else:
+            latency = generator.lognormvariate(math.log(latency_median), latency_sigma)
+        if lengths:
+            length = generator.choice(lengths)
+        else:
+            length = int(generator.lognormvariate(math.log(length_median), length_sigma))
+        length = max(1, min(length, request["max_tokens"] * 4))
+
+        content = (SYNTHETIC_TEXT * (length // len(SYNTHETIC_TEXT) + 1))[:length]
+        if latency_scale > 0:
+            await asyncio.sleep(latency * latency_scale)
+
+        prompt_chars = sum(len(message["content"]) for message in request["messages"])
+        return {
+            "content": content,
+            # Оценка: около 4 символов на токен
+            "usage": {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": length // 4,
+                "cached_tokens": 0
+            }
+        }
+
+    return synthetic
+
+def create_backend(mode: str, path: Optional[str] = None, latency_scale: float = 1.0) -> Backend:
+    """
+    Создает бэкенд кассеты по названию режима
+
+    Args:
+        mode: Режим (record, replay, synthetic)
+        path: Путь к файлу кассеты (для synthetic - необязательный источник распределений)
+        latency_scale: Множитель задержки для replay и synthetic
+
+    Returns:
+        Корутина бэкенда
+    """
+    if mode == MODE_RECORD:
+        if not path:
+            raise ValueError("Для режима record нужен путь к кассете")
+        return recording_backend(path)
+    if mode == MODE_REPLAY:
+        if not path:
+            raise ValueError("Для режима replay нужен путь к кассете")
+        return replay_backend(path, latency_scale=latency_scale)
+    if mode == MODE_SYNTHETIC:
+        if path and os.path.exists(path):
+            latencies, lengths = load_distributions(path)
+            return synthetic_backend(latencies=latencies, lengths=lengths, latency_scale=latency_scale)
+        return synthetic_backend(latency_scale=latency_scale)
+    raise ValueError(f"Неизвестный режим кассеты: {mode}")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для отображения индикатора набора текста в Telegram
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+from src import metrics
+from src.rate_limit import create_bucket, try_acquire
+from src.tenants import tenant_key
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Интервал обновления индикатора (Telegram показывает его около 5 секунд)
+REFRESH_INTERVAL = 4.5
+
+# Пауза перед повторной попыткой, если глобальный лимит исчерпан
+RETRY_INTERVAL = 1.0
+
+# Общий для всех чатов лимит на отправку индикатора, чтобы он
+# не расходовал лимит запросов бота к Telegram API
+action_bucket = create_bucket(rate=10, capacity=10)
+
+# Время последней отправки индикатора: {tenant_key(chat_id): time.monotonic()}
+# (индикатор отправляет бот арендатора, поэтому чаты разных ботов учитываются отдельно)
+last_action_sent: Dict[Any, float] = {}
+
+async def send_typing(bot, chat_id: int, action: str = "typing") -> bool:
+    """
+    Отправляет индикатор набора текста с учетом глобального лимита
+
+    Args:
+        bot: Экземпляр бота aiogram
+        chat_id: Идентификатор чата
+        action: Тип действия Telegram
+
+    Returns:
+        True, если индикатор отправлен, иначе False
+    """
+    if not try_acquire(action_bucket):
+        metrics.inc("chat_action_skipped_total")
+        return False
+
+    try:
+        await bot.send_chat_action(chat_id=chat_id, action=action)
+    except Exception as e:
+        # Индикатор не критичен: ошибка не должна прерывать обработку
+        logger.warning(f"Не удалось отправить индикатор набора текста в чат {chat_id}: {e}")
+        return False
+
+    last_action_sent[tenant_key(chat_id)] = time.monotonic()
+    metrics.inc("chat_action_sent_total")
+    return True
+
+async def _refresh_typing(bot, chat_id: int, action: str) -> None:
+    """
+    Периодически обновляет индикатор набора текста
+
+    Args:
+        bot: Экземпляр бота aiogram
+        chat_id: Идентификатор чата
+        action: Тип действия Telegram
+    """
+    key = tenant_key(chat_id)
+    while True:
+        # Не дублируем индикатор, если он был отправлен недавно
+        elapsed = time.monotonic() - last_action_sent.get(key, 0.0)
+        if elapsed < REFRESH_INTERVAL:
+            await asyncio.sleep(REFRESH_INTERVAL - elapsed)
+            continue
+
+        if await send_typing(bot, chat_id, action):
+            await asyncio.sleep(REFRESH_INTERVAL)
+        else:
+            await asyncio.sleep(RETRY_INTERVAL)
+
+@asynccontextmanager
+async def keep_typing(bot, chat_id: int, action: str = "typing") -> AsyncIterator[None]:
+    """
+    Показывает индикатор набора текста, пока выполняется блок кода
+
+    Пример:
+        async with keep_typing(bot, chat_id):
+            response = await generate_response(messages)
+
+    Args:
+        bot: Экземпляр бота aiogram
+        chat_id: Идентификатор чата
+        action: Тип действия Telegram
+    """
+    task = asyncio.create_task(_refresh_typing(bot, chat_id, action))
+    try:
+        yield
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        last_action_sent.pop(tenant_key(chat_id), None)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для объединения серии быстрых сообщений пользователя в один запрос к LLM
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from src import tracing
+from src.lanes import lane_slot
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Окно ожидания (в секундах), в течение которого сообщения одного чата объединяются.
+# Значение 0 отключает объединение: сообщение обрабатывается сразу
+coalesce_window: float = 0.0
+
+# Разделитель между объединяемыми сообщениями
+MESSAGE_SEPARATOR = "\n"
+
+# Сообщения, ожидающие обработки: {chat_id: [текст, ...]}
+pending_messages: Dict[int, List[str]] = {}
+
+# Задачи обработки для каждого чата (ожидание окна или запрос к LLM): {chat_id: task}
+chat_tasks: Dict[int, asyncio.Task] = {}
+
+def init_coalescer(window: float) -> None:
+    """
+    Задает окно объединения сообщений
+
+    Args:
+        window: Длительность окна в секундах (0 - без объединения)
+    """
+    global coalesce_window
+    coalesce_window = max(0.0, window)
+    logger.info(f"Окно объединения сообщений: {coalesce_window} с")
+
+def is_chat_busy(chat_id: int) -> bool:
+    """
+    Проверяет, есть ли у чата сообщения в ожидании или в обработке
+
+    Args:
+        chat_id: Идентификатор чата
+
+    Returns:
+        True, если для чата уже запущена обработка
+    """
+    task = chat_tasks.get(chat_id)
+    return task is not None and not task.done()
+
+async def coalesce_message(
+    chat_id: int,
+    text: str,
+    handler: Callable[[str], Awaitable[None]],
+    lane: Optional[str] = None
+) -> None:
+    """
+    Добавляет сообщение в очередь чата и откладывает его обработку.
+
+    Каждое новое сообщение перезапускает окно ожидания и отменяет
+    незавершенную обработку предыдущих сообщений этого чата, поэтому
+    на серию сообщений генерируется только один ответ.
+
+    Args:
+        chat_id: Идентификатор чата
+        text: Текст сообщения пользователя
+        handler: Корутина, обрабатывающая объединенный текст
+        lane: Полоса, в которой выполняется обработчик (None - без полосы)
+    """
+    if coalesce_window <= 0:
+        await _run_handler(handler, text, lane)
+        return
+
+    pending_messages.setdefault(chat_id, []).append(text)
+
+    if is_chat_busy(chat_id):
+        chat_tasks[chat_id].cancel()
+        logger.info(f"Обработка предыдущих сообщений чата {chat_id} отменена новым сообщением")
+
+    # Задача продолжает трассу сообщения, запустившего ее
+    chat_tasks[chat_id] = tracing.create_task(_process_after_window(chat_id, handler, lane))
+
+async def _run_handler(handler: Callable[[str], Awaitable[None]], text: str, lane: Optional[str]) -> None:
+    """
+    Вызывает обработчик, при необходимости заняв место в полосе
+
+    Args:
+        handler: Корутина, обрабатывающая текст
+        text: Текст для обработки
+        lane: Полоса (None - без полосы)
+    """
+    if lane is None:
+        await handler(text)
+        return
+    async with lane_slot(lane):
+        await handler(text)
+
+async def _process_after_window(
+    chat_id: int,
+    handler: Callable[[str], Awaitable[None]],
+    lane: Optional[str] = None
+) -> None:
+    """
+    Ждет окончания окна и передает накопленные сообщения обработчику
+
+    Args:
+        chat_id: Идентификатор чата
+        handler: Корутина, обрабатывающая объединенный текст
+        lane: Полоса, в которой выполняется обработчик (None - без полосы)
+    """
+    try:
+        with tracing.span("coalesce_window", window=coalesce_window):
+            await asyncio.sleep(coalesce_window)
+
+        # Забираем сообщения до вызова обработчика. Обработчик сохраняет текст
+        # в историю диалога до первого ожидания, поэтому после его запуска
+        # отмена следующим сообщением не теряет текст и не повторяет его в запросе
+        texts = pending_messages.pop(chat_id, [])
+        if not texts:
+            return
+
+        if len(texts) > 1:
+            logger.info(f"Объединено {len(texts)} сообщений чата {chat_id} в один запрос")
+        tracing.set_attributes(coalesced_messages=len(texts))
+        if lane is None:
+            await handler(MESSAGE_SEPARATOR.join(texts))
+            return
+
+        # Место в полосе может освободиться нескоро: если задачу отменят
+        # до запуска обработчика, сообщения возвращаются в ожидание и
+        # попадают в объединенный запрос следующей задачи
+        started = False
+        try:
+            async with lane_slot(lane):
+                started = True
+                await handler(MESSAGE_SEPARATOR.join(texts))
+        except asyncio.CancelledError:
+            if not started:
+                pending_messages[chat_id] = texts + pending_messages.get(chat_id, [])
+            raise
+    except asyncio.CancelledError:
+        logger.debug(f"Обработка сообщений чата {chat_id} отменена")
+        raise
+    except Exception as e:
+        tracing.mark_error(f"{type(e).__name__}: {e}")
+        logger.error(f"Ошибка при обработке сообщений чата {chat_id}: {e}")
+    finally:
+        if chat_tasks.get(chat_id) is asyncio.current_task():
+            del chat_tasks[chat_id]
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для поддержания контекста LLM каждого чата
+
+Контекст чата - системный промпт стиля и последние сообщения диалога,
+уже закодированные в JSON. Контекст обновляется при каждом add_message,
+поэтому подготовка запроса кодирует только новое сообщение, а тело
+запроса к API собирается из готовых байтов без повторной сериализации.
+"""
+import json
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src import experiments, memory
+from src.styles import STYLE_NORMAL, load_style_prompt, user_styles
+from src.tenants import tenant_key
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Количество последних сообщений истории в контексте
+HISTORY_WINDOW = 10
+
+# Роли сообщений истории, которые попадают в запрос
+CONTEXT_ROLES = ("user", "assistant")
+
+# Контексты чатов: {chat_id: {"window", "turns": deque([(сообщение, байты, фрагмент ключа), ...]),
+# "joined", "key_joined"}}
+chat_contexts: Dict[int, Dict[str, Any]] = {}
+
+# Закодированные системные промпты стилей: {tenant_key(стиль) или (директория, стиль): (сообщение, байты)}
+system_messages: Dict[Any, Tuple[Dict[str, str], bytes]] = {}
+
+class EncodedMessages(list):
+    """
+    Список сообщений для LLM с готовым JSON-представлением
+
+    Ведет себя как обычный список [{role, content}]; атрибут encoded
+    содержит тот же список, закодированный в JSON (UTF-8), атрибут
+    key_data - сообщения, нормализованные для ключа запроса (key_fragment).
+    """
+
+    encoded: bytes = b"[]"
+    key_data: Optional[bytes] = None
+
+def encode_message(message: Dict[str, str]) -> bytes:
+    """
+    Кодирует сообщение в JSON
+
+    Args:
+        message: Сообщение {role, content}
+
+    Returns:
+        JSON-представление сообщения в UTF-8
+    """
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def key_fragment(message: Dict[str, str]) -> bytes:
+    """
+    Нормализует сообщение для ключа запроса (make_request_key)
+
+    В ключ входят только роль и текст без крайних пробелов; длина текста
+    разделяет соседние сообщения.
+
+    Args:
+        message: Сообщение {role, content}
+
+    Returns:
+        Нормализованное представление сообщения
+    """
+    content = message["content"].strip().encode("utf-8")
+    return f"{message['role']}:{len(content)}:".encode("utf-8") + content
+
+def _get_system_message(style: str, prompts_dir: Optional[str] = None) -> Optional[Tuple[Dict[str, str], bytes]]:
+    """
+    Возвращает закодированный системный промпт стиля
+
+    Args:
+        style: Стиль ответа
+        prompts_dir: Директория промптов варианта эксперимента (None - директория арендатора)
+
+    Returns:
+        Кортеж (сообщение, байты) или None, если промпт не загружен
+    """
+    system_prompt = load_style_prompt(style, prompts_dir)
+    if not system_prompt:
+        return None
+    # Промпты стилей у арендаторов и вариантов экспериментов разные
+    cache_key = tenant_key(style) if prompts_dir is None else (prompts_dir, style)
+    cached = system_messages.get(cache_key)
+    if cached is None or cached[0]["content"] is not system_prompt:
+        # Промпт стиля кодируется заново только после его перезагрузки
+        message = {"role": "system", "content": system_prompt}
+        cached = (message, encode_message(message))
+        system_messages[cache_key] = cached
+    return cached
+
+def _get_context(chat_id: int, window: int) -> Dict[str, Any]:
+    """
+    Возвращает контекст чата, создавая его из истории диалога
+
+    Args:
+        chat_id: Идентификатор чата
+        window: Количество последних сообщений истории
+
+    Returns:
+        Контекст чата
+    """
+    context = chat_contexts.get(chat_id)
+    if context is not None and context["window"] == window:
+        return context
+
+    # Контекст строится из истории один раз, затем только дополняется
+    turns: Deque[Tuple[Dict[str, str], Optional[bytes], bytes]] = deque(maxlen=window)
+    for entry in memory.get_dialog_history(chat_id, window):
+        turns.append(_make_turn(entry["role"], entry["content"]))
+    context = {"window": window, "turns": turns, "joined": None, "key_joined": None}
+    chat_contexts[chat_id] = context
+    return context
+
+def _make_turn(role: str, content: str) -> Tuple[Dict[str, str], Optional[bytes], bytes]:
+    """
+    Создает запись истории в контексте
+
+    Сообщения с ролями не из CONTEXT_ROLES занимают место в окне
+    истории (как в get_dialog_messages_for_llm), но не попадают в запрос.
+
+    Args:
+        role: Роль отправителя
+        content: Текст сообщения
+
+    Returns:
+        Кортеж (сообщение, байты или None, фрагмент ключа запроса)
+    """
+    message = {"role": role, "content": content}
+    if role not in CONTEXT_ROLES:
+        return message, None, b""
+    return message, encode_message(message), key_fragment(message)
+
+def on_message_added(chat_id: int, role: str, content: str) -> None:
+    """
+    Дополняет контекст чата новым сообщением (вызывается из add_message)
+
+    Args:
+        chat_id: Идентификатор чата
+        role: Роль отправителя
+        content: Текст сообщения
+    """
+    context = chat_contexts.get(chat_id)
+    if context is None:
+        # Контекст будет построен из истории при первом запросе
+        return
+    context["turns"].append(_make_turn(role, content))
+    context["joined"] = None
+    context["key_joined"] = None
+
+def on_history_cleared(chat_id: int) -> None:
+    """
+    Удаляет контекст чата (вызывается из clear_dialog_history)
+
+    Args:
+        chat_id: Идентификатор чата
+    """
+    chat_contexts.pop(chat_id, None)
+
+def build_messages(chat_id: int, user_message: str, window: int = HISTORY_WINDOW) -> EncodedMessages:
+    """
+    Собирает сообщения для LLM из контекста чата и нового сообщения
+
+    Args:
+        chat_id: Идентификатор чата
+        user_message: Сообщение пользователя
+        window: Количество последних сообщений истории
+
+    Returns:
+        Список сообщений [{role, content}] с готовым JSON-представлением
+    """
+    context = _get_context(chat_id, window)
+    turns = context["turns"]
+    if context["joined"] is None:
+        context["joined"] = b",".join(encoded for _, encoded, _ in turns if encoded is not None)
+        context["key_joined"] = b"".join(fragment for _, _, fragment in turns)
+
+    user_turn = {"role": "user", "content": user_message}
+    parts: List[bytes] = []
+    messages = EncodedMessages()
+
+    # Версия промптов может зависеть от варианта эксперимента чата
+    prompts_dir = experiments.get_overrides(chat_id).get("prompts_dir")
+    system = _get_system_message(user_styles.get(chat_id, STYLE_NORMAL), prompts_dir)
+    if system is not None:
+        messages.append(system[0])
+        parts.append(system[1])
+    messages.extend(message for message, encoded, _ in turns if encoded is not None)
+    if context["joined"]:
+        parts.append(context["joined"])
+    messages.append(user_turn)
+    parts.append(encode_message(user_turn))
+
+    messages.encoded = b"[" + b",".join(parts) + b"]"
+    # Нормализованные сообщения для ключа запроса собраны из готовых фрагментов
+    system_key = key_fragment(system[0]) if system is not None else b""
+    messages.key_data = system_key + context["key_joined"] + key_fragment(user_turn)
+    return messages
+
+# Контексты подписываются на изменения истории при импорте модуля,
+# чтобы кэш не мог разойтись с историей диалога
+memory.message_listeners.append(on_message_added)
+memory.clear_listeners.append(on_history_cleared)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для постепенного упрощения запросов к LLM при перегрузке
+
+Контроллер раз в interval секунд оценивает нагрузку по трем сигналам:
+количество выполняющихся запросов к LLM, сглаженное время ожидания
+места в полосе llm и p95 времени ответа LLM за последние секунды.
+Нагрузка - наибольшее отношение сигнала к его целевому значению.
+
+Если нагрузка не меньше 1, уровень повышается на одну ступень
+за оценку. Понижается уровень тоже по одной ступени и только после
+того, как нагрузка recovery_seconds подряд оставалась ниже recover_below
+(гистерезис): при нагрузке между порогами уровень не меняется.
+
+Уровни (каждый включает ограничения предыдущего):
+0 - без ограничений;
+1 - короткое окно истории;
+2 - меньший лимит токенов ответа;
+3 - быстрая модель;
+4 - к LLM отправляются только запросы, совпадающие с уже выполняющимися;
+    остальные получают ответ без LLM (приветствия из пула, сообщение об ошибке).
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from src import lanes, metrics
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Ограничения уровней: окно истории, лимит токенов ответа, быстрая модель, только быстрый путь
+LEVELS = [
+    {"history_window": None, "max_tokens": None, "fast_model": False, "shed": False},
+    {"history_window": 4, "max_tokens": None, "fast_model": False, "shed": False},
+    {"history_window": 4, "max_tokens": 300, "fast_model": False, "shed": False},
+    {"history_window": 2, "max_tokens": 300, "fast_model": True, "shed": False},
+    {"history_window": 2, "max_tokens": 300, "fast_model": True, "shed": True}
+]
+
+# Параметры контроллера
+degradation_config: Dict[str, float] = {
+    # Целевое количество одновременных запросов к LLM
+    "max_inflight": 12,
+    # Целевое сглаженное время ожидания места в полосе llm (в секундах)
+    "max_wait": 2.0,
+    # Целевой p95 времени ответа LLM (в секундах)
+    "max_p95": 20.0,
+    # Нагрузка, ниже которой начинается восстановление
+    "recover_below": 0.6,
+    # Время низкой нагрузки перед понижением уровня на одну ступень (в секундах)
+    "recovery_seconds": 30.0,
+    # Интервал оценки нагрузки (в секундах)
+    "interval": 1.0,
+    # Окно, по которому считается p95 времени ответа (в секундах)
+    "latency_horizon": 60.0,
+    # Максимальный уровень (0 - контроллер не снижает качество ответов)
+    "max_level": len(LEVELS) - 1
+}
+
+# Текущий уровень
+current_level = 0
+
+# Количество выполняющихся запросов к LLM
+inflight = 0
+
+# Последние времена ответа LLM: [(время наблюдения, секунды), ...]
+latencies: Deque[Tuple[float, float]] = deque(maxlen=500)
+
+# Момент, с которого нагрузка ниже порога восстановления (None - нагрузка выше)
+calm_since: Optional[float] = None
+
+# Фоновая задача оценки нагрузки
+controller_task: Optional[asyncio.Task] = None
+
+def get_limits() -> Dict[str, Any]:
+    """
+    Возвращает ограничения текущего уровня
+
+    Returns:
+        Словарь {history_window, max_tokens, fast_model, shed}
+    """
+    return LEVELS[current_level]
+
+def history_window(default: int) -> int:
+    """
+    Возвращает окно истории с учетом текущего уровня
+
+    Args:
+        default: Окно истории без ограничений
+
+    Returns:
+        Количество последних сообщений истории
+    """
+    window = LEVELS[current_level]["history_window"]
+    return default if window is None else min(default, window)
+
+def request_started() -> None:
+    """
+    Учитывает начало запроса к LLM
+    """
+    global inflight
+    inflight += 1
+
+def request_finished() -> None:
+    """
+    Учитывает окончание запроса к LLM (успешного, с ошибкой или отмененного)
+    """
+    global inflight
+    inflight = max(0, inflight - 1)
+
+def observe_latency(latency: float, now: Optional[float] = None) -> None:
+    """
+    Сохраняет время ответа LLM для расчета p95
+
+    Args:
+        latency: Время ответа в секундах
+        now: Момент наблюдения (time.monotonic)
+    """
+    latencies.append((time.monotonic() if now is None else now, latency))
+
+def latency_p95(now: float) -> float:
+    """
+    Считает p95 времени ответа LLM за последние latency_horizon секунд
+
+    Args:
+        now: Текущее время (time.monotonic)
+
+    Returns:
+        p95 в секундах (0, если ответов не было)
+    """
+    horizon = now - degradation_config["latency_horizon"]
+    while latencies and latencies[0][0] < horizon:
+        latencies.popleft()
+    if not latencies:
+        return 0.0
+    ordered = sorted(latency for _, latency in latencies)
+    return ordered[int(0.95 * (len(ordered) - 1))]
+
+def get_pressure(now: float) -> float:
+    """
+    Оценивает нагрузку как наибольшее отношение сигнала к целевому значению
+
+    Args:
+        now: Текущее время (time.monotonic)
+
+    Returns:
+        Нагрузка (1 - сигнал достиг целевого значения)
+    """
+    # Сглаженное ожидание учитывается, только пока в полосе есть очередь:
+    # без новых запросов оно не обновляется
+    waiting = lanes.lane_waiting.get(lanes.LANE_LLM, 0)
+    wait = lanes.lane_wait_average.get(lanes.LANE_LLM, 0.0) if waiting else 0.0
+    return max(
+        inflight / degradation_config["max_inflight"],
+        wait / degradation_config["max_wait"],
+        latency_p95(now) / degradation_config["max_p95"]
+    )
+
+def evaluate(now: Optional[float] = None) -> int:
+    """
+    Оценивает нагрузку и меняет уровень не более чем на одну ступень
+
+    Args:
+        now: Текущее время (time.monotonic)
+
+    Returns:
+        Текущий уровень
+    """
+    global current_level, calm_since
+    now = time.monotonic() if now is None else now
+    pressure = get_pressure(now)
+    metrics.set_gauge("degradation_pressure", round(pressure, 3))
+
+    level = current_level
+    if pressure >= 1.0:
+        calm_since = None
+        level = min(current_level + 1, int(degradation_config["max_level"]))
+    elif pressure < degradation_config["recover_below"]:
+        if calm_since is None:
+            calm_since = now
+        elif current_level > 0 and now - calm_since >= degradation_config["recovery_seconds"]:
+            level = current_level - 1
+            # Следующая ступень снимается после нового периода низкой нагрузки
+            calm_since = now
+    else:
+        calm_since = None
+
+    if level != current_level:
+        direction = "up" if level > current_level else "down"
+        logger.warning(f"Уровень деградации {current_level} -> {level} (нагрузка {pressure:.2f}): {LEVELS[level]}")
+        metrics.inc("degradation_transitions_total", direction=direction)
+        current_level = level
+    metrics.set_gauge("degradation_level", current_level)
+    return current_level
+
+def reset_degradation() -> None:
+    """
+    Возвращает контроллер в исходное состояние
+    """
+    global current_level, inflight, calm_since
+    current_level = 0
+    inflight = 0
+    calm_since = None
+    latencies.clear()
+    metrics.set_gauge("degradation_level", 0)
+
+async def _controller_loop() -> None:
+    """
+    Периодически оценивает нагрузку
+    """
+    while True:
+        await asyncio.sleep(degradation_config["interval"])
+        evaluate()
+
+def start_degradation(config: Optional[Dict[str, float]] = None) -> None:
+    """
+    Запускает контроллер деградации
+
+    Args:
+        config: Параметры в формате degradation_config
+    """
+    global controller_task
+    degradation_config.update(config or {})
+    degradation_config["max_level"] = min(int(degradation_config["max_level"]), len(LEVELS) - 1)
+    controller_task = asyncio.create_task(_controller_loop())
+    logger.info(f"Контроллер деградации: {degradation_config}")
+
+async def stop_degradation() -> None:
+    """
+    Останавливает контроллер деградации
+    """
+    global controller_task
+    if controller_task is not None:
+        controller_task.cancel()
+        try:
+            await controller_task
+        except asyncio.CancelledError:
+            pass
+        controller_task = None
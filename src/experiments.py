@@ -0,0 +1,643 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для A/B-экспериментов с моделями, версиями промптов и лимитом токенов
+
+Эксперимент делит чаты на варианты по хэшу (эксперимент, chat_id):
+чат всегда попадает в один и тот же вариант, в том числе после
+перезапуска. Вариант может заменить модель (model), директорию
+промптов стилей (prompts_dir - другая версия prompts/*.txt) и лимит
+токенов ответа (max_tokens). Разные эксперименты не могут менять
+один и тот же параметр, поэтому их варианты не смешиваются.
+
+Для каждого варианта считаются запросы, ошибки, токены, доля ответов,
+после которых пользователь написал снова в течение follow_up_window
+секунд, а распределения времени ответа и длины ответа хранятся
+в потоковых скетчах квантилей (QuantileSketch) фиксированного размера.
+Статистика периодически сохраняется в файл JSON и восстанавливается
+при запуске.
+
+Отчет со значимостью отличий от контрольного (первого) варианта:
+
+    python -m src.experiments report logs/experiments.json
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src import memory
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Параметры запроса, которые может менять вариант
+OVERRIDES = ("model", "prompts_dir", "max_tokens")
+
+# Относительная точность скетча квантилей
+SKETCH_ACCURACY = 0.01
+
+# Параметры учета
+experiments_config: Dict[str, float] = {
+    # Сообщение пользователя позже этого срока после ответа не считается продолжением (в секундах)
+    "follow_up_window": 600.0,
+    # Интервал сохранения статистики в файл (в секундах)
+    "interval": 60.0
+}
+
+# Наибольшее количество чатов в кэше вариантов (кэш очищается при переполнении)
+MAX_CACHED_CHATS = 100000
+
+# Эксперименты: {имя: [{"name", "weight", параметры OVERRIDES...}, ...]}
+experiments: Dict[str, List[Dict[str, Any]]] = {}
+
+# Доли экспериментов: {имя: [вариант, ...]}, вариант повторяется weight раз
+experiment_slots: Dict[str, List[Dict[str, Any]]] = {}
+
+# Кэш вариантов чатов: {chat_id: [(эксперимент, вариант), ...]}
+chat_variants: Dict[Any, List[Tuple[str, Dict[str, Any]]]] = {}
+
+# Статистика вариантов: {(эксперимент, вариант): {счетчики, latency, output_tokens}}
+variant_stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+# Последние ответы чатов для учета продолжений: {chat_id: время ответа (time.monotonic)}
+last_answers: Dict[Any, float] = {}
+
+# Путь к файлу статистики (None - статистика только в памяти)
+stats_path: Optional[str] = None
+
+# Фоновая задача сохранения статистики
+save_task: Optional[asyncio.Task] = None
+
+class QuantileSketch:
+    """
+    Потоковый скетч квантилей с относительной точностью (логарифмические корзины)
+
+    Значение v попадает в корзину ceil(log(v) / log(gamma)); квантиль
+    восстанавливается с относительной ошибкой не больше accuracy.
+    Размер скетча зависит от диапазона значений, а не от их количества,
+    скетчи одинаковой точности складываются (merge).
+    """
+
+    def __init__(self, accuracy: float = SKETCH_ACCURACY) -> None:
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # Количество значений в корзинах: {индекс: количество}
+        self.bins: Dict[int, int] = {}
+        # Количество нулевых (и отрицательных) значений
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float) -> None:
+        """
+        Добавляет значение
+
+        Args:
+            value: Значение
+        """
+        self.count += 1
+        self.total += value
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + 1
+
+    def bin_value(self, index: int) -> float:
+        """
+        Возвращает представительное значение корзины
+
+        Args:
+            index: Индекс корзины
+
+        Returns:
+            Значение с относительной ошибкой не больше accuracy
+        """
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        """
+        Возвращает квантиль
+
+        Args:
+            q: Уровень квантиля от 0 до 1
+
+        Returns:
+            Значение квантиля (0, если значений нет)
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                return self.bin_value(index)
+        return self.bin_value(max(self.bins))
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """
+        Добавляет значения другого скетча той же точности
+
+        Args:
+            other: Скетч
+        """
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Возвращает представление скетча для JSON
+
+        Returns:
+            Словарь {accuracy, zeros, count, total, bins}
+        """
+        return {
+            "accuracy": self.accuracy,
+            "zeros": self.zeros,
+            "count": self.count,
+            "total": self.total,
+            "bins": {str(index): count for index, count in self.bins.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        """
+        Восстанавливает скетч из представления to_dict
+
+        Args:
+            data: Словарь {accuracy, zeros, count, total, bins}
+
+        Returns:
+            Скетч
+        """
+        sketch = cls(data["accuracy"])
+        sketch.zeros = data["zeros"]
+        sketch.count = data["count"]
+        sketch.total = data["total"]
+        sketch.bins = {int(index): count for index, count in data["bins"].items()}
+        return sketch
+
+def _new_stats() -> Dict[str, Any]:
+    """
+    Создает пустую статистику варианта
+
+    Returns:
+        Словарь счетчиков и скетчей
+    """
+    return {
+        "requests": 0,
+        "errors": 0,
+        "shed": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "answers": 0,
+        "follow_ups": 0,
+        "latency": QuantileSketch(),
+        "output_tokens": QuantileSketch()
+    }
+
+def init_experiments(config: Dict[str, Any]) -> None:
+    """
+    Задает эксперименты
+
+    Формат: {эксперимент: {"variants": [{"name": ..., "weight": 1, "model": ..., ...}, ...]}}
+
+    Args:
+        config: Настройки экспериментов
+
+    Raises:
+        ValueError: Если у эксперимента меньше двух вариантов, вариант меняет
+            неизвестный параметр или два эксперимента меняют один параметр
+    """
+    parsed: Dict[str, List[Dict[str, Any]]] = {}
+    owners: Dict[str, str] = {}
+    for name, experiment in config.items():
+        variants = experiment.get("variants", [])
+        if len(variants) < 2:
+            raise ValueError(f"В эксперименте {name} должно быть не меньше двух вариантов")
+        for variant in variants:
+            unknown = set(variant) - {"name", "weight"} - set(OVERRIDES)
+            if unknown:
+                raise ValueError(f"Неизвестные параметры варианта {name}/{variant.get('name')}: {sorted(unknown)}")
+            for parameter in OVERRIDES:
+                if parameter in variant and owners.setdefault(parameter, name) != name:
+                    raise ValueError(f"Эксперименты {owners[parameter]} и {name} меняют один параметр {parameter}")
+        parsed[name] = [dict(variant, weight=int(variant.get("weight", 1))) for variant in variants]
+    experiments.clear()
+    experiments.update(parsed)
+    experiment_slots.clear()
+    chat_variants.clear()
+    for name, variants in experiments.items():
+        experiment_slots[name] = [variant for variant in variants for _ in range(variant["weight"])]
+        for variant in variants:
+            variant_stats.setdefault((name, variant["name"]), _new_stats())
+    logger.info(f"Эксперименты: {({name: [variant['name'] for variant in variants] for name, variants in experiments.items()})}")
+
+def load_experiments(path: str) -> None:
+    """
+    Загружает эксперименты из JSON-файла
+
+    Args:
+        path: Путь к JSON-файлу в формате init_experiments
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            init_experiments(json.load(file))
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке экспериментов из {path}: {e}")
+
+def assign_variant(experiment: str, chat_id: Any) -> Dict[str, Any]:
+    """
+    Определяет вариант эксперимента для чата
+
+    Args:
+        experiment: Имя эксперимента
+        chat_id: Идентификатор чата (ключ чата арендатора)
+
+    Returns:
+        Вариант {"name", "weight", параметры...}
+    """
+    slots = experiment_slots[experiment]
+    digest = hashlib.blake2b(f"{experiment}:{chat_id}".encode("utf-8"), digest_size=8).digest()
+    return slots[int.from_bytes(digest, "big") % len(slots)]
+
+def get_variants(chat_id: Any) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Возвращает варианты всех экспериментов для чата
+
+    Args:
+        chat_id: Идентификатор чата (None - служебный запрос)
+
+    Returns:
+        Список [(эксперимент, вариант), ...] (пустой, если экспериментов нет)
+    """
+    if not experiments or chat_id is None:
+        return []
+    variants = chat_variants.get(chat_id)
+    if variants is None:
+        if len(chat_variants) >= MAX_CACHED_CHATS:
+            chat_variants.clear()
+        variants = chat_variants[chat_id] = [(name, assign_variant(name, chat_id)) for name in experiments]
+    return variants
+
+def get_overrides(chat_id: Any) -> Dict[str, Any]:
+    """
+    Возвращает параметры запроса, которые меняют варианты чата
+
+    Args:
+        chat_id: Идентификатор чата (None - служебный запрос)
+
+    Returns:
+        Словарь {параметр: значение} из OVERRIDES
+    """
+    overrides: Dict[str, Any] = {}
+    for _, variant in get_variants(chat_id):
+        for parameter in OVERRIDES:
+            if parameter in variant:
+                overrides[parameter] = variant[parameter]
+    return overrides
+
+def record_request(
+    chat_id: Any,
+    latency: float,
+    completion_usage: Optional[Dict[str, Any]] = None,
+    error: bool = False,
+    shed: bool = False
+) -> None:
+    """
+    Учитывает запрос к LLM в статистике вариантов чата
+
+    Args:
+        chat_id: Идентификатор чата
+        latency: Время ответа в секундах
+        completion_usage: Расход токенов {prompt_tokens, completion_tokens}
+        error: Запрос завершился ошибкой
+        shed: Запрос не отправлен из-за перегрузки (degradation)
+    """
+    for name, variant in get_variants(chat_id):
+        stats = variant_stats[(name, variant["name"])]
+        stats["requests"] += 1
+        if error or shed:
+            stats["shed" if shed else "errors"] += 1
+            continue
+        completion_usage = completion_usage or {}
+        completion_tokens = completion_usage.get("completion_tokens", 0)
+        stats["prompt_tokens"] += completion_usage.get("prompt_tokens", 0)
+        stats["completion_tokens"] += completion_tokens
+        stats["latency"].add(latency)
+        stats["output_tokens"].add(completion_tokens)
+
+def on_message_added(chat_id: Any, role: str, content: str) -> None:
+    """
+    Учитывает ответы и продолжения диалога (подписчик memory.message_listeners)
+
+    Args:
+        chat_id: Идентификатор чата
+        role: Роль отправителя
+        content: Текст сообщения
+    """
+    if not experiments:
+        return
+    now = time.monotonic()
+    if role == "assistant":
+        last_answers[chat_id] = now
+        counter = "answers"
+    elif role == "user":
+        answered = last_answers.pop(chat_id, None)
+        if answered is None or now - answered > experiments_config["follow_up_window"]:
+            return
+        counter = "follow_ups"
+    else:
+        return
+    for name, variant in get_variants(chat_id):
+        variant_stats[(name, variant["name"])][counter] += 1
+
+def _sweep_answers(now: float) -> None:
+    """
+    Удаляет ответы, продолжение которых уже не учитывается
+
+    Args:
+        now: Текущее время (time.monotonic)
+    """
+    window = experiments_config["follow_up_window"]
+    for chat_id in [chat_id for chat_id, answered in last_answers.items() if now - answered > window]:
+        del last_answers[chat_id]
+
+def stats_to_dict() -> Dict[str, Any]:
+    """
+    Возвращает эксперименты и статистику вариантов для сохранения в JSON
+
+    Returns:
+        Словарь {experiments, stats: {эксперимент: {вариант: статистика}}}
+    """
+    stats: Dict[str, Dict[str, Any]] = {}
+    for (name, variant), values in variant_stats.items():
+        stats.setdefault(name, {})[variant] = {
+            key: value.to_dict() if isinstance(value, QuantileSketch) else value
+            for key, value in values.items()
+        }
+    return {"experiments": experiments, "stats": stats}
+
+def _restore_stats(path: str) -> None:
+    """
+    Добавляет сохраненную статистику к статистике в памяти
+
+    Args:
+        path: Путь к файлу статистики
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        saved = json.load(file)["stats"]
+    for name, variants in saved.items():
+        for variant, values in variants.items():
+            stats = variant_stats.setdefault((name, variant), _new_stats())
+            for key, value in values.items():
+                if isinstance(stats[key], QuantileSketch):
+                    stats[key].merge(QuantileSketch.from_dict(value))
+                else:
+                    stats[key] += value
+
+def _write_stats(path: str, data: Dict[str, Any]) -> None:
+    """
+    Записывает статистику в файл (через временный файл, чтобы не оставить его недописанным)
+
+    Args:
+        path: Путь к файлу статистики
+        data: Статистика (stats_to_dict)
+    """
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False)
+    os.replace(temporary, path)
+
+async def save_stats() -> None:
+    """
+    Сохраняет статистику в файл
+    """
+    _sweep_answers(time.monotonic())
+    if stats_path is None:
+        return
+    # Снимок собирается в цикле событий, запись в файл - в отдельном потоке
+    await asyncio.to_thread(_write_stats, stats_path, stats_to_dict())
+
+async def _save_loop(interval: float) -> None:
+    """
+    Периодически сохраняет статистику
+
+    Args:
+        interval: Интервал в секундах
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await save_stats()
+        except OSError as e:
+            logger.error(f"Ошибка при сохранении статистики экспериментов: {e}")
+
+def start_experiments(path: Optional[str] = None, config: Optional[Dict[str, float]] = None) -> None:
+    """
+    Включает сохранение статистики экспериментов
+
+    Args:
+        path: Путь к файлу статистики (None или пустая строка - статистика только в памяти)
+        config: Параметры в формате experiments_config
+    """
+    global stats_path, save_task
+    experiments_config.update(config or {})
+    # Пустой путь (EXPERIMENTS_STATS_PATH=) означает статистику только в памяти
+    stats_path = path or None
+    if path:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            _restore_stats(path)
+    save_task = asyncio.create_task(_save_loop(experiments_config["interval"]))
+    logger.info(f"Статистика экспериментов: {path or 'только в памяти'}")
+
+async def stop_experiments() -> None:
+    """
+    Останавливает периодическое сохранение и сохраняет статистику
+    """
+    global save_task
+    if save_task is not None:
+        save_task.cancel()
+        try:
+            await save_task
+        except asyncio.CancelledError:
+            pass
+        save_task = None
+    await save_stats()
+
+def proportion_p_value(successes_a: int, total_a: int, successes_b: int, total_b: int) -> float:
+    """
+    Двусторонний z-тест разности долей
+
+    Args:
+        successes_a: Успехи в группе A
+        total_a: Размер группы A
+        successes_b: Успехи в группе B
+        total_b: Размер группы B
+
+    Returns:
+        p-значение (1, если данных недостаточно)
+    """
+    if not total_a or not total_b:
+        return 1.0
+    pooled = (successes_a + successes_b) / (total_a + total_b)
+    variance = pooled * (1 - pooled) * (1 / total_a + 1 / total_b)
+    if variance <= 0:
+        return 1.0
+    z = (successes_a / total_a - successes_b / total_b) / math.sqrt(variance)
+    return math.erfc(abs(z) / math.sqrt(2))
+
+def mann_whitney_p_value(first: QuantileSketch, second: QuantileSketch) -> float:
+    """
+    Двусторонний тест Манна-Уитни по корзинам двух скетчей
+
+    Значения одной корзины считаются равными (связанные ранги), поэтому
+    тест учитывает сдвиг распределений с точностью скетча.
+
+    Args:
+        first: Скетч группы A
+        second: Скетч группы B
+
+    Returns:
+        p-значение (1, если данных недостаточно)
+    """
+    n1, n2 = first.count, second.count
+    if not n1 or not n2:
+        return 1.0
+    # Общие корзины по возрастанию, нулевые значения - первая группа
+    groups = [(first.zeros, second.zeros)] + [
+        (first.bins.get(index, 0), second.bins.get(index, 0))
+        for index in sorted(set(first.bins) | set(second.bins))
+    ]
+    rank_sum = 0.0
+    ties = 0.0
+    position = 0
+    for a, b in groups:
+        size = a + b
+        if not size:
+            continue
+        # Средний ранг значений корзины
+        rank_sum += a * (position + (size + 1) / 2)
+        ties += size ** 3 - size
+        position += size
+    u = rank_sum - n1 * (n1 + 1) / 2
+    total = n1 + n2
+    variance = n1 * n2 / 12 * ((total + 1) - ties / (total * (total - 1))) if total > 1 else 0.0
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2) / math.sqrt(variance)
+    return math.erfc(abs(z) / math.sqrt(2))
+
+def summarize(stats: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Считает показатели варианта
+
+    Args:
+        stats: Статистика варианта
+
+    Returns:
+        Словарь {requests, error_rate, shed_rate, p50, p90, p99, mean_output_tokens, follow_up_rate}
+    """
+    latency = stats["latency"]
+    succeeded = stats["requests"] - stats["errors"] - stats["shed"]
+    return {
+        "requests": stats["requests"],
+        "error_rate": stats["errors"] / stats["requests"] if stats["requests"] else 0.0,
+        "shed_rate": stats["shed"] / stats["requests"] if stats["requests"] else 0.0,
+        "p50": latency.quantile(0.5),
+        "p90": latency.quantile(0.9),
+        "p99": latency.quantile(0.99),
+        "mean_output_tokens": stats["completion_tokens"] / succeeded if succeeded else 0.0,
+        "follow_up_rate": stats["follow_ups"] / stats["answers"] if stats["answers"] else 0.0
+    }
+
+def compare(control: Dict[str, Any], variant: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Проверяет значимость отличий варианта от контрольного
+
+    Args:
+        control: Статистика контрольного варианта
+        variant: Статистика варианта
+
+    Returns:
+        p-значения {latency, output_tokens, error_rate, follow_up_rate}
+    """
+    return {
+        "latency": mann_whitney_p_value(control["latency"], variant["latency"]),
+        "output_tokens": mann_whitney_p_value(control["output_tokens"], variant["output_tokens"]),
+        "error_rate": proportion_p_value(control["errors"], control["requests"], variant["errors"], variant["requests"]),
+        "follow_up_rate": proportion_p_value(control["follow_ups"], control["answers"], variant["follow_ups"], variant["answers"])
+    }
+
+def report(path: str, alpha: float = 0.05) -> str:
+    """
+    Формирует отчет по сохраненной статистике
+
+    Args:
+        path: Путь к файлу статистики
+        alpha: Уровень значимости
+
+    Returns:
+        Текст отчета
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        saved = json.load(file)
+    lines = []
+    for name, variants in saved["experiments"].items():
+        lines.append(f"Эксперимент {name}")
+        lines.append(f"{'Вариант':<16}{'Запросы':>9}{'Ошибки':>9}{'Отказы':>9}{'p50, с':>9}{'p90, с':>9}"
+                     f"{'p99, с':>9}{'Токены':>9}{'Продолж.':>10}")
+        loaded = {}
+        for variant in variants:
+            values = dict(saved["stats"].get(name, {}).get(variant["name"], {}))
+            stats = _new_stats()
+            for key, value in values.items():
+                stats[key] = QuantileSketch.from_dict(value) if isinstance(stats[key], QuantileSketch) else value
+            loaded[variant["name"]] = stats
+            summary = summarize(stats)
+            lines.append(
+                f"{variant['name']:<16}{summary['requests']:>9}{summary['error_rate']:>9.1%}{summary['shed_rate']:>9.1%}"
+                f"{summary['p50']:>9.2f}{summary['p90']:>9.2f}{summary['p99']:>9.2f}{summary['mean_output_tokens']:>9.0f}"
+                f"{summary['follow_up_rate']:>10.1%}"
+            )
+        control_name = variants[0]["name"]
+        for variant in variants[1:]:
+            p_values = compare(loaded[control_name], loaded[variant["name"]])
+            verdict = ", ".join(
+                f"{metric} p={p:.3f}{' *' if p < alpha else ''}" for metric, p in p_values.items()
+            )
+            lines.append(f"{variant['name']} против {control_name}: {verdict}")
+        lines.append("")
+    lines.append(f"* - отличие значимо при уровне {alpha}")
+    return "\n".join(lines)
+
+def main() -> None:
+    """
+    Выводит отчет по экспериментам: python -m src.experiments report <файл статистики>
+    """
+    if len(sys.argv) != 3 or sys.argv[1] != "report":
+        print("Использование: python -m src.experiments report <файл статистики>")
+        sys.exit(1)
+    print(report(sys.argv[2]))
+
+# Продолжения диалога учитываются по изменениям истории
+memory.message_listeners.append(on_message_added)
+
+if __name__ == "__main__":
+    main()
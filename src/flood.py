@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для защиты от потока входящих сообщений
+
+Внешний промежуточный обработчик aiogram пропускает сообщение дальше,
+только если есть токены в корзинах пользователя и чата (алгоритм token
+bucket, как в rate_limit.py). Сообщения для LLM (не команды) проходят
+также через общую корзину, скорость которой снижается, когда растет
+время ожидания в полосе llm. Отклоненные сообщения не вызывают ни
+индикатор набора текста, ни запрос к LLM; пользователь получает
+короткий ответ о превышении лимита, не чаще одного раза в интервал.
+"""
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware, types
+
+from src import metrics
+from src.lanes import LANE_LLM, lane_wait_average
+from src.sender import send_answer
+from src.tenants import tenant_key
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Причины отклонения сообщения
+REASON_USER = "user"
+REASON_CHAT = "chat"
+REASON_GLOBAL = "global"
+
+# Ответ пользователю, превысившему лимит
+THROTTLE_TEXT = "Слишком много сообщений подряд. Пожалуйста, подождите немного и отправьте вопрос одним сообщением."
+
+# Параметры ограничений
+flood_config: Dict[str, float] = {
+    # Скорость пополнения (сообщений в секунду) и размер корзины пользователя
+    "user_rate": 0.5,
+    "user_capacity": 5,
+    # Скорость пополнения и размер корзины чата (в группах пишут несколько пользователей)
+    "chat_rate": 1.0,
+    "chat_capacity": 10,
+    # Скорость пополнения и размер общей корзины сообщений для LLM
+    "global_rate": 20.0,
+    "global_capacity": 40,
+    # Время ожидания в полосе llm (в секундах), выше которого общий лимит снижается
+    "target_wait": 1.0,
+    # Минимальная доля общей скорости при перегрузке
+    "min_factor": 0.1,
+    # Минимальный интервал между ответами о превышении лимита в одном чате (в секундах)
+    "reply_interval": 10.0,
+    # Интервал удаления простаивающих корзин (в секундах)
+    "sweep_interval": 60.0
+}
+
+# Корзины пользователей и чатов: {идентификатор: [токены, время обновления]}
+# Скорость и размер корзин общие и хранятся в flood_config, поэтому
+# на каждого пользователя хранятся только два числа
+user_buckets: Dict[int, List[float]] = {}
+chat_buckets: Dict[int, List[float]] = {}
+
+# Общая корзина сообщений для LLM: [токены, время обновления]
+global_bucket: List[float] = []
+
+# Время последнего ответа о превышении лимита: {chat_id: clock()}
+throttle_replies: Dict[int, float] = {}
+
+# Время последнего удаления простаивающих корзин
+last_sweep = 0.0
+
+# Источник текущего времени для корзин (в тестах подменяется)
+clock: Callable[[], float] = time.monotonic
+
+def init_flood(config: Optional[Dict[str, float]] = None) -> None:
+    """
+    Обновляет параметры ограничений и сбрасывает корзины
+
+    Args:
+        config: Параметры в формате flood_config
+    """
+    global last_sweep
+    flood_config.update(config or {})
+    user_buckets.clear()
+    chat_buckets.clear()
+    throttle_replies.clear()
+    last_sweep = clock()
+    global_bucket[:] = [flood_config["global_capacity"], last_sweep]
+    logger.info(f"Защита от потока сообщений: {flood_config}")
+
+def _take(buckets: Dict[int, List[float]], key: int, rate: float, capacity: float, now: float) -> bool:
+    """
+    Забирает токен из корзины, создавая ее при первом обращении
+
+    Args:
+        buckets: Корзины
+        key: Идентификатор пользователя или чата
+        rate: Скорость пополнения (токенов в секунду)
+        capacity: Размер корзины
+        now: Текущее время (clock)
+
+    Returns:
+        True, если токен получен
+    """
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = [capacity - 1, now]
+        return True
+    tokens = min(capacity, bucket[0] + max(0.0, now - bucket[1]) * rate)
+    bucket[1] = now
+    if tokens >= 1:
+        bucket[0] = tokens - 1
+        return True
+    bucket[0] = tokens
+    return False
+
+def global_factor() -> float:
+    """
+    Возвращает долю общей скорости с учетом времени ожидания в полосе llm
+
+    Returns:
+        1.0 без перегрузки, меньше при росте ожидания (не ниже min_factor)
+    """
+    wait = lane_wait_average.get(LANE_LLM, 0.0)
+    if wait <= flood_config["target_wait"]:
+        return 1.0
+    return max(flood_config["min_factor"], flood_config["target_wait"] / wait)
+
+def _take_global(now: float) -> bool:
+    """
+    Забирает токен из общей корзины сообщений для LLM
+
+    Args:
+        now: Текущее время (clock)
+
+    Returns:
+        True, если токен получен
+    """
+    if not global_bucket:
+        global_bucket[:] = [flood_config["global_capacity"], now]
+    factor = global_factor()
+    metrics.set_gauge("flood_global_factor", factor)
+    capacity = max(1.0, flood_config["global_capacity"] * factor)
+    elapsed = max(0.0, now - global_bucket[1])
+    tokens = min(capacity, global_bucket[0] + elapsed * flood_config["global_rate"] * factor)
+    global_bucket[1] = now
+    if tokens >= 1:
+        global_bucket[0] = tokens - 1
+        return True
+    global_bucket[0] = tokens
+    return False
+
+def sweep_idle(now: float) -> None:
+    """
+    Удаляет корзины, которые успели заполниться (их состояние совпадает с новыми)
+
+    Args:
+        now: Текущее время (clock)
+    """
+    global last_sweep
+    last_sweep = now
+    for buckets, rate, capacity in (
+        (user_buckets, flood_config["user_rate"], flood_config["user_capacity"]),
+        (chat_buckets, flood_config["chat_rate"], flood_config["chat_capacity"])
+    ):
+        idle = capacity / rate
+        for key in [key for key, bucket in buckets.items() if now - bucket[1] >= idle]:
+            del buckets[key]
+    for chat_id in [chat_id for chat_id, sent in throttle_replies.items() if now - sent >= flood_config["reply_interval"]]:
+        del throttle_replies[chat_id]
+    metrics.set_gauge("flood_buckets", len(user_buckets) + len(chat_buckets))
+
+def check_message(user_id: int, chat_id: int, to_llm: bool, now: Optional[float] = None) -> Optional[str]:
+    """
+    Проверяет, можно ли обработать сообщение
+
+    Args:
+        user_id: Идентификатор пользователя
+        chat_id: Идентификатор чата
+        to_llm: Сообщение будет передано LLM (не команда)
+        now: Текущее время (по умолчанию clock())
+
+    Returns:
+        None, если сообщение можно обработать, иначе причина отклонения
+    """
+    if now is None:
+        now = clock()
+    if now - last_sweep >= flood_config["sweep_interval"]:
+        sweep_idle(now)
+
+    # Отклоненное сообщение не расходует лимит: токены уже взятых корзин
+    # возвращаются, иначе отклонение по чату или общему лимиту съедало бы
+    # лимит пользователя
+    if not _take(user_buckets, user_id, flood_config["user_rate"], flood_config["user_capacity"], now):
+        return REASON_USER
+    if not _take(chat_buckets, chat_id, flood_config["chat_rate"], flood_config["chat_capacity"], now):
+        user_buckets[user_id][0] += 1
+        return REASON_CHAT
+    if to_llm and not _take_global(now):
+        user_buckets[user_id][0] += 1
+        chat_buckets[chat_id][0] += 1
+        return REASON_GLOBAL
+    return None
+
+class FloodMiddleware(BaseMiddleware):
+    """
+    Внешний промежуточный обработчик aiogram, отклоняющий поток сообщений
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: types.Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Пользователи и чаты разных арендаторов ограничиваются отдельно
+        user_id = tenant_key(event.from_user.id if event.from_user else event.chat.id)
+        chat_id = tenant_key(event.chat.id)
+        to_llm = not (event.text or "").startswith("/")
+        now = clock()
+        reason = check_message(user_id, chat_id, to_llm, now)
+        if reason is None:
+            return await handler(event, data)
+
+        metrics.inc("flood_dropped_total", reason=reason)
+        if now - throttle_replies.get(chat_id, -flood_config["reply_interval"]) >= flood_config["reply_interval"]:
+            throttle_replies[chat_id] = now
+            metrics.inc("flood_replies_total")
+            logger.info(f"Сообщения пользователя {user_id} в чате {chat_id} ограничены ({reason})")
+            await send_answer(event, THROTTLE_TEXT)
+        return None
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для пула заранее сгенерированных приветствий
+
+Фоновая задача поддерживает для каждого стиля несколько вариантов
+приветствия, в которых имя пользователя заменено меткой {user_name}.
+Команда /start берет готовый вариант из пула и подставляет имя,
+а к LLM обращается, только если пул стиля пуст.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from src import metrics
+from src.lanes import LANE_BACKGROUND, lane_slot
+from src.llm import generate_response, OVERLOADED_RESPONSE, ROUTE_FAST
+from src.prompts import SCENARIO_START
+from src.styles import STYLE_REGISTRY, load_style_prompt
+from src.tenants import DEFAULT_TENANT, current_tenant
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Метка, вместо которой подставляется имя пользователя
+USER_NAME_PLACEHOLDER = "{user_name}"
+
+# Промпт для генерации варианта приветствия
+GREETING_POOL_PROMPT = (
+    "Новый пользователь только что запустил бота. Поприветствуй его, представься как ассистент "
+    "компании ООО \"ТехноСервис\", кратко расскажи о компании и спроси, чем можешь помочь. "
+    "Ответ должен быть дружелюбным и профессиональным. Вместо имени пользователя напиши ровно "
+    f"один раз метку {USER_NAME_PLACEHOLDER} без изменений."
+)
+
+# Количество вариантов приветствия в пуле каждого стиля
+pool_size = 3
+
+# Время жизни варианта в пуле (в секундах): устаревшие варианты заменяются новыми
+MAX_GREETING_AGE = 6 * 3600
+
+# Интервал проверки пула, если его никто не опустошает (в секундах)
+REFILL_INTERVAL = 60.0
+
+# Пул приветствий: {стиль: deque([{"text": текст, "created": time.monotonic()}, ...])}
+greeting_pool: Dict[str, Deque[Dict[str, object]]] = {}
+
+# Фоновая задача пополнения пула
+refill_task: Optional[asyncio.Task] = None
+
+# Сигнал о том, что пул нужно пополнить раньше интервала
+refill_needed: Optional[asyncio.Event] = None
+
+def start_greeting_pool(size: int = 3) -> None:
+    """
+    Запускает фоновое пополнение пула приветствий
+
+    Args:
+        size: Количество вариантов приветствия на стиль (0 - пул выключен)
+    """
+    global pool_size, refill_task, refill_needed
+    if size <= 0:
+        return
+    pool_size = size
+    refill_needed = asyncio.Event()
+    refill_task = asyncio.create_task(_refill_loop())
+    logger.info(f"Пул приветствий запущен: {size} вариантов на стиль")
+
+async def stop_greeting_pool() -> None:
+    """
+    Останавливает фоновое пополнение пула приветствий
+    """
+    global refill_task
+    if refill_task is None:
+        return
+    refill_task.cancel()
+    try:
+        await refill_task
+    except asyncio.CancelledError:
+        pass
+    refill_task = None
+
+def take_greeting(style: str) -> Optional[str]:
+    """
+    Берет из пула вариант приветствия
+
+    Args:
+        style: Стиль ответа
+
+    Returns:
+        Текст приветствия с меткой {user_name} или None, если пул стиля пуст
+    """
+    if current_tenant.get() != DEFAULT_TENANT:
+        # Пул заполняется промптами основного бота: другие арендаторы
+        # получают приветствие по своим промптам
+        return None
+    _drop_stale(style)
+    pool = greeting_pool.get(style)
+    if not pool:
+        metrics.inc("greeting_pool_misses_total", style=style)
+        _update_hit_rate()
+        if refill_needed is not None:
+            refill_needed.set()
+        return None
+
+    entry = pool.popleft()
+    metrics.inc("greeting_pool_hits_total", style=style)
+    metrics.set_gauge("greeting_pool_size", len(pool), style=style)
+    _update_hit_rate()
+    if refill_needed is not None:
+        refill_needed.set()
+    return entry["text"]
+
+def _update_hit_rate() -> None:
+    """
+    Обновляет долю запросов /start, обслуженных из пула
+    """
+    hits = sum(metrics.get_counter("greeting_pool_hits_total", style=style) for style in STYLE_REGISTRY)
+    misses = sum(metrics.get_counter("greeting_pool_misses_total", style=style) for style in STYLE_REGISTRY)
+    metrics.set_gauge("greeting_pool_hit_rate", hits / (hits + misses))
+
+def _drop_stale(style: str) -> None:
+    """
+    Удаляет из пула стиля устаревшие варианты
+
+    Args:
+        style: Стиль ответа
+    """
+    pool = greeting_pool.get(style)
+    now = time.monotonic()
+    while pool and now - pool[0]["created"] > MAX_GREETING_AGE:
+        pool.popleft()
+        metrics.inc("greeting_pool_expired_total", style=style)
+
+async def generate_greeting(style: str) -> Optional[str]:
+    """
+    Генерирует вариант приветствия с меткой имени пользователя
+
+    Args:
+        style: Стиль ответа
+
+    Returns:
+        Текст с меткой {user_name} или None, если вариант не подходит
+    """
+    messages = []
+    system_prompt = load_style_prompt(style)
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": GREETING_POOL_PROMPT})
+
+    response = await generate_response(messages, route=ROUTE_FAST, style=style, scenario=SCENARIO_START)
+    if not response or response == OVERLOADED_RESPONSE or response.count(USER_NAME_PLACEHOLDER) != 1:
+        # Без метки нельзя подставить имя: вариант отбрасывается
+        metrics.inc("greeting_pool_rejected_total", style=style)
+        return None
+    return response
+
+async def refill_pool() -> bool:
+    """
+    Дополняет пул каждого стиля до нужного размера
+
+    Варианты генерируются по одному, чтобы не создавать всплеск
+    запросов к LLM одновременно с запросами пользователей.
+
+    Returns:
+        True, если пулы всех стилей заполнены
+    """
+    filled = True
+    for style in STYLE_REGISTRY:
+        pool = greeting_pool.setdefault(style, deque())
+        _drop_stale(style)
+        # Количество попыток ограничено, чтобы не повторять запросы бесконечно
+        attempts = 0
+        while len(pool) < pool_size and attempts < pool_size * 2:
+            attempts += 1
+            async with lane_slot(LANE_BACKGROUND):
+                text = await generate_greeting(style)
+            if text:
+                pool.append({"text": text, "created": time.monotonic()})
+        metrics.set_gauge("greeting_pool_size", len(pool), style=style)
+        filled = filled and len(pool) >= pool_size
+    return filled
+
+async def _refill_loop() -> None:
+    """
+    Пополняет пул при его опустошении или по интервалу
+    """
+    while True:
+        refill_needed.clear()
+        try:
+            filled = await refill_pool()
+        except Exception as e:
+            logger.error(f"Ошибка при пополнении пула приветствий: {e}")
+            filled = False
+        if not filled:
+            # LLM недоступна или отвечает без метки: повторяем не раньше интервала
+            await asyncio.sleep(REFILL_INTERVAL)
+            continue
+        try:
+            await asyncio.wait_for(refill_needed.wait(), REFILL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
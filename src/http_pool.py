@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для настройки пулов HTTP-соединений к OpenRouter и Telegram
+
+Клиент LLM (httpx через SDK openai) и сессия бота (aiohttp через aiogram)
+получают пулы с долгим keepalive; соединитель сессии бота кэширует DNS
+(ttl_dns_cache). Глобальное разрешение имен процесса не подменяется.
+Фоновая задача периодически обращается к серверам в периоды простоя,
+чтобы первый запрос пользователя не тратил время на DNS, TCP и TLS.
+Доля повторно использованных соединений попадает в метрики.
+"""
+import asyncio
+import importlib.util
+import logging
+import ssl
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import certifi
+from aiohttp import ClientSession, TCPConnector, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram import __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+
+from src import metrics
+from src.lanes import LANE_BACKGROUND, lane_slot
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Цели запросов для метрик
+TARGET_LLM = "llm"
+TARGET_TELEGRAM = "telegram"
+
+# Параметры пулов соединений
+pool_config: Dict[str, Any] = {
+    # Максимальное количество соединений в пуле
+    "max_connections": 20,
+    # Максимальное количество простаивающих соединений
+    "max_keepalive": 10,
+    # Время жизни простаивающего соединения (в секундах)
+    "keepalive_expiry": 120.0,
+    # Время хранения адресов в кэше DNS соединителя сессии бота (в секундах, 0 - без кэша)
+    "dns_ttl": 300.0,
+    # HTTP/2 для клиента LLM (нужен пакет h2)
+    "http2": False
+}
+
+# Время последнего запроса к цели: {цель: time.monotonic()}
+last_request_at: Dict[str, float] = {}
+
+# HTTP-клиент LLM, созданный create_llm_http_client
+llm_http_client = None
+
+# Фоновая задача прогрева соединений
+warmup_task: Optional[asyncio.Task] = None
+
+def init_http_pool(config: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Обновляет параметры пулов
+
+    Args:
+        config: Параметры в формате pool_config
+    """
+    pool_config.update(config or {})
+    logger.info(f"Пулы HTTP-соединений: {pool_config}")
+
+def record_request(target: str) -> None:
+    """
+    Учитывает запрос к цели и обновляет долю повторного использования соединений
+
+    Args:
+        target: Цель запроса (llm, telegram)
+    """
+    last_request_at[target] = time.monotonic()
+    metrics.inc("http_requests_total", target=target)
+    _update_reuse_rate(target)
+
+def record_connection(target: str) -> None:
+    """
+    Учитывает новое соединение с целью
+
+    Args:
+        target: Цель запроса (llm, telegram)
+    """
+    metrics.inc("http_connections_opened_total", target=target)
+    _update_reuse_rate(target)
+
+def _update_reuse_rate(target: str) -> None:
+    """
+    Обновляет долю запросов, выполненных через уже открытое соединение
+
+    Args:
+        target: Цель запроса (llm, telegram)
+    """
+    requests = metrics.get_counter("http_requests_total", target=target)
+    if requests:
+        opened = metrics.get_counter("http_connections_opened_total", target=target)
+        metrics.set_gauge("http_connection_reuse_rate", max(0.0, 1 - opened / requests), target=target)
+
+def create_llm_http_client():
+    """
+    Создает HTTP-клиент для SDK openai с настроенным пулом соединений
+
+    Returns:
+        Клиент httpx, совместимый с параметром http_client клиента OpenAI
+    """
+    from openai import DEFAULT_CONNECTION_LIMITS, DefaultHttpxClient
+
+    global llm_http_client
+    # Класс лимитов берется из того же пакета httpx, что использует SDK
+    limits = type(DEFAULT_CONNECTION_LIMITS)(
+        max_connections=pool_config["max_connections"],
+        max_keepalive_connections=pool_config["max_keepalive"],
+        keepalive_expiry=pool_config["keepalive_expiry"]
+    )
+    http2 = pool_config["http2"]
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 недоступен: не установлен пакет h2")
+        http2 = False
+
+    def trace(event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            record_connection(TARGET_LLM)
+
+    def on_request(request) -> None:
+        record_request(TARGET_LLM)
+        request.extensions["trace"] = trace
+
+    llm_http_client = DefaultHttpxClient(limits=limits, http2=http2, event_hooks={"request": [on_request]})
+    return llm_http_client
+
+class PooledAiohttpSession(AiohttpSession):
+    """
+    Сессия aiogram с настроенным соединителем и учетом новых соединений
+
+    Сессия aiohttp создается в create_session и закрывается в close -
+    через эти методы к ней обращаются все запросы aiogram.
+    """
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.client_session: Optional[ClientSession] = None
+
+    async def create_session(self) -> ClientSession:
+        if self.client_session is None or self.client_session.closed:
+            trace_config = TraceConfig()
+            trace_config.on_request_start.append(_on_telegram_request)
+            trace_config.on_connection_create_end.append(_on_telegram_connection)
+            connector = TCPConnector(
+                ssl=ssl.create_default_context(cafile=certifi.where()),
+                limit=pool_config["max_connections"],
+                ttl_dns_cache=int(pool_config["dns_ttl"]) or None,
+                use_dns_cache=pool_config["dns_ttl"] > 0,
+                keepalive_timeout=pool_config["keepalive_expiry"]
+            )
+            self.client_session = ClientSession(
+                connector=connector,
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[trace_config]
+            )
+        return self.client_session
+
+    async def close(self) -> None:
+        if self.client_session is not None and not self.client_session.closed:
+            await self.client_session.close()
+        await super().close()
+
+async def _on_telegram_request(session, context, params) -> None:
+    """Учитывает запрос к Telegram"""
+    record_request(TARGET_TELEGRAM)
+
+async def _on_telegram_connection(session, context, params) -> None:
+    """Учитывает новое соединение с Telegram"""
+    record_connection(TARGET_TELEGRAM)
+
+def create_bot_session(api_url: Optional[str] = None) -> AiohttpSession:
+    """
+    Создает сессию бота с настроенным пулом соединений
+
+    Args:
+        api_url: Адрес собственного сервера Bot API
+
+    Returns:
+        Сессия aiogram
+    """
+    if api_url:
+        from aiogram.client.telegram import TelegramAPIServer
+        return PooledAiohttpSession(api=TelegramAPIServer.from_base(api_url))
+    return PooledAiohttpSession()
+
+async def ping_llm(url: str) -> None:
+    """
+    Легкий запрос к API LLM через пул клиента для прогрева соединения
+
+    Args:
+        url: Адрес для запроса HEAD (например, список моделей)
+    """
+    if llm_http_client is not None:
+        await asyncio.to_thread(llm_http_client.head, url)
+
+def start_warmup(pings: Dict[str, Callable[[], Awaitable[Any]]], interval: float = 60.0) -> None:
+    """
+    Запускает периодический прогрев соединений
+
+    Если к цели не было запросов дольше interval, выполняется легкий
+    запрос, чтобы соединение в пуле оставалось открытым.
+
+    Args:
+        pings: Легкие запросы к целям: {цель: корутина запроса}
+        interval: Интервал проверки в секундах
+    """
+    global warmup_task
+    if interval <= 0 or not pings:
+        return
+    warmup_task = asyncio.create_task(_warmup_loop(pings, interval))
+    logger.info(f"Прогрев соединений каждые {interval:.0f} с: {', '.join(pings)}")
+
+async def stop_warmup() -> None:
+    """
+    Останавливает прогрев соединений
+    """
+    global warmup_task
+    if warmup_task is None:
+        return
+    warmup_task.cancel()
+    try:
+        await warmup_task
+    except asyncio.CancelledError:
+        pass
+    warmup_task = None
+
+async def warmup_once(pings: Dict[str, Callable[[], Awaitable[Any]]], interval: float) -> None:
+    """
+    Прогревает соединения с целями, к которым давно не было запросов
+
+    Args:
+        pings: Легкие запросы к целям: {цель: корутина запроса}
+        interval: Время простоя, после которого нужен прогрев (в секундах)
+    """
+    now = time.monotonic()
+    for target, ping in pings.items():
+        if now - last_request_at.get(target, 0.0) < interval:
+            continue
+        try:
+            async with lane_slot(LANE_BACKGROUND):
+                await ping()
+            metrics.inc("http_warmup_total", target=target)
+        except Exception as e:
+            # Прогрев не критичен: ошибка только записывается в лог
+            logger.warning(f"Не удалось прогреть соединение {target}: {e}")
+
+async def _warmup_loop(pings: Dict[str, Callable[[], Awaitable[Any]]], interval: float) -> None:
+    """
+    Периодически прогревает соединения
+
+    Args:
+        pings: Легкие запросы к целям: {цель: корутина запроса}
+        interval: Интервал проверки в секундах
+    """
+    while True:
+        await warmup_once(pings, interval)
+        await asyncio.sleep(interval)
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для анализа памяти, занятой состоянием чатов, в работающем процессе
+
+Отчет содержит глубокий размер структур (memory.dialogs, styles.user_styles
+и др.), количество чатов, распределение длины истории и самые тяжелые
+чаты. Большие словари оцениваются по случайной выборке, а обход
+прерывается передачей управления циклу событий, чтобы отчет не
+задерживал обработку сообщений.
+
+Снимки tracemalloc делаются по запросу и сравниваются между собой.
+Отчеты доступны через локальный HTTP-эндпоинт администратора и команду:
+
+    python -m src.introspection memory --top 10
+    python -m src.introspection snapshot before
+    python -m src.introspection diff before after
+
+Через тот же эндпоинт запускается рассылка (broadcast) и запрашивается
+ее прогресс:
+
+    python -m src.introspection broadcast "Текст объявления" --badges
+    python -m src.introspection broadcast-status
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import tracemalloc
+import urllib.request
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+from src import broadcast, context, flood, memory, styles
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Количество элементов, после обработки которых управление передается циклу событий
+YIELD_EVERY = 500
+
+# Во сколько раз кандидатов в самые тяжелые чаты больше, чем чатов в отчете:
+# половина - самые длинные истории, половина - случайная выборка остальных
+# (короткая история с длинными сообщениями может весить больше длинной)
+TOP_CANDIDATES_FACTOR = 10
+
+# Структуры состояния чатов: {название: функция, возвращающая структуру}
+STRUCTURES: Dict[str, Callable[[], Any]] = {
+    "memory.dialogs": lambda: memory.dialogs,
+    "memory.first_bot_message_sent": lambda: memory.first_bot_message_sent,
+    "styles.user_styles": lambda: styles.user_styles,
+    "context.chat_contexts": lambda: context.chat_contexts,
+    "flood.user_buckets": lambda: flood.user_buckets,
+    "flood.chat_buckets": lambda: flood.chat_buckets
+}
+
+# Снимки tracemalloc: {название: снимок}
+snapshots: Dict[str, tracemalloc.Snapshot] = {}
+
+# Сервер эндпоинта администратора
+admin_runner: Optional[web.AppRunner] = None
+
+def deep_size(obj: Any, seen: Optional[set] = None) -> int:
+    """
+    Вычисляет размер объекта вместе с вложенными контейнерами и строками
+
+    Args:
+        obj: Объект
+        seen: Идентификаторы уже учтенных объектов (общие объекты учитываются один раз)
+
+    Returns:
+        Размер в байтах
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == "deque":
+        for item in obj:
+            size += deep_size(item, seen)
+    return size
+
+async def structure_size(structure: Any, sample_size: int) -> Dict[str, Any]:
+    """
+    Оценивает глубокий размер структуры
+
+    Если элементов больше sample_size, размер оценивается по случайной
+    выборке элементов.
+
+    Args:
+        structure: Словарь или множество
+        sample_size: Максимальное количество обходимых элементов
+
+    Returns:
+        Словарь {entries, bytes, sampled}
+    """
+    # Копия ключей защищает обход от изменения структуры между передачами управления
+    keys = list(structure)
+    sampled = len(keys) > sample_size
+    if sampled:
+        keys = random.sample(keys, sample_size)
+
+    seen: set = set()
+    entries_size = 0
+    for i, key in enumerate(keys):
+        entries_size += deep_size(key, seen)
+        if isinstance(structure, dict):
+            entries_size += deep_size(structure.get(key), seen)
+        if i % YIELD_EVERY == YIELD_EVERY - 1:
+            await asyncio.sleep(0)
+
+    if sampled:
+        entries_size = int(entries_size / len(keys) * len(structure))
+    return {"entries": len(structure), "bytes": sys.getsizeof(structure) + entries_size, "sampled": sampled}
+
+def _percentile(values: List[int], fraction: float) -> int:
+    """
+    Возвращает перцентиль отсортированного списка
+
+    Args:
+        values: Отсортированные значения
+        fraction: Доля (0.5 - медиана)
+
+    Returns:
+        Значение перцентиля (0 для пустого списка)
+    """
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def memory_report(top: int = 10, sample_size: int = 1000) -> Dict[str, Any]:
+    """
+    Формирует отчет о памяти, занятой состоянием чатов
+
+    Args:
+        top: Количество самых тяжелых чатов в отчете (глубокий размер
+            считается для top * TOP_CANDIDATES_FACTOR кандидатов)
+        sample_size: Максимальное количество элементов, обходимых в каждой структуре
+
+    Returns:
+        Словарь {structures, chats, history_length, top_chats}
+    """
+    structures = {}
+    for name, getter in STRUCTURES.items():
+        structures[name] = await structure_size(getter(), sample_size)
+
+    # Длины истории: только len, поэтому обходятся все чаты
+    lengths = []
+    for i, (chat_id, history) in enumerate(list(memory.dialogs.items())):
+        lengths.append((len(history), chat_id))
+        if i % YIELD_EVERY == YIELD_EVERY - 1:
+            await asyncio.sleep(0)
+    sorted_lengths = sorted(length for length, _ in lengths)
+
+    # Глубокий размер считается для кандидатов: самых длинных историй
+    # и случайной выборки остальных чатов, в отчет попадают самые тяжелые
+    half = top * TOP_CANDIDATES_FACTOR // 2
+    by_length = sorted(lengths, key=lambda item: item[0], reverse=True)
+    rest = by_length[half:]
+    candidates = by_length[:half] + random.sample(rest, min(half, len(rest)))
+    top_chats = []
+    for i, (length, chat_id) in enumerate(candidates):
+        history = memory.dialogs.get(chat_id, [])
+        top_chats.append({"chat_id": chat_id, "messages": length, "bytes": deep_size(history)})
+        if i % YIELD_EVERY == YIELD_EVERY - 1:
+            await asyncio.sleep(0)
+    top_chats.sort(key=lambda chat: chat["bytes"], reverse=True)
+    del top_chats[top:]
+
+    return {
+        "structures": structures,
+        "chats": len(memory.dialogs),
+        "history_length": {
+            "p50": _percentile(sorted_lengths, 0.5),
+            "p90": _percentile(sorted_lengths, 0.9),
+            "p99": _percentile(sorted_lengths, 0.99),
+            "max": sorted_lengths[-1] if sorted_lengths else 0,
+            "total": sum(sorted_lengths)
+        },
+        "top_chats": top_chats
+    }
+
+def start_tracing(frames: int = 10) -> None:
+    """
+    Включает отслеживание выделений памяти tracemalloc
+
+    Args:
+        frames: Глубина стека, сохраняемая для каждого выделения
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info(f"Отслеживание памяти tracemalloc включено ({frames} кадров)")
+
+async def take_snapshot(name: str) -> Dict[str, Any]:
+    """
+    Делает снимок выделений памяти
+
+    Args:
+        name: Название снимка
+
+    Returns:
+        Словарь {name, traced_bytes, blocks}
+    """
+    start_tracing()
+    snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+    snapshots[name] = snapshot
+    traced = sum(trace.size for trace in snapshot.traces)
+    return {"name": name, "traced_bytes": traced, "blocks": len(snapshot.traces)}
+
+async def diff_snapshots(first: str, second: str, top: int = 10) -> List[Dict[str, Any]]:
+    """
+    Сравнивает два снимка выделений памяти
+
+    Args:
+        first: Название более раннего снимка
+        second: Название более позднего снимка
+        top: Количество строк с наибольшим изменением
+
+    Returns:
+        Список {location, size_diff, size, count_diff}
+    """
+    if first not in snapshots or second not in snapshots:
+        raise KeyError(f"Нет снимка {first if first not in snapshots else second}")
+    stats = await asyncio.to_thread(snapshots[second].compare_to, snapshots[first], "lineno")
+    return [
+        {
+            "location": str(stat.traceback[0]),
+            "size_diff": stat.size_diff,
+            "size": stat.size,
+            "count_diff": stat.count_diff
+        }
+        for stat in stats[:top]
+    ]
+
+async def _handle_memory(request: web.Request) -> web.Response:
+    """Обработчик GET /memory?top=N&sample=N"""
+    report = await memory_report(int(request.query.get("top", 10)), int(request.query.get("sample", 1000)))
+    return web.json_response(report, dumps=_dumps)
+
+async def _handle_snapshot(request: web.Request) -> web.Response:
+    """Обработчик POST /tracemalloc/snapshot?name=..."""
+    return web.json_response(await take_snapshot(request.query.get("name", "latest")), dumps=_dumps)
+
+async def _handle_diff(request: web.Request) -> web.Response:
+    """Обработчик GET /tracemalloc/diff?first=...&second=...&top=N"""
+    try:
+        diff = await diff_snapshots(request.query["first"], request.query["second"], int(request.query.get("top", 10)))
+    except KeyError as e:
+        return web.json_response({"error": str(e)}, status=404, dumps=_dumps)
+    return web.json_response(diff, dumps=_dumps)
+
+async def _handle_broadcast_start(request: web.Request) -> web.Response:
+    """Обработчик POST /broadcast с телом {text, variants, badges, style}"""
+    body = await request.json()
+    try:
+        broadcast.start_broadcast(
+            body["text"],
+            body.get("variants"),
+            bool(body.get("badges", False)),
+            body.get("style")
+        )
+    except KeyError as e:
+        return web.json_response({"error": f"Не задан параметр {e}"}, status=400, dumps=_dumps)
+    except RuntimeError as e:
+        return web.json_response({"error": str(e)}, status=409, dumps=_dumps)
+    return web.json_response(broadcast.get_progress(), dumps=_dumps)
+
+async def _handle_broadcast_progress(request: web.Request) -> web.Response:
+    """Обработчик GET /broadcast"""
+    return web.json_response(broadcast.get_progress(), dumps=_dumps)
+
+async def _handle_broadcast_stop(request: web.Request) -> web.Response:
+    """Обработчик POST /broadcast/stop"""
+    await broadcast.stop_broadcast()
+    return web.json_response(broadcast.get_progress(), dumps=_dumps)
+
+def _dumps(data: Any) -> str:
+    """Кодирует ответ эндпоинта в JSON (ключи-числа и кириллица как есть)"""
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+async def start_admin_server(host: str = "127.0.0.1", port: int = 8090) -> None:
+    """
+    Запускает локальный HTTP-эндпоинт администратора
+
+    Args:
+        host: Адрес (по умолчанию только локальный)
+        port: Порт
+    """
+    global admin_runner
+    app = web.Application()
+    app.router.add_get("/memory", _handle_memory)
+    app.router.add_post("/tracemalloc/snapshot", _handle_snapshot)
+    app.router.add_get("/tracemalloc/diff", _handle_diff)
+    app.router.add_post("/broadcast", _handle_broadcast_start)
+    app.router.add_get("/broadcast", _handle_broadcast_progress)
+    app.router.add_post("/broadcast/stop", _handle_broadcast_stop)
+    admin_runner = web.AppRunner(app, access_log=None)
+    await admin_runner.setup()
+    await web.TCPSite(admin_runner, host, port).start()
+    logger.info(f"Эндпоинт администратора: http://{host}:{port}")
+
+async def stop_admin_server() -> None:
+    """
+    Останавливает HTTP-эндпоинт администратора
+    """
+    global admin_runner
+    if admin_runner is not None:
+        await admin_runner.cleanup()
+        admin_runner = None
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Команда для запроса отчетов у работающего бота
+
+    Args:
+        argv: Аргументы командной строки
+    """
+    parser = argparse.ArgumentParser(description="Анализ памяти работающего бота")
+    parser.add_argument("--url", default="http://127.0.0.1:8090", help="Адрес эндпоинта администратора")
+    commands = parser.add_subparsers(dest="command", required=True)
+    memory_command = commands.add_parser("memory", help="Отчет о памяти состояния чатов")
+    memory_command.add_argument("--top", type=int, default=10)
+    memory_command.add_argument("--sample", type=int, default=1000)
+    snapshot_command = commands.add_parser("snapshot", help="Снимок tracemalloc")
+    snapshot_command.add_argument("name")
+    diff_command = commands.add_parser("diff", help="Сравнение двух снимков tracemalloc")
+    diff_command.add_argument("first")
+    diff_command.add_argument("second")
+    diff_command.add_argument("--top", type=int, default=10)
+    broadcast_command = commands.add_parser("broadcast", help="Рассылка всем чатам")
+    broadcast_command.add_argument("text")
+    broadcast_command.add_argument("--badges", action="store_true", help="Начинать текст с метки стиля чата")
+    broadcast_command.add_argument("--style", help="Только чаты с этим стилем")
+    broadcast_command.add_argument("--variants", help="Файл JSON с текстами для стилей {стиль: текст}")
+    commands.add_parser("broadcast-status", help="Прогресс рассылки")
+    commands.add_parser("broadcast-stop", help="Остановка рассылки с сохранением прогресса")
+    args = parser.parse_args(argv)
+
+    if args.command == "memory":
+        request = urllib.request.Request(f"{args.url}/memory?top={args.top}&sample={args.sample}")
+    elif args.command == "snapshot":
+        request = urllib.request.Request(f"{args.url}/tracemalloc/snapshot?name={args.name}", method="POST")
+    elif args.command == "broadcast":
+        variants = None
+        if args.variants:
+            with open(args.variants, "r", encoding="utf-8") as file:
+                variants = json.load(file)
+        body = {"text": args.text, "variants": variants, "badges": args.badges, "style": args.style}
+        request = urllib.request.Request(
+            f"{args.url}/broadcast", data=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST"
+        )
+    elif args.command == "broadcast-status":
+        request = urllib.request.Request(f"{args.url}/broadcast")
+    elif args.command == "broadcast-stop":
+        request = urllib.request.Request(f"{args.url}/broadcast/stop", method="POST")
+    else:
+        request = urllib.request.Request(
+            f"{args.url}/tracemalloc/diff?first={args.first}&second={args.second}&top={args.top}"
+        )
+    with urllib.request.urlopen(request, timeout=60) as response:
+        print(json.dumps(json.loads(response.read()), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для журнала диалогов (для анализа вне бота)
+
+Каждое сообщение, добавленное в историю (memory.add_message), ставится
+в ограниченную очередь без ожидания; если очередь заполнена, запись
+отбрасывается и учитывается в метриках. Фоновая задача записывает
+очередь в сегменты - файлы JSONL, сжатые gzip. Каждая пачка записей
+сжимается отдельным блоком gzip, поэтому сегмент можно читать потоком,
+в том числе пока он еще дописывается.
+
+Сегмент закрывается по размеру или по времени, после чего в индекс
+(index.jsonl) добавляется строка с именем файла, временем первой
+и последней записи и количеством записей. По индексу read_journal
+выбирает только сегменты нужного интервала.
+"""
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from src import memory, metrics
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Имя файла индекса в директории журнала
+INDEX_FILE = "index.jsonl"
+
+# Максимальное количество записей, сжимаемых одним блоком
+MAX_BATCH = 500
+
+# Параметры журнала
+journal_config: Dict[str, Any] = {
+    # Директория сегментов
+    "directory": "logs/journal",
+    # Размер сегмента до сжатия, после которого он закрывается (в байтах)
+    "max_bytes": 64 * 1024 * 1024,
+    # Время, после которого сегмент закрывается (в секундах)
+    "max_age": 3600.0,
+    # Максимальное количество записей в очереди
+    "queue_size": 10000
+}
+
+# Очередь записей (None - журнал выключен)
+# Значение None в очереди - метка остановки задачи записи
+journal_queue: Optional[asyncio.Queue] = None
+
+# Фоновая задача записи
+writer_task: Optional[asyncio.Task] = None
+
+# Текущий сегмент: {"path", "opened", "first_ts", "last_ts", "records", "raw_bytes"}
+# Изменяется только задачей записи (в отдельном потоке, по одной пачке за раз)
+segment: Optional[Dict[str, Any]] = None
+
+# Количество сегментов, открытых процессом
+segment_number = 0
+
+def on_message_added(chat_id: int, role: str, content: str) -> None:
+    """
+    Ставит сообщение в очередь журнала (вызывается из add_message)
+
+    Функция не ждет и не обращается к диску: при заполненной очереди
+    запись отбрасывается.
+
+    Args:
+        chat_id: Идентификатор чата
+        role: Роль отправителя
+        content: Текст сообщения
+    """
+    if journal_queue is None:
+        return
+    try:
+        journal_queue.put_nowait({"ts": round(time.time(), 3), "chat_id": chat_id, "role": role, "content": content})
+    except asyncio.QueueFull:
+        metrics.inc("journal_dropped_total")
+
+def start_journal(config: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Включает журнал диалогов
+
+    Args:
+        config: Параметры в формате journal_config
+    """
+    global journal_queue, writer_task
+    journal_config.update(config or {})
+    os.makedirs(journal_config["directory"], exist_ok=True)
+    journal_queue = asyncio.Queue(maxsize=journal_config["queue_size"])
+    writer_task = asyncio.create_task(_writer_loop())
+    if on_message_added not in memory.message_listeners:
+        memory.message_listeners.append(on_message_added)
+    logger.info(f"Журнал диалогов: {journal_config['directory']}")
+
+async def stop_journal() -> None:
+    """
+    Записывает оставшиеся записи, закрывает сегмент и выключает журнал
+    """
+    global journal_queue, writer_task
+    if on_message_added in memory.message_listeners:
+        memory.message_listeners.remove(on_message_added)
+    if writer_task is not None:
+        # Отмена не останавливает запись, уже выполняющуюся в потоке, поэтому
+        # задача не отменяется: метка остановки встает в очередь последней,
+        # задача записывает все записи перед ней, закрывает сегмент и завершается
+        if not writer_task.done():
+            await journal_queue.put(None)
+        await writer_task
+        writer_task = None
+    journal_queue = None
+
+def _drain(queue: asyncio.Queue, limit: int) -> List[Dict[str, Any]]:
+    """
+    Забирает из очереди записи, которые уже в ней есть
+
+    Args:
+        queue: Очередь журнала
+        limit: Максимальное количество записей
+
+    Returns:
+        Список записей
+    """
+    batch = []
+    while len(batch) < limit and not queue.empty():
+        batch.append(queue.get_nowait())
+    return batch
+
+async def _writer_loop() -> None:
+    """
+    Записывает очередь в сегменты и закрывает устаревшие сегменты
+    """
+    while True:
+        try:
+            first = await asyncio.wait_for(journal_queue.get(), timeout=min(60.0, journal_config["max_age"]))
+        except asyncio.TimeoutError:
+            # Новых сообщений нет: сегмент закрывается по времени и без записи
+            if segment is not None and time.time() - segment["opened"] >= journal_config["max_age"]:
+                await asyncio.to_thread(_close_segment)
+            continue
+        batch = [first] + _drain(journal_queue, MAX_BATCH - 1)
+        metrics.set_gauge("journal_queue_size", journal_queue.qsize())
+        # Метка остановки - последний элемент очереди
+        stopping = batch[-1] is None
+        if stopping:
+            batch.pop()
+        if batch:
+            try:
+                await asyncio.to_thread(_write_batch, batch)
+            except OSError as e:
+                metrics.inc("journal_dropped_total", len(batch))
+                logger.error(f"Ошибка при записи журнала диалогов: {e}")
+        if stopping:
+            await asyncio.to_thread(_close_segment)
+            return
+
+def _write_batch(batch: List[Dict[str, Any]]) -> None:
+    """
+    Дописывает пачку записей в текущий сегмент отдельным блоком gzip
+
+    Args:
+        batch: Записи журнала
+    """
+    global segment, segment_number
+    if segment is not None and (
+        segment["raw_bytes"] >= journal_config["max_bytes"]
+        or time.time() - segment["opened"] >= journal_config["max_age"]
+    ):
+        _close_segment()
+    if segment is None:
+        opened = time.time()
+        segment_number += 1
+        # Номер сегмента различает сегменты, открытые в одну миллисекунду
+        name = (time.strftime("%Y%m%d-%H%M%S", time.gmtime(opened))
+                + f"-{int(opened * 1000) % 1000:03d}-{segment_number:04d}.jsonl.gz")
+        segment = {
+            "path": os.path.join(journal_config["directory"], name),
+            "opened": opened,
+            "first_ts": batch[0]["ts"],
+            "last_ts": batch[0]["ts"],
+            "records": 0,
+            "raw_bytes": 0
+        }
+
+    data = "".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in batch).encode("utf-8")
+    with open(segment["path"], "ab") as file:
+        file.write(gzip.compress(data, compresslevel=6))
+    segment["records"] += len(batch)
+    segment["raw_bytes"] += len(data)
+    segment["last_ts"] = batch[-1]["ts"]
+    metrics.inc("journal_records_total", len(batch))
+
+def _close_segment() -> None:
+    """
+    Закрывает текущий сегмент и добавляет его в индекс
+    """
+    global segment
+    if segment is None:
+        return
+    entry = {
+        "file": os.path.basename(segment["path"]),
+        "first_ts": segment["first_ts"],
+        "last_ts": segment["last_ts"],
+        "records": segment["records"],
+        "raw_bytes": segment["raw_bytes"],
+        "bytes": os.path.getsize(segment["path"])
+    }
+    with open(os.path.join(journal_config["directory"], INDEX_FILE), "a", encoding="utf-8") as file:
+        file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    metrics.inc("journal_segments_total")
+    segment = None
+
+def load_index(directory: str) -> List[Dict[str, Any]]:
+    """
+    Загружает индекс закрытых сегментов
+
+    Args:
+        directory: Директория журнала
+
+    Returns:
+        Строки индекса в порядке закрытия сегментов
+    """
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def read_journal(
+    directory: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    include_open: bool = False
+) -> Iterator[Dict[str, Any]]:
+    """
+    Читает записи журнала потоком, не загружая сегменты целиком
+
+    Args:
+        directory: Директория журнала
+        start: Начало интервала (Unix time), None - без ограничения
+        end: Конец интервала (Unix time), None - без ограничения
+        include_open: Читать также сегменты, еще не попавшие в индекс
+
+    Yields:
+        Записи {ts, chat_id, role, content}
+    """
+    index = load_index(directory)
+    files = [
+        entry["file"] for entry in index
+        if (start is None or entry["last_ts"] >= start) and (end is None or entry["first_ts"] <= end)
+    ]
+    if include_open:
+        indexed = {entry["file"] for entry in index}
+        files += sorted(
+            os.path.basename(path) for path in glob.glob(os.path.join(directory, "*.jsonl.gz"))
+            if os.path.basename(path) not in indexed
+        )
+
+    for name in files:
+        with gzip.open(os.path.join(directory, name), "rt", encoding="utf-8") as file:
+            try:
+                for line in file:
+                    record = json.loads(line)
+                    if (start is None or record["ts"] >= start) and (end is None or record["ts"] <= end):
+                        yield record
+            except (EOFError, json.JSONDecodeError):
+                # Последний блок сегмента мог быть записан не полностью
+                logger.warning(f"Сегмент журнала {name} прочитан не полностью")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для распределения обработчиков по полосам с отдельными лимитами
+
+Полоса - ограничение количества одновременно выполняющихся обработчиков
+своего типа:
+- fast - команды, работающие только с памятью процесса (/style, /cat и др.);
+- llm - обработчики, ожидающие ответа LLM;
+- background - служебная работа (пополнение пула приветствий, прогрев соединений).
+
+Каждая полоса ограничена отдельно, поэтому при заполненной полосе llm
+команды не ждут в общей очереди за медленными обработчиками. Время
+ожидания и выполнения в каждой полосе попадает в метрики.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+
+from src import metrics, tracing
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Полосы обработки
+LANE_FAST = "fast"
+LANE_LLM = "llm"
+LANE_BACKGROUND = "background"
+
+# Параметры полос: {полоса: {"limit": одновременных обработчиков, "budget": секунд}}
+# Обработчик, выполнявшийся дольше бюджета, учитывается в метриках и логе
+lane_config: Dict[str, Dict[str, float]] = {
+    LANE_FAST: {"limit": 8, "budget": 0.005},
+    LANE_LLM: {"limit": 16, "budget": 60.0},
+    LANE_BACKGROUND: {"limit": 1, "budget": 120.0}
+}
+
+# Семафоры полос: {полоса: семафор}
+lane_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+# Количество обработчиков, ожидающих места в полосе: {полоса: количество}
+lane_waiting: Dict[str, int] = {}
+
+# Сглаженное время ожидания места в полосе (в секундах): {полоса: значение}
+lane_wait_average: Dict[str, float] = {}
+
+# Вес нового наблюдения в сглаженном времени ожидания
+WAIT_SMOOTHING = 0.2
+
+def init_lanes(config: Optional[Dict[str, Dict[str, float]]] = None) -> None:
+    """
+    Обновляет параметры полос и создает их семафоры
+
+    Args:
+        config: Параметры в формате lane_config (обновляют значения по умолчанию)
+    """
+    for lane, params in (config or {}).items():
+        lane_config.setdefault(lane, {}).update(params)
+    lane_semaphores.clear()
+    for lane, params in lane_config.items():
+        lane_semaphores[lane] = asyncio.Semaphore(int(params["limit"]))
+    logger.info(f"Полосы обработки: {lane_config}")
+
+@asynccontextmanager
+async def lane_slot(lane: str) -> AsyncIterator[None]:
+    """
+    Занимает место в полосе на время выполнения блока
+
+    Args:
+        lane: Полоса (fast, llm, background)
+    """
+    semaphore = lane_semaphores.get(lane)
+    if semaphore is None:
+        semaphore = lane_semaphores[lane] = asyncio.Semaphore(int(lane_config[lane]["limit"]))
+
+    queued_at = time.perf_counter()
+    lane_waiting[lane] = lane_waiting.get(lane, 0) + 1
+    metrics.set_gauge("lane_waiting", lane_waiting[lane], lane=lane)
+    try:
+        with tracing.span("lane_wait", lane=lane):
+            await semaphore.acquire()
+    finally:
+        lane_waiting[lane] -= 1
+        metrics.set_gauge("lane_waiting", lane_waiting[lane], lane=lane)
+
+    started = time.perf_counter()
+    metrics.observe("lane_wait_seconds", started - queued_at, lane=lane)
+    previous = lane_wait_average.get(lane, 0.0)
+    lane_wait_average[lane] = previous + WAIT_SMOOTHING * (started - queued_at - previous)
+    try:
+        yield
+    finally:
+        semaphore.release()
+        finished = time.perf_counter()
+        metrics.observe("lane_run_seconds", finished - started, lane=lane)
+        metrics.observe("lane_latency_seconds", finished - queued_at, lane=lane)
+        if finished - started > lane_config[lane]["budget"]:
+            metrics.inc("lane_budget_exceeded_total", lane=lane)
+            logger.warning(f"Обработчик полосы {lane} выполнялся {(finished - started) * 1000:.1f} мс")
+
+async def run_in_lane(lane: str, handler: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+    """
+    Выполняет корутину в полосе
+
+    Args:
+        lane: Полоса (fast, llm, background)
+        handler: Функция, возвращающая корутину
+        *args: Аргументы функции
+
+    Returns:
+        Результат корутины
+    """
+    async with lane_slot(lane):
+        return await handler(*args)
+
+class LaneMiddleware(BaseMiddleware):
+    """
+    Промежуточный обработчик aiogram, выполняющий обработчик в его полосе
+
+    Полоса задается флагом lane при регистрации обработчика. Обработчики
+    без флага выполняются без ограничения (они сами занимают полосу
+    для долгой части работы, например после объединения сообщений).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        lane = get_flag(data, "lane")
+        if lane is None:
+            return await handler(event, data)
+        return await run_in_lane(lane, handler, event, data)
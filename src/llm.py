@@ -3,75 +3,802 @@
 """
 Функции для работы с LLM API через OpenRouter
 """
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Tuple
 import os
 import logging
 import json
-from openai import OpenAI
+import asyncio
+import hashlib
+import inspect
+import time
+import urllib.request
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+from src import degradation, experiments, metrics, tracing, usage
+from src.context import key_fragment
+from src.prompts import get_output_budget
+
+# Логгер модуля (логирование настраивается в main.py)
 logger = logging.getLogger(__name__)
 
 # Клиент OpenAI для работы с OpenRouter
 client = None
 
-def init_llm(api_key: str, base_url: str = "https://openrouter.ai/api/v1") -> None:
+# Задача создания клиента в фоне (init_llm_background)
+client_init_task: Optional[asyncio.Future] = None
+
+# Бэкенд для выполнения запросов (запись, воспроизведение, синтетические ответы).
+# None - запрос отправляется в API через client
+completion_backend: Optional[Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = None
+
+# Модель по умолчанию
+DEFAULT_MODEL = "qwen/qwen3-30b-a3b:free"
+
+# Маршруты запросов к LLM
+ROUTE_FAST = "fast"
+ROUTE_FULL = "full"
+
+# Таблица маршрутов: {маршрут: параметры запроса}
+routes: Dict[str, Dict[str, Any]] = {
+    # Быстрая дешевая модель для коротких простых реплик
+    ROUTE_FAST: {"model": "qwen/qwen3-8b:free", "max_tokens": 500, "temperature": 0.7},
+    # Большая модель для вопросов об услугах и длинных диалогов
+    ROUTE_FULL: {"model": DEFAULT_MODEL, "max_tokens": 1000, "temperature": 0.7}
+}
+
+# Правила выбора маршрута
+routing_rules: Dict[str, Any] = {
+    # Максимальная длина сообщения пользователя для быстрого маршрута
+    "fast_max_chars": 120,
+    # Максимальное количество сообщений истории для быстрого маршрута
+    "fast_max_history": 4,
+    # Стили, для которых всегда используется большая модель
+    "full_styles": []
+}
+
+# Примерное количество символов на токен (для русского текста)
+CHARS_PER_TOKEN = 3
+
+# Запас жесткого лимита токенов над бюджетом, чтобы ответ успел
+# дойти до границы абзаца после достижения бюджета
+BUDGET_HEADROOM = 1.3
+
+# Задачи отправки пачек запросов (хранятся, чтобы их не удалил сборщик мусора)
+batch_tasks: set = set()
+
+# Выполняющиеся запросы к LLM для объединения одинаковых вызовов:
+# {ключ запроса: {"task": задача запроса, "waiters": число ожидающих}}
+inflight_requests: Dict[str, Dict[str, Any]] = {}
+
+# Ответ на запрос, не отправленный к LLM из-за сильной перегрузки (degradation).
+# Вызывающие отличают его от ответа модели и от ошибки (None) сравнением с константой
+OVERLOADED_RESPONSE = (
+    "Сейчас к ассистенту очень много обращений, поэтому ответить сразу не получилось. "
+    "Пожалуйста, повторите вопрос через минуту или обратитесь к менеджеру."
+)
+
+# Параметр client.post для готового тела запроса (content или body, зависит от версии SDK)
+raw_body_param: Optional[str] = None
+
+def init_llm(api_key: str, base_url: str = "https://openrouter.ai/api/v1", http_client: Any = None) -> None:
     """
     Инициализирует клиент для работы с LLM через OpenRouter
     
     Args:
         api_key: API ключ OpenRouter
         base_url: Базовый URL для API (по умолчанию OpenRouter)
+        http_client: HTTP-клиент с настроенным пулом соединений (опционально)
     """
+    # Пакет openai импортируется при создании клиента: его импорт
+    # занимает заметное время и не нужен бэкендам без API
+    from openai import OpenAI
+    
     global client
+    options = {"http_client": http_client} if http_client is not None else {}
     client = OpenAI(
         api_key=api_key,
-        base_url=base_url
+        base_url=base_url,
+        **options
     )
     logger.info("LLM клиент инициализирован")
 
+def init_llm_background(
+    api_key: str,
+    base_url: str = "https://openrouter.ai/api/v1",
+    http_client_factory: Optional[Callable[[], Any]] = None
+) -> asyncio.Future:
+    """
+    Создает клиент LLM в отдельном потоке, не задерживая запуск бота
+    
+    Запросы, пришедшие до готовности клиента, дожидаются его создания.
+    
+    Args:
+        api_key: API ключ OpenRouter
+        base_url: Базовый URL для API (по умолчанию OpenRouter)
+        http_client_factory: Функция создания HTTP-клиента с пулом соединений
+        
+    Returns:
+        Задача создания клиента
+    """
+    global client_init_task
+    
+    def create_client() -> None:
+        http_client = http_client_factory() if http_client_factory else None
+        init_llm(api_key, base_url, http_client)
+    
+    client_init_task = asyncio.ensure_future(asyncio.to_thread(create_client))
+    return client_init_task
+
+def set_backend(backend: Optional[Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]]) -> None:
+    """
+    Устанавливает бэкенд для выполнения запросов к LLM
+    
+    Бэкенд - корутина, которая принимает запрос {model, messages, temperature,
+    max_tokens} и возвращает {content, usage}.
+    
+    Args:
+        backend: Корутина бэкенда или None для запросов к API через клиент
+    """
+    global completion_backend
+    completion_backend = backend
+    if backend is None:
+        logger.info("Запросы к LLM отправляются в API через клиент")
+    else:
+        logger.info(f"Установлен бэкенд LLM: {getattr(backend, '__name__', backend)}")
+
+def init_router(config: Dict[str, Any]) -> None:
+    """
+    Обновляет таблицу маршрутов и правила выбора маршрута
+    
+    Args:
+        config: Словарь {"routes": {маршрут: параметры}, "rules": {правило: значение}}
+    """
+    for route, params in config.get("routes", {}).items():
+        routes.setdefault(route, {}).update(params)
+    routing_rules.update(config.get("rules", {}))
+    for route, params in routes.items():
+        logger.info(f"Маршрут LLM {route}: {params}")
+
+def load_router_config(path: str) -> None:
+    """
+    Загружает настройки маршрутизации из JSON-файла
+    
+    Args:
+        path: Путь к JSON-файлу в формате init_router
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            init_router(json.load(file))
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке настроек маршрутизации из {path}: {e}")
+
+def select_route(
+    messages: List[Dict[str, str]],
+    style: Optional[str] = None,
+    service_type: Optional[str] = None
+) -> str:
+    """
+    Выбирает маршрут запроса по простым локальным признакам
+    
+    Args:
+        messages: Список сообщений в формате [{role, content}]
+        style: Стиль ответа
+        service_type: Тип услуги, если пользователь спрашивает об услуге
+        
+    Returns:
+        Название маршрута
+    """
+    if service_type:
+        return ROUTE_FULL
+    if style in routing_rules["full_styles"]:
+        return ROUTE_FULL
+    
+    # Последнее сообщение - текущая реплика, остальные (кроме системного) - история
+    dialog_messages = [message for message in messages if message["role"] != "system"]
+    history_depth = max(0, len(dialog_messages) - 1)
+    if history_depth > routing_rules["fast_max_history"]:
+        return ROUTE_FULL
+    
+    last_message = dialog_messages[-1]["content"] if dialog_messages else ""
+    if len(last_message) > routing_rules["fast_max_chars"]:
+        return ROUTE_FULL
+    
+    return ROUTE_FAST
+
 async def generate_response(
     messages: List[Dict[str, str]], 
-    model: str = "qwen/qwen3-30b-a3b:free", 
-    temperature: float = 0.7,
-    max_tokens: int = 1000
+    model: Optional[str] = None, 
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    route: Optional[str] = None,
+    style: Optional[str] = None,
+    service_type: Optional[str] = None,
+    scenario: Optional[str] = None,
+    chat_id: Optional[int] = None
 ) -> Optional[str]:
     """
     Генерирует ответ от LLM на основе сообщений
     
+    Модель, температура и лимит токенов берутся из маршрута, если не заданы явно.
+    Маршрут выбирается автоматически (select_route), если не закреплен вызывающим.
+    Если лимит токенов не задан явно, применяется бюджет сценария и стиля
+    (prompts/budgets.json): по достижении бюджета ответ обрезается
+    по границе абзаца, а генерация при потоковой передаче прекращается.
+    Расход токенов записывается в журнал (usage); если чат исчерпал
+    дневную квоту, ответ генерируется быстрой моделью с коротким лимитом.
+    При перегрузке модель, лимит токенов и отправка запроса ограничиваются
+    текущим уровнем деградации (degradation). Варианты экспериментов чата
+    (experiments) могут заменить модель и лимит токенов; время ответа,
+    токены и ошибки учитываются в статистике вариантов.
+    
     Args:
         messages: Список сообщений в формате [{role, content}]
         model: Модель для использования
         temperature: Температура генерации (0.0-1.0)
         max_tokens: Максимальное количество токенов в ответе
+        route: Закрепленный маршрут (fast, full)
+        style: Стиль ответа (признак для выбора маршрута)
+        service_type: Тип услуги (признак для выбора маршрута)
+        scenario: Сценарий (start, service, chat) для бюджета и метрик
+        chat_id: Идентификатор чата для учета расхода и квоты
         
     Returns:
-        Текст ответа или None в случае ошибки
+        Текст ответа, OVERLOADED_RESPONSE, если запрос не отправлен
+        из-за перегрузки, или None в случае ошибки
     """
-    if client is None:
+    if client_init_task is not None and not client_init_task.done():
+        # Клиент еще создается в фоне: ждем его, а не отвечаем ошибкой
+        await asyncio.wait([client_init_task])
+    
+    if client is None and completion_backend is None:
         logger.error("LLM клиент не инициализирован")
         return None
     
+    degraded = usage.is_over_quota(chat_id)
+    limits = degradation.get_limits()
+    if degraded:
+        # Квота чата исчерпана: отвечаем дешевле, а не отказом
+        route = ROUTE_FAST
+        metrics.inc("llm_quota_degraded_total")
+    elif limits["fast_model"]:
+        # Перегрузка: все запросы выполняются быстрой моделью
+        route = ROUTE_FAST
+    elif route is None or route not in routes:
+        route = select_route(messages, style, service_type)
+    params = routes[route]
+    # Экономный режим и перегрузка важнее модели варианта эксперимента
+    overrides = experiments.get_overrides(chat_id)
+    if not degraded and not limits["fast_model"]:
+        model = model or overrides.get("model")
+    model = model or params["model"]
+    if max_tokens is None:
+        max_tokens = overrides.get("max_tokens")
+    temperature = params["temperature"] if temperature is None else temperature
+    
+    options: Dict[str, Any] = {}
+    if scenario or style:
+        budget = get_output_budget(scenario, style)
+        if budget["stop"]:
+            options["stop"] = budget["stop"]
+        if max_tokens is None and budget["max_tokens"] and budget["max_tokens"] < params["max_tokens"]:
+            options["soft_max_tokens"] = budget["max_tokens"]
+            max_tokens = min(params["max_tokens"], int(budget["max_tokens"] * BUDGET_HEADROOM))
+    max_tokens = max_tokens or params["max_tokens"]
+    caps = [usage.quota_config["degraded_max_tokens"] if degraded else None, limits["max_tokens"]]
+    if any(caps):
+        max_tokens = min([max_tokens] + [cap for cap in caps if cap])
+        if options.get("soft_max_tokens", 0) >= max_tokens:
+            del options["soft_max_tokens"]
+    
+    if limits["shed"] and make_request_key(messages, model, temperature, max_tokens, options) not in inflight_requests:
+        # Сильная перегрузка: новый запрос не отправляется, вызывающий отвечает
+        # сообщением о перегрузке (а не об ошибке) или своим быстрым путем
+        metrics.inc("llm_shed_total")
+        experiments.record_request(chat_id, 0.0, shed=True)
+        logger.warning("Запрос к LLM не отправлен из-за перегрузки")
+        return OVERLOADED_RESPONSE
+    
+    started = time.monotonic()
+    degradation.request_started()
     try:
         # Логирование запроса
-        logger.info(f"Запрос к LLM: модель={model}, температура={temperature}")
-        logger.debug(f"Сообщения: {json.dumps(messages, ensure_ascii=False)}")
-        
-        # Отправка запроса к API
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
+        logger.info(f"Запрос к LLM: маршрут={route}, модель={model}, температура={temperature}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Сообщения: {json.dumps(messages, ensure_ascii=False)}")
+        
+        # Одинаковые одновременные запросы разделяют один вызов API
+        with tracing.span("llm_request", route=route, model=model, max_tokens=max_tokens, messages=len(messages)):
+            completion = await request_single_flight(messages, model, temperature, max_tokens, options)
+            completion_usage = completion.get("usage", {})
+            tracing.set_attributes(degraded=degraded, early_stopped=bool(completion.get("early_stopped")), **completion_usage)
+        result = completion["content"]
         
-        # Получение и логирование ответа
-        result = response.choices[0].message.content
-        logger.info(f"Получен ответ от LLM ({len(result)} символов)")
+        # Логирование ответа и статистики маршрута, сценария и стиля
+        latency = time.monotonic() - started
+        degradation.observe_latency(latency)
+        completion_tokens = completion_usage.get("completion_tokens", 0)
+        usage.record_usage(completion_usage, latency, chat_id, style, scenario, model)
+        experiments.record_request(chat_id, latency, completion_usage)
+        metrics.observe("llm_latency_seconds", latency, route=route)
+        metrics.observe("llm_response_chars", len(result), route=route)
+        metrics.observe("llm_scenario_latency_seconds", latency, scenario=scenario, style=style)
+        metrics.observe("llm_output_tokens", completion_tokens, scenario=scenario, style=style)
+        if completion.get("early_stopped"):
+            metrics.inc("llm_early_stop_total", scenario=scenario, style=style)
+        if completion_tokens >= max_tokens:
+            # Ответ обрезан по лимиту токенов - признак нехватки бюджета маршрута
+            metrics.inc("llm_truncated_total", route=route)
+        logger.info(f"Получен ответ от LLM ({len(result)} символов, маршрут={route}, {latency:.2f} с)")
         logger.debug(f"Ответ: {result}")
         
         return result
     except Exception as e:
-        logger.error(f"Ошибка при запросе к LLM: {e}")
-        return None
\ No newline at end of file
+        metrics.inc("llm_errors_total", route=route)
+        experiments.record_request(chat_id, time.monotonic() - started, error=True)
+        tracing.mark_error(f"{type(e).__name__}: {e}")
+        logger.error(f"Ошибка при запросе к LLM (маршрут={route}): {e}")
+        return None
+    finally:
+        degradation.request_finished()
+
+def make_request_key(
+    messages: List[Dict[str, str]],
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    options: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Формирует ключ запроса для поиска одинаковых вызовов
+    
+    Args:
+        messages: Список сообщений в формате [{role, content}]
+        model: Модель для использования
+        temperature: Температура генерации
+        max_tokens: Максимальное количество токенов в ответе
+        options: Дополнительные параметры (stop, soft_max_tokens)
+        
+    Returns:
+        Хэш нормализованных параметров запроса
+    """
+    # Одна нормализация для любых сообщений (key_fragment): контекст чата
+    # хранит уже нормализованные сообщения, остальные нормализуются здесь
+    key_data = getattr(messages, "key_data", None)
+    if key_data is None:
+        key_data = b"".join(key_fragment(message) for message in messages)
+    digest = hashlib.sha256(key_data)
+    params = json.dumps([model, round(temperature, 3), max_tokens, options or {}], sort_keys=True)
+    digest.update(params.encode("utf-8"))
+    return digest.hexdigest()
+
+async def request_single_flight(
+    messages: List[Dict[str, str]],
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    options: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Выполняет запрос к LLM, объединяя одинаковые одновременные вызовы.
+    
+    Если такой же запрос уже выполняется, вызывающий ждет его результат
+    вместо нового обращения к API. Ошибка запроса передается всем ожидающим.
+    Отмена одного ожидающего не прерывает общий запрос; запрос отменяется,
+    только когда его перестают ждать все.
+    
+    Args:
+        messages: Список сообщений в формате [{role, content}]
+        model: Модель для использования
+        temperature: Температура генерации
+        max_tokens: Максимальное количество токенов в ответе
+        options: Дополнительные параметры (stop, soft_max_tokens)
+        
+    Returns:
+        Словарь {content, usage}
+    """
+    key = make_request_key(messages, model, temperature, max_tokens, options)
+    entry = inflight_requests.get(key)
+    
+    if entry is None:
+        task = asyncio.ensure_future(_request_completion(messages, model, temperature, max_tokens, options))
+        entry = {"task": task, "waiters": 0}
+        inflight_requests[key] = entry
+        task.add_done_callback(lambda done_task: _forget_request(key, done_task))
+    else:
+        metrics.inc("llm_singleflight_saved_total")
+        logger.info("Запрос к LLM объединен с уже выполняющимся таким же запросом")
+    
+    entry["waiters"] += 1
+    try:
+        return await asyncio.shield(entry["task"])
+    finally:
+        entry["waiters"] -= 1
+        if entry["waiters"] == 0 and not entry["task"].done():
+            entry["task"].cancel()
+            # Отмененный запрос завершится позже; новые вызовы не должны к нему присоединяться
+            if inflight_requests.get(key) is entry:
+                del inflight_requests[key]
+
+def _forget_request(key: str, task: asyncio.Future) -> None:
+    """
+    Удаляет завершенный запрос из списка выполняющихся
+    
+    Args:
+        key: Ключ запроса
+        task: Завершенная задача запроса
+    """
+    entry = inflight_requests.get(key)
+    if entry is not None and entry["task"] is task:
+        del inflight_requests[key]
+    
+    # Забираем исключение, чтобы оно не считалось необработанным,
+    # если запрос к этому моменту уже никто не ждет
+    if not task.cancelled():
+        task.exception()
+
+async def _request_completion(
+    messages: List[Dict[str, str]],
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    options: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Отправляет запрос через текущий бэкенд
+    
+    Args:
+        messages: Список сообщений в формате [{role, content}]
+        model: Модель для использования
+        temperature: Температура генерации
+        max_tokens: Максимальное количество токенов в ответе
+        options: Дополнительные параметры (stop, soft_max_tokens)
+        
+    Returns:
+        Словарь {content, usage, early_stopped}
+    """
+    request = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }
+    request.update(options or {})
+    backend = completion_backend or openai_completion
+    completion = await backend(request)
+    metrics.inc("llm_requests_total")
+    
+    # Бэкенды без потоковой передачи получают ответ целиком:
+    # применяем то же правило обрезки по бюджету
+    soft_max_tokens = request.get("soft_max_tokens")
+    if soft_max_tokens and not completion.get("early_stopped"):
+        content = cut_at_paragraph(completion["content"], soft_max_tokens * CHARS_PER_TOKEN)
+        if len(content) < len(completion["content"]):
+            completion = dict(completion, content=content, early_stopped=True)
+    return completion
+
+def cut_at_paragraph(text: str, max_chars: int) -> str:
+    """
+    Обрезает текст по последней границе абзаца не дальше max_chars
+    
+    Если граница абзаца не найдена, используется граница строки,
+    а если нет и ее - текст возвращается без изменений.
+    
+    Args:
+        text: Текст ответа
+        max_chars: Бюджет длины в символах
+        
+    Returns:
+        Обрезанный или исходный текст
+    """
+    if len(text) <= max_chars:
+        return text
+    for separator in ("\n\n", "\n"):
+        position = text.rfind(separator, 0, max_chars)
+        if position > 0:
+            return text[:position].rstrip()
+    return text
+
+async def openai_completion(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Бэкенд по умолчанию: отправляет запрос к API через клиент OpenAI
+    
+    Args:
+        request: Параметры запроса {model, messages, temperature, max_tokens}
+        
+    Returns:
+        Словарь {content, usage}
+    """
+    api_request = dict(request)
+    soft_max_tokens = api_request.pop("soft_max_tokens", None)
+    
+    # Отправка запроса к API в отдельном потоке, чтобы не блокировать
+    # цикл событий: иначе бот не принимает новые сообщения во время запроса
+    if soft_max_tokens:
+        return await asyncio.to_thread(_stream_completion, api_request, soft_max_tokens * CHARS_PER_TOKEN)
+    
+    response = await asyncio.to_thread(_create_completion, api_request)
+    return {
+        "content": response.choices[0].message.content,
+        "usage": extract_usage(response)
+    }
+
+def encode_request_body(api_request: Dict[str, Any]) -> Optional[bytes]:
+    """
+    Собирает JSON тела запроса из готовых байтов сообщений
+    
+    Args:
+        api_request: Параметры запроса к API
+        
+    Returns:
+        Тело запроса или None, если сообщения не закодированы заранее
+    """
+    encoded = getattr(api_request["messages"], "encoded", None)
+    if encoded is None:
+        return None
+    rest = {key: value for key, value in api_request.items() if key != "messages"}
+    # Остальные параметры дописываются в тот же объект после сообщений
+    return b'{"messages":' + encoded + b"," + json.dumps(rest, ensure_ascii=False).encode("utf-8")[1:]
+
+def _create_completion(api_request: Dict[str, Any], **params: Any) -> Any:
+    """
+    Отправляет запрос к API через клиент OpenAI
+    
+    Если сообщения пришли из контекста чата с готовым JSON, тело запроса
+    собирается из этих байтов, а клиент не сериализует историю заново.
+    
+    Args:
+        api_request: Параметры запроса к API
+        **params: Дополнительные параметры запроса (stream, stream_options)
+        
+    Returns:
+        Ответ API или поток фрагментов ответа (при stream=True)
+    """
+    global raw_body_param
+    body = encode_request_body({**api_request, **params})
+    if body is None:
+        return client.chat.completions.create(**api_request, **params)
+
+    from openai import Stream
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+    if raw_body_param is None:
+        # В новых версиях SDK готовые байты передаются параметром content
+        raw_body_param = "content" if "content" in inspect.signature(client.post).parameters else "body"
+    return client.post(
+        "/chat/completions",
+        cast_to=ChatCompletion,
+        options={"headers": {"Content-Type": "application/json"}},
+        stream=bool(params.get("stream")),
+        stream_cls=Stream[ChatCompletionChunk],
+        **{raw_body_param: body}
+    )
+
+def _stream_completion(api_request: Dict[str, Any], soft_max_chars: int) -> Dict[str, Any]:
+    """
+    Получает ответ потоком и прекращает генерацию после достижения бюджета
+    
+    Когда длина ответа достигает бюджета, поток закрывается, а ответ
+    обрезается по последней границе абзаца. Если границы еще нет,
+    чтение продолжается до ее появления или до жесткого лимита токенов.
+    
+    Args:
+        api_request: Параметры запроса к API
+        soft_max_chars: Бюджет длины ответа в символах
+        
+    Returns:
+        Словарь {content, usage, early_stopped}
+    """
+    stream = _create_completion(api_request, stream=True, stream_options={"include_usage": True})
+    parts: List[str] = []
+    length = 0
+    usage = None
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            parts.append(delta)
+            length += len(delta)
+            if length < soft_max_chars:
+                continue
+            
+            # Бюджет исчерпан: обрезаем по последней границе абзаца,
+            # а если ее еще нет - ждем первую
+            text = "".join(parts)
+            position = text.rfind("\n\n")
+            if position > 0:
+                return {
+                    "content": text[:position].rstrip(),
+                    # Статистика приходит последним фрагментом потока, который
+                    # уже не будет прочитан: оцениваем запрос и весь полученный текст
+                    "usage": estimate_usage(api_request["messages"], text),
+                    "early_stopped": True
+                }
+    finally:
+        stream.close()
+    
+    content = "".join(parts)
+    usage_info = extract_usage(usage)
+    if not usage_info["prompt_tokens"] or not usage_info["completion_tokens"]:
+        # Сервер не прислал статистику (include_usage не поддерживается)
+        estimate = estimate_usage(api_request["messages"], content)
+        usage_info["prompt_tokens"] = usage_info["prompt_tokens"] or estimate["prompt_tokens"]
+        usage_info["completion_tokens"] = usage_info["completion_tokens"] or estimate["completion_tokens"]
+    return {"content": content, "usage": usage_info}
+
+def estimate_usage(messages: List[Dict[str, str]], content: str) -> Dict[str, int]:
+    """
+    Оценивает расход токенов по длине текста запроса и ответа
+    
+    Args:
+        messages: Сообщения запроса [{role, content}]
+        content: Полученный текст ответа
+        
+    Returns:
+        Словарь {prompt_tokens, completion_tokens, cached_tokens}
+    """
+    prompt_chars = sum(len(message["content"]) for message in messages)
+    return {
+        "prompt_tokens": (prompt_chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN,
+        "completion_tokens": (len(content) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN,
+        "cached_tokens": 0
+    }
+
+def extract_usage(response: Any) -> Dict[str, int]:
+    """
+    Извлекает количество токенов из ответа API
+    
+    Args:
+        response: Ответ API
+        
+    Returns:
+        Словарь {prompt_tokens, completion_tokens, cached_tokens}
+    """
+    def to_int(value: Any) -> int:
+        return int(value) if isinstance(value, (int, float)) else 0
+    
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": to_int(getattr(usage, "prompt_tokens", 0)),
+        "completion_tokens": to_int(getattr(usage, "completion_tokens", 0)),
+        "cached_tokens": to_int(getattr(details, "cached_tokens", 0))
+    }
+
+def init_batching(window: float, max_batch: int = 8, batch_url: Optional[str] = None) -> None:
+    """
+    Включает пакетную отправку запросов поверх текущего бэкенда
+    
+    Args:
+        window: Время сбора пачки в секундах (0 - пакетная отправка выключена)
+        max_batch: Максимальное количество запросов в пачке
+        batch_url: Адрес эндпоинта сервера, принимающего пачку запросов;
+            если не задан, запросы пачки отправляются параллельно
+    """
+    if window <= 0:
+        return
+    submit_batch = post_batch(batch_url) if batch_url else None
+    set_backend(batching_backend(completion_backend, window, max_batch, submit_batch))
+    logger.info(f"Пакетная отправка запросов к LLM: окно {window * 1000:.0f} мс, "
+                f"до {max_batch} запросов, {'эндпоинт ' + batch_url if batch_url else 'параллельные запросы'}")
+
+def batching_backend(
+    backend: Optional[Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = None,
+    window: float = 0.005,
+    max_batch: int = 8,
+    submit_batch: Optional[Callable[[List[Dict[str, Any]]], Awaitable[List[Any]]]] = None
+) -> Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]:
+    """
+    Создает бэкенд, который собирает одновременные запросы в пачки
+    
+    Пачка отправляется, когда истекает окно сбора после первого запроса
+    или набирается max_batch запросов. Каждый вызов получает свой ответ;
+    ошибка одного запроса пачки не затрагивает остальные.
+    
+    Args:
+        backend: Бэкенд для параллельной отправки запросов пачки
+            (по умолчанию API через клиент)
+        window: Время сбора пачки в секундах
+        max_batch: Максимальное количество запросов в пачке
+        submit_batch: Корутина, отправляющая пачку целиком и возвращающая
+            список ответов или исключений в порядке запросов
+            
+    Returns:
+        Корутина бэкенда
+    """
+    pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+    state: Dict[str, Optional[asyncio.Task]] = {"timer": None}
+    
+    def take_batch() -> List[Tuple[Dict[str, Any], asyncio.Future]]:
+        batch = pending[:]
+        pending.clear()
+        return batch
+    
+    async def flush(batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        metrics.observe("llm_batch_size", len(batch))
+        requests = [request for request, _ in batch]
+        try:
+            if submit_batch is not None:
+                results = await submit_batch(requests)
+            else:
+                target = backend or openai_completion
+                results = await asyncio.gather(*(target(request) for request in requests), return_exceptions=True)
+        except Exception as e:
+            results = [e] * len(batch)
+        if len(results) != len(batch):
+            results = [RuntimeError("Количество ответов не совпадает с размером пачки")] * len(batch)
+        
+        for (_, future), result in zip(batch, results):
+            # Обработчик мог перестать ждать ответ
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    
+    async def flush_after_window() -> None:
+        await asyncio.sleep(window)
+        state["timer"] = None
+        await flush(take_batch())
+    
+    def start(coroutine: Awaitable[None]) -> asyncio.Task:
+        task = asyncio.ensure_future(coroutine)
+        batch_tasks.add(task)
+        task.add_done_callback(batch_tasks.discard)
+        return task
+    
+    async def batched(request: Dict[str, Any]) -> Dict[str, Any]:
+        future = asyncio.get_running_loop().create_future()
+        pending.append((request, future))
+        if len(pending) >= max_batch:
+            # Пачка набрана: отправляем, не дожидаясь окончания окна
+            if state["timer"] is not None:
+                state["timer"].cancel()
+                state["timer"] = None
+            start(flush(take_batch()))
+        elif state["timer"] is None:
+            state["timer"] = start(flush_after_window())
+        return await future
+    
+    return batched
+
+def post_batch(url: str, timeout: float = 120.0) -> Callable[[List[Dict[str, Any]]], Awaitable[List[Any]]]:
+    """
+    Создает функцию отправки пачки запросов на эндпоинт сервера
+    
+    Эндпоинт принимает POST {"requests": [запрос, ...]} и возвращает
+    {"responses": [{content, usage} или {error}, ...]} в том же порядке.
+    
+    Args:
+        url: Адрес эндпоинта
+        timeout: Таймаут запроса в секундах
+        
+    Returns:
+        Корутина, принимающая список запросов
+    """
+    def send(requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        body = json.dumps(
+            {"requests": [{k: v for k, v in request.items() if k != "soft_max_tokens"} for request in requests]},
+            ensure_ascii=False
+        ).encode("utf-8")
+        http_request = urllib.request.Request(
+            url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(http_request, timeout=timeout) as response:
+            return json.loads(response.read())
+    
+    async def submit(requests: List[Dict[str, Any]]) -> List[Any]:
+        data = await asyncio.to_thread(send, requests)
+        results = []
+        for item in data["responses"]:
+            if "error" in item:
+                results.append(RuntimeError(item["error"]))
+            else:
+                results.append({"content": item["content"], "usage": item.get("usage", {})})
+        return results
+    
+    return submit
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для локального запуска LLM на CPU (офлайн и резервный бэкенд)
+
+Небольшая квантованная модель загружается в каждом процессе пула
+(через llama-cpp-python, необязательная зависимость). Запросы ставятся
+в ограниченную очередь, диспетчеры собирают их в пачки и передают
+процессам пула, а ответы возвращаются ожидающим обработчикам.
+
+Вместо пула процессов можно использовать локальный сервер
+с OpenAI-совместимым API (например, llama.cpp server).
+
+Режимы подключения:
+- primary - запросы идут в локальную модель, при ошибке - в основной бэкенд;
+- fallback - запросы идут в основной бэкенд, при ошибке - в локальную модель;
+- cheap - в локальную модель идут только запросы быстрого маршрута.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src import metrics
+from src.llm import ROUTE_FAST, extract_usage, routes
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Режимы подключения локальной модели
+MODE_PRIMARY = "primary"
+MODE_FALLBACK = "fallback"
+MODE_CHEAP = "cheap"
+
+# Путь модели для синтетической нагрузки на CPU без файла модели (для бенчмарков)
+SYNTHETIC_MODEL = "synthetic"
+
+# Тип бэкенда LLM: корутина {model, messages, temperature, max_tokens} -> {content, usage}
+Backend = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+# Пул процессов с загруженной моделью
+executor: Optional[Executor] = None
+
+# Очередь запросов к локальной модели: элементы {"request", "future", "enqueued_at"}
+request_queue: Optional[asyncio.Queue] = None
+
+# Задачи, собирающие запросы в пачки
+dispatcher_tasks: List[asyncio.Task] = []
+
+# Параметры локальной модели
+local_config: Dict[str, Any] = {
+    # Путь к файлу модели в формате GGUF
+    "model_path": None,
+    # Количество процессов пула
+    "workers": 2,
+    # Количество потоков CPU на процесс
+    "threads": 2,
+    # Размер контекста модели в токенах
+    "context": 4096,
+    # Максимальное количество запросов в одной пачке
+    "batch_size": 4,
+    # Время ожидания запросов для пачки (в секундах)
+    "batch_wait": 0.01,
+    # Максимальное количество запросов в очереди
+    "queue_size": 32
+}
+
+# Модель, загруженная в процессе пула
+_worker_model = None
+
+def _init_worker(model_path: str, threads: int, context: int) -> None:
+    """
+    Загружает модель в процессе пула
+
+    Args:
+        model_path: Путь к файлу модели или SYNTHETIC_MODEL
+        threads: Количество потоков CPU
+        context: Размер контекста в токенах
+    """
+    global _worker_model
+    if model_path == SYNTHETIC_MODEL:
+        _worker_model = SYNTHETIC_MODEL
+        return
+
+    # Необязательная зависимость: нужна только при работе с локальной моделью
+    from llama_cpp import Llama
+    _worker_model = Llama(model_path=model_path, n_threads=threads, n_ctx=context, verbose=False)
+
+def _synthetic_completion(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Имитирует генерацию: нагружает CPU пропорционально количеству токенов
+
+    Args:
+        request: Параметры запроса
+
+    Returns:
+        Ответ в формате create_chat_completion
+    """
+    tokens = request["max_tokens"]
+    digest = b""
+    words = []
+    for i in range(tokens):
+        # Фиксированный объем вычислений на каждый токен
+        for _ in range(300):
+            digest = hashlib.sha256(digest).digest()
+        words.append(f"слово{i % 10}")
+    return {
+        "choices": [{"message": {"content": " ".join(words)}}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": tokens}
+    }
+
+def _generate_batch(requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Выполняет пачку запросов в процессе пула
+
+    Ошибка одного запроса не влияет на остальные запросы пачки.
+
+    Args:
+        requests: Список запросов {messages, temperature, max_tokens, stop}
+
+    Returns:
+        Список ответов {content, usage} или {error} в порядке запросов
+    """
+    results = []
+    for request in requests:
+        try:
+            if _worker_model == SYNTHETIC_MODEL:
+                response = _synthetic_completion(request)
+            else:
+                response = _worker_model.create_chat_completion(
+                    messages=request["messages"],
+                    temperature=request["temperature"],
+                    max_tokens=request["max_tokens"],
+                    stop=request.get("stop")
+                )
+            usage = response.get("usage") or {}
+            results.append({
+                "content": response["choices"][0]["message"]["content"],
+                "usage": {
+                    "prompt_tokens": usage.get("prompt_tokens", 0),
+                    "completion_tokens": usage.get("completion_tokens", 0),
+                    "cached_tokens": 0
+                }
+            })
+        except Exception as e:
+            results.append({"error": str(e)})
+    return results
+
+def _ping() -> bool:
+    """
+    Пустая задача для запуска процесса пула и загрузки модели
+
+    Returns:
+        True, если модель загружена
+    """
+    return _worker_model is not None
+
+async def start_local_llm(config: Optional[Dict[str, Any]] = None, pool: Optional[Executor] = None) -> None:
+    """
+    Запускает пул процессов с локальной моделью и диспетчеры очереди
+
+    Процессы запускаются и загружают модель сразу, чтобы первый
+    запрос пользователя не ждал загрузки.
+
+    Args:
+        config: Параметры в формате local_config (обновляют значения по умолчанию)
+        pool: Готовый пул (например, для тестов); по умолчанию создается пул процессов
+    """
+    global executor, request_queue
+    local_config.update(config or {})
+    if not local_config["model_path"]:
+        raise ValueError("Не задан путь к файлу локальной модели")
+
+    workers = local_config["workers"]
+    if pool is None:
+        # spawn: процессы не наследуют цикл событий и потоки бота
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(local_config["model_path"], local_config["threads"], local_config["context"])
+        )
+    executor = pool
+    request_queue = asyncio.Queue(maxsize=local_config["queue_size"])
+
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    await asyncio.gather(*(loop.run_in_executor(executor, _ping) for _ in range(workers)))
+    logger.info(f"Локальная модель {local_config['model_path']} загружена в {workers} процессах "
+                f"за {time.monotonic() - started:.1f} с")
+
+    dispatcher_tasks.extend(asyncio.create_task(_dispatch()) for _ in range(workers))
+
+async def stop_local_llm() -> None:
+    """
+    Останавливает диспетчеры и пул процессов локальной модели
+    """
+    global executor, request_queue
+    for task in dispatcher_tasks:
+        task.cancel()
+    await asyncio.gather(*dispatcher_tasks, return_exceptions=True)
+    dispatcher_tasks.clear()
+
+    # Запросы, оставшиеся в очереди, завершаются ошибкой
+    while request_queue is not None and not request_queue.empty():
+        item = request_queue.get_nowait()
+        if not item["future"].done():
+            item["future"].set_exception(RuntimeError("Локальная модель остановлена"))
+
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+    executor = None
+    request_queue = None
+    logger.info("Локальная модель остановлена")
+
+async def local_completion(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Бэкенд LLM: выполняет запрос в локальной модели
+
+    Если очередь заполнена, запрос сразу отклоняется, чтобы
+    обработчик мог обратиться к другому бэкенду, а не ждать.
+
+    Args:
+        request: Параметры запроса {model, messages, temperature, max_tokens, stop}
+
+    Returns:
+        Словарь {content, usage}
+    """
+    if request_queue is None:
+        raise RuntimeError("Локальная модель не запущена")
+
+    future = asyncio.get_running_loop().create_future()
+    try:
+        request_queue.put_nowait({"request": request, "future": future, "enqueued_at": time.monotonic()})
+    except asyncio.QueueFull:
+        metrics.inc("local_llm_rejected_total")
+        raise RuntimeError("Очередь локальной модели переполнена")
+    metrics.set_gauge("local_llm_queue_size", request_queue.qsize())
+    return await future
+
+async def _dispatch() -> None:
+    """
+    Собирает запросы из очереди в пачки и передает их процессу пула
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await request_queue.get()]
+        deadline = loop.time() + local_config["batch_wait"]
+        while len(batch) < local_config["batch_size"]:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(request_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        metrics.set_gauge("local_llm_queue_size", request_queue.qsize())
+
+        # Обработчики, которые перестали ждать, не занимают процесс пула
+        batch = [item for item in batch if not item["future"].done()]
+        if not batch:
+            continue
+
+        started = time.monotonic()
+        for item in batch:
+            metrics.observe("local_llm_queue_wait_seconds", started - item["enqueued_at"])
+        metrics.observe("local_llm_batch_size", len(batch))
+
+        requests = [
+            {key: item["request"].get(key) for key in ("messages", "temperature", "max_tokens", "stop")}
+            for item in batch
+        ]
+        try:
+            results = await loop.run_in_executor(executor, _generate_batch, requests)
+        except Exception as e:
+            # Процесс пула упал: ошибка передается всей пачке
+            logger.error(f"Ошибка пула локальной модели: {e}")
+            results = [{"error": str(e)}] * len(batch)
+
+        latency = time.monotonic() - started
+        for item, result in zip(batch, results):
+            if item["future"].done():
+                continue
+            if "error" in result:
+                metrics.inc("local_llm_errors_total")
+                item["future"].set_exception(RuntimeError(result["error"]))
+                continue
+            metrics.observe("local_llm_latency_seconds", latency)
+            metrics.inc("local_llm_tokens_total", result["usage"]["completion_tokens"])
+            item["future"].set_result(result)
+
+def local_server_backend(base_url: str, model: str = "local", max_concurrency: int = 4) -> Backend:
+    """
+    Создает бэкенд для локального сервера с OpenAI-совместимым API
+
+    Args:
+        base_url: Адрес сервера (например, http://127.0.0.1:8080/v1)
+        model: Название модели на сервере
+        max_concurrency: Максимальное количество одновременных запросов
+
+    Returns:
+        Корутина бэкенда
+    """
+    from openai import OpenAI
+
+    server_client = OpenAI(api_key="local", base_url=base_url)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def local_server(request: Dict[str, Any]) -> Dict[str, Any]:
+        api_request = {key: value for key, value in request.items() if key != "soft_max_tokens"}
+        api_request["model"] = model
+        async with semaphore:
+            response = await asyncio.to_thread(server_client.chat.completions.create, **api_request)
+        return {"content": response.choices[0].message.content, "usage": extract_usage(response)}
+
+    return local_server
+
+def combine_backends(mode: str, local: Backend, remote: Backend) -> Backend:
+    """
+    Объединяет локальный и основной бэкенды по режиму подключения
+
+    Args:
+        mode: Режим (primary, fallback, cheap)
+        local: Бэкенд локальной модели
+        remote: Основной бэкенд (API или кассета)
+
+    Returns:
+        Корутина бэкенда
+    """
+    if mode not in (MODE_PRIMARY, MODE_FALLBACK, MODE_CHEAP):
+        raise ValueError(f"Неизвестный режим локальной модели: {mode}")
+
+    async def call_with_fallback(first: Backend, second: Backend, request: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await first(request)
+        except Exception as e:
+            logger.warning(f"Бэкенд LLM недоступен ({e}), запрос передан резервному бэкенду")
+            metrics.inc("local_llm_fallback_total", mode=mode)
+            return await second(request)
+
+    async def combined(request: Dict[str, Any]) -> Dict[str, Any]:
+        if mode == MODE_FALLBACK:
+            return await call_with_fallback(remote, local, request)
+        if mode == MODE_CHEAP:
+            # Локальная модель обслуживает только быстрый маршрут
+            if request["model"] != routes[ROUTE_FAST]["model"]:
+                return await remote(request)
+        return await call_with_fallback(local, remote, request)
+
+    return combined
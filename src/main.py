@@ -7,23 +7,41 @@ import os
 import asyncio
 import logging
 from dotenv import load_dotenv
-from src.bot import init_bot, start_polling
-from src.llm import init_llm
-
-# Загрузка переменных окружения
-# Сначала проверяем наличие переменных в системном окружении
-telegram_token = os.getenv('TELEGRAM_BOT_TOKEN')
-openrouter_api_key = os.getenv('OPENROUTER_API_KEY')
+from src import bot as telegram_bot
+from src.bot import add_tenant_bot, init_bot, start_polling
+from src.tenants import load_tenants_config
+from src.broadcast import init_broadcast, resume_broadcast, stop_broadcast
+from src.llm import init_llm_background, init_batching, set_backend, load_router_config, openai_completion
+from src.cassette import MODE_REPLAY, MODE_SYNTHETIC, create_backend
+from src.local_llm import (
+    MODE_PRIMARY, combine_backends, local_completion, local_server_backend,
+    start_local_llm, stop_local_llm
+)
+from src.coalescer import init_coalescer
+from src.sender import start_sender, stop_sender
+from src.lanes import LANE_BACKGROUND, LANE_FAST, LANE_LLM, init_lanes
+from src.flood import init_flood
+from src.degradation import start_degradation, stop_degradation
+from src.experiments import load_experiments, start_experiments, stop_experiments
+from src.usage import start_usage_ledger, stop_usage_ledger
+from src.journal import start_journal, stop_journal
+from src.introspection import start_admin_server, stop_admin_server
+from src.tracing import start_tracing, stop_tracing
+from src.greetings import start_greeting_pool, stop_greeting_pool
+from src.prompts import preload_prompts
+from src.http_pool import (
+    TARGET_LLM, TARGET_TELEGRAM, create_bot_session, create_llm_http_client, init_http_pool,
+    ping_llm, start_warmup, stop_warmup
+)
 
-# Если переменные не найдены в системном окружении, пробуем загрузить из .env файла
-if not telegram_token or not openrouter_api_key:
-    import os.path
-    env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
-    if os.path.exists(env_path):
-        load_dotenv(dotenv_path=env_path)
-        print(f"Загружены переменные из .env файла")
+# Загрузка переменных окружения из .env файла (если он есть).
+# Переменные системного окружения имеют приоритет над .env
+env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
+if os.path.exists(env_path):
+    load_dotenv(dotenv_path=env_path)
+    print(f"Загружены переменные из .env файла")
 
-# Настройка логирования
+# Настройка логирования (единственное место настройки для всех модулей)
 log_level = os.getenv("LOG_LEVEL", "INFO")
 logging.basicConfig(
     level=getattr(logging, log_level),
@@ -42,18 +60,208 @@ async def main() -> None:
         logger.error("Токен бота не найден в переменных окружения")
         return
     
-    # Получение API ключа OpenRouter
+    # Бэкенд LLM: openai (по умолчанию), record, replay или synthetic
+    llm_backend = os.getenv("LLM_BACKEND", "openai")
+    
+    # Локальная модель на CPU: primary, fallback, cheap или не используется
+    local_llm_mode = os.getenv("LOCAL_LLM_MODE")
+    
+    # Получение API ключа OpenRouter (не нужен для воспроизведения кассет
+    # и при работе через локальную модель)
     openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
-    if not openrouter_api_key:
+    if (not openrouter_api_key and llm_backend not in (MODE_REPLAY, MODE_SYNTHETIC)
+            and local_llm_mode != MODE_PRIMARY):
         logger.error("API ключ OpenRouter не найден в переменных окружения")
         return
     
-    # Инициализация LLM клиента
-    init_llm(openrouter_api_key)
+    # Пулы HTTP-соединений с keepalive для LLM и Telegram (и кэш DNS сессии бота)
+    init_http_pool({
+        "max_connections": int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "20")),
+        "keepalive_expiry": float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120")),
+        "dns_ttl": float(os.getenv("DNS_CACHE_TTL", "300")),
+        "http2": os.getenv("LLM_HTTP2", "0") == "1"
+    })
+    
+    # Инициализация LLM клиента в отдельном потоке, параллельно с запуском бота
+    # LLM_BASE_URL - адрес собственного сервера с OpenAI-совместимым API
+    llm_base_url = os.getenv("LLM_BASE_URL") or "https://openrouter.ai/api/v1"
+    if openrouter_api_key:
+        init_llm_background(openrouter_api_key, llm_base_url, create_llm_http_client)
+    backend = None
+    if llm_backend != "openai":
+        backend = create_backend(
+            llm_backend,
+            os.getenv("LLM_CASSETTE_PATH"),
+            float(os.getenv("LLM_LATENCY_SCALE", "1.0"))
+        )
+    
+    # Подключение локальной модели: через локальный сервер или пул процессов
+    if local_llm_mode:
+        local_llm_url = os.getenv("LOCAL_LLM_URL")
+        if local_llm_url:
+            local_backend = local_server_backend(local_llm_url, os.getenv("LOCAL_LLM_MODEL", "local"))
+        else:
+            await start_local_llm({
+                "model_path": os.getenv("LOCAL_LLM_MODEL_PATH"),
+                "workers": int(os.getenv("LOCAL_LLM_WORKERS", "2")),
+                "threads": int(os.getenv("LOCAL_LLM_THREADS", "2")),
+                "queue_size": int(os.getenv("LOCAL_LLM_QUEUE_SIZE", "32"))
+            })
+            local_backend = local_completion
+        backend = combine_backends(local_llm_mode, local_backend, backend or openai_completion)
+    if backend is not None:
+        set_backend(backend)
+    
+    # Пакетная отправка одновременных запросов (для собственного сервера)
+    init_batching(
+        float(os.getenv("LLM_BATCH_WINDOW", "0")),
+        int(os.getenv("LLM_BATCH_MAX_SIZE", "8")),
+        os.getenv("LLM_BATCH_URL")
+    )
+    
+    # Таблица маршрутов моделей (необязательно)
+    routes_file = os.getenv("LLM_ROUTES_FILE")
+    if routes_file:
+        load_router_config(routes_file)
+    
+    # A/B-эксперименты с моделями, версиями промптов и лимитом токенов (необязательно)
+    experiments_file = os.getenv("EXPERIMENTS_FILE")
+    if experiments_file:
+        load_experiments(experiments_file)
+        start_experiments(
+            os.getenv("EXPERIMENTS_STATS_PATH", "logs/experiments.json"),
+            {"follow_up_window": float(os.getenv("EXPERIMENTS_FOLLOW_UP_WINDOW", "600"))}
+        )
+    
+    # Окно объединения быстрых сообщений одного чата
+    init_coalescer(float(os.getenv("MESSAGE_COALESCE_WINDOW", "1.0")))
+    
+    # Ответы отправляются через очередь с учетом лимитов Telegram
+    start_sender()
     
-    # Инициализация и запуск бота
-    await init_bot(telegram_token)
-    await start_polling()
+    # Отдельные лимиты для команд, обработчиков LLM и фоновой работы
+    init_lanes({
+        LANE_FAST: {"limit": int(os.getenv("LANE_FAST_LIMIT", "8"))},
+        LANE_LLM: {"limit": int(os.getenv("LANE_LLM_LIMIT", "16"))},
+        LANE_BACKGROUND: {"limit": int(os.getenv("LANE_BACKGROUND_LIMIT", "1"))}
+    })
+    
+    # Лимиты входящих сообщений пользователя, чата и общий лимит запросов к LLM
+    init_flood({
+        "user_rate": float(os.getenv("FLOOD_USER_RATE", "0.5")),
+        "user_capacity": float(os.getenv("FLOOD_USER_BURST", "5")),
+        "chat_rate": float(os.getenv("FLOOD_CHAT_RATE", "1.0")),
+        "chat_capacity": float(os.getenv("FLOOD_CHAT_BURST", "10")),
+        "global_rate": float(os.getenv("FLOOD_GLOBAL_RATE", "20")),
+        "global_capacity": float(os.getenv("FLOOD_GLOBAL_BURST", "40"))
+    })
+    
+    # Постепенное упрощение запросов к LLM при перегрузке
+    start_degradation({
+        "max_inflight": float(os.getenv("DEGRADATION_MAX_INFLIGHT", "12")),
+        "max_wait": float(os.getenv("DEGRADATION_MAX_WAIT", "2")),
+        "max_p95": float(os.getenv("DEGRADATION_MAX_P95", "20")),
+        "recovery_seconds": float(os.getenv("DEGRADATION_RECOVERY_SECONDS", "30")),
+        "max_level": int(os.getenv("DEGRADATION_MAX_LEVEL", "4"))
+    })
+    
+    # Журнал расхода токенов и дневные квоты чатов
+    await start_usage_ledger(
+        os.getenv("USAGE_LEDGER_PATH", "logs/usage_ledger.jsonl"),
+        float(os.getenv("USAGE_FLUSH_INTERVAL", "10")),
+        {
+            "daily_tokens": int(os.getenv("CHAT_DAILY_TOKEN_QUOTA", "0")),
+            "degraded_max_tokens": int(os.getenv("QUOTA_DEGRADED_MAX_TOKENS", "200"))
+        }
+    )
+    
+    # Журнал диалогов для анализа (выключен, если директория не задана)
+    journal_dir = os.getenv("JOURNAL_DIR")
+    if journal_dir:
+        start_journal({
+            "directory": journal_dir,
+            "max_bytes": int(float(os.getenv("JOURNAL_SEGMENT_MB", "64")) * 1024 * 1024),
+            "max_age": float(os.getenv("JOURNAL_SEGMENT_SECONDS", "3600"))
+        })
+    
+    # Трассировка обработки сообщений (выключена, если способ экспорта не задан)
+    trace_exporter = os.getenv("TRACE_EXPORT")
+    if trace_exporter:
+        start_tracing({
+            "exporter": trace_exporter,
+            "path": os.getenv("TRACE_PATH", "logs/traces.jsonl"),
+            "endpoint": os.getenv("TRACE_OTLP_ENDPOINT"),
+            "slow_seconds": float(os.getenv("TRACE_SLOW_SECONDS", "5")),
+            "sample_rate": float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+        })
+    
+    # Локальный эндпоинт администратора для анализа памяти (выключен, если порт не задан)
+    admin_port = os.getenv("ADMIN_PORT")
+    if admin_port:
+        await start_admin_server(os.getenv("ADMIN_HOST", "127.0.0.1"), int(admin_port))
+    
+    # Фоновая генерация приветствий для мгновенного ответа на /start
+    start_greeting_pool(int(os.getenv("GREETING_POOL_SIZE", "3")))
+    
+    # Инициализация бота и параллельная загрузка промптов
+    bot_session = create_bot_session(os.getenv("TELEGRAM_API_URL"))
+    await asyncio.gather(
+        init_bot(telegram_token, bot_session),
+        preload_prompts()
+    )
+    
+    # Боты других брендов в том же процессе: общий диспетчер, пул соединений,
+    # клиент LLM, лимиты и кэши
+    tenants_config = os.getenv("TENANTS_CONFIG")
+    if tenants_config:
+        for tenant in load_tenants_config(tenants_config):
+            await add_tenant_bot(
+                tenant["name"],
+                tenant["token"],
+                bot_session,
+                tenant.get("prompts_dir"),
+                tenant.get("links")
+            )
+    
+    # Рассылки всем чатам основного бота; незавершенная рассылка продолжается
+    init_broadcast(
+        telegram_bot.bot,
+        os.getenv("BROADCAST_CHECKPOINT", "logs/broadcast.json"),
+        {
+            "rate": float(os.getenv("BROADCAST_RATE", "25")),
+            "workers": int(os.getenv("BROADCAST_WORKERS", "16"))
+        }
+    )
+    resume_broadcast()
+    
+    # Прогрев соединений в периоды простоя
+    pings = {TARGET_TELEGRAM: lambda: telegram_bot.bot.get_me()}
+    if openrouter_api_key:
+        pings[TARGET_LLM] = lambda: ping_llm(f"{llm_base_url}/models")
+    start_warmup(pings, float(os.getenv("HTTP_WARMUP_INTERVAL", "60")))
+    try:
+        await start_polling()
+    finally:
+        # Ошибка остановки одного модуля не должна пропускать остановку остальных
+        for stop in (
+            stop_warmup,
+            stop_greeting_pool,
+            # Прогресс рассылки сохраняется после текущих отправок
+            stop_broadcast,
+            # Дожидаемся отправки сообщений, уже поставленных в очередь
+            stop_sender,
+            stop_local_llm,
+            stop_usage_ledger,
+            stop_experiments,
+            stop_journal,
+            stop_admin_server,
+            stop_tracing,
+            stop_degradation
+        ):
+            try:
+                await stop()
+            except Exception as e:
+                logger.error(f"Ошибка при остановке {stop.__module__}.{stop.__name__}: {e}")
 
 if __name__ == "__main__":
     try:
@@ -3,12 +3,11 @@
 """
 Функции для работы с памятью диалогов
 """
-from typing import Dict, List, Any, Optional, Set
+from typing import Callable, Dict, List, Any, Optional, Set
 import logging
 import datetime
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Логгер модуля (логирование настраивается в main.py)
 logger = logging.getLogger(__name__)
 
 # Глобальный словарь для хранения диалогов
@@ -18,6 +17,12 @@ dialogs = {}
 # Множество для отслеживания чатов, где уже было первое сообщение от бота
 first_bot_message_sent: Set[int] = set()
 
+# Подписчики на новые сообщения: функции (chat_id, role, content)
+message_listeners: List[Callable[[int, str, str], None]] = []
+
+# Подписчики на очистку истории: функции (chat_id)
+clear_listeners: List[Callable[[int], None]] = []
+
 def add_message(chat_id: int, role: str, content: str) -> None:
     """
     Добавляет сообщение в историю диалога
@@ -41,6 +46,9 @@ def add_message(chat_id: int, role: str, content: str) -> None:
     
     dialogs[chat_id].append(message)
     logger.debug(f"Добавлено сообщение для чата {chat_id}: {role}")
+
+    for listener in message_listeners:
+        listener(chat_id, role, content)
     
     # Отмечаем, что для этого чата было отправлено сообщение от бота
     if role == "assistant" and chat_id not in first_bot_message_sent:
@@ -101,6 +109,9 @@ def clear_dialog_history(chat_id: int) -> None:
     if chat_id in dialogs:
         dialogs[chat_id] = []
         logger.info(f"История диалога для чата {chat_id} очищена")
+
+    for listener in clear_listeners:
+        listener(chat_id)
     
     # Также удаляем информацию о первом сообщении
     if chat_id in first_bot_message_sent:
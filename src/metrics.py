@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для сбора метрик работы бота в памяти процесса
+"""
+import logging
+from collections import deque
+from typing import Any, Deque, Dict
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Количество последних наблюдений, по которым считаются перцентили
+MAX_OBSERVATIONS = 1000
+
+# Счетчики: {ключ метрики: значение}
+counters: Dict[str, float] = {}
+
+# Текущие значения (уровни, размеры очередей): {ключ метрики: значение}
+gauges: Dict[str, float] = {}
+
+# Наблюдения (например, задержки): {ключ метрики: последние значения}
+observations: Dict[str, Deque[float]] = {}
+
+def metric_key(name: str, **labels: Any) -> str:
+    """
+    Формирует ключ метрики из имени и меток
+
+    Args:
+        name: Имя метрики
+        labels: Метки метрики (например, style="cat")
+
+    Returns:
+        Ключ вида name{label1=value1,label2=value2}
+    """
+    if not labels:
+        return name
+    label_text = ",".join(f"{key}={value}" for key, value in sorted(labels.items()))
+    return f"{name}{{{label_text}}}"
+
+def inc(name: str, value: float = 1, **labels: Any) -> None:
+    """
+    Увеличивает счетчик
+
+    Args:
+        name: Имя метрики
+        value: Величина увеличения
+        labels: Метки метрики
+    """
+    key = metric_key(name, **labels)
+    counters[key] = counters.get(key, 0) + value
+
+def set_gauge(name: str, value: float, **labels: Any) -> None:
+    """
+    Устанавливает текущее значение метрики
+
+    Args:
+        name: Имя метрики
+        value: Новое значение
+        labels: Метки метрики
+    """
+    gauges[metric_key(name, **labels)] = value
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    """
+    Сохраняет наблюдение (например, длительность операции)
+
+    Args:
+        name: Имя метрики
+        value: Наблюдаемое значение
+        labels: Метки метрики
+    """
+    key = metric_key(name, **labels)
+    if key not in observations:
+        observations[key] = deque(maxlen=MAX_OBSERVATIONS)
+    observations[key].append(value)
+
+def get_counter(name: str, **labels: Any) -> float:
+    """
+    Возвращает значение счетчика
+
+    Args:
+        name: Имя метрики
+        labels: Метки метрики
+
+    Returns:
+        Значение счетчика (0, если счетчик еще не увеличивался)
+    """
+    return counters.get(metric_key(name, **labels), 0)
+
+def summarize(values: Deque[float]) -> Dict[str, float]:
+    """
+    Считает сводную статистику по наблюдениям
+
+    Args:
+        values: Наблюдения
+
+    Returns:
+        Словарь с количеством, средним, медианой, p95 и максимумом
+    """
+    ordered = sorted(values)
+    count = len(ordered)
+    if count == 0:
+        return {"count": 0}
+    return {
+        "count": count,
+        "avg": sum(ordered) / count,
+        "p50": ordered[int(0.5 * (count - 1))],
+        "p95": ordered[int(0.95 * (count - 1))],
+        "max": ordered[-1]
+    }
+
+def get_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    Возвращает снимок всех метрик
+
+    Returns:
+        Словарь с разделами counters, gauges и summaries
+    """
+    return {
+        "counters": dict(counters),
+        "gauges": dict(gauges),
+        "summaries": {key: summarize(values) for key, values in observations.items()}
+    }
+
+def reset_metrics() -> None:
+    """
+    Сбрасывает все метрики
+    """
+    counters.clear()
+    gauges.clear()
+    observations.clear()
+    logger.info("Метрики сброшены")
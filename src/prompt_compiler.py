@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для компиляции промптов стилей в компактный вид
+
+Промпт стиля отправляется системным сообщением в каждом запросе,
+поэтому лишние символы стоят токенов и времени на каждом ходе диалога.
+Компиляция:
+- убирает лишние пробелы, пустые строки и отступы вложенных списков;
+- убирает разметку markdown (заголовки #, выделение ** и __);
+- выносит разделы, одинаковые в нескольких промптах (например, сведения
+  о компании), в общие фрагменты, которые ставятся в начало промпта.
+
+Модель должна видеть сведения общего фрагмента в каждом запросе, поэтому
+вынос не уменьшает число токенов запроса. Он дает другое: у стилей с общим
+фрагментом совпадает начало системного сообщения (бэкенд переиспользует
+кэш префикса, отчет показывает размер этого префикса), а на диске фрагмент
+хранится один раз - файл промпта содержит только собственные разделы.
+
+Результат записывается в prompts/compiled рядом с исходными файлами
+вместе с манифестом (хэши исходников, фрагменты и количество токенов).
+load_compiled_prompt собирает промпт из фрагментов и собственных разделов;
+если скомпилированный промпт отсутствует или устарел, исходники
+компилируются в памяти.
+
+Сборка и отчет о токенах:
+
+    python -m src.prompt_compiler
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Путь к директории с промптами
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prompts')
+
+# Поддиректория скомпилированных промптов
+COMPILED_DIR = "compiled"
+
+# Манифест скомпилированных промптов
+MANIFEST_FILE = "manifest.json"
+
+# Примерное количество символов на токен (как в llm.CHARS_PER_TOKEN)
+CHARS_PER_TOKEN = 3
+
+# Минимальная длина раздела, который выносится в общий фрагмент
+MIN_SHARED_CHARS = 200
+
+# Результаты компиляции в памяти (если скомпилированные файлы устарели): {директория: результат}
+compiled_cache: Dict[str, Dict[str, Any]] = {}
+
+def estimate_tokens(text: str) -> int:
+    """
+    Оценивает количество токенов текста
+
+    Args:
+        text: Текст
+
+    Returns:
+        Примерное количество токенов
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def source_hash(text: str) -> str:
+    """
+    Вычисляет хэш исходного промпта
+
+    Args:
+        text: Текст исходного промпта
+
+    Returns:
+        Хэш SHA-256 (первые 16 символов)
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+def minify(text: str) -> str:
+    """
+    Убирает из промпта лишние пробелы и разметку, сохраняя строки и разделы
+
+    Args:
+        text: Текст промпта
+
+    Returns:
+        Компактный текст
+    """
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        # Заголовки markdown становятся обычными строками
+        stripped = re.sub(r"^#+\s*", "", stripped)
+        # Выделение markdown (описание запрета на * и ** в правилах не затрагивается)
+        stripped = re.sub(r"\*\*([^*\s][^*]*?)\*\*|__([^_\s][^_]*?)__", lambda m: m.group(1) or m.group(2), stripped)
+        stripped = re.sub(r"[ \t]{2,}", " ", stripped)
+        # Вложенный пункт списка сохраняет признак вложенности одним пробелом
+        indent = " " if line[:1].isspace() and re.match(r"[-•]|\d+\.", stripped) else ""
+        lines.append(indent + stripped)
+    return "\n".join(lines)
+
+def split_sections(text: str) -> List[str]:
+    """
+    Делит промпт на разделы, разделенные пустыми строками
+
+    Args:
+        text: Текст промпта
+
+    Returns:
+        Непустые разделы
+    """
+    return [section.strip("\n") for section in re.split(r"\n[ \t]*\n", text) if section.strip()]
+
+def compile_prompts(sources: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Компилирует промпты стилей
+
+    Args:
+        sources: Исходные промпты {имя файла: текст}
+
+    Returns:
+        Словарь {prompts: {имя файла: полный текст}, own: {имя файла: собственные разделы},
+        fragments: [текст], report: {имя файла: {...}}}
+    """
+    sectioned = {name: [minify(section) for section in split_sections(text)] for name, text in sources.items()}
+
+    # Разделы, которые встречаются в нескольких промптах
+    counts: Dict[str, int] = {}
+    for sections in sectioned.values():
+        for section in set(sections):
+            counts[section] = counts.get(section, 0) + 1
+    fragments = [
+        section for section in dict.fromkeys(section for sections in sectioned.values() for section in sections)
+        if counts[section] > 1 and len(section) >= MIN_SHARED_CHARS
+    ]
+
+    prompts = {}
+    own_sections = {}
+    report = {}
+    for name, sections in sectioned.items():
+        shared = [fragment for fragment in fragments if fragment in sections]
+        own_sections[name] = "\n".join(section for section in sections if section not in shared)
+        prompts[name] = assemble(shared, own_sections[name])
+        report[name] = {
+            "source_hash": source_hash(sources[name]),
+            "source_chars": len(sources[name]),
+            "source_tokens": estimate_tokens(sources[name]),
+            "compiled_chars": len(prompts[name]),
+            "compiled_tokens": estimate_tokens(prompts[name]),
+            # Общее начало с другими промптами (кэшируемый префикс)
+            "shared_tokens": estimate_tokens("\n".join(shared)),
+            "fragments": [fragments.index(fragment) for fragment in shared]
+        }
+    return {"prompts": prompts, "own": own_sections, "fragments": fragments, "report": report}
+
+def assemble(fragments: List[str], own: str) -> str:
+    """
+    Собирает промпт из общих фрагментов и собственных разделов
+
+    Args:
+        fragments: Общие фрагменты промпта (ставятся в начало)
+        own: Собственные разделы промпта
+
+    Returns:
+        Текст промпта
+    """
+    return "\n".join(fragments + ([own] if own else []))
+
+def fragment_file(index: int) -> str:
+    """
+    Возвращает имя файла общего фрагмента
+
+    Args:
+        index: Номер фрагмента
+
+    Returns:
+        Имя файла в поддиректории compiled
+    """
+    return f"shared_{index}.fragment"
+
+def read_sources(directory: str = PROMPTS_DIR) -> Dict[str, str]:
+    """
+    Читает исходные промпты (*.txt) директории
+
+    Args:
+        directory: Директория промптов
+
+    Returns:
+        Словарь {имя файла: текст}
+    """
+    sources = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".txt"):
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as file:
+                sources[name] = file.read()
+    return sources
+
+def build(directory: str = PROMPTS_DIR) -> Dict[str, Any]:
+    """
+    Компилирует промпты директории и записывает результат в поддиректорию compiled
+
+    Args:
+        directory: Директория промптов
+
+    Returns:
+        Результат компиляции (compile_prompts)
+    """
+    result = compile_prompts(read_sources(directory))
+    output = os.path.join(directory, COMPILED_DIR)
+    os.makedirs(output, exist_ok=True)
+    # Общие фрагменты записываются один раз, файлы промптов - без них
+    for name, text in result["own"].items():
+        with open(os.path.join(output, name), "w", encoding="utf-8") as file:
+            file.write(text)
+    for i, fragment in enumerate(result["fragments"]):
+        with open(os.path.join(output, fragment_file(i)), "w", encoding="utf-8") as file:
+            file.write(fragment)
+    with open(os.path.join(output, MANIFEST_FILE), "w", encoding="utf-8") as file:
+        json.dump(result["report"], file, ensure_ascii=False, indent=2)
+        file.write("\n")
+    return result
+
+def load_compiled_prompt(prompt_file: str, directory: str = PROMPTS_DIR) -> str:
+    """
+    Возвращает скомпилированный промпт
+
+    Промпт собирается из общих фрагментов манифеста и файла собственных
+    разделов prompts/compiled, если хэш исходника совпадает с манифестом;
+    иначе исходники компилируются в памяти.
+
+    Args:
+        prompt_file: Имя файла исходного промпта (например, cat_mode.txt)
+        directory: Директория промптов
+
+    Returns:
+        Текст скомпилированного промпта
+
+    Raises:
+        OSError: Если исходный промпт не найден
+    """
+    with open(os.path.join(directory, prompt_file), "r", encoding="utf-8") as file:
+        source = file.read()
+
+    output = os.path.join(directory, COMPILED_DIR)
+    manifest_path = os.path.join(output, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            entry = json.load(file).get(prompt_file)
+        compiled_path = os.path.join(output, prompt_file)
+        if entry and entry["source_hash"] == source_hash(source) and os.path.exists(compiled_path):
+            fragments = []
+            for index in entry["fragments"]:
+                with open(os.path.join(output, fragment_file(index)), "r", encoding="utf-8") as file:
+                    fragments.append(file.read())
+            with open(compiled_path, "r", encoding="utf-8") as file:
+                return assemble(fragments, file.read())
+
+    logger.warning(f"Скомпилированный промпт {prompt_file} отсутствует или устарел, компиляция в памяти")
+    compiled = compiled_cache.get(directory)
+    if compiled is None or prompt_file not in compiled["prompts"] or \
+            compiled["report"][prompt_file]["source_hash"] != source_hash(source):
+        compiled = compiled_cache[directory] = compile_prompts(read_sources(directory))
+    return compiled["prompts"][prompt_file]
+
+def main() -> None:
+    """
+    Компилирует промпты и выводит отчет о количестве токенов
+    """
+    result = build()
+    print(f"{'Промпт':<22}{'Символы':>16}{'Токены':>14}{'Экономия':>10}{'Общий префикс':>15}")
+    for name, entry in result["report"].items():
+        saved = 1 - entry["compiled_tokens"] / entry["source_tokens"]
+        print(
+            f"{name:<22}{entry['source_chars']:>7} -> {entry['compiled_chars']:<6}"
+            f"{entry['source_tokens']:>6} -> {entry['compiled_tokens']:<5}{saved:>9.1%}"
+            f"{entry['shared_tokens']:>15}"
+        )
+    # Токены запроса вынос фрагментов не уменьшает: он уменьшает файлы и дает общий префикс
+    stored = sum(len(text) for text in result["own"].values()) + sum(len(text) for text in result["fragments"])
+    inlined = sum(len(text) for text in result["prompts"].values())
+    print(f"Общих фрагментов: {len(result['fragments'])}, на диске {stored} символов вместо {inlined}")
+
+if __name__ == "__main__":
+    main()
@@ -4,36 +4,109 @@
 Функции для работы с промптами
 """
 import os
+import json
+import asyncio
 import logging
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+from src.styles import STYLE_NORMAL, STYLE_REGISTRY, load_style_prompt
+from src.context import HISTORY_WINDOW, build_messages
+from src import degradation
+
+# Логгер модуля (логирование настраивается в main.py)
 logger = logging.getLogger(__name__)
 
 # Путь к директории с промптами
 PROMPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prompts')
 
-def load_system_prompt() -> Optional[str]:
+# Файл с бюджетами длины ответа для сценариев и стилей
+BUDGETS_FILE = 'budgets.json'
+
+# Сценарии, для которых задаются бюджеты
+SCENARIO_START = "start"
+SCENARIO_SERVICE = "service"
+SCENARIO_CHAT = "chat"
+
+# Загруженные бюджеты: {"scenarios": {...}, "styles": {...}}
+output_budgets: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
+
+def load_output_budgets() -> Dict[str, Dict[str, Dict[str, Any]]]:
     """
-    Загружает системный промпт из файла
+    Загружает бюджеты длины ответа из файла рядом с промптами
+    
+    Файл читается один раз, затем бюджеты берутся из памяти.
     
     Returns:
-        Текст системного промпта или None в случае ошибки
+        Словарь {"scenarios": {сценарий: бюджет}, "styles": {стиль: бюджет}}
     """
+    global output_budgets
+    if output_budgets is not None:
+        return output_budgets
+    
+    budgets_path = os.path.join(PROMPTS_DIR, BUDGETS_FILE)
     try:
-        system_prompt_path = os.path.join(PROMPTS_DIR, 'system.txt')
-        if not os.path.exists(system_prompt_path):
-            logger.error(f"Системный промпт не найден по пути: {system_prompt_path}")
-            return None
-            
-        with open(system_prompt_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            logger.info(f"Системный промпт загружен ({len(content)} символов)")
-            return content
+        with open(budgets_path, 'r', encoding='utf-8') as file:
+            output_budgets = json.load(file)
+            logger.info(f"Загружены бюджеты длины ответа из {budgets_path}")
     except Exception as e:
-        logger.error(f"Ошибка при загрузке системного промпта: {e}")
-        return None
+        logger.error(f"Ошибка при загрузке бюджетов длины ответа: {e}")
+        output_budgets = {}
+    return output_budgets
+
+def get_output_budget(scenario: Optional[str] = None, style: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Возвращает бюджет ответа для сочетания сценария и стиля
+    
+    Лимит токенов - наименьший из лимитов сценария и стиля,
+    стоп-последовательности объединяются.
+    
+    Args:
+        scenario: Сценарий (start, service, chat)
+        style: Стиль ответа
+        
+    Returns:
+        Словарь {max_tokens, stop}; max_tokens равен None, если бюджет не задан
+    """
+    budgets = load_output_budgets()
+    parts = [
+        budgets.get("scenarios", {}).get(scenario, {}),
+        budgets.get("styles", {}).get(style, {})
+    ]
+    
+    limits = [part["max_tokens"] for part in parts if part.get("max_tokens")]
+    stop = []
+    for part in parts:
+        for sequence in part.get("stop", []):
+            if sequence not in stop:
+                stop.append(sequence)
+    
+    # API принимает не более четырех стоп-последовательностей
+    return {"max_tokens": min(limits) if limits else None, "stop": stop[:4]}
+
+async def preload_prompts() -> None:
+    """
+    Загружает промпты всех стилей и бюджеты длины ответа параллельно
+    
+    Файлы читаются в отдельных потоках при запуске бота, чтобы первые
+    запросы пользователей не ждали чтения с диска.
+    """
+    await asyncio.gather(
+        *(asyncio.to_thread(load_style_prompt, style) for style in STYLE_REGISTRY),
+        asyncio.to_thread(load_output_budgets)
+    )
+
+def load_system_prompt() -> Optional[str]:
+    """
+    Возвращает системный промпт
+    
+    Системный промпт - промпт обычного стиля: он загружается так же, как
+    промпты остальных стилей (load_style_prompt), то есть в скомпилированном
+    виде из директории промптов арендатора и с кэшированием.
+    
+    Returns:
+        Текст системного промпта или None в случае ошибки
+    """
+    return load_style_prompt(STYLE_NORMAL)
 
 def create_messages_for_llm(user_message: str, chat_id: Optional[int] = None) -> List[Dict[str, str]]:
     """
@@ -46,41 +119,22 @@ def create_messages_for_llm(user_message: str, chat_id: Optional[int] = None) ->
     Returns:
         Список сообщений в формате [{role, content}]
     """
-    messages = []
-    
-    # Определяем стиль ответа на основе сообщения пользователя и его предпочтений
     if chat_id is not None:
-        from src.styles import load_style_prompt, user_styles
-        
-        # Используем стиль, который уже был определен в bot.py
-        # Это гарантирует, что метка стиля соответствует содержимому ответа
-        style = user_styles.get(chat_id, "normal")
-        
-        # Загружаем системный промпт для определенного стиля
-        system_prompt = load_style_prompt(style)
-    else:
-        # Если chat_id не указан, используем стандартный промпт
-        system_prompt = load_system_prompt()
-    
-    # Добавляем системный промпт
+        # Системный промпт стиля и история берутся из контекста чата,
+        # который обновляется при каждом новом сообщении. При перегрузке
+        # окно истории сокращается (degradation)
+        return build_messages(chat_id, user_message, degradation.history_window(HISTORY_WINDOW))
+
+    messages = []
+
+    # Если chat_id не указан, используем стандартный промпт
+    system_prompt = load_system_prompt()
     if system_prompt:
         messages.append({
             "role": "system",
             "content": system_prompt
         })
     
-    # Добавляем историю диалога, если указан chat_id
-    if chat_id is not None:
-        from src.memory import get_dialog_messages_for_llm
-        history_messages = get_dialog_messages_for_llm(chat_id)
-        
-        # Добавляем только сообщения пользователя и ассистента из истории
-        for msg in history_messages:
-            if msg["role"] in ["user", "assistant"]:
-                messages.append(msg)
-                
-        logger.debug(f"Добавлено {len(history_messages)} сообщений из истории для чата {chat_id}")
-    
     # Добавляем текущее сообщение пользователя
     messages.append({
         "role": "user",
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для ограничения частоты операций (алгоритм token bucket)
+"""
+import asyncio
+import time
+from typing import Dict
+
+def create_bucket(rate: float, capacity: float) -> Dict[str, float]:
+    """
+    Создает корзину токенов
+
+    Args:
+        rate: Скорость пополнения (токенов в секунду)
+        capacity: Максимальное количество токенов (допустимый всплеск)
+
+    Returns:
+        Словарь с состоянием корзины
+    """
+    return {
+        "rate": rate,
+        "capacity": capacity,
+        "tokens": capacity,
+        "updated": time.monotonic()
+    }
+
+def _refill(bucket: Dict[str, float]) -> None:
+    """
+    Пополняет корзину токенами за прошедшее время
+
+    Args:
+        bucket: Состояние корзины
+    """
+    now = time.monotonic()
+    elapsed = now - bucket["updated"]
+    bucket["tokens"] = min(bucket["capacity"], bucket["tokens"] + elapsed * bucket["rate"])
+    bucket["updated"] = now
+
+def try_acquire(bucket: Dict[str, float], tokens: float = 1) -> bool:
+    """
+    Забирает токены из корзины, если их достаточно
+
+    Args:
+        bucket: Состояние корзины
+        tokens: Количество токенов
+
+    Returns:
+        True, если токены получены, иначе False
+    """
+    _refill(bucket)
+    if bucket["tokens"] >= tokens:
+        bucket["tokens"] -= tokens
+        return True
+    return False
+
+def time_until_available(bucket: Dict[str, float], tokens: float = 1) -> float:
+    """
+    Возвращает время ожидания до появления нужного количества токенов
+
+    Args:
+        bucket: Состояние корзины
+        tokens: Количество токенов
+
+    Returns:
+        Время ожидания в секундах (0, если токены уже есть)
+    """
+    _refill(bucket)
+    missing = tokens - bucket["tokens"]
+    if missing <= 0:
+        return 0.0
+    return missing / bucket["rate"]
+
+async def acquire(bucket: Dict[str, float], tokens: float = 1) -> None:
+    """
+    Ждет появления токенов и забирает их
+
+    Args:
+        bucket: Состояние корзины
+        tokens: Количество токенов
+    """
+    while not try_acquire(bucket, tokens):
+        await asyncio.sleep(time_until_available(bucket, tokens))
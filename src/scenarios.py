@@ -3,34 +3,74 @@
 """
 Функции для работы с различными сценариями взаимодействия с пользователем
 """
+import html
 import logging
 import re
+import time
 from typing import Dict, Any, Optional, List
 from aiogram import types
 from aiogram.utils.markdown import hbold, hlink
 
-from src.llm import generate_response
-from src.prompts import create_messages_for_llm
+from src import metrics
+from src.llm import generate_response, OVERLOADED_RESPONSE, ROUTE_FAST, ROUTE_FULL
+from src.prompts import create_messages_for_llm, SCENARIO_START, SCENARIO_SERVICE, SCENARIO_CHAT
 from src.memory import add_message, clear_dialog_history
+from src.chat_action import keep_typing
+from src.sender import send_answer
+from src.styles import STYLE_NORMAL, user_styles
+from src.tenants import get_tenant, tenant_key
+from src.greetings import USER_NAME_PLACEHOLDER, take_greeting
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Логгер модуля (логирование настраивается в main.py)
 logger = logging.getLogger(__name__)
 
-async def handle_start_command(message: types.Message, style_badge: str = None) -> None:
+# Ключевые слова и соответствующие им ссылки для add_clickable_links
+DEFAULT_LINKS: Dict[str, str] = {
+    "ООО \"ТехноСервис\"": "https://technoservice.ru",
+    "ТехноСервис": "https://technoservice.ru",
+    "наш сайт": "https://technoservice.ru",
+    "веб-приложений": "https://technoservice.ru/web",
+    "мобильных приложений": "https://technoservice.ru/mobile",
+    "автоматизация бизнес-процессов": "https://technoservice.ru/automation",
+    "IT-консалтинг": "https://technoservice.ru/consulting",
+    "менеджер": "https://t.me/manager_technoservice",
+    "контакты": "https://technoservice.ru/contacts",
+    "+7 (999) 123-45-67": "tel:+79991234567",
+    "info@technoservice.ru": "mailto:info@technoservice.ru"
+}
+
+async def handle_start_command(message: types.Message, style_badge: str = None, style: Optional[str] = None) -> None:
     """
     Обрабатывает команду /start, реализуя сценарий приветствия
     
+    Приветствие берется из пула заранее сгенерированных вариантов;
+    к LLM бот обращается, только если пул стиля пуст.
+    
     Args:
         message: Сообщение пользователя с командой /start
         style_badge: HTML-метка текущего стиля (опционально)
+        style: Стиль ответа (по умолчанию обычный)
     """
+    started = time.monotonic()
     chat_id = message.chat.id
+    chat_key = tenant_key(chat_id)
     user_id = message.from_user.id
     user_name = message.from_user.first_name
     
     # Очищаем предыдущую историю диалога
-    clear_dialog_history(chat_id)
+    clear_dialog_history(chat_key)
+    
+    # Готовое приветствие из пула: отвечаем сразу, без запроса к LLM
+    greeting = take_greeting(style or STYLE_NORMAL)
+    if greeting:
+        formatted_greeting = add_clickable_links(greeting.replace(USER_NAME_PLACEHOLDER, html.escape(user_name)))
+        if style_badge:
+            formatted_greeting = f"{style_badge}\n\n{formatted_greeting}"
+        await send_answer(message, formatted_greeting, parse_mode="HTML")
+        add_message(chat_key, "assistant", greeting.replace(USER_NAME_PLACEHOLDER, user_name))
+        metrics.observe("start_latency_seconds", time.monotonic() - started, source="pool")
+        logger.info(f"Отправлено приветствие из пула пользователю {user_id}")
+        return
     
     # Создаем специальный промпт для приветствия
     greeting_prompt = f"Пользователь {user_name} только что запустил бота. Поприветствуй его, представься как ассистент компании ООО \"ТехноСервис\", кратко расскажи о компании и спроси, чем можешь помочь. Ответ должен быть дружелюбным и профессиональным."
@@ -38,10 +78,15 @@ async def handle_start_command(message: types.Message, style_badge: str = None)
     # Создаем сообщения для LLM
     messages = create_messages_for_llm(greeting_prompt)
     
-    # Получаем ответ от LLM
-    response = await generate_response(messages)
+    # Получаем ответ от LLM, поддерживая индикатор набора текста.
+    # Приветствие простое, поэтому закрепляем быстрый маршрут
+    async with keep_typing(message.bot, chat_id):
+        response = await generate_response(messages, route=ROUTE_FAST, scenario=SCENARIO_START, chat_id=chat_key)
+    metrics.observe("start_latency_seconds", time.monotonic() - started, source="live")
     
-    if response:
+    # При перегрузке запрос к LLM не отправляется: стандартное приветствие -
+    # быстрый путь, а не ошибка
+    if response and response != OVERLOADED_RESPONSE:
         # Добавляем кликабельные ссылки в ответ
         formatted_response = add_clickable_links(response)
         
@@ -50,10 +95,10 @@ async def handle_start_command(message: types.Message, style_badge: str = None)
             formatted_response = f"{style_badge}\n\n{formatted_response}"
             
         # Отправляем приветственное сообщение с поддержкой HTML-форматирования
-        await message.answer(formatted_response, parse_mode="HTML")
+        await send_answer(message, formatted_response, parse_mode="HTML")
         
         # Сохраняем оригинальное приветственное сообщение в историю
-        add_message(chat_id, "assistant", response)
+        add_message(chat_key, "assistant", response)
         
         logger.info(f"Отправлено приветственное сообщение пользователю {user_id}")
     else:
@@ -65,14 +110,31 @@ async def handle_start_command(message: types.Message, style_badge: str = None)
         if style_badge:
             default_greeting = f"{style_badge}\n\n{default_greeting}"
             
-        await message.answer(default_greeting, parse_mode="HTML")
+        await send_answer(message, default_greeting, parse_mode="HTML")
         
         # Сохраняем стандартное приветствие в историю (без HTML-тегов)
-        add_message(chat_id, "assistant", f"Здравствуйте, {user_name}! Я ассистент компании ООО \"ТехноСервис\". Мы специализируемся на IT-консалтинге и разработке программного обеспечения. Более подробную информацию о наших услугах вы можете узнать на нашем сайте. Чем я могу вам помочь?")
+        add_message(chat_key, "assistant", f"Здравствуйте, {user_name}! Я ассистент компании ООО \"ТехноСервис\". Мы специализируемся на IT-консалтинге и разработке программного обеспечения. Более подробную информацию о наших услугах вы можете узнать на нашем сайте. Чем я могу вам помочь?")
         
-        logger.error(f"Ошибка при получении приветственного сообщения от LLM для пользователя {user_id}")
+        if response is None:
+            logger.error(f"Ошибка при получении приветственного сообщения от LLM для пользователя {user_id}")
+        else:
+            logger.info(f"Отправлено стандартное приветствие пользователю {user_id} из-за перегрузки")
+
+async def send_overloaded_reply(message: types.Message, chat_key: Any, style_badge: Optional[str] = None) -> None:
+    """
+    Отправляет ответ о перегрузке, когда запрос к LLM не был отправлен
+    
+    Args:
+        message: Сообщение пользователя
+        chat_key: Ключ чата (tenant_key) для истории диалога
+        style_badge: HTML-метка стиля (опционально)
+    """
+    text = f"{style_badge}\n\n{OVERLOADED_RESPONSE}" if style_badge else OVERLOADED_RESPONSE
+    await send_answer(message, text, parse_mode="HTML")
+    add_message(chat_key, "assistant", OVERLOADED_RESPONSE)
+    logger.info(f"Отправлен ответ о перегрузке в чат {message.chat.id}")
 
-async def handle_service_inquiry(message: types.Message, service_type: Optional[str] = None, style_badge: str = None) -> None:
+async def handle_service_inquiry(message: types.Message, service_type: Optional[str] = None, style_badge: str = None, user_text: Optional[str] = None) -> None:
     """
     Обрабатывает запрос о услугах компании
     
@@ -80,26 +142,46 @@ async def handle_service_inquiry(message: types.Message, service_type: Optional[
         message: Сообщение пользователя
         service_type: Тип услуги, если удалось определить
         style_badge: HTML-метка текущего стиля (опционально)
+        user_text: Текст запроса, если он отличается от текста сообщения
+            (например, объединенная серия сообщений)
     """
     chat_id = message.chat.id
+    chat_key = tenant_key(chat_id)
     user_id = message.from_user.id
-    user_text = message.text
+    if user_text is None:
+        user_text = message.text
     
     # Сохраняем сообщение пользователя в историю
-    add_message(chat_id, "user", user_text)
+    add_message(chat_key, "user", user_text)
     
     # Создаем специальный промпт для ответа на вопрос об услугах
     if service_type:
         service_prompt = f"Пользователь интересуется услугой '{service_type}'. Предоставь подробную информацию об этой услуге, укажи примерную стоимость и сроки. Предложи дополнительные релевантные услуги."
-        messages = create_messages_for_llm(service_prompt, chat_id)
+        messages = create_messages_for_llm(service_prompt, chat_key)
+        # Подробное описание услуги со стоимостью требует большой модели
+        route = ROUTE_FULL
+        scenario = SCENARIO_SERVICE
     else:
         # Используем обычный промпт с историей диалога
-        messages = create_messages_for_llm(user_text, chat_id)
+        messages = create_messages_for_llm(user_text, chat_key)
+        route = None
+        scenario = SCENARIO_CHAT
     
-    # Получаем ответ от LLM
-    response = await generate_response(messages)
+    # Получаем ответ от LLM, поддерживая индикатор набора текста
+    async with keep_typing(message.bot, chat_id):
+        response = await generate_response(
+            messages,
+            route=route,
+            # Стиль уже выбран вызывающим обработчиком для этого сообщения
+            style=user_styles.get(chat_key, STYLE_NORMAL),
+            service_type=service_type,
+            scenario=scenario,
+            chat_id=chat_key
+        )
     
-    if response:
+    if response == OVERLOADED_RESPONSE:
+        await send_overloaded_reply(message, chat_key, style_badge)
+    elif response:
         # Добавляем кликабельные ссылки в ответ
         formatted_response = add_clickable_links(response)
         
@@ -108,10 +190,10 @@ async def handle_service_inquiry(message: types.Message, service_type: Optional[
             formatted_response = f"{style_badge}\n\n{formatted_response}"
             
         # Отправляем ответ пользователю с поддержкой HTML-форматирования
-        await message.answer(formatted_response, parse_mode="HTML")
+        await send_answer(message, formatted_response, parse_mode="HTML")
         
         # Сохраняем оригинальный ответ в историю
-        add_message(chat_id, "assistant", response)
+        add_message(chat_key, "assistant", response)
         
         logger.info(f"Отправлен ответ на запрос об услугах пользователю {user_id}")
     else:
@@ -123,10 +205,10 @@ async def handle_service_inquiry(message: types.Message, service_type: Optional[
         if style_badge:
             default_response = f"{style_badge}\n\n{default_response}"
             
-        await message.answer(default_response, parse_mode="HTML")
+        await send_answer(message, default_response, parse_mode="HTML")
         
         # Сохраняем стандартный ответ в историю (без HTML-тегов)
-        add_message(chat_id, "assistant", "Извините, произошла ошибка. Пожалуйста, уточните ваш вопрос или свяжитесь с менеджером.")
+        add_message(chat_key, "assistant", "Извините, произошла ошибка. Пожалуйста, уточните ваш вопрос или свяжитесь с менеджером.")
         
         logger.error(f"Ошибка при получении ответа от LLM для пользователя {user_id}")
 
@@ -183,20 +265,8 @@ def add_clickable_links(text: str) -> str:
     Returns:
         Текст с HTML-разметкой для кликабельных ссылок
     """
-    # Словарь с ключевыми словами и соответствующими ссылками
-    link_keywords = {
-        "ООО \"ТехноСервис\"": "https://technoservice.ru",
-        "ТехноСервис": "https://technoservice.ru",
-        "наш сайт": "https://technoservice.ru",
-        "веб-приложений": "https://technoservice.ru/web",
-        "мобильных приложений": "https://technoservice.ru/mobile",
-        "автоматизация бизнес-процессов": "https://technoservice.ru/automation",
-        "IT-консалтинг": "https://technoservice.ru/consulting",
-        "менеджер": "https://t.me/manager_technoservice",
-        "контакты": "https://technoservice.ru/contacts",
-        "+7 (999) 123-45-67": "tel:+79991234567",
-        "info@technoservice.ru": "mailto:info@technoservice.ru"
-    }
+    # Таблица ссылок текущего арендатора (по умолчанию - ссылки основного бота)
+    link_keywords = get_tenant()["links"] or DEFAULT_LINKS
     
     # Заменяем ключевые слова на кликабельные ссылки
     result = text
@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для отправки сообщений в Telegram через очередь с учетом лимитов
+"""
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from aiogram import types
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+
+from src import metrics
+from src.rate_limit import acquire, create_bucket, time_until_available
+from src.tenants import tenant_key
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Максимальная длина сообщения в Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+# Максимальное количество отправок в очереди одного чата
+MAX_CHAT_QUEUE_SIZE = 50
+
+# Количество попыток отправки одной части сообщения
+MAX_SEND_ATTEMPTS = 5
+
+# Пауза перед повторной отправкой после сетевой ошибки (в секундах)
+NETWORK_RETRY_DELAY = 1.0
+
+# Количество корзин чатов, после которого удаляются неактивные
+MAX_CHAT_BUCKETS = 1000
+
+# Регулярное выражение для поиска HTML-тегов
+TAG_PATTERN = re.compile(r"<[^<>]*>")
+
+# HTML-теги и сущности (&amp; и т.п.), внутри которых нельзя резать текст
+TOKEN_PATTERN = re.compile(r"<[^<>]*>|&#?\w+;")
+
+# Имя тега в открывающем или закрывающем теге
+TAG_NAME_PATTERN = re.compile(r"</?\s*([\w-]+)")
+
+# Глобальный лимит Telegram: около 30 сообщений в секунду
+global_bucket = create_bucket(rate=30, capacity=30)
+
+# Лимиты Telegram действуют для каждого бота отдельно, поэтому состояние
+# чатов хранится по tenant_key(chat_id): у ботов разных арендаторов
+# с одним и тем же пользователем свои корзины и очереди
+
+# Лимиты отдельных чатов: {tenant_key(chat_id): корзина}
+chat_buckets: Dict[Any, Dict[str, float]] = {}
+
+# Очереди отправки: {tenant_key(chat_id): deque([отправка, ...])}
+chat_queues: Dict[Any, Deque[Dict[str, Any]]] = {}
+
+# Задачи, отправляющие сообщения из очередей: {tenant_key(chat_id): task}
+chat_workers: Dict[Any, asyncio.Task] = {}
+
+# Общее количество отправок в очередях
+queued_total = 0
+
+# Время (time.monotonic), до которого приостановлены все отправки после RetryAfter
+paused_until = 0.0
+
+# Режим работы: True - обработчики только ставят сообщения в очередь,
+# False - сообщение отправляется сразу (например, в тестах и скриптах)
+background_sending = False
+
+def start_sender() -> None:
+    """
+    Включает фоновую отправку сообщений через очереди
+    """
+    global background_sending
+    background_sending = True
+    logger.info("Очередь исходящих сообщений запущена")
+
+async def stop_sender(timeout: float = 10.0) -> None:
+    """
+    Отключает фоновую отправку и ждет отправки сообщений из очередей
+
+    Args:
+        timeout: Максимальное время ожидания в секундах
+    """
+    global background_sending
+    background_sending = False
+    workers = list(chat_workers.values())
+    if workers:
+        logger.info(f"Ожидание отправки сообщений из {len(workers)} очередей")
+        await asyncio.wait(workers, timeout=timeout)
+
+def split_message(text: str, limit: Optional[int] = None) -> List[str]:
+    """
+    Разбивает длинный текст на части, не разрывая HTML-теги
+
+    Текст делится по границам абзацев, затем строк, затем слов.
+    Позиции внутри тегов и между открывающим и закрывающим тегом
+    не используются для разбиения. Если разметка сама длиннее части,
+    открытые теги закрываются в конце части и открываются заново
+    в начале следующей.
+
+    Args:
+        text: Текст сообщения с HTML-разметкой
+        limit: Максимальная длина части (по умолчанию лимит Telegram)
+
+    Returns:
+        Список частей сообщения
+    """
+    limit = limit or MAX_MESSAGE_LENGTH
+    chunks = []
+    while len(text) > limit:
+        cut = _find_cut(text, limit)
+        if _open_tags(text[:cut]):
+            chunk, text = _split_markup(text, limit)
+        else:
+            chunk = text[:cut].rstrip()
+            text = text[cut:].lstrip()
+        if chunk:
+            chunks.append(chunk)
+    if text:
+        chunks.append(text)
+    return chunks
+
+def _markup_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Находит участки текста, которые нельзя разрывать
+
+    Args:
+        text: Текст с HTML-разметкой
+
+    Returns:
+        Список пар (начало, конец) от открывающего тега верхнего уровня до закрывающего
+    """
+    spans = []
+    depth = 0
+    start = None
+    for match in TAG_PATTERN.finditer(text):
+        tag = match.group(0)
+        if tag.startswith("</"):
+            depth = max(0, depth - 1)
+            if depth == 0 and start is not None:
+                spans.append((start, match.end()))
+                start = None
+        elif not tag.endswith("/>"):
+            if depth == 0:
+                start = match.start()
+            depth += 1
+    if start is not None:
+        spans.append((start, len(text)))
+    return spans
+
+def _find_cut(text: str, limit: int) -> int:
+    """
+    Находит позицию разбиения текста не дальше limit
+
+    Args:
+        text: Текст с HTML-разметкой
+        limit: Максимальная длина части
+
+    Returns:
+        Позиция, по которой нужно разрезать текст
+    """
+    spans = _markup_spans(text[:limit + 1])
+
+    def is_safe(position: int) -> bool:
+        return not any(start < position < end for start, end in spans)
+
+    for separator in ("\n\n", "\n", " "):
+        position = text.rfind(separator, 0, limit)
+        while position > 0:
+            if is_safe(position):
+                return position
+            position = text.rfind(separator, 0, position)
+
+    # Подходящего разделителя нет: режем перед разметкой или по лимиту
+    for start, end in spans:
+        if start < limit < end and start > 0:
+            return start
+    return limit
+
+def _open_tags(text: str) -> List[Tuple[str, str]]:
+    """
+    Находит теги, не закрытые к концу фрагмента
+
+    Args:
+        text: Фрагмент текста с HTML-разметкой
+
+    Returns:
+        Список пар (имя тега, открывающий тег) от внешнего к внутреннему
+    """
+    opened = []
+    for match in TAG_PATTERN.finditer(text):
+        tag = match.group(0)
+        name = TAG_NAME_PATTERN.match(tag)
+        if name is None or tag.endswith("/>"):
+            continue
+        if tag.startswith("</"):
+            for index in range(len(opened) - 1, -1, -1):
+                if opened[index][0] == name.group(1):
+                    del opened[index]
+                    break
+        else:
+            opened.append((name.group(1), tag))
+    return opened
+
+def _find_inner_cut(text: str, limit: int) -> int:
+    """
+    Находит позицию разбиения внутри разметки не дальше limit
+
+    Позиции внутри самих тегов и HTML-сущностей не используются.
+
+    Args:
+        text: Текст с HTML-разметкой
+        limit: Максимальная длина части
+
+    Returns:
+        Позиция, по которой нужно разрезать текст
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        if match.start() > limit:
+            break
+        tokens.append(match.span())
+
+    def is_safe(position: int) -> bool:
+        return not any(start < position < end for start, end in tokens)
+
+    for separator in ("\n\n", "\n", " "):
+        position = text.rfind(separator, 0, limit)
+        while position > 0:
+            if is_safe(position):
+                return position
+            position = text.rfind(separator, 0, position)
+
+    for start, end in tokens:
+        if start < limit < end:
+            return start
+    return limit
+
+def _split_markup(text: str, limit: int) -> Tuple[str, str]:
+    """
+    Отделяет часть от разметки, которая длиннее части сообщения
+
+    Открытые в месте разреза теги закрываются в конце части и
+    открываются заново в начале остатка, поэтому обе половины
+    остаются корректным HTML.
+
+    Args:
+        text: Текст, начинающийся с длинной разметки
+        limit: Максимальная длина части
+
+    Returns:
+        Пара (часть, остаток текста)
+    """
+    budget = limit
+    while budget > 0:
+        cut = _find_inner_cut(text, budget)
+        opened = _open_tags(text[:cut])
+        closing = "".join(f"</{name}>" for name, _ in reversed(opened))
+        reopening = "".join(tag for _, tag in opened)
+        if cut <= len(reopening):
+            # Открывающие теги не оставляют места для текста
+            break
+        if cut + len(closing) <= limit:
+            rest = text[cut:].lstrip()
+            if not TAG_PATTERN.sub("", rest).strip():
+                # После разреза остались только закрывающие теги
+                return text[:cut].rstrip() + rest, ""
+            return text[:cut].rstrip() + closing, reopening + rest
+        budget = min(budget - 1, limit - len(closing))
+
+    logger.warning("Не удалось разбить сообщение без разрыва HTML-разметки")
+    return text[:limit], text[limit:]
+
+def get_chat_bucket(chat_id: int) -> Dict[str, float]:
+    """
+    Возвращает корзину лимита для чата бота текущего арендатора (около 1 сообщения в секунду)
+
+    Args:
+        chat_id: Идентификатор чата
+
+    Returns:
+        Состояние корзины
+    """
+    key = tenant_key(chat_id)
+    if key not in chat_buckets:
+        if len(chat_buckets) >= MAX_CHAT_BUCKETS:
+            # Удаляем корзины чатов без активной очереди, которые уже полностью пополнились
+            for idle_key in list(chat_buckets):
+                if idle_key not in chat_queues and time_until_available(
+                        chat_buckets[idle_key], chat_buckets[idle_key]["capacity"]) == 0:
+                    del chat_buckets[idle_key]
+        chat_buckets[key] = create_bucket(rate=1, capacity=3)
+    return chat_buckets[key]
+
+async def enqueue_send(
+    chat_id: int,
+    send: Callable[..., Awaitable[Any]],
+    text: str,
+    parse_mode: Optional[str] = None
+) -> bool:
+    """
+    Ставит сообщение в очередь отправки чата
+
+    Длинный текст заранее делится на части не длиннее лимита Telegram.
+    В режиме фоновой отправки функция возвращается сразу после постановки
+    в очередь, иначе ждет завершения отправки.
+
+    Args:
+        chat_id: Идентификатор чата
+        send: Корутина отправки (например, message.answer или bot.send_message с chat_id)
+        text: Текст сообщения
+        parse_mode: Режим разметки Telegram (HTML или None)
+
+    Returns:
+        True, если сообщение поставлено в очередь (или отправлено), иначе False
+    """
+    global queued_total
+    item = {
+        "chat_id": chat_id,
+        "send": send,
+        "chunks": split_message(text),
+        "sent_chunks": 0,
+        "parse_mode": parse_mode,
+        "enqueued_at": time.monotonic()
+    }
+
+    if not background_sending:
+        return await _deliver(item)
+
+    # Очереди ботов разных арендаторов независимы
+    key = tenant_key(chat_id)
+    queue = chat_queues.setdefault(key, deque())
+    if len(queue) >= MAX_CHAT_QUEUE_SIZE:
+        metrics.inc("send_dropped_total", reason="queue_full")
+        logger.error(f"Очередь отправки чата {chat_id} переполнена, сообщение отброшено")
+        return False
+
+    queue.append(item)
+    queued_total += 1
+    metrics.set_gauge("send_queue_size", queued_total)
+    if key not in chat_workers:
+        chat_workers[key] = asyncio.create_task(_chat_worker(key))
+    return True
+
+async def send_answer(message: types.Message, text: str, parse_mode: Optional[str] = None) -> bool:
+    """
+    Отправляет ответ на сообщение пользователя через очередь
+
+    Args:
+        message: Сообщение пользователя
+        text: Текст ответа
+        parse_mode: Режим разметки Telegram (HTML или None)
+
+    Returns:
+        True, если ответ поставлен в очередь (или отправлен), иначе False
+    """
+    return await enqueue_send(message.chat.id, message.answer, text, parse_mode)
+
+async def _chat_worker(key: Any) -> None:
+    """
+    Отправляет сообщения из очереди чата по порядку
+
+    Args:
+        key: Ключ чата (tenant_key)
+    """
+    global queued_total
+    queue = chat_queues[key]
+    try:
+        while queue:
+            item = queue.popleft()
+            queued_total -= 1
+            metrics.set_gauge("send_queue_size", queued_total)
+            await _deliver(item)
+    finally:
+        # Неотправленные из-за отмены сообщения считаются потерянными
+        if queue:
+            queued_total -= len(queue)
+            metrics.inc("send_dropped_total", len(queue), reason="cancelled")
+            metrics.set_gauge("send_queue_size", queued_total)
+        chat_queues.pop(key, None)
+        chat_workers.pop(key, None)
+
+async def _wait_pause() -> None:
+    """
+    Ждет окончания паузы после RetryAfter
+    """
+    while True:
+        delay = paused_until - time.monotonic()
+        if delay <= 0:
+            return
+        await asyncio.sleep(delay)
+
+async def _deliver(item: Dict[str, Any]) -> bool:
+    """
+    Отправляет все части сообщения с учетом лимитов и повторов
+
+    Уже отправленные части не отправляются повторно: при ошибке
+    отправка продолжается с первой неотправленной части.
+
+    Args:
+        item: Отправка из очереди
+
+    Returns:
+        True, если все части отправлены, иначе False
+    """
+    global paused_until
+    chat_id = item["chat_id"]
+    metrics.observe("send_queue_latency_seconds", time.monotonic() - item["enqueued_at"])
+    kwargs = {"parse_mode": item["parse_mode"]} if item["parse_mode"] else {}
+
+    attempts = 0
+    while item["sent_chunks"] < len(item["chunks"]):
+        chunk = item["chunks"][item["sent_chunks"]]
+        await acquire(global_bucket)
+        # Задача очереди создана в контексте арендатора чата (tenant_key)
+        await acquire(get_chat_bucket(chat_id))
+        # Пауза проверяется после ожидания корзин: за это время другая
+        # очередь могла получить RetryAfter
+        await _wait_pause()
+        try:
+            await item["send"](chunk, **kwargs)
+        except TelegramRetryAfter as e:
+            attempts += 1
+            metrics.inc("send_retry_total", reason="retry_after")
+            if attempts >= MAX_SEND_ATTEMPTS:
+                break
+            # Превышен лимит бота: приостанавливаются очереди всех чатов
+            paused_until = max(paused_until, time.monotonic() + e.retry_after)
+            logger.warning(f"Превышен лимит Telegram для чата {chat_id}, отправка приостановлена на {e.retry_after} с")
+            continue
+        except TelegramNetworkError as e:
+            attempts += 1
+            metrics.inc("send_retry_total", reason="network")
+            if attempts >= MAX_SEND_ATTEMPTS:
+                break
+            logger.warning(f"Сетевая ошибка при отправке в чат {chat_id}: {e}")
+            await asyncio.sleep(NETWORK_RETRY_DELAY * attempts)
+            continue
+        except Exception as e:
+            logger.error(f"Ошибка при отправке сообщения в чат {chat_id}: {e}")
+            break
+
+        item["sent_chunks"] += 1
+        attempts = 0
+        metrics.inc("send_messages_total")
+
+    if item["sent_chunks"] < len(item["chunks"]):
+        metrics.inc("send_dropped_total", reason="send_failed")
+        logger.error(f"Сообщение в чат {chat_id} не отправлено "
+                     f"({item['sent_chunks']} из {len(item['chunks'])} частей)")
+        return False
+    return True
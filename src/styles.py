@@ -4,13 +4,14 @@
 Функции для работы с различными стилями ответов бота
 """
 import os
-import re
 import random
 import logging
-from typing import Dict, Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+from src.prompt_compiler import load_compiled_prompt
+from src.tenants import get_tenant, tenant_key
+
+# Логгер модуля (логирование настраивается в main.py)
 logger = logging.getLogger(__name__)
 
 # Путь к директории с промптами
@@ -25,51 +26,140 @@ STYLE_DRAMATIC = "dramatic"
 # Словарь для хранения предпочтений пользователей: {chat_id: style}
 user_styles: Dict[int, str] = {}
 
-# Ключевые слова для определения стиля
-STYLE_KEYWORDS = {
-    STYLE_CAT: [
-        "кошачий", "кот", "котик", "мяу", "кошка", "котята", "мурлыкать", 
-        "лапки", "хвостик", "мурчать", "объясни как кот", "как котик", 
-        "кошачьим языком", "по-кошачьи"
-    ],
-    STYLE_VILLAIN: [
-        "злодей", "суперзлодей", "злодейски", "мировое господство", "захват мира",
-        "муахаха", "зловещий", "темная сторона", "как злодей", "злодейским голосом",
-        "злобно", "коварный план", "как суперзлодей"
-    ],
-    STYLE_DRAMATIC: [
-        "драматично", "эпично", "сага", "эпос", "драма", "театрально", 
-        "пафосно", "как в кино", "как в фильме", "как в книге", "эпическая история",
-        "драматическим голосом", "как рассказчик", "как в легенде"
-    ]
+# Реестр стилей: каждый стиль описывается один раз. Чтобы добавить стиль,
+# достаточно добавить запись сюда и файл промпта в директорию prompts
+STYLE_REGISTRY: Dict[str, Dict[str, Any]] = {
+    STYLE_NORMAL: {
+        "badge": "🔹 <b>Обычный режим</b>",
+        "icon": "🔹",
+        "description": "Обычный режим",
+        "prompt_file": "system.txt",
+        "command": "normal",
+        "command_reply": "Выбран обычный стиль общения.",
+        # Обычный стиль не выбирается случайно и не определяется по ключевым словам
+        "random": False,
+        "keywords": []
+    },
+    STYLE_CAT: {
+        "badge": "🐱 <b>Кошачий режим</b>",
+        "icon": "🐱",
+        "description": "Переводчик с технического на кошачий",
+        "prompt_file": "cat_mode.txt",
+        "command": "cat",
+        "command_reply": "Мяу! Выбран кошачий стиль общения. Мррр... 🐱",
+        "random": True,
+        "keywords": [
+            "кошачий", "кот", "котик", "мяу", "кошка", "котята", "мурлыкать", 
+            "лапки", "хвостик", "мурчать", "объясни как кот", "как котик", 
+            "кошачьим языком", "по-кошачьи"
+        ]
+    },
+    STYLE_VILLAIN: {
+        "badge": "😈 <b>Злодейский режим</b>",
+        "icon": "😈",
+        "description": "Переводчик на язык суперзлодеев",
+        "prompt_file": "villain_mode.txt",
+        "command": "villain",
+        "command_reply": "МУАХАХА! Выбран ЗЛОДЕЙСКИЙ стиль общения! Теперь вы в моей ВЛАСТИ! 😈",
+        "random": True,
+        "keywords": [
+            "злодей", "суперзлодей", "злодейски", "мировое господство", "захват мира",
+            "муахаха", "зловещий", "темная сторона", "как злодей", "злодейским голосом",
+            "злобно", "коварный план", "как суперзлодей"
+        ]
+    },
+    STYLE_DRAMATIC: {
+        "badge": "🎭 <b>Драматический режим</b>",
+        "icon": "🎭",
+        "description": "Драматический технический писатель",
+        "prompt_file": "dramatic_mode.txt",
+        "command": "dramatic",
+        "command_reply": "О, благородный собеседник! Вы избрали ЭПИЧЕСКИЙ и ДРАМАТИЧЕСКИЙ стиль общения! Да начнется наша ВЕЛИЧЕСТВЕННАЯ беседа! 🎭",
+        "random": True,
+        "keywords": [
+            "драматично", "эпично", "сага", "эпос", "драма", "театрально", 
+            "пафосно", "как в кино", "как в фильме", "как в книге", "эпическая история",
+            "драматическим голосом", "как рассказчик", "как в легенде"
+        ]
+    }
+}
+
+# Таблицы, построенные из реестра один раз при загрузке модуля,
+# чтобы при обработке сообщений выполнялись только поиски по словарям
+
+# Метки стилей: {style: badge}
+STYLE_BADGES: Dict[str, str] = {style: info["badge"] for style, info in STYLE_REGISTRY.items()}
+
+# Ключевые слова для определения стиля: {style: [keyword, ...]}
+STYLE_KEYWORDS: Dict[str, List[str]] = {
+    style: info["keywords"] for style, info in STYLE_REGISTRY.items() if info["keywords"]
+}
+
+# Ключевые слова в нижнем регистре в порядке проверки: [(keyword, style), ...]
+KEYWORD_TABLE: List[Tuple[str, str]] = [
+    (keyword.lower(), style) for style, keywords in STYLE_KEYWORDS.items() for keyword in keywords
+]
+
+# Стили для случайного выбора
+RANDOM_STYLES: List[str] = [style for style, info in STYLE_REGISTRY.items() if info["random"]]
+
+# Команды переключения стиля: {command: style}
+STYLE_COMMANDS: Dict[str, str] = {info["command"]: style for style, info in STYLE_REGISTRY.items()}
+
+# Ответы на команды переключения стиля: {style: reply}
+STYLE_COMMAND_REPLIES: Dict[str, str] = {
+    style: info["command_reply"] for style, info in STYLE_REGISTRY.items()
 }
 
-def load_style_prompt(style: str) -> Optional[str]:
+# Ответ на команду /style
+STYLE_HELP_TEXT = (
+    "Доступные стили общения:\n\n"
+    + "".join(
+        f"{info['icon']} /{info['command']} - {info['description']}\n"
+        for info in STYLE_REGISTRY.values()
+    )
+    + "\nВы также можете просто упомянуть стиль в своём сообщении, "
+    "и бот автоматически переключится на него. Например: \"Расскажи о базах данных как кот\""
+)
+
+# Загруженные промпты стилей: {tenant_key(style) или (директория, style): текст промпта}
+prompt_cache: Dict[Any, str] = {}
+
+def load_style_prompt(style: str, prompts_dir: Optional[str] = None) -> Optional[str]:
     """
-    Загружает промпт для указанного стиля
+    Возвращает промпт для указанного стиля
+    
+    Возвращается скомпилированный (компактный) промпт из prompts/compiled
+    директории промптов текущего арендатора; он читается с диска один раз,
+    затем берется из кэша.
     
     Args:
         style: Название стиля (normal, cat, villain, dramatic)
+        prompts_dir: Директория другой версии промптов (None - директория арендатора)
         
     Returns:
         Текст промпта или None в случае ошибки
     """
+    cache_key = tenant_key(style) if prompts_dir is None else (prompts_dir, style)
+    if cache_key in prompt_cache:
+        return prompt_cache[cache_key]
+    
     try:
-        # Для обычного стиля используем стандартный системный промпт
-        if style == STYLE_NORMAL:
-            prompt_path = os.path.join(PROMPTS_DIR, 'system.txt')
-        else:
-            prompt_path = os.path.join(PROMPTS_DIR, f'{style}_mode.txt')
+        # Неизвестный стиль использует стандартный системный промпт
+        style_info = STYLE_REGISTRY.get(style, STYLE_REGISTRY[STYLE_NORMAL])
+        prompt_file = style_info["prompt_file"]
+        prompts_dir = prompts_dir or get_tenant()["prompts_dir"] or PROMPTS_DIR
+        prompt_path = os.path.join(prompts_dir, prompt_file)
             
         if not os.path.exists(prompt_path):
             logger.error(f"Промпт для стиля {style} не найден по пути: {prompt_path}")
             # Если промпт не найден, используем стандартный
-            prompt_path = os.path.join(PROMPTS_DIR, 'system.txt')
+            prompt_file = STYLE_REGISTRY[STYLE_NORMAL]["prompt_file"]
             
-        with open(prompt_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            logger.info(f"Загружен промпт для стиля {style} ({len(content)} символов)")
-            return content
+        content = load_compiled_prompt(prompt_file, prompts_dir)
+        logger.info(f"Загружен промпт для стиля {style} из {prompts_dir} ({len(content)} символов)")
+        prompt_cache[cache_key] = content
+        return content
     except Exception as e:
         logger.error(f"Ошибка при загрузке промпта для стиля {style}: {e}")
         return None
@@ -87,11 +177,10 @@ def detect_style_from_text(text: str) -> str:
     text_lower = text.lower()
     
     # Проверяем наличие явных запросов на определенный стиль
-    for style, keywords in STYLE_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword.lower() in text_lower:
-                logger.info(f"Определен стиль {style} по ключевому слову '{keyword}'")
-                return style
+    for keyword, style in KEYWORD_TABLE:
+        if keyword in text_lower:
+            logger.info(f"Определен стиль {style} по ключевому слову '{keyword}'")
+            return style
     
     # Если явных запросов нет, возвращаем обычный стиль
     return STYLE_NORMAL
@@ -116,7 +205,7 @@ def get_user_style(chat_id: int, message_text: str) -> str:
         return detected_style
     
     # Для каждого нового сообщения выбираем случайный стиль (исключая обычный)
-    random_styles = [STYLE_CAT, STYLE_VILLAIN, STYLE_DRAMATIC]
+    random_styles = list(RANDOM_STYLES)
     
     # Если у пользователя уже был стиль, исключаем его из выбора,
     # чтобы стиль гарантированно менялся с каждым сообщением
@@ -137,7 +226,7 @@ def set_user_style(chat_id: int, style: str) -> None:
         chat_id: ID чата/пользователя
         style: Название стиля (normal, cat, villain, dramatic)
     """
-    if style in [STYLE_NORMAL, STYLE_CAT, STYLE_VILLAIN, STYLE_DRAMATIC]:
+    if style in STYLE_REGISTRY:
         user_styles[chat_id] = style
         logger.info(f"Установлен стиль {style} для пользователя {chat_id}")
     else:
@@ -161,9 +250,4 @@ def get_available_styles() -> List[Tuple[str, str]]:
     Returns:
         Список кортежей (код_стиля, описание)
     """
-    return [
-        (STYLE_NORMAL, "Обычный режим"),
-        (STYLE_CAT, "Переводчик с технического на кошачий"),
-        (STYLE_VILLAIN, "Переводчик на язык суперзлодеев"),
-        (STYLE_DRAMATIC, "Драматический технический писатель")
-    ]
\ No newline at end of file
+    return [(style, info["description"]) for style, info in STYLE_REGISTRY.items()]
\ No newline at end of file
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для работы нескольких ботов (арендаторов) в одном процессе
+
+Арендатор - бот отдельного бренда со своим токеном, директорией
+промптов и таблицей ссылок для add_clickable_links. Все арендаторы
+обслуживаются одним диспетчером в одном цикле событий и разделяют
+пул соединений LLM, лимиты входящих сообщений и кэши.
+
+Текущий арендатор передается через contextvars: промежуточный
+обработчик TenantMiddleware определяет его по боту, получившему
+обновление. Состояние чатов хранится по ключу tenant_key(chat_id):
+у основного арендатора это chat_id (как в режиме с одним ботом),
+у остальных - (арендатор, chat_id).
+"""
+import contextvars
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from aiogram import BaseMiddleware
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Основной арендатор (бот из TELEGRAM_TOKEN)
+DEFAULT_TENANT = "default"
+
+# Параметры арендаторов: {имя: {"prompts_dir": директория или None, "links": {текст: url} или None}}
+# None означает значение основного арендатора
+tenants: Dict[str, Dict[str, Any]] = {
+    DEFAULT_TENANT: {"prompts_dir": None, "links": None}
+}
+
+# Арендаторы ботов: {идентификатор бота: имя арендатора}
+bot_tenants: Dict[int, str] = {}
+
+# Текущий арендатор
+current_tenant: contextvars.ContextVar[str] = contextvars.ContextVar("current_tenant", default=DEFAULT_TENANT)
+
+def register_tenant(
+    name: str,
+    bot_id: Optional[int] = None,
+    prompts_dir: Optional[str] = None,
+    links: Optional[Dict[str, str]] = None
+) -> None:
+    """
+    Регистрирует арендатора
+
+    Args:
+        name: Имя арендатора
+        bot_id: Идентификатор бота арендатора
+        prompts_dir: Директория промптов (None - промпты основного арендатора)
+        links: Таблица ссылок {текст: url} (None - ссылки основного арендатора)
+    """
+    tenants[name] = {"prompts_dir": prompts_dir, "links": links}
+    if bot_id is not None:
+        bot_tenants[bot_id] = name
+    logger.info(f"Арендатор {name}: бот {bot_id}, промпты {prompts_dir or 'по умолчанию'}")
+
+def get_tenant() -> Dict[str, Any]:
+    """
+    Возвращает параметры текущего арендатора
+
+    Returns:
+        Словарь {prompts_dir, links}
+    """
+    return tenants.get(current_tenant.get(), tenants[DEFAULT_TENANT])
+
+def tenant_key(key: Hashable) -> Hashable:
+    """
+    Возвращает ключ состояния с учетом текущего арендатора
+
+    Args:
+        key: Ключ в пределах арендатора (chat_id, стиль)
+
+    Returns:
+        key для основного арендатора, (арендатор, key) для остальных
+    """
+    tenant = current_tenant.get()
+    return key if tenant == DEFAULT_TENANT else (tenant, key)
+
+def load_tenants_config(path: str) -> List[Dict[str, Any]]:
+    """
+    Загружает список арендаторов из файла JSON
+
+    Формат: [{"name": ..., "token": ..., "prompts_dir": ..., "links": {...}}, ...]
+
+    Args:
+        path: Путь к файлу
+
+    Returns:
+        Список параметров арендаторов
+
+    Raises:
+        ValueError: Если у арендатора нет имени или токена, или имена повторяются
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        configs = json.load(file)
+    names = set()
+    for config in configs:
+        if not config.get("name") or not config.get("token"):
+            raise ValueError(f"У арендатора в {path} должны быть name и token")
+        if config["name"] in names or config["name"] == DEFAULT_TENANT:
+            raise ValueError(f"Повторяющееся имя арендатора: {config['name']}")
+        names.add(config["name"])
+    return configs
+
+class TenantMiddleware(BaseMiddleware):
+    """
+    Промежуточный обработчик aiogram, задающий текущего арендатора по боту обновления
+
+    Задачи, запущенные при обработке обновления, наследуют арендатора.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        bot = data.get("bot")
+        tenant = bot_tenants.get(bot.id, DEFAULT_TENANT) if bot is not None else DEFAULT_TENANT
+        token = current_tenant.set(tenant)
+        try:
+            return await handler(event, data)
+        finally:
+            current_tenant.reset(token)
@@ -0,0 +1,429 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для трассировки обработки обновлений Telegram
+
+Каждому входящему обновлению присваивается трасса, которая передается
+через contextvars: этапы обработки (определение стиля и услуги, сборка
+промпта, запрос к LLM, отправка ответа) записываются как вложенные
+интервалы (span) с атрибутами - моделью, токенами, размером истории.
+
+Трасса завершается, когда закрыт последний ее интервал, в том числе
+в задачах, запущенных через create_task этого модуля (например, после
+окна объединения сообщений). Решение о сохранении принимается по
+завершенной трассе: медленные и завершившиеся ошибкой трассы
+сохраняются всегда, остальные - с вероятностью sample_rate.
+
+Сохраненные трассы в формате OTLP JSON дописываются в файл (по строке
+на трассу) или отправляются коллектору OTLP/HTTP фоновой задачей.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Iterator, List, Optional
+
+from aiogram import BaseMiddleware
+
+from src import metrics
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Способы экспорта трасс
+EXPORT_FILE = "file"
+EXPORT_OTLP = "otlp"
+
+# Статусы интервалов (коды OTLP)
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Максимальное количество трасс, отправляемых одной пачкой
+MAX_BATCH = 100
+
+# Параметры трассировки
+trace_config: Dict[str, Any] = {
+    # Способ экспорта (file, otlp)
+    "exporter": EXPORT_FILE,
+    # Файл трасс для экспорта в файл
+    "path": "logs/traces.jsonl",
+    # Адрес коллектора OTLP/HTTP (например, http://127.0.0.1:4318/v1/traces)
+    "endpoint": None,
+    # Длительность трассы, начиная с которой она сохраняется всегда (в секундах)
+    "slow_seconds": 5.0,
+    # Доля сохраняемых быстрых трасс без ошибок
+    "sample_rate": 0.05,
+    # Максимальное количество трасс в очереди экспорта
+    "queue_size": 1000,
+    # Имя сервиса в экспортируемых трассах
+    "service_name": "telegram-bot"
+}
+
+# Текущая трасса: {"trace_id", "spans", "open", "error"}
+current_trace: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("current_trace", default=None)
+
+# Текущий интервал: {"span_id", "parent_id", "name", "start", "end", "attributes", "status"}
+current_span: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("current_span", default=None)
+
+# Очередь сохраненных трасс (None - трассировка выключена)
+export_queue: Optional[asyncio.Queue] = None
+
+# Фоновая задача экспорта
+export_task: Optional[asyncio.Task] = None
+
+def _new_id(bits: int) -> str:
+    """
+    Создает случайный идентификатор трассы или интервала
+
+    Args:
+        bits: Длина идентификатора в битах
+
+    Returns:
+        Идентификатор в шестнадцатеричном виде
+    """
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+@contextmanager
+def start_trace(name: str, **attributes: Any) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Начинает трассу с корневым интервалом (выключенная трассировка ничего не записывает)
+
+    Args:
+        name: Имя корневого интервала
+        attributes: Атрибуты корневого интервала
+
+    Yields:
+        Корневой интервал или None
+    """
+    if export_queue is None:
+        yield None
+        return
+    trace = {"trace_id": _new_id(128), "spans": [], "open": 0, "error": False}
+    token = current_trace.set(trace)
+    try:
+        with span(name, **attributes) as root:
+            yield root
+    finally:
+        current_trace.reset(token)
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Записывает интервал текущей трассы на время выполнения блока
+
+    Вне трассы интервал не записывается. Исключение в блоке помечает
+    интервал и трассу как завершившиеся ошибкой.
+
+    Args:
+        name: Имя интервала (этап обработки)
+        attributes: Атрибуты интервала
+
+    Yields:
+        Интервал или None (вне трассы)
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = current_span.get()
+    record = {
+        "span_id": _new_id(64),
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "start": time.time_ns(),
+        "end": None,
+        "attributes": attributes,
+        "status": STATUS_OK
+    }
+    trace["spans"].append(record)
+    trace["open"] += 1
+    token = current_span.set(record)
+    try:
+        yield record
+    except BaseException as e:
+        # Отмена (например, новым сообщением серии) ошибкой не считается
+        if not isinstance(e, asyncio.CancelledError):
+            mark_error(f"{type(e).__name__}: {e}", record)
+        else:
+            record["attributes"]["cancelled"] = True
+        raise
+    finally:
+        current_span.reset(token)
+        record["end"] = time.time_ns()
+        _release(trace)
+
+def set_attributes(**attributes: Any) -> None:
+    """
+    Добавляет атрибуты к текущему интервалу (вне трассы ничего не делает)
+
+    Args:
+        attributes: Атрибуты (например, model, prompt_tokens)
+    """
+    record = current_span.get()
+    if record is not None:
+        record["attributes"].update(attributes)
+
+def mark_error(message: str, record: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Помечает интервал и его трассу как завершившиеся ошибкой
+
+    Нужна для ошибок, которые обрабатываются без исключения
+    (например, generate_response возвращает None).
+
+    Args:
+        message: Описание ошибки
+        record: Интервал (по умолчанию текущий)
+    """
+    record = record or current_span.get()
+    trace = current_trace.get()
+    if record is None or trace is None:
+        return
+    record["status"] = STATUS_ERROR
+    record["attributes"]["error"] = message
+    trace["error"] = True
+
+def create_task(coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+    """
+    Запускает задачу, продолжающую текущую трассу
+
+    Трасса не завершается, пока задача не закончится.
+
+    Args:
+        coro: Корутина
+
+    Returns:
+        Задача asyncio
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return asyncio.create_task(coro)
+    trace["open"] += 1
+    task = asyncio.create_task(coro)
+    # Обратный вызов выполняется и для задачи, отмененной до запуска
+    task.add_done_callback(lambda _: _release(trace))
+    return task
+
+def _release(trace: Dict[str, Any]) -> None:
+    """
+    Уменьшает количество открытых интервалов и завершает трассу при нуле
+
+    Args:
+        trace: Трасса
+    """
+    trace["open"] -= 1
+    if trace["open"] > 0:
+        return
+    duration = (max(record["end"] or 0 for record in trace["spans"]) - trace["spans"][0]["start"]) / 1e9
+    if trace["error"]:
+        decision = "error"
+    elif duration >= trace_config["slow_seconds"]:
+        decision = "slow"
+    elif random.random() < trace_config["sample_rate"]:
+        decision = "sampled"
+    else:
+        decision = "dropped"
+    metrics.inc("traces_total", decision=decision)
+    metrics.observe("trace_duration_seconds", duration)
+    if decision == "dropped" or export_queue is None:
+        return
+    try:
+        export_queue.put_nowait(trace)
+    except asyncio.QueueFull:
+        metrics.inc("traces_export_dropped_total")
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    """
+    Кодирует значение атрибута в формате OTLP JSON
+
+    Args:
+        value: Значение
+
+    Returns:
+        Значение OTLP (stringValue, intValue, doubleValue или boolValue)
+    """
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otlp(traces: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Преобразует трассы в запрос экспорта OTLP JSON
+
+    Args:
+        traces: Завершенные трассы
+
+    Returns:
+        Словарь {"resourceSpans": [...]}
+    """
+    spans = []
+    for trace in traces:
+        for record in trace["spans"]:
+            encoded = {
+                "traceId": trace["trace_id"],
+                "spanId": record["span_id"],
+                "name": record["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(record["start"]),
+                "endTimeUnixNano": str(record["end"] or record["start"]),
+                "attributes": [
+                    {"key": key, "value": _attribute_value(value)}
+                    for key, value in record["attributes"].items() if value is not None
+                ],
+                "status": {"code": record["status"]}
+            }
+            if record["parent_id"]:
+                encoded["parentSpanId"] = record["parent_id"]
+            spans.append(encoded)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": trace_config["service_name"]}}
+            ]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}]
+        }]
+    }
+
+def _export_batch(batch: List[Dict[str, Any]]) -> None:
+    """
+    Записывает пачку трасс в файл или отправляет коллектору
+
+    Args:
+        batch: Завершенные трассы
+    """
+    if trace_config["exporter"] == EXPORT_OTLP:
+        request = urllib.request.Request(
+            trace_config["endpoint"],
+            data=json.dumps(to_otlp(batch), ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=10):
+            pass
+    else:
+        lines = "".join(json.dumps(to_otlp([trace]), ensure_ascii=False, separators=(",", ":")) + "\n" for trace in batch)
+        with open(trace_config["path"], "a", encoding="utf-8") as file:
+            file.write(lines)
+    metrics.inc("traces_exported_total", len(batch))
+
+def _drain(limit: int) -> List[Dict[str, Any]]:
+    """
+    Забирает из очереди трассы, которые уже в ней есть
+
+    Args:
+        limit: Максимальное количество трасс
+
+    Returns:
+        Список трасс
+    """
+    batch = []
+    while len(batch) < limit and not export_queue.empty():
+        batch.append(export_queue.get_nowait())
+    return batch
+
+async def _export(batch: List[Dict[str, Any]]) -> int:
+    """
+    Экспортирует пачку трасс в отдельном потоке
+
+    Args:
+        batch: Завершенные трассы
+
+    Returns:
+        Количество экспортированных трасс (0 при ошибке)
+    """
+    try:
+        await asyncio.to_thread(_export_batch, batch)
+    except OSError as e:
+        metrics.inc("traces_export_dropped_total", len(batch))
+        logger.error(f"Ошибка при экспорте трасс: {e}")
+        return 0
+    return len(batch)
+
+async def flush_traces() -> int:
+    """
+    Экспортирует трассы, уже стоящие в очереди
+
+    Returns:
+        Количество экспортированных трасс
+    """
+    exported = 0
+    while export_queue is not None and not export_queue.empty():
+        exported += await _export(_drain(MAX_BATCH))
+    return exported
+
+async def _export_loop() -> None:
+    """
+    Экспортирует сохраненные трассы по мере их появления
+    """
+    while True:
+        first = await export_queue.get()
+        await _export([first] + _drain(MAX_BATCH - 1))
+
+def start_tracing(config: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Включает трассировку и фоновый экспорт трасс
+
+    Args:
+        config: Параметры в формате trace_config
+    """
+    global export_queue, export_task
+    trace_config.update(config or {})
+    if trace_config["exporter"] == EXPORT_OTLP and not trace_config["endpoint"]:
+        raise ValueError("Для экспорта OTLP нужен адрес коллектора")
+    if trace_config["exporter"] == EXPORT_FILE:
+        directory = os.path.dirname(trace_config["path"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    export_queue = asyncio.Queue(maxsize=trace_config["queue_size"])
+    export_task = asyncio.create_task(_export_loop())
+    target = trace_config["endpoint"] if trace_config["exporter"] == EXPORT_OTLP else trace_config["path"]
+    logger.info(
+        f"Трассировка: {trace_config['exporter']} ({target}), медленные от {trace_config['slow_seconds']} с, "
+        f"доля остальных {trace_config['sample_rate']}"
+    )
+
+async def stop_tracing() -> None:
+    """
+    Экспортирует оставшиеся трассы и выключает трассировку
+    """
+    global export_queue, export_task
+    if export_task is not None:
+        export_task.cancel()
+        try:
+            await export_task
+        except asyncio.CancelledError:
+            pass
+        export_task = None
+    await flush_traces()
+    export_queue = None
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Промежуточный обработчик aiogram, начинающий трассу для каждого сообщения
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        if export_queue is None:
+            return await handler(event, data)
+        text = getattr(event, "text", None) or ""
+        with start_trace(
+            "update",
+            chat_id=event.chat.id,
+            user_id=event.from_user.id if event.from_user else None,
+            command=text.split()[0] if text.startswith("/") else None,
+            text_length=len(text)
+        ):
+            return await handler(event, data)
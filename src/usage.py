@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Функции для учета расхода токенов LLM и дневных квот чатов
+
+Каждый запрос к LLM записывается в журнал расхода: токены запроса,
+ответа и взятые из кэша, время ответа и метки (чат, стиль, сценарий,
+модель). Записи накапливаются в памяти и периодически дописываются
+в файл JSONL, который только растет. Одновременно обновляются итоги
+по меткам, поэтому запросы к статистике не перебирают сами записи.
+
+Если у чата задана дневная квота и она исчерпана, запросы чата
+выполняются в экономном режиме (быстрая модель и короткий ответ),
+а не завершаются ошибкой.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src import metrics
+
+# Логгер модуля (логирование настраивается в main.py)
+logger = logging.getLogger(__name__)
+
+# Метки запросов, по которым считаются итоги
+DIMENSIONS = ("chat_id", "style", "scenario", "model")
+
+# Поля итогов
+FIELDS = ("requests", "prompt_tokens", "completion_tokens", "cached_tokens", "latency")
+
+# Параметры квот
+quota_config: Dict[str, int] = {
+    # Дневная квота токенов на чат (0 - без ограничения)
+    "daily_tokens": 0,
+    # Лимит токенов ответа в экономном режиме
+    "degraded_max_tokens": 200
+}
+
+# Итоги за день: {(день, chat_id, style, scenario, model): [значения полей FIELDS]}
+# Итоги изменяются только в потоке цикла событий, поэтому блокировки не нужны
+usage_totals: Dict[Tuple[Any, ...], List[float]] = {}
+
+# Токены чатов за день для проверки квот: {(день, chat_id): токены}
+chat_daily_tokens: Dict[Tuple[str, Any], int] = {}
+
+# Количество дней, за которые итоги хранятся в памяти
+RETENTION_DAYS = 7
+
+# Последний день, за который записывался расход
+last_day: Optional[str] = None
+
+# Записи, еще не дописанные в файл
+pending_records: List[Dict[str, Any]] = []
+
+# Путь к файлу журнала (None - журнал только в памяти)
+ledger_path: Optional[str] = None
+
+# Фоновая задача записи журнала
+flush_task: Optional[asyncio.Task] = None
+
+def current_day() -> str:
+    """
+    Возвращает текущий день (UTC), к которому относятся квоты
+
+    Returns:
+        Дата в формате YYYY-MM-DD
+    """
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d")
+
+def _add_to_totals(record: Dict[str, Any]) -> None:
+    """
+    Добавляет запись к итогам и счетчику квоты чата
+
+    Args:
+        record: Запись журнала
+    """
+    key = (record["day"],) + tuple(record[dimension] for dimension in DIMENSIONS)
+    totals = usage_totals.get(key)
+    if totals is None:
+        totals = usage_totals[key] = [0] * len(FIELDS)
+    totals[0] += 1
+    totals[1] += record["prompt_tokens"]
+    totals[2] += record["completion_tokens"]
+    totals[3] += record["cached_tokens"]
+    totals[4] += record["latency"]
+
+    quota_key = (record["day"], record["chat_id"])
+    chat_daily_tokens[quota_key] = (
+        chat_daily_tokens.get(quota_key, 0) + record["prompt_tokens"] + record["completion_tokens"]
+    )
+
+def _start_day(day: str) -> None:
+    """
+    Удаляет счетчики квот прошедших дней и итоги старше RETENTION_DAYS
+
+    Args:
+        day: Новый текущий день
+    """
+    global last_day
+    last_day = day
+    oldest = (datetime.date.fromisoformat(day) - datetime.timedelta(days=RETENTION_DAYS)).isoformat()
+    for key in [key for key in chat_daily_tokens if key[0] != day]:
+        del chat_daily_tokens[key]
+    for key in [key for key in usage_totals if key[0] <= oldest]:
+        del usage_totals[key]
+
+def record_usage(
+    usage: Dict[str, int],
+    latency: float,
+    chat_id: Optional[int] = None,
+    style: Optional[str] = None,
+    scenario: Optional[str] = None,
+    model: Optional[str] = None
+) -> None:
+    """
+    Записывает расход токенов запроса к LLM
+
+    Args:
+        usage: Токены {prompt_tokens, completion_tokens, cached_tokens}
+        latency: Время ответа в секундах
+        chat_id: Идентификатор чата (None - служебный запрос, например пул приветствий)
+        style: Стиль ответа
+        scenario: Сценарий (start, service, chat)
+        model: Модель
+    """
+    day = current_day()
+    if day != last_day:
+        _start_day(day)
+    record = {
+        "ts": round(time.time(), 3),
+        "day": day,
+        "chat_id": chat_id,
+        "style": style,
+        "scenario": scenario,
+        "model": model,
+        "prompt_tokens": int(usage.get("prompt_tokens", 0)),
+        "completion_tokens": int(usage.get("completion_tokens", 0)),
+        "cached_tokens": int(usage.get("cached_tokens", 0)),
+        "latency": round(latency, 4)
+    }
+    _add_to_totals(record)
+    if ledger_path is not None:
+        pending_records.append(record)
+    metrics.inc("llm_prompt_tokens_total", record["prompt_tokens"], model=model)
+    metrics.inc("llm_completion_tokens_total", record["completion_tokens"], model=model)
+    metrics.inc("llm_cached_tokens_total", record["cached_tokens"], model=model)
+
+def get_chat_tokens(chat_id: int, day: Optional[str] = None) -> int:
+    """
+    Возвращает количество токенов чата за день
+
+    Args:
+        chat_id: Идентификатор чата
+        day: День в формате YYYY-MM-DD (по умолчанию текущий)
+
+    Returns:
+        Сумма токенов запросов и ответов
+    """
+    return chat_daily_tokens.get((day or current_day(), chat_id), 0)
+
+def is_over_quota(chat_id: Optional[int]) -> bool:
+    """
+    Проверяет, исчерпал ли чат дневную квоту токенов
+
+    Args:
+        chat_id: Идентификатор чата
+
+    Returns:
+        True, если квота задана и исчерпана
+    """
+    limit = quota_config["daily_tokens"]
+    return bool(limit) and chat_id is not None and get_chat_tokens(chat_id) >= limit
+
+def get_usage(group_by: Tuple[str, ...] = ("style",), day: Optional[str] = None) -> Dict[Tuple[Any, ...], Dict[str, float]]:
+    """
+    Возвращает итоги расхода, сгруппированные по меткам
+
+    Итоги складываются из накопленных сумм, а не из записей журнала.
+
+    Args:
+        group_by: Метки для группировки (из DIMENSIONS)
+        day: День в формате YYYY-MM-DD (None - все дни в памяти)
+
+    Returns:
+        Словарь {значения меток: {поле: сумма}}
+    """
+    positions = [DIMENSIONS.index(dimension) + 1 for dimension in group_by]
+    grouped: Dict[Tuple[Any, ...], List[float]] = {}
+    for key, totals in usage_totals.items():
+        if day is not None and key[0] != day:
+            continue
+        group = tuple(key[position] for position in positions)
+        target = grouped.get(group)
+        if target is None:
+            target = grouped[group] = [0] * len(FIELDS)
+        for i, value in enumerate(totals):
+            target[i] += value
+    return {group: dict(zip(FIELDS, totals)) for group, totals in grouped.items()}
+
+def _append_records(path: str, records: List[Dict[str, Any]]) -> None:
+    """
+    Дописывает записи в файл журнала
+
+    Args:
+        path: Путь к файлу журнала
+        records: Записи
+    """
+    with open(path, "a", encoding="utf-8") as file:
+        file.write("".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records))
+
+async def flush_usage() -> int:
+    """
+    Дописывает накопленные записи в файл журнала
+
+    Returns:
+        Количество записанных записей
+    """
+    global pending_records
+    if ledger_path is None or not pending_records:
+        return 0
+    # Новые записи во время записи в файл попадают в новый список
+    records, pending_records = pending_records, []
+    try:
+        await asyncio.to_thread(_append_records, ledger_path, records)
+    except OSError:
+        # Записи возвращаются в начало очереди и будут дописаны при следующей попытке
+        pending_records[:0] = records
+        raise
+    metrics.inc("usage_records_flushed_total", len(records))
+    return len(records)
+
+def _read_day(path: str, day: str) -> List[Dict[str, Any]]:
+    """
+    Читает из файла журнала записи одного дня (выполняется в отдельном потоке)
+
+    Args:
+        path: Путь к файлу журнала
+        day: День в формате YYYY-MM-DD
+
+    Returns:
+        Записи дня
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Последняя строка могла быть записана не полностью
+                continue
+            if record.get("day") == day:
+                # Ключ чата арендатора (арендатор, chat_id) записывается в JSON списком
+                if isinstance(record.get("chat_id"), list):
+                    record["chat_id"] = tuple(record["chat_id"])
+                records.append(record)
+    return records
+
+async def _restore_today(path: str) -> None:
+    """
+    Восстанавливает итоги текущего дня из файла журнала (после перезапуска)
+
+    Файл читается целиком, поэтому чтение выполняется в отдельном потоке;
+    итоги изменяются только в потоке цикла событий.
+
+    Args:
+        path: Путь к файлу журнала
+    """
+    today = current_day()
+    records = await asyncio.to_thread(_read_day, path, today)
+    for record in records:
+        _add_to_totals(record)
+    logger.info(f"Из журнала расхода {path} восстановлено {len(records)} записей за {today}")
+
+async def start_usage_ledger(path: Optional[str] = None, interval: float = 10.0, config: Optional[Dict[str, int]] = None) -> None:
+    """
+    Включает журнал расхода токенов и квоты
+
+    Args:
+        path: Путь к файлу журнала (None или пустая строка - итоги только в памяти)
+        interval: Интервал записи в файл в секундах
+        config: Параметры квот в формате quota_config
+    """
+    global ledger_path, flush_task
+    quota_config.update(config or {})
+    # Пустой путь (USAGE_LEDGER_PATH=) означает журнал только в памяти
+    ledger_path = path or None
+    if path:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            await _restore_today(path)
+        flush_task = asyncio.create_task(_flush_loop(interval))
+    logger.info(f"Журнал расхода токенов: {path or 'только в памяти'}, квоты: {quota_config}")
+
+async def stop_usage_ledger() -> None:
+    """
+    Останавливает запись журнала и дописывает оставшиеся записи
+    """
+    global flush_task
+    if flush_task is not None:
+        flush_task.cancel()
+        try:
+            await flush_task
+        except asyncio.CancelledError:
+            pass
+        flush_task = None
+    await flush_usage()
+
+async def _flush_loop(interval: float) -> None:
+    """
+    Периодически дописывает записи в файл журнала
+
+    Args:
+        interval: Интервал записи в секундах
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_usage()
+        except OSError as e:
+            logger.error(f"Ошибка при записи журнала расхода: {e}")
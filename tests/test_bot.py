@@ -44,6 +44,7 @@ async def test_echo_without_llm():
     bot_mock.send_chat_action = AsyncMock()
     
     with patch("src.bot.bot", bot_mock), \
+         patch("src.coalescer.coalesce_window", 0.0), \
          patch("src.bot.create_messages_for_llm") as create_messages_mock, \
          patch("src.bot.generate_response", return_value=None) as generate_response_mock:
         
@@ -55,8 +56,8 @@ async def test_echo_without_llm():
             action="typing"
         )
         
-        # Проверяем, что были созданы сообщения для LLM
-        create_messages_mock.assert_called_once_with(message.text)
+        # Проверяем, что были созданы сообщения для LLM с историей чата
+        create_messages_mock.assert_called_once_with(message.text, message.chat.id)
         
         # Проверяем, что был вызван generate_response
         generate_response_mock.assert_called_once()
@@ -66,6 +67,31 @@ async def test_echo_without_llm():
         assert "ошибка" in message.answer.call_args[0][0].lower()
 
 
+@pytest.mark.asyncio
+async def test_echo_overloaded_reply():
+    """Тест ответа о перегрузке, когда запрос к LLM не отправлен (не ответа об ошибке)"""
+    from src.llm import OVERLOADED_RESPONSE
+    from src.memory import clear_dialog_history, get_dialog_history
+    
+    message = AsyncMock()
+    message.from_user = MagicMock()
+    message.from_user.id = 123456790
+    message.text = "Тестовое сообщение"
+    message.chat = MagicMock()
+    message.chat.id = 123456790
+    
+    with patch("src.bot.bot", AsyncMock()), \
+         patch("src.coalescer.coalesce_window", 0.0), \
+         patch("src.bot.generate_response", return_value=OVERLOADED_RESPONSE):
+        await echo(message)
+    
+    message.answer.assert_called_once()
+    assert message.answer.call_args[0][0].endswith(OVERLOADED_RESPONSE)
+    assert "ошибка" not in message.answer.call_args[0][0].lower()
+    assert get_dialog_history(message.chat.id)[-1]["content"] == OVERLOADED_RESPONSE
+    clear_dialog_history(message.chat.id)
+
+
 @pytest.mark.asyncio
 async def test_init_bot():
     """Тест инициализации бота"""
@@ -83,7 +109,8 @@ async def test_init_bot():
         
         # Проверяем, что обработчики были зарегистрированы
         dp_instance = dp_mock.return_value
-        assert dp_instance.message.register.call_count == 2
+        # /start, /style, команды выбора стиля и обработчик текста
+        assert dp_instance.message.register.call_count == 4
 
 
 @pytest.mark.asyncio
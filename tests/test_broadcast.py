@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля broadcast.py (с локальным поддельным сервером Bot API)
+"""
+import asyncio
+import json
+import socket
+import time
+
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+from aiohttp import web
+from aiogram import Bot
+
+from src import broadcast, memory, sender
+from src.broadcast import get_progress, init_broadcast, resume_broadcast, start_broadcast, stop_broadcast
+from src.http_pool import create_bot_session
+from src.rate_limit import create_bucket
+from src.styles import STYLE_BADGES, STYLE_CAT, user_styles
+
+CHAT_IDS = list(range(7001, 7041))
+BLOCKED_CHAT_ID = 7005
+
+
+class FakeBotAPI:
+    """Поддельный сервер Bot API: принимает sendMessage и отвечает ошибками по настройке"""
+
+    def __init__(self) -> None:
+        self.received = []
+        self.retry_after_first = 0
+        self.delay = 0.0
+        self.retry_at = None
+        self.runner = None
+        self.url = None
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        chat_id = int(data["chat_id"])
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.retry_after_first:
+            self.retry_after_first -= 1
+            self.retry_at = time.monotonic()
+            return web.json_response({
+                "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1}
+            })
+        if chat_id == BLOCKED_CHAT_ID:
+            return web.json_response({"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"})
+        self.received.append((time.monotonic(), chat_id, data["text"]))
+        return web.json_response({"ok": True, "result": {
+            "message_id": len(self.received), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": data["text"]
+        }})
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/bot{token}/sendMessage", self.send_message)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        self.url = f"http://127.0.0.1:{port}"
+
+
+@pytest_asyncio.fixture
+async def fake_api():
+    """Фикстура поддельного сервера Bot API и бота, отправляющего в него запросы"""
+    server = FakeBotAPI()
+    await server.start()
+    bot = Bot(token="42:TEST", session=create_bot_session(server.url))
+    yield server, bot
+    await bot.session.close()
+    await server.runner.cleanup()
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """Фикстура для заполнения истории чатов и сброса состояния рассылки"""
+    saved = dict(broadcast.broadcast_config)
+    sender.chat_buckets.clear()
+    # Получатели - только чаты теста (другие тесты могли оставить историю)
+    with patch.dict("src.memory.dialogs", clear=True), patch.dict("src.styles.user_styles", clear=True), \
+         patch("src.sender.global_bucket", create_bucket(rate=1000, capacity=1000)):
+        for chat_id in CHAT_IDS:
+            memory.dialogs[chat_id] = [{"role": "user", "content": "Привет"}]
+        memory.dialogs[("brand", CHAT_IDS[0])] = [{"role": "user", "content": "Привет"}]
+        user_styles[CHAT_IDS[1]] = STYLE_CAT
+        yield
+    broadcast.broadcast_config.update(saved)
+    broadcast.state = None
+    broadcast.done_ahead.clear()
+    broadcast.broadcast_task = None
+    broadcast.paused_until = 0.0
+    sender.chat_buckets.clear()
+
+
+@pytest.mark.asyncio
+async def test_broadcast_honors_retry_after_and_renders_styles(fake_api, tmp_path):
+    """Тест паузы после RetryAfter, пропуска заблокировавших бот чатов и текстов по стилям"""
+    server, bot = fake_api
+    server.retry_after_first = 1
+    init_broadcast(bot, str(tmp_path / "broadcast.json"), {"rate": 1000, "workers": 8, "checkpoint_interval": 0.05})
+
+    await start_broadcast("Новая услуга", variants={STYLE_CAT: "Мяу, новая услуга"}, badges=True)
+
+    delivered = {chat_id: text for _, chat_id, text in server.received}
+    assert sorted(delivered) == [chat_id for chat_id in CHAT_IDS if chat_id != BLOCKED_CHAT_ID]
+    assert len(server.received) == len(delivered)
+    # После RetryAfter новые сообщения не отправлялись до конца паузы
+    # (успевают только запросы, уже отправленные другими отправителями)
+    assert not [moment for moment, _, _ in server.received if 0.1 < moment - server.retry_at < 0.9]
+    assert max(moment for moment, _, _ in server.received) - server.retry_at >= 0.9
+    assert delivered[CHAT_IDS[1]] == f"{STYLE_BADGES[STYLE_CAT]}\n\nМяу, новая услуга"
+    assert delivered[CHAT_IDS[0]].endswith("\n\nНовая услуга")
+
+    progress = get_progress()
+    assert (progress["done"], progress["sent"], progress["failed"], progress["finished"]) == (40, 39, 1, True)
+    saved = json.loads((tmp_path / "broadcast.json").read_text(encoding="utf-8"))
+    assert saved["finished"] and saved["errors"][0]["chat_id"] == BLOCKED_CHAT_ID
+
+
+@pytest.mark.asyncio
+async def test_broadcast_resumes_from_checkpoint(fake_api, tmp_path):
+    """Тест продолжения рассылки после остановки без повторной отправки"""
+    server, bot = fake_api
+    server.delay = 0.02
+    path = str(tmp_path / "broadcast.json")
+    init_broadcast(bot, path, {"rate": 1000, "workers": 4, "checkpoint_interval": 0.05})
+
+    start_broadcast("Изменение цен", parse_mode=None)
+    while len(server.received) < 10:
+        await asyncio.sleep(0.01)
+    await stop_broadcast()
+    stopped_at = len(server.received)
+    saved = json.loads(open(path, encoding="utf-8").read())
+    assert not saved["finished"] and saved["sent"] == stopped_at
+    assert saved["cursor"] + len(saved["done_ahead"]) == saved["sent"] + saved["failed"]
+    assert stopped_at < len(CHAT_IDS) - 1
+
+    # Перезапуск процесса: состояние восстанавливается только из файла
+    broadcast.state = None
+    broadcast.done_ahead.clear()
+    memory.dialogs.clear()
+    init_broadcast(bot, path, {"rate": 1000, "workers": 4, "checkpoint_interval": 0.05})
+    await resume_broadcast()
+
+    chat_ids = [chat_id for _, chat_id, _ in server.received]
+    assert sorted(chat_ids) == [chat_id for chat_id in CHAT_IDS if chat_id != BLOCKED_CHAT_ID]
+    assert get_progress()["finished"] and resume_broadcast() is None
+
+
+@pytest.mark.asyncio
+async def test_broadcast_rate_limit(fake_api):
+    """Тест ограничения скорости рассылки корзиной"""
+    server, bot = fake_api
+    init_broadcast(bot, None, {"rate": 20, "workers": 8, "checkpoint_interval": 0.1})
+
+    started = time.monotonic()
+    await start_broadcast("Объявление", style=None)
+    elapsed = time.monotonic() - started
+
+    # Первые 20 сообщений - всплеск емкостью в секунду, остальные 20 - со скоростью 20 в секунду
+    assert len(server.received) == len(CHAT_IDS) - 1
+    assert elapsed >= 0.9
+    assert get_progress()["rate"] > 0
+
+
+@pytest.mark.asyncio
+async def test_broadcast_checkpoint_errors_do_not_break_stop(fake_api, tmp_path, monkeypatch):
+    """Тест рассылки без файла прогресса и остановки при ошибке записи прогресса"""
+    server, bot = fake_api
+    monkeypatch.chdir(tmp_path)
+    init_broadcast(bot, "", {"rate": 1000, "workers": 4, "checkpoint_interval": 0.05})
+    assert broadcast.checkpoint_path is None
+    await start_broadcast("Объявление")
+    assert get_progress()["finished"] and not list(tmp_path.iterdir())
+
+    server.delay = 0.02
+    init_broadcast(bot, str(tmp_path / "broadcast.json"), {"rate": 1000, "workers": 4, "checkpoint_interval": 0.05})
+    with patch("src.broadcast._write_checkpoint", side_effect=OSError("Нет места на диске")):
+        start_broadcast("Второе объявление")
+        while len(server.received) < len(CHAT_IDS) + 5:
+            await asyncio.sleep(0.01)
+        await stop_broadcast()
+    assert not get_progress()["finished"]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля cassette.py
+"""
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from src.cassette import (
+    create_backend, load_cassette, recording_backend, replay_backend, synthetic_backend
+)
+from src.llm import generate_response
+
+
+def make_request(content, max_tokens=1000):
+    """Создает запрос к бэкенду"""
+    return {
+        "model": "test-model",
+        "messages": [{"role": "user", "content": content}],
+        "temperature": 0.7,
+        "max_tokens": max_tokens
+    }
+
+
+async def fake_api(request):
+    """Бэкенд, имитирующий API"""
+    await asyncio.sleep(0.01)
+    return {
+        "content": f"Ответ на: {request['messages'][-1]['content']}",
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "cached_tokens": 0}
+    }
+
+
+@pytest.mark.asyncio
+async def test_record_and_replay(tmp_path):
+    """Тест записи ответов и их воспроизведения"""
+    path = str(tmp_path / "cassette.jsonl")
+    record = recording_backend(path, backend=fake_api)
+    
+    await record(make_request("Привет"))
+    await record(make_request("Сколько стоит сайт?"))
+    
+    records = load_cassette(path)
+    assert len(records) == 2
+    assert records[0]["usage"]["prompt_tokens"] == 10
+    assert records[0]["latency"] > 0
+    # В кассете хранится отпечаток запроса, а не сами сообщения
+    assert "messages" not in records[0]
+    
+    replay = replay_backend(path, latency_scale=0)
+    result = await replay(make_request("Сколько стоит сайт?"))
+    assert result["content"] == "Ответ на: Сколько стоит сайт?"
+
+
+@pytest.mark.asyncio
+async def test_replay_unknown_request(tmp_path):
+    """Тест воспроизведения запроса, которого нет в кассете"""
+    path = str(tmp_path / "cassette.jsonl")
+    record = recording_backend(path, backend=fake_api)
+    await record(make_request("Привет"))
+    
+    replay = replay_backend(path, latency_scale=0)
+    result = await replay(make_request("Новый вопрос"))
+    assert result["content"] == "Ответ на: Привет"
+    
+    strict_replay = replay_backend(path, latency_scale=0, strict=True)
+    with pytest.raises(KeyError):
+        await strict_replay(make_request("Новый вопрос"))
+
+
+@pytest.mark.asyncio
+async def test_replay_scales_latency(tmp_path):
+    """Тест масштабирования записанной задержки"""
+    path = tmp_path / "cassette.jsonl"
+    path.write_text(json.dumps({"fp": "x", "model": "m", "max_tokens": 10, "prompt_chars": 5,
+                                "latency": 1.0, "content": "Ответ", "usage": {}}) + "\n")
+    
+    replay = replay_backend(str(path), latency_scale=0.05)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await replay(make_request("Привет"))
+    
+    assert 0.04 <= loop.time() - started < 0.5
+
+
+@pytest.mark.asyncio
+async def test_synthetic_backend_is_deterministic_with_seed():
+    """Тест генерации синтетических ответов"""
+    first = synthetic_backend(length_median=200, latency_scale=0, seed=1)
+    second = synthetic_backend(length_median=200, latency_scale=0, seed=1)
+    
+    results = [await first(make_request("Привет")) for _ in range(3)]
+    expected = [await second(make_request("Привет")) for _ in range(3)]
+    
+    assert results == expected
+    assert all(result["content"] for result in results)
+    assert all(result["usage"]["completion_tokens"] > 0 for result in results)
+
+
+@pytest.mark.asyncio
+async def test_generate_response_with_replay_backend(tmp_path):
+    """Тест generate_response без клиента и сети"""
+    path = str(tmp_path / "cassette.jsonl")
+    await recording_backend(path, backend=fake_api)(make_request("Привет!", max_tokens=500))
+    
+    with patch("src.llm.client", None), \
+         patch("src.llm.completion_backend", replay_backend(path, latency_scale=0, strict=True)):
+        result = await generate_response(
+            [{"role": "user", "content": "Привет!"}], "test-model", 0.7, 500
+        )
+    
+    assert result == "Ответ на: Привет!"
+
+
+@pytest.mark.asyncio
+async def test_scenario_with_synthetic_backend():
+    """Тест сценария приветствия с синтетическим бэкендом"""
+    from src.scenarios import handle_start_command
+    
+    message = AsyncMock()
+    message.from_user = MagicMock()
+    message.from_user.id = 7
+    message.from_user.first_name = "Иван"
+    message.chat = MagicMock()
+    message.chat.id = 7
+    
+    with patch("src.llm.completion_backend", synthetic_backend(latency_scale=0, seed=3)):
+        await handle_start_command(message)
+    
+    message.answer.assert_called_once()
+    assert "ТехноСервис" in message.answer.call_args[0][0]
+
+
+def test_create_backend_unknown_mode():
+    """Тест создания бэкенда с неизвестным режимом"""
+    with pytest.raises(ValueError):
+        create_backend("unknown")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля chat_action.py
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from src import chat_action
+from src.chat_action import keep_typing, send_typing
+from src.rate_limit import create_bucket
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """Фикстура для сброса состояния модуля между тестами"""
+    chat_action.last_action_sent.clear()
+    with patch("src.chat_action.action_bucket", create_bucket(rate=100, capacity=100)):
+        yield
+    chat_action.last_action_sent.clear()
+
+
+@pytest.mark.asyncio
+async def test_keep_typing_refreshes_action():
+    """Тест периодического обновления индикатора"""
+    bot_mock = AsyncMock()
+    
+    with patch("src.chat_action.REFRESH_INTERVAL", 0.02):
+        async with keep_typing(bot_mock, 1):
+            await asyncio.sleep(0.07)
+    
+    assert bot_mock.send_chat_action.call_count >= 3
+    bot_mock.send_chat_action.assert_called_with(chat_id=1, action="typing")
+
+
+@pytest.mark.asyncio
+async def test_keep_typing_stops_on_exit():
+    """Тест остановки обновления после выхода из блока"""
+    bot_mock = AsyncMock()
+    
+    with patch("src.chat_action.REFRESH_INTERVAL", 0.02):
+        async with keep_typing(bot_mock, 1):
+            await asyncio.sleep(0.01)
+        calls = bot_mock.send_chat_action.call_count
+        await asyncio.sleep(0.05)
+    
+    assert calls == 1
+    assert bot_mock.send_chat_action.call_count == calls
+    assert 1 not in chat_action.last_action_sent
+
+
+@pytest.mark.asyncio
+async def test_keep_typing_skips_recently_sent_action():
+    """Тест отсутствия повторной отправки сразу после send_typing"""
+    bot_mock = AsyncMock()
+    
+    await send_typing(bot_mock, 1)
+    async with keep_typing(bot_mock, 1):
+        await asyncio.sleep(0.01)
+    
+    bot_mock.send_chat_action.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_send_typing_respects_global_limit():
+    """Тест глобального ограничения частоты индикатора"""
+    bot_mock = AsyncMock()
+    
+    with patch("src.chat_action.action_bucket", create_bucket(rate=0.001, capacity=2)):
+        results = [await send_typing(bot_mock, chat_id) for chat_id in range(5)]
+    
+    assert results == [True, True, False, False, False]
+    assert bot_mock.send_chat_action.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_send_typing_error_is_not_raised():
+    """Тест обработки ошибки Telegram API при отправке индикатора"""
+    bot_mock = AsyncMock()
+    bot_mock.send_chat_action.side_effect = Exception("Test exception")
+    
+    assert await send_typing(bot_mock, 1) is False
+
+
+@pytest.mark.asyncio
+async def test_keep_typing_propagates_cancellation():
+    """Тест отмены задачи, выполняющейся внутри блока"""
+    bot_mock = AsyncMock()
+    
+    async def handler():
+        async with keep_typing(bot_mock, 1):
+            await asyncio.sleep(10)
+    
+    task = asyncio.create_task(handler())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert 1 not in chat_action.last_action_sent
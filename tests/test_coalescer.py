@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля coalescer.py
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+from src import coalescer
+from src.coalescer import coalesce_message, is_chat_busy
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """Фикстура для очистки состояния модуля между тестами"""
+    coalescer.pending_messages.clear()
+    coalescer.chat_tasks.clear()
+    yield
+    for task in coalescer.chat_tasks.values():
+        task.cancel()
+    coalescer.pending_messages.clear()
+    coalescer.chat_tasks.clear()
+
+
+@pytest.mark.asyncio
+async def test_without_window_handler_called_immediately():
+    """Тест обработки без окна объединения"""
+    received = []
+
+    async def handler(text):
+        received.append(text)
+
+    with patch("src.coalescer.coalesce_window", 0.0):
+        await coalesce_message(1, "Привет", handler)
+
+    assert received == ["Привет"]
+    assert not is_chat_busy(1)
+
+
+@pytest.mark.asyncio
+async def test_messages_within_window_are_merged():
+    """Тест объединения сообщений, пришедших в пределах окна"""
+    received = []
+
+    async def handler(text):
+        received.append(text)
+
+    with patch("src.coalescer.coalesce_window", 0.05):
+        await coalesce_message(1, "Привет", handler)
+        await asyncio.sleep(0.01)
+        await coalesce_message(1, "Хочу сайт", handler)
+        await asyncio.sleep(0.01)
+        await coalesce_message(1, "для магазина", handler)
+        assert is_chat_busy(1)
+
+        await asyncio.sleep(0.1)
+
+    assert received == ["Привет\nХочу сайт\nдля магазина"]
+    assert not is_chat_busy(1)
+
+
+@pytest.mark.asyncio
+async def test_messages_outside_window_processed_separately():
+    """Тест раздельной обработки сообщений с паузой больше окна"""
+    received = []
+
+    async def handler(text):
+        received.append(text)
+
+    with patch("src.coalescer.coalesce_window", 0.02):
+        await coalesce_message(1, "Первое", handler)
+        await asyncio.sleep(0.06)
+        await coalesce_message(1, "Второе", handler)
+        await asyncio.sleep(0.06)
+
+    assert received == ["Первое", "Второе"]
+
+
+@pytest.mark.asyncio
+async def test_chats_are_independent():
+    """Тест независимости окон разных чатов"""
+    received = []
+
+    async def handler(text):
+        received.append(text)
+
+    with patch("src.coalescer.coalesce_window", 0.03):
+        await coalesce_message(1, "Чат 1", handler)
+        await coalesce_message(2, "Чат 2", handler)
+        await asyncio.sleep(0.08)
+
+    assert sorted(received) == ["Чат 1", "Чат 2"]
+
+
+@pytest.mark.asyncio
+async def test_in_flight_processing_is_superseded():
+    """Тест отмены обработки, которая уже ждет ответа LLM"""
+    started = []
+    finished = []
+
+    async def slow_handler(text):
+        started.append(text)
+        # Имитация долгого запроса к LLM
+        await asyncio.sleep(0.2)
+        finished.append(text)
+
+    with patch("src.coalescer.coalesce_window", 0.02):
+        await coalesce_message(1, "Первое", slow_handler)
+        # Окно истекло, обработка первого сообщения уже идет
+        await asyncio.sleep(0.05)
+        assert started == ["Первое"]
+
+        await coalesce_message(1, "Второе", slow_handler)
+        await asyncio.sleep(0.3)
+
+    # Первая обработка отменена, ответ сформирован только один раз
+    assert started == ["Первое", "Второе"]
+    assert finished == ["Второе"]
+    assert not is_chat_busy(1)
+
+
+@pytest.mark.asyncio
+async def test_handler_error_does_not_leave_chat_busy():
+    """Тест обработки исключения в обработчике"""
+    async def failing_handler(text):
+        raise ValueError("Test exception")
+
+    with patch("src.coalescer.coalesce_window", 0.01):
+        await coalesce_message(1, "Привет", failing_handler)
+        await asyncio.sleep(0.05)
+
+    assert not is_chat_busy(1)
+
+
+@pytest.mark.asyncio
+async def test_messages_kept_while_waiting_for_full_lane():
+    """Тест сохранения сообщений, если задачу отменили в ожидании места в полосе"""
+    from src import lanes
+
+    received = []
+
+    async def handler(text):
+        received.append(text)
+
+    with patch.dict(lanes.lane_config, {"test": {"limit": 1, "budget": 60.0}}), \
+            patch.dict(lanes.lane_semaphores, {"test": asyncio.Semaphore(1)}), \
+            patch("src.coalescer.coalesce_window", 0.01):
+        # Полоса занята другим обработчиком
+        await lanes.lane_semaphores["test"].acquire()
+
+        await coalesce_message(1, "first", handler, lane="test")
+        await asyncio.sleep(0.05)
+        assert 1 not in coalescer.pending_messages
+
+        # Задача ждет места в полосе и отменяется следующим сообщением
+        await coalesce_message(1, "second", handler, lane="test")
+        await asyncio.sleep(0.05)
+
+        lanes.lane_semaphores["test"].release()
+        await asyncio.sleep(0.05)
+
+    assert received == ["first\nsecond"]
+    assert not is_chat_busy(1)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля context.py
+"""
+import json
+import pytest
+from unittest.mock import patch
+
+from src import context, memory
+from src.context import build_messages, chat_contexts
+from src.llm import make_request_key
+from src.styles import STYLE_CAT, user_styles
+
+CHAT_ID = 4242
+
+
+@pytest.fixture(autouse=True)
+def clean_chat():
+    """Фикстура для очистки истории и контекста тестового чата"""
+    memory.clear_dialog_history(CHAT_ID)
+    user_styles.pop(CHAT_ID, None)
+    yield
+    memory.clear_dialog_history(CHAT_ID)
+    user_styles.pop(CHAT_ID, None)
+
+
+def reference_messages(user_message):
+    """Собирает сообщения так же, как до появления контекста чата"""
+    messages = [{"role": "system", "content": context.load_style_prompt(user_styles.get(CHAT_ID, "normal"))}]
+    for message in memory.get_dialog_messages_for_llm(CHAT_ID):
+        if message["role"] in ["user", "assistant"]:
+            messages.append(message)
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+def test_build_messages_matches_history():
+    """Тест совпадения сообщений и их JSON с историей диалога"""
+    for i in range(12):
+        memory.add_message(CHAT_ID, "user" if i % 2 == 0 else "assistant", f"Сообщение \"{i}\"\n")
+    memory.add_message(CHAT_ID, "system", "служебная запись")
+
+    messages = build_messages(CHAT_ID, "Новый вопрос")
+
+    assert messages == reference_messages("Новый вопрос")
+    assert json.loads(messages.encoded) == messages
+
+
+def test_context_updated_incrementally():
+    """Тест обновления контекста при добавлении сообщения без повторной сборки"""
+    memory.add_message(CHAT_ID, "user", "Привет")
+    build_messages(CHAT_ID, "Первый вопрос")
+    context_before = chat_contexts[CHAT_ID]
+
+    with patch("src.context.memory.get_dialog_history") as history_mock:
+        memory.add_message(CHAT_ID, "assistant", "Здравствуйте")
+        messages = build_messages(CHAT_ID, "Второй вопрос")
+
+    history_mock.assert_not_called()
+    assert chat_contexts[CHAT_ID] is context_before
+    assert [message["content"] for message in messages[1:]] == ["Привет", "Здравствуйте", "Второй вопрос"]
+    assert json.loads(messages.encoded) == messages
+
+
+def test_context_reset_on_clear_and_style_change():
+    """Тест сброса контекста при очистке истории и смены системного промпта при смене стиля"""
+    memory.add_message(CHAT_ID, "user", "Привет")
+    build_messages(CHAT_ID, "Вопрос")
+
+    memory.clear_dialog_history(CHAT_ID)
+    assert CHAT_ID not in chat_contexts
+
+    user_styles[CHAT_ID] = STYLE_CAT
+    messages = build_messages(CHAT_ID, "Вопрос")
+
+    assert messages == reference_messages("Вопрос")
+    assert len(messages) == 2
+
+
+def test_request_key_uses_one_normalization():
+    """Тест одинакового ключа запроса для закодированных и обычных сообщений"""
+    memory.add_message(CHAT_ID, "user", "Привет")
+    first = build_messages(CHAT_ID, "Вопрос")
+    second = build_messages(CHAT_ID, "Вопрос")
+    other = build_messages(CHAT_ID, "Другой вопрос")
+
+    assert make_request_key(first, "model", 0.7, 100) == make_request_key(second, "model", 0.7, 100)
+    assert make_request_key(first, "model", 0.7, 100) != make_request_key(other, "model", 0.7, 100)
+    assert make_request_key(first, "model", 0.7, 100) != make_request_key(first, "model", 0.7, 200)
+    # Закодированный контекстом чата список и обычный список с теми же
+    # сообщениями (с точностью до крайних пробелов) дают один ключ
+    plain = [{"role": message["role"], "content": f" {message['content']}\n"} for message in first]
+    assert make_request_key(plain, "model", 0.7, 100) == make_request_key(first, "model", 0.7, 100)
+
+
+def test_openai_completion_sends_encoded_body():
+    """Тест отправки готового JSON сообщений в теле запроса к API"""
+    from src import llm
+
+    memory.add_message(CHAT_ID, "user", "Привет")
+    messages = build_messages(CHAT_ID, "Вопрос")
+    request = {"model": "model", "messages": messages, "temperature": 0.7, "max_tokens": 100}
+
+    sent = []
+
+    def post(path, *, cast_to, content=None, options=None, stream=False, stream_cls=None):
+        sent.append((path, content))
+
+    with patch("src.llm.client") as client_mock, patch("src.llm.raw_body_param", None):
+        client_mock.post = post
+        llm._create_completion(request)
+
+    path, body = sent[0]
+    assert path == "/chat/completions"
+    assert json.loads(body) == {**request, "messages": list(messages)}
+    client_mock.chat.completions.create.assert_not_called()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля degradation.py
+"""
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from src import degradation, llm, memory, metrics
+from src.degradation import evaluate, observe_latency, reset_degradation
+from src.prompts import create_messages_for_llm
+
+CHAT_ID = 4701
+
+
+@pytest.fixture(autouse=True)
+def clean_controller():
+    """Фикстура для сброса контроллера и метрик"""
+    saved = dict(degradation.degradation_config)
+    reset_degradation()
+    metrics.reset_metrics()
+    yield
+    degradation.degradation_config.update(saved)
+    reset_degradation()
+    memory.clear_dialog_history(CHAT_ID)
+
+
+def test_latency_spike_escalates_and_recovers_with_hysteresis():
+    """Тест повышения уровня при всплеске задержек и восстановления с гистерезисом"""
+    degradation.degradation_config.update({"max_p95": 10.0, "recovery_seconds": 30.0, "latency_horizon": 20.0})
+    now = 1000.0
+    for i in range(20):
+        observe_latency(1.0, now + i * 0.1)
+    assert evaluate(now + 2) == 0
+
+    # Всплеск: ответы по 30 секунд, уровень растет на ступень за оценку
+    for i in range(20):
+        observe_latency(30.0, now + 3 + i * 0.1)
+    assert [evaluate(now + 5 + i) for i in range(6)] == [1, 2, 3, 4, 4, 4]
+    assert metrics.get_metrics()["gauges"]["degradation_level"] == 4
+
+    # Задержки на границе порогов (между recover_below и 1): уровень держится
+    levels = []
+    for i in range(10):
+        observe_latency(8.0, now + 30 + i * 10)
+        levels.append(evaluate(now + 30 + i * 10))
+    assert levels == [4] * 10
+
+    # Нагрузка спала: уровень снижается по одной ступени за recovery_seconds
+    later = now + 200
+    assert evaluate(later) == 4
+    assert evaluate(later + 29) == 4
+    assert evaluate(later + 30) == 3
+    assert evaluate(later + 45) == 3
+    assert evaluate(later + 60) == 2
+    assert metrics.get_counter("degradation_transitions_total", direction="down") == 2
+
+
+def test_inflight_requests_raise_level():
+    """Тест повышения уровня по количеству выполняющихся запросов"""
+    degradation.degradation_config["max_inflight"] = 2
+    for _ in range(2):
+        degradation.request_started()
+    assert evaluate(10.0) == 1
+    degradation.request_finished()
+    degradation.request_finished()
+    degradation.degradation_config["max_level"] = 1
+    assert evaluate(11.0) == 1
+
+
+@pytest.mark.asyncio
+async def test_levels_limit_history_tokens_and_model():
+    """Тест ограничений уровней: окно истории, лимит токенов, модель и отказ от запроса"""
+    for i in range(10):
+        memory.add_message(CHAT_ID, "user" if i % 2 == 0 else "assistant", f"Сообщение {i}")
+    backend = AsyncMock(return_value={"content": "Ответ", "usage": {}})
+
+    with patch("src.llm.completion_backend", backend), patch("src.llm.client", None):
+        degradation.current_level = 0
+        full = create_messages_for_llm("Вопрос", CHAT_ID)
+        await llm.generate_response(full, route=llm.ROUTE_FULL)
+        assert backend.call_args.args[0]["model"] == llm.routes[llm.ROUTE_FULL]["model"]
+
+        degradation.current_level = 3
+        short = create_messages_for_llm("Вопрос", CHAT_ID)
+        assert len(short) == len(full) - 8
+        await llm.generate_response(short, route=llm.ROUTE_FULL)
+        request = backend.call_args.args[0]
+        assert request["model"] == llm.routes[llm.ROUTE_FAST]["model"]
+        assert request["max_tokens"] <= 300
+
+        degradation.current_level = 4
+        backend.reset_mock()
+        assert await llm.generate_response(short) is llm.OVERLOADED_RESPONSE
+        backend.assert_not_called()
+        assert metrics.get_counter("llm_shed_total") == 1
+    assert degradation.inflight == 0
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля experiments.py
+"""
+import random
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from src import experiments, llm, memory, styles
+from src.experiments import (
+    QuantileSketch, assign_variant, init_experiments, mann_whitney_p_value, proportion_p_value,
+    record_request, report, save_stats, start_experiments, stop_experiments
+)
+from src.prompts import create_messages_for_llm
+
+CHAT_ID = 4901
+
+
+@pytest.fixture(autouse=True)
+def clean_experiments():
+    """Фикстура для сброса экспериментов и статистики"""
+    yield
+    experiments.experiments.clear()
+    experiments.experiment_slots.clear()
+    experiments.chat_variants.clear()
+    experiments.variant_stats.clear()
+    experiments.last_answers.clear()
+    experiments.stats_path = None
+    memory.clear_dialog_history(CHAT_ID)
+
+
+def test_assignment_is_deterministic_and_weighted():
+    """Тест постоянного распределения чатов по вариантам с учетом весов"""
+    config = {"length": {"variants": [{"name": "control", "weight": 3}, {"name": "short", "max_tokens": 300}]}}
+    init_experiments(config)
+    first = [assign_variant("length", chat_id)["name"] for chat_id in range(20000)]
+    init_experiments(config)
+    assert [assign_variant("length", chat_id)["name"] for chat_id in range(20000)] == first
+    assert 0.72 < first.count("control") / len(first) < 0.78
+
+    for broken in ({"a": {"variants": [{"name": "x"}]}},
+                   {"a": {"variants": [{"name": "x"}, {"name": "y", "temperature": 1}]}},
+                   {"a": {"variants": [{"name": "x"}, {"name": "y", "model": "m"}]},
+                    "b": {"variants": [{"name": "x"}, {"name": "y", "model": "n"}]}}):
+        with pytest.raises(ValueError):
+            init_experiments(broken)
+
+
+def test_sketch_quantiles_within_relative_accuracy():
+    """Тест точности квантилей скетча, сложения и сохранения"""
+    random.seed(1)
+    values = [random.lognormvariate(0.5, 1.0) for _ in range(20000)] + [0.0] * 100
+    first, second = QuantileSketch(), QuantileSketch()
+    for i, value in enumerate(values):
+        (first if i % 2 else second).add(value)
+    first.merge(QuantileSketch.from_dict(second.to_dict()))
+
+    ordered = sorted(values)
+    for q in (0.5, 0.9, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(first.quantile(q) - exact) <= 0.011 * exact
+    assert first.quantile(0.001) == 0.0
+    assert first.count == len(values) and len(first.bins) < 1000
+
+
+@pytest.mark.asyncio
+async def test_variant_overrides_and_statistics():
+    """Тест подмены модели и лимита токенов и учета запросов, ошибок и продолжений"""
+    init_experiments({
+        "model": {"variants": [{"name": "control"}, {"name": "small", "model": "small-model", "max_tokens": 123}]}
+    })
+    variant = assign_variant("model", CHAT_ID)["name"]
+    backend = AsyncMock(return_value={"content": "Ответ", "usage": {"prompt_tokens": 50, "completion_tokens": 20}})
+
+    with patch("src.llm.completion_backend", backend), patch("src.llm.client", None):
+        await llm.generate_response([{"role": "user", "content": "Вопрос"}], chat_id=CHAT_ID)
+        request = backend.call_args.args[0]
+        if variant == "small":
+            assert request["model"] == "small-model" and request["max_tokens"] == 123
+        else:
+            assert request["model"] != "small-model"
+        # Служебные запросы без чата в эксперименты не попадают
+        await llm.generate_response([{"role": "user", "content": "Пул"}])
+        backend.side_effect = RuntimeError("сбой")
+        assert await llm.generate_response([{"role": "user", "content": "Еще"}], chat_id=CHAT_ID) is None
+
+    memory.add_message(CHAT_ID, "assistant", "Ответ")
+    memory.add_message(CHAT_ID, "user", "А подробнее?")
+    memory.add_message(CHAT_ID, "assistant", "Подробнее")
+
+    stats = experiments.variant_stats[("model", variant)]
+    assert (stats["requests"], stats["errors"], stats["completion_tokens"]) == (2, 1, 20)
+    assert (stats["answers"], stats["follow_ups"]) == (2, 1)
+    assert stats["latency"].count == 1 and stats["output_tokens"].quantile(0.5) == pytest.approx(20, rel=0.01)
+    other = "control" if variant == "small" else "small"
+    assert experiments.variant_stats[("model", other)]["requests"] == 0
+
+
+@pytest.mark.asyncio
+async def test_shed_requests_counted_separately():
+    """Тест учета запросов, не отправленных из-за перегрузки"""
+    init_experiments({"model": {"variants": [{"name": "control"}, {"name": "small", "model": "small-model"}]}})
+    variant = assign_variant("model", CHAT_ID)["name"]
+    backend = AsyncMock(return_value={"content": "Ответ", "usage": {}})
+
+    with patch("src.llm.completion_backend", backend), patch("src.llm.client", None), \
+         patch("src.degradation.current_level", 4):
+        assert await llm.generate_response([{"role": "user", "content": "Вопрос"}], chat_id=CHAT_ID) \
+            is llm.OVERLOADED_RESPONSE
+    backend.assert_not_called()
+
+    stats = experiments.variant_stats[("model", variant)]
+    assert (stats["requests"], stats["shed"], stats["errors"]) == (1, 1, 0)
+    assert experiments.summarize(stats)["shed_rate"] == 1.0 and stats["latency"].count == 0
+
+
+def test_prompt_version_variant(tmp_path, monkeypatch):
+    """Тест версии промптов варианта в системном сообщении"""
+    (tmp_path / "system.txt").write_text("Промпт   версии 2", encoding="utf-8")
+    monkeypatch.setattr(styles, "prompt_cache", {})
+    init_experiments({"prompts": {"variants": [{"name": "v2", "prompts_dir": str(tmp_path)}, {"name": "v1", "weight": 0}]}})
+
+    assert create_messages_for_llm("Вопрос", CHAT_ID)[0]["content"] == "Промпт версии 2"
+    experiments.experiments.clear()
+    experiments.chat_variants.clear()
+    assert create_messages_for_llm("Вопрос", CHAT_ID)[0]["content"] != "Промпт версии 2"
+
+
+def test_significance_tests():
+    """Тест значимости отличий времени ответа и долей"""
+    random.seed(2)
+    control, same, slower = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for _ in range(2000):
+        control.add(random.lognormvariate(1.0, 0.5))
+        same.add(random.lognormvariate(1.0, 0.5))
+        slower.add(random.lognormvariate(1.2, 0.5))
+    assert mann_whitney_p_value(control, same) > 0.01
+    assert mann_whitney_p_value(control, slower) < 0.001
+    assert proportion_p_value(100, 1000, 104, 1000) > 0.5
+    assert proportion_p_value(100, 1000, 160, 1000) < 0.001
+    assert proportion_p_value(0, 0, 1, 10) == 1.0
+
+
+@pytest.mark.asyncio
+async def test_report_from_saved_stats(tmp_path):
+    """Тест отчета по сохраненной статистике"""
+    init_experiments({"model": {"variants": [{"name": "control"}, {"name": "small", "model": "small-model"}]}})
+    random.seed(3)
+    for chat_id in range(400):
+        slow = assign_variant("model", chat_id)["name"] == "small"
+        record_request(chat_id, random.uniform(4, 6) if slow else random.uniform(1, 3), {"completion_tokens": 100})
+    experiments.stats_path = str(tmp_path / "experiments.json")
+    await save_stats()
+
+    text = report(experiments.stats_path)
+    assert "Эксперимент model" in text
+    assert "small против control: latency p=0.000 *" in text
+
+
+@pytest.mark.asyncio
+async def test_empty_stats_path_keeps_stats_in_memory(tmp_path, monkeypatch):
+    """Тест пустого пути статистики: остановка не пишет файлы и не падает"""
+    monkeypatch.chdir(tmp_path)
+    init_experiments({"model": {"variants": [{"name": "control"}, {"name": "small", "model": "small-model"}]}})
+    start_experiments("")
+    record_request(CHAT_ID, 1.0, {"completion_tokens": 10})
+
+    assert experiments.stats_path is None
+    await stop_experiments()
+    assert not list(tmp_path.iterdir())
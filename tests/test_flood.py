@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля flood.py
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src import flood, lanes, metrics
+from src.flood import FloodMiddleware, REASON_CHAT, REASON_GLOBAL, REASON_USER, check_message, init_flood
+from src.lanes import LANE_LLM
+
+
+@pytest.fixture(autouse=True)
+def fresh_flood(monkeypatch):
+    """Фикстура для сброса корзин и метрик с остановленными часами корзин"""
+    saved = dict(flood.flood_config)
+    metrics.reset_metrics()
+    monkeypatch.setattr(flood, "clock", lambda: 1000.0)
+    init_flood()
+    yield
+    flood.flood_config.update(saved)
+    lanes.lane_wait_average.pop(LANE_LLM, None)
+
+
+def make_message(user_id, text="Привет"):
+    """Создает мок сообщения пользователя в личном чате"""
+    message = MagicMock()
+    message.from_user.id = user_id
+    message.chat.id = user_id
+    message.text = text
+    return message
+
+
+@pytest.mark.asyncio
+async def test_flood_simulation():
+    """Тест потока из 50 сообщений одного пользователя рядом с обычным пользователем"""
+    middleware = FloodMiddleware()
+    handler = AsyncMock()
+
+    with patch("src.flood.send_answer", AsyncMock()) as send_mock:
+        for _ in range(50):
+            await middleware(handler, make_message(1), {})
+        await middleware(handler, make_message(2), {})
+
+    # Пользователь 1 получил обработку только в пределах всплеска, пользователь 2 - обслужен
+    handled_users = [call.args[0].from_user.id for call in handler.call_args_list]
+    assert handled_users.count(1) == flood.flood_config["user_capacity"]
+    assert handled_users.count(2) == 1
+
+    # Ответ о превышении лимита отправлен один раз
+    send_mock.assert_called_once()
+    assert metrics.get_counter("flood_dropped_total", reason=REASON_USER) == 45
+    assert metrics.get_counter("flood_replies_total") == 1
+
+
+def test_user_bucket_refills():
+    """Тест пополнения корзины пользователя со временем"""
+    now = flood.clock()
+    for _ in range(5):
+        assert check_message(1, 1, True, now=now) is None
+    assert check_message(1, 1, True, now=now) == REASON_USER
+
+    # Через 2 секунды при скорости 0.5 в секунду появляется один токен
+    assert check_message(1, 1, True, now=now + 2) is None
+    assert check_message(1, 1, True, now=now + 2) == REASON_USER
+
+
+def test_global_limit_tightens_with_llm_wait():
+    """Тест снижения общего лимита при росте ожидания в полосе llm"""
+    init_flood({"global_capacity": 40, "user_capacity": 100, "chat_capacity": 100})
+    lanes.lane_wait_average[LANE_LLM] = 10.0
+    now = flood.clock()
+
+    results = [check_message(user_id, user_id, True, now=now) for user_id in range(20)]
+
+    # При ожидании в 10 раз выше целевого общая корзина уменьшается до 4 сообщений
+    assert results.count(None) == 4
+    assert results.count(REASON_GLOBAL) == 16
+    # Команды не расходуют общий лимит
+    assert check_message(100, 100, False, now=now) is None
+
+
+def test_rejected_message_does_not_spend_user_limit():
+    """Тест сохранения лимита пользователя при отклонении по лимиту чата"""
+    init_flood({"user_capacity": 2, "chat_capacity": 2})
+    now = flood.clock()
+
+    # В группе чат исчерпан другими пользователями
+    assert check_message(1, 100, True, now=now) is None
+    assert check_message(2, 100, True, now=now) is None
+    for _ in range(5):
+        assert check_message(3, 100, True, now=now) == REASON_CHAT
+
+    # Пользователь 3 по-прежнему может написать в другой чат
+    for _ in range(2):
+        assert check_message(3, 200, True, now=now) is None
+    assert check_message(3, 200, True, now=now) == REASON_USER
+
+def test_idle_buckets_are_evicted():
+    """Тест удаления простаивающих корзин"""
+    now = flood.clock()
+    for user_id in range(100):
+        check_message(user_id, user_id, False, now=now)
+    assert len(flood.user_buckets) == 100
+
+    check_message(1, 1, False, now=now + flood.flood_config["sweep_interval"])
+
+    assert len(flood.user_buckets) == 1
+    assert len(flood.chat_buckets) == 1
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля greetings.py и приветствия из пула
+"""
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from src import greetings, metrics
+from src.greetings import USER_NAME_PLACEHOLDER, refill_pool, take_greeting
+from src.scenarios import handle_start_command
+from src.styles import STYLE_CAT, STYLE_REGISTRY
+
+
+@pytest.fixture(autouse=True)
+def clean_pool():
+    """Фикстура для очистки пула и метрик"""
+    metrics.reset_metrics()
+    greetings.greeting_pool.clear()
+    yield
+    greetings.greeting_pool.clear()
+
+
+@pytest.mark.asyncio
+async def test_refill_pool_fills_every_style():
+    """Тест заполнения пула вариантами с меткой имени"""
+    response = f"Здравствуйте, {USER_NAME_PLACEHOLDER}! Я ассистент компании ООО \"ТехноСервис\"."
+    with patch("src.greetings.generate_response", AsyncMock(return_value=response)), \
+         patch("src.greetings.pool_size", 2):
+        assert await refill_pool() is True
+
+    assert all(len(greetings.greeting_pool[style]) == 2 for style in STYLE_REGISTRY)
+
+
+@pytest.mark.asyncio
+async def test_refill_pool_rejects_variants_without_placeholder():
+    """Тест отбрасывания вариантов без метки имени"""
+    with patch("src.greetings.generate_response", AsyncMock(return_value="Здравствуйте, Иван!")), \
+         patch("src.greetings.pool_size", 1):
+        assert await refill_pool() is False
+
+    assert not any(greetings.greeting_pool.values())
+    assert metrics.get_counter("greeting_pool_rejected_total", style=STYLE_CAT) == 2
+
+
+def test_take_greeting_skips_stale_entries():
+    """Тест удаления устаревших вариантов и подсчета попаданий"""
+    now = time.monotonic()
+    greetings.greeting_pool[STYLE_CAT] = greetings.deque([
+        {"text": "старый", "created": now - greetings.MAX_GREETING_AGE - 1},
+        {"text": "свежий", "created": now}
+    ])
+
+    assert take_greeting(STYLE_CAT) == "свежий"
+    assert take_greeting(STYLE_CAT) is None
+    assert metrics.get_counter("greeting_pool_expired_total", style=STYLE_CAT) == 1
+    assert metrics.get_metrics()["gauges"]["greeting_pool_hit_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_start_answers_from_pool_without_llm():
+    """Тест ответа на /start из пула без запроса к LLM"""
+    greetings.greeting_pool[STYLE_CAT] = greetings.deque([
+        {"text": f"Мяу, {USER_NAME_PLACEHOLDER}! Чем помочь?", "created": time.monotonic()}
+    ])
+    message = AsyncMock()
+    message.from_user = MagicMock()
+    message.from_user.id = 1
+    message.from_user.first_name = "<Иван>"
+    message.chat = MagicMock()
+    message.chat.id = 1
+
+    with patch("src.scenarios.generate_response", AsyncMock()) as generate_mock, \
+         patch("src.scenarios.add_message") as add_message_mock:
+        await handle_start_command(message, style_badge="🐱", style=STYLE_CAT)
+
+    generate_mock.assert_not_called()
+    # Имя экранировано в HTML-ответе и сохранено как есть в истории
+    assert "Мяу, &lt;Иван&gt;!" in message.answer.call_args[0][0]
+    add_message_mock.assert_called_once_with(1, "assistant", "Мяу, <Иван>! Чем помочь?")
+    assert metrics.get_metrics()["summaries"]["start_latency_seconds{source=pool}"]["count"] == 1
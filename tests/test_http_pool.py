@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля http_pool.py на локальных серверах, считающих соединения
+"""
+import socket
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import AsyncMock, MagicMock, patch
+from src import http_pool, metrics
+from src.http_pool import (
+    TARGET_LLM, TARGET_TELEGRAM, create_bot_session, create_llm_http_client, init_http_pool, warmup_once
+)
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    """Сервер с поддержкой keepalive, считающий новые соединения"""
+
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def do_GET(self):
+        data = b'{"ok": true, "result": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    """Фикстура для запуска локального сервера"""
+    metrics.reset_metrics()
+    CountingHandler.connections = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CountingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+
+def test_llm_client_reuses_connection(server_url):
+    """Тест повторного использования соединения клиентом LLM"""
+    client = create_llm_http_client()
+    for _ in range(5):
+        client.get(server_url)
+    client.close()
+
+    assert CountingHandler.connections == 1
+    assert metrics.get_counter("http_connections_opened_total", target=TARGET_LLM) == 1
+    assert metrics.get_metrics()["gauges"]["http_connection_reuse_rate{target=llm}"] == pytest.approx(0.8)
+
+
+@pytest.mark.asyncio
+async def test_bot_session_reuses_connection(server_url):
+    """Тест повторного использования соединения сессией бота"""
+    session = create_bot_session()
+    client_session = await session.create_session()
+    for _ in range(4):
+        async with client_session.get(server_url) as response:
+            await response.read()
+    await session.close()
+
+    assert CountingHandler.connections == 1
+    assert metrics.get_counter("http_requests_total", target=TARGET_TELEGRAM) == 4
+    assert metrics.get_metrics()["gauges"]["http_connection_reuse_rate{target=telegram}"] == pytest.approx(0.75)
+
+
+@pytest.mark.asyncio
+async def test_bot_session_connector_settings():
+    """Тест кэша DNS и keepalive соединителя сессии бота без подмены разрешения имен"""
+    getaddrinfo = socket.getaddrinfo
+    with patch.dict("src.http_pool.pool_config"):
+        init_http_pool({"dns_ttl": 60, "keepalive_expiry": 90, "max_connections": 7})
+        assert socket.getaddrinfo is getaddrinfo
+
+        session = create_bot_session()
+        connector = (await session.create_session()).connector
+        assert connector.use_dns_cache and connector.limit == 7
+        await session.close()
+        assert session.client_session.closed
+
+        init_http_pool({"dns_ttl": 0})
+        session = create_bot_session()
+        assert not (await session.create_session()).connector.use_dns_cache
+        await session.close()
+
+
+@pytest.mark.asyncio
+async def test_warmup_pings_only_idle_targets():
+    """Тест прогрева только простаивающих соединений"""
+    metrics.reset_metrics()
+    llm_ping = AsyncMock()
+    telegram_ping = AsyncMock(side_effect=Exception("Нет сети"))
+
+    with patch.dict("src.http_pool.last_request_at", {TARGET_LLM: time.monotonic()}, clear=True):
+        await warmup_once({TARGET_LLM: llm_ping, TARGET_TELEGRAM: telegram_ping}, interval=60)
+
+    llm_ping.assert_not_called()
+    telegram_ping.assert_called_once()
+    assert metrics.get_counter("http_warmup_total", target=TARGET_TELEGRAM) == 0
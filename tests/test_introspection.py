@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля introspection.py
+"""
+import asyncio
+import json
+import socket
+import tracemalloc
+import urllib.request
+import pytest
+from unittest.mock import patch
+
+from src import introspection, memory
+from src.introspection import (
+    deep_size, diff_snapshots, memory_report, start_admin_server, stop_admin_server,
+    structure_size, take_snapshot
+)
+
+CHAT_IDS = [6101, 6102, 6103]
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """Фикстура для очистки истории чатов и снимков"""
+    yield
+    for chat_id in CHAT_IDS:
+        memory.clear_dialog_history(chat_id)
+    introspection.snapshots.clear()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def test_deep_size_counts_nested_and_shared_once():
+    """Тест учета вложенных объектов и однократного учета общих объектов"""
+    text = "x" * 1000
+    assert deep_size([text]) > 1000
+    assert deep_size([text, text]) < 2 * deep_size([text])
+    assert deep_size({"a": [{"content": text}]}) > deep_size(text)
+
+
+@pytest.mark.asyncio
+async def test_report_history_distribution_and_top_chats():
+    """Тест распределения длины истории и самых тяжелых чатов"""
+    for count, chat_id in zip((1, 3, 6), CHAT_IDS):
+        for i in range(count):
+            memory.add_message(chat_id, "user", f"Сообщение {i}")
+
+    report = await memory_report(top=2)
+    assert report["chats"] >= 3
+    assert report["history_length"]["max"] >= 6
+    assert [chat["chat_id"] for chat in report["top_chats"]][:1] == [6103]
+    assert report["top_chats"][0]["messages"] == 6
+    assert report["structures"]["memory.dialogs"]["entries"] == len(memory.dialogs)
+
+
+@pytest.mark.asyncio
+async def test_top_chats_are_ranked_by_size_not_length():
+    """Тест выбора самых тяжелых чатов по размеру, а не по количеству сообщений"""
+    with patch.dict("src.memory.dialogs", clear=True):
+        for chat_id in range(15):
+            memory.dialogs[chat_id] = [{"role": "user", "content": f"Да {i}"} for i in range(5)]
+        memory.dialogs[500] = [{"role": "user", "content": "Подробный вопрос " * 2000}]
+
+        report = await memory_report(top=2)
+
+    # Самая короткая история - не среди самых длинных, но в кандидатах по выборке
+    assert [chat["chat_id"] for chat in report["top_chats"]][:1] == [500]
+    assert report["top_chats"][0]["messages"] == 1 and len(report["top_chats"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_large_structure_is_sampled():
+    """Тест оценки большой структуры по выборке"""
+    structure = {i: "y" * 100 for i in range(5000)}
+    exact = await structure_size(structure, sample_size=10000)
+    sampled = await structure_size(structure, sample_size=500)
+    assert not exact["sampled"] and sampled["sampled"]
+    assert abs(sampled["bytes"] - exact["bytes"]) < exact["bytes"] * 0.05
+
+
+@pytest.mark.asyncio
+async def test_snapshot_diff_shows_new_allocations():
+    """Тест сравнения снимков tracemalloc"""
+    await take_snapshot("before")
+    leak = [str(i) * 1000 for i in range(1000)]
+    await take_snapshot("after")
+
+    diff = await diff_snapshots("before", "after", top=5)
+    assert diff[0]["size_diff"] > 500000
+    assert "test_introspection.py" in diff[0]["location"]
+    with pytest.raises(KeyError):
+        await diff_snapshots("before", "missing")
+    del leak
+
+
+@pytest.mark.asyncio
+async def test_admin_endpoint():
+    """Тест отчета через локальный эндпоинт администратора"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    memory.add_message(CHAT_IDS[0], "user", "Привет")
+    await start_admin_server("127.0.0.1", port)
+    try:
+        def fetch(path, method="GET"):
+            request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", method=method)
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return json.loads(response.read())
+
+        report = await asyncio.to_thread(fetch, "/memory?top=3")
+        assert "memory.dialogs" in report["structures"]
+        snapshot = await asyncio.to_thread(fetch, "/tracemalloc/snapshot?name=a", "POST")
+        assert snapshot["name"] == "a"
+    finally:
+        await stop_admin_server()
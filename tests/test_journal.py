@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля journal.py
+"""
+import asyncio
+import os
+import pytest
+from unittest.mock import patch
+
+from src import journal, memory, metrics
+from src.journal import load_index, read_journal, start_journal, stop_journal
+
+CHAT_ID = 5151
+
+
+@pytest.fixture(autouse=True)
+def clean_journal():
+    """Фикстура для сброса журнала, истории и метрик"""
+    saved = dict(journal.journal_config)
+    metrics.reset_metrics()
+    yield
+    journal.journal_config.update(saved)
+    memory.clear_dialog_history(CHAT_ID)
+
+
+@pytest.mark.asyncio
+async def test_messages_written_to_segments(tmp_path):
+    """Тест записи сообщений в сегмент и чтения журнала по индексу"""
+    start_journal({"directory": str(tmp_path)})
+    memory.add_message(CHAT_ID, "user", "Привет")
+    memory.add_message(CHAT_ID, "assistant", "Здравствуйте")
+    await asyncio.sleep(0.05)
+    await stop_journal()
+
+    records = list(read_journal(str(tmp_path)))
+    assert [(record["role"], record["content"]) for record in records] == [
+        ("user", "Привет"), ("assistant", "Здравствуйте")
+    ]
+    index = load_index(str(tmp_path))
+    assert len(index) == 1 and index[0]["records"] == 2
+    assert journal.on_message_added not in memory.message_listeners
+
+
+@pytest.mark.asyncio
+async def test_add_message_does_not_touch_disk(tmp_path):
+    """Тест постановки сообщения в очередь без записи на диск в обработчике"""
+    start_journal({"directory": str(tmp_path)})
+    with patch("builtins.open", side_effect=AssertionError("запись на диск в обработчике")):
+        memory.add_message(CHAT_ID, "user", "Привет")
+    assert journal.journal_queue.qsize() == 1
+    await stop_journal()
+
+
+@pytest.mark.asyncio
+async def test_segments_rotate_by_size_and_filter_by_time(tmp_path):
+    """Тест закрытия сегментов по размеру и выбора сегментов по интервалу"""
+    start_journal({"directory": str(tmp_path), "max_bytes": 200})
+    for i in range(5):
+        memory.add_message(CHAT_ID, "user", f"Сообщение {i} " + "x" * 200)
+        await asyncio.sleep(0.02)
+    await stop_journal()
+
+    index = load_index(str(tmp_path))
+    assert len(index) == 5
+    assert all(os.path.exists(tmp_path / entry["file"]) for entry in index)
+
+    start = index[3]["first_ts"]
+    assert [record["content"][:11] for record in read_journal(str(tmp_path), start=start)] == [
+        "Сообщение 3", "Сообщение 4"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_entries(tmp_path):
+    """Тест отбрасывания записей при заполненной очереди"""
+    start_journal({"directory": str(tmp_path), "queue_size": 2})
+    # Задача записи не успевает запуститься: очередь заполняется
+    for i in range(5):
+        memory.add_message(CHAT_ID, "user", f"Сообщение {i}")
+
+    assert metrics.get_counter("journal_dropped_total") == 3
+    await stop_journal()
+    assert len(list(read_journal(str(tmp_path)))) == 2
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_running_write(tmp_path):
+    """Тест остановки журнала во время записи пачки в потоке"""
+    import threading
+    import time
+
+    original = journal._write_batch
+    lock = threading.Lock()
+    overlaps = []
+
+    def slow_write(batch):
+        if not lock.acquire(blocking=False):
+            overlaps.append(batch)
+            return original(batch)
+        try:
+            time.sleep(0.05)
+            original(batch)
+        finally:
+            lock.release()
+
+    with patch("src.journal._write_batch", side_effect=slow_write):
+        start_journal({"directory": str(tmp_path)})
+        memory.add_message(CHAT_ID, "user", "Первое")
+        await asyncio.sleep(0.01)
+        # Первая пачка еще записывается, вторая ждет в очереди
+        memory.add_message(CHAT_ID, "user", "Второе")
+        await stop_journal()
+
+    assert overlaps == []
+    assert [record["content"] for record in read_journal(str(tmp_path))] == ["Первое", "Второе"]
+    assert journal.writer_task is None and journal.segment is None
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля lanes.py
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from src import lanes, metrics
+from src.lanes import LANE_FAST, LANE_LLM, LaneMiddleware, init_lanes, lane_slot, run_in_lane
+
+
+@pytest.fixture(autouse=True)
+def small_lanes():
+    """Фикстура для полос с маленькими лимитами"""
+    metrics.reset_metrics()
+    saved = {lane: dict(params) for lane, params in lanes.lane_config.items()}
+    init_lanes({LANE_FAST: {"limit": 2}, LANE_LLM: {"limit": 2}})
+    yield
+    lanes.lane_config.clear()
+    lanes.lane_config.update(saved)
+    lanes.lane_semaphores.clear()
+
+
+def handler_data(lane):
+    """Данные обработчика aiogram с флагом полосы"""
+    handler = MagicMock()
+    handler.flags = {} if lane is None else {"lane": lane}
+    return {"handler": handler}
+
+
+@pytest.mark.asyncio
+async def test_lane_limits_concurrency():
+    """Тест ограничения количества одновременных обработчиков в полосе"""
+    active = 0
+    peak = 0
+
+    async def slow():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+
+    await asyncio.gather(*(run_in_lane(LANE_LLM, slow) for _ in range(6)))
+
+    assert peak == 2
+    summaries = metrics.get_metrics()["summaries"]
+    assert summaries["lane_wait_seconds{lane=llm}"]["count"] == 6
+    assert summaries["lane_wait_seconds{lane=llm}"]["max"] >= 0.02
+
+
+@pytest.mark.asyncio
+async def test_fast_lane_not_blocked_by_saturated_llm_lane():
+    """Тест выполнения команды без ожидания при заполненной полосе llm"""
+    middleware = LaneMiddleware()
+    release = asyncio.Event()
+
+    async def llm_handler(event, data):
+        await release.wait()
+
+    llm_tasks = [
+        asyncio.create_task(middleware(llm_handler, MagicMock(), handler_data(LANE_LLM)))
+        for _ in range(5)
+    ]
+    await asyncio.sleep(0)
+    assert lanes.lane_waiting[LANE_LLM] == 3
+
+    command = AsyncMock(return_value="ok")
+    result = await asyncio.wait_for(middleware(command, MagicMock(), handler_data(LANE_FAST)), 0.1)
+
+    assert result == "ok"
+    assert metrics.get_metrics()["summaries"]["lane_wait_seconds{lane=fast}"]["max"] < 0.01
+    release.set()
+    await asyncio.gather(*llm_tasks)
+
+
+@pytest.mark.asyncio
+async def test_handler_without_lane_flag_runs_directly():
+    """Тест выполнения обработчика без флага полосы вне полос"""
+    handler = AsyncMock(return_value="ok")
+
+    assert await LaneMiddleware()(handler, MagicMock(), handler_data(None)) == "ok"
+    assert not any(key.startswith("lane_") for key in metrics.get_metrics()["summaries"])
+
+
+@pytest.mark.asyncio
+async def test_budget_exceeded_is_counted():
+    """Тест учета обработчиков, превысивших бюджет полосы"""
+    lanes.lane_config[LANE_FAST]["budget"] = 0.001
+
+    async with lane_slot(LANE_FAST):
+        await asyncio.sleep(0.01)
+
+    assert metrics.get_counter("lane_budget_exceeded_total", lane=LANE_FAST) == 1
@@ -19,7 +19,7 @@ def openai_client_mock():
 
 def test_init_llm(openai_client_mock):
     """Тест инициализации клиента LLM"""
-    with patch("src.llm.OpenAI", return_value=openai_client_mock) as openai_mock:
+    with patch("openai.OpenAI", return_value=openai_client_mock) as openai_mock:
         api_key = "test_api_key"
         base_url = "https://test-url.com/api/v1"
         
@@ -99,4 +99,330 @@ async def test_generate_response_exception():
         result = await generate_response(messages)
         
         # Проверяем, что был возвращен None при исключении
-        assert result is None
\ No newline at end of file
+        assert result is None
+
+def make_completion(text):
+    """Создает мок ответа OpenAI с указанным текстом"""
+    mock_completion = MagicMock()
+    mock_choice = MagicMock()
+    mock_choice.message.content = text
+    mock_completion.choices = [mock_choice]
+    return mock_completion
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_requests_share_one_call():
+    """Тест объединения одинаковых одновременных запросов"""
+    import asyncio
+    import time
+    from src import metrics
+    
+    calls = []
+    
+    def mock_create(*args, **kwargs):
+        calls.append(kwargs)
+        time.sleep(0.05)
+        return make_completion("Общий ответ")
+    
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = mock_create
+    saved_before = metrics.get_counter("llm_singleflight_saved_total")
+    
+    with patch("src.llm.client", mock_client):
+        messages = [{"role": "user", "content": "Расскажи о мобильных приложениях"}]
+        results = await asyncio.gather(*[generate_response(messages) for _ in range(5)])
+    
+    assert results == ["Общий ответ"] * 5
+    assert len(calls) == 1
+    assert metrics.get_counter("llm_singleflight_saved_total") - saved_before == 4
+
+
+@pytest.mark.asyncio
+async def test_different_requests_are_not_merged():
+    """Тест раздельной отправки запросов с разными параметрами"""
+    import asyncio
+    import time
+    
+    calls = []
+    
+    def mock_create(*args, **kwargs):
+        calls.append(kwargs)
+        time.sleep(0.02)
+        return make_completion(kwargs["messages"][-1]["content"])
+    
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = mock_create
+    
+    with patch("src.llm.client", mock_client):
+        messages = [{"role": "user", "content": "Привет!"}]
+        results = await asyncio.gather(
+            generate_response(messages),
+            generate_response(messages, temperature=0.1),
+            generate_response([{"role": "user", "content": "Пока!"}])
+        )
+    
+    assert results == ["Привет!", "Привет!", "Пока!"]
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_single_flight_error_propagates_to_all_waiters():
+    """Тест передачи ошибки запроса всем ожидающим"""
+    import asyncio
+    import time
+    
+    calls = []
+    
+    def mock_create(*args, **kwargs):
+        calls.append(kwargs)
+        time.sleep(0.02)
+        raise Exception("Test exception")
+    
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = mock_create
+    
+    with patch("src.llm.client", mock_client):
+        messages = [{"role": "user", "content": "Привет!"}]
+        results = await asyncio.gather(*[generate_response(messages) for _ in range(3)])
+    
+    assert results == [None, None, None]
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancelled_waiter_does_not_cancel_others():
+    """Тест отмены одного из ожидающих общего запроса"""
+    import asyncio
+    import time
+    from src.llm import request_single_flight, inflight_requests
+    
+    def mock_create(*args, **kwargs):
+        time.sleep(0.05)
+        return make_completion("Ответ")
+    
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = mock_create
+    
+    with patch("src.llm.client", mock_client):
+        messages = [{"role": "user", "content": "Привет!"}]
+        first = asyncio.ensure_future(request_single_flight(messages, "test-model", 0.7, 100))
+        second = asyncio.ensure_future(request_single_flight(messages, "test-model", 0.7, 100))
+        await asyncio.sleep(0.01)
+        
+        first.cancel()
+        result = await second
+    
+    assert result["content"] == "Ответ"
+    assert first.cancelled()
+    assert inflight_requests == {}
+
+
+
+@pytest.mark.asyncio
+async def test_single_flight_late_caller_starts_new_request():
+    """Тест нового запроса после отмены всех ожидающих предыдущего"""
+    import asyncio
+    import time
+    from src.llm import request_single_flight, inflight_requests
+    
+    calls = []
+    
+    def mock_create(*args, **kwargs):
+        calls.append(kwargs)
+        time.sleep(0.05)
+        return make_completion("Ответ")
+    
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = mock_create
+    
+    with patch("src.llm.client", mock_client):
+        messages = [{"role": "user", "content": "Привет!"}]
+        first = asyncio.ensure_future(request_single_flight(messages, "test-model", 0.7, 100))
+        await asyncio.sleep(0.01)
+        
+        first.cancel()
+        await asyncio.sleep(0)
+        assert inflight_requests == {}
+        
+        result = await request_single_flight(messages, "test-model", 0.7, 100)
+    
+    assert result["content"] == "Ответ"
+    assert len(calls) == 2
+    assert inflight_requests == {}
+
+
+def test_select_route():
+    """Тест выбора маршрута по признакам запроса"""
+    from src.llm import select_route, ROUTE_FAST, ROUTE_FULL
+    
+    system = {"role": "system", "content": "Системный промпт " * 100}
+    short = [system, {"role": "user", "content": "Привет"}]
+    long_text = [system, {"role": "user", "content": "Нужна подробная смета " * 20}]
+    deep_history = [system] + [{"role": "user", "content": "Да"}] * 10
+    
+    assert select_route(short) == ROUTE_FAST
+    assert select_route(short, service_type="IT-консалтинг") == ROUTE_FULL
+    assert select_route(long_text) == ROUTE_FULL
+    assert select_route(deep_history) == ROUTE_FULL
+    
+    with patch.dict("src.llm.routing_rules", {"full_styles": ["dramatic"]}):
+        assert select_route(short, style="dramatic") == ROUTE_FULL
+
+
+@pytest.mark.asyncio
+async def test_generate_response_uses_route_parameters():
+    """Тест применения параметров маршрута и явных параметров"""
+    from src import metrics
+    
+    requests = []
+    
+    async def backend(request):
+        requests.append(request)
+        return {"content": "Ответ", "usage": {"completion_tokens": 3}}
+    
+    test_routes = {
+        "fast": {"model": "small-model", "max_tokens": 100, "temperature": 0.5},
+        "full": {"model": "large-model", "max_tokens": 1000, "temperature": 0.7}
+    }
+    with patch.dict("src.llm.routes", test_routes), \
+         patch("src.llm.completion_backend", backend):
+        await generate_response([{"role": "user", "content": "Привет"}])
+        await generate_response([{"role": "user", "content": "Привет!"}], route="full")
+        await generate_response([{"role": "user", "content": "Пока"}], model="pinned-model", max_tokens=50)
+    
+    assert [r["model"] for r in requests] == ["small-model", "large-model", "pinned-model"]
+    assert [r["max_tokens"] for r in requests] == [100, 1000, 50]
+    assert requests[0]["temperature"] == 0.5
+    assert metrics.get_metrics()["summaries"]["llm_latency_seconds{route=fast}"]["count"] >= 2
+
+
+def test_cut_at_paragraph():
+    """Тест обрезки ответа по границе абзаца"""
+    from src.llm import cut_at_paragraph
+    
+    text = "а" * 20 + "\n\n" + "б" * 20 + "\n\n" + "в" * 20
+    
+    assert cut_at_paragraph(text, 100) == text
+    assert cut_at_paragraph(text, 50) == "а" * 20 + "\n\n" + "б" * 20
+    assert cut_at_paragraph("x" * 100, 50) == "x" * 100
+
+
+@pytest.mark.asyncio
+async def test_generate_response_applies_output_budget():
+    """Тест применения бюджета сценария и стиля к запросу и ответу"""
+    from src import metrics
+    
+    requests = []
+    paragraph = "Абзац ответа. " * 10
+    
+    async def backend(request):
+        requests.append(request)
+        return {"content": "\n\n".join([paragraph] * 5), "usage": {"completion_tokens": 200}}
+    
+    test_routes = {"fast": {"model": "small-model", "max_tokens": 1000, "temperature": 0.5}}
+    budgets = {
+        "scenarios": {"chat": {"max_tokens": 100}},
+        "styles": {"cat": {"max_tokens": 200, "stop": ["\nВопрос о"]}}
+    }
+    metrics.reset_metrics()
+    with patch.dict("src.llm.routes", test_routes), \
+         patch("src.llm.completion_backend", backend), \
+         patch("src.prompts.output_budgets", budgets):
+        result = await generate_response(
+            [{"role": "user", "content": "Привет"}], route="fast", style="cat", scenario="chat"
+        )
+    
+    # Жесткий лимит - бюджет с запасом, мягкий - сам бюджет
+    assert requests[0]["max_tokens"] == 130
+    assert requests[0]["soft_max_tokens"] == 100
+    assert requests[0]["stop"] == ["\nВопрос о"]
+    
+    # Ответ обрезан по границе абзаца в пределах бюджета
+    assert len(result) <= 100 * 3
+    assert result.endswith(paragraph.rstrip())
+    assert metrics.get_counter("llm_early_stop_total", scenario="chat", style="cat") == 1
+    assert metrics.get_metrics()["summaries"]["llm_output_tokens{scenario=chat,style=cat}"]["count"] == 1
+
+
+def test_stream_completion_stops_at_paragraph():
+    """Тест прекращения потоковой генерации после достижения бюджета"""
+    from src import llm
+    
+    def make_chunk(text):
+        chunk = MagicMock()
+        chunk.usage = None
+        chunk.choices = [MagicMock()]
+        chunk.choices[0].delta.content = text
+        return chunk
+    
+    deltas = ["Первый абзац.", "\n\n", "Второй абзац длиннее бюджета.", "\n\n", "Третий", " абзац."]
+    consumed = []
+    
+    class Stream:
+        def __iter__(self):
+            for delta in deltas:
+                consumed.append(delta)
+                yield make_chunk(delta)
+        
+        close = MagicMock()
+    
+    stream = Stream()
+    client_mock = MagicMock()
+    client_mock.chat.completions.create.return_value = stream
+    
+    with patch("src.llm.client", client_mock):
+        completion = llm._stream_completion(
+            {"model": "m", "messages": [{"role": "user", "content": "Расскажите подробнее"}]}, soft_max_chars=20
+        )
+    
+    assert completion["content"] == "Первый абзац."
+    assert completion["early_stopped"] is True
+    # Статистика сервера не дочитана: расход оценивается по запросу и полученному тексту
+    assert completion["usage"]["prompt_tokens"] == 7
+    assert completion["usage"]["completion_tokens"] == len("Первый абзац.\n\nВторой абзац длиннее бюджета.") // 3 + 1
+    # Генерация прервана, не дожидаясь конца ответа
+    assert len(consumed) < len(deltas)
+    stream.close.assert_called_once()
+    assert client_mock.chat.completions.create.call_args.kwargs["stream"] is True
+    assert client_mock.chat.completions.create.call_args.kwargs["stream_options"] == {"include_usage": True}
+
+
+@pytest.mark.asyncio
+async def test_batching_backend_groups_concurrent_requests():
+    """Тест объединения одновременных запросов в пачки"""
+    import asyncio
+    from src.llm import batching_backend
+    
+    batches = []
+    
+    async def submit_batch(requests):
+        batches.append(len(requests))
+        return [{"content": request["messages"][0]["content"], "usage": {}} for request in requests]
+    
+    backend = batching_backend(window=0.05, max_batch=3, submit_batch=submit_batch)
+    requests = [{"messages": [{"role": "user", "content": f"Вопрос {i}"}]} for i in range(4)]
+    
+    results = await asyncio.gather(*(backend(request) for request in requests))
+    
+    # Каждый ответ вернулся своему вызову
+    assert [result["content"] for result in results] == [f"Вопрос {i}" for i in range(4)]
+    # Первые три отправлены сразу по размеру пачки, четвертый - по окончании окна
+    assert batches == [3, 1]
+
+
+@pytest.mark.asyncio
+async def test_batching_backend_isolates_errors():
+    """Тест передачи ошибки только запросу, который ее вызвал"""
+    import asyncio
+    from src.llm import batching_backend
+    
+    async def backend(request):
+        if request["fail"]:
+            raise RuntimeError("Ошибка сервера")
+        return {"content": "Ответ", "usage": {}}
+    
+    batched = batching_backend(backend, window=0.01, max_batch=8)
+    results = await asyncio.gather(batched({"fail": False}), batched({"fail": True}), return_exceptions=True)
+    
+    assert results[0]["content"] == "Ответ"
+    assert isinstance(results[1], RuntimeError)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля local_llm.py
+"""
+import asyncio
+import pytest
+import pytest_asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, patch
+from src import local_llm, metrics
+from src.local_llm import (
+    MODE_CHEAP, MODE_FALLBACK, MODE_PRIMARY, SYNTHETIC_MODEL,
+    combine_backends, local_completion, start_local_llm, stop_local_llm
+)
+
+
+def make_request(model="local", max_tokens=5):
+    """Создает запрос к бэкенду"""
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": "Привет"}],
+        "temperature": 0.7,
+        "max_tokens": max_tokens
+    }
+
+
+@pytest_asyncio.fixture
+async def local_model():
+    """Фикстура для запуска локальной модели в пуле потоков"""
+    metrics.reset_metrics()
+    local_llm._init_worker(SYNTHETIC_MODEL, 1, 512)
+    config = {"model_path": SYNTHETIC_MODEL, "workers": 1, "batch_size": 4, "batch_wait": 0.05, "queue_size": 8}
+    with patch.dict("src.local_llm.local_config"):
+        await start_local_llm(config, pool=ThreadPoolExecutor(max_workers=1))
+        yield
+        await stop_local_llm()
+    local_llm._worker_model = None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_batched(local_model):
+    """Тест объединения одновременных запросов в одну пачку"""
+    results = await asyncio.gather(*(local_completion(make_request(max_tokens=3)) for _ in range(4)))
+
+    assert all(result["usage"]["completion_tokens"] == 3 for result in results)
+    assert metrics.get_metrics()["summaries"]["local_llm_batch_size"]["max"] == 4
+    assert metrics.get_counter("local_llm_tokens_total") == 12
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_request():
+    """Тест отклонения запроса при переполненной очереди"""
+    metrics.reset_metrics()
+    queue = asyncio.Queue(maxsize=1)
+    queue.put_nowait({"request": make_request(), "future": asyncio.Future(), "enqueued_at": 0})
+
+    with patch("src.local_llm.request_queue", queue):
+        with pytest.raises(RuntimeError):
+            await local_completion(make_request())
+
+    assert metrics.get_counter("local_llm_rejected_total") == 1
+
+
+@pytest.mark.asyncio
+async def test_local_completion_requires_started_model():
+    """Тест ошибки при обращении к незапущенной модели"""
+    with pytest.raises(RuntimeError):
+        await local_completion(make_request())
+
+
+@pytest.mark.asyncio
+async def test_combine_backends_modes():
+    """Тест выбора бэкенда в режимах primary, fallback и cheap"""
+    local = AsyncMock(return_value={"content": "локально", "usage": {}})
+    remote = AsyncMock(return_value={"content": "API", "usage": {}})
+    failing = AsyncMock(side_effect=RuntimeError("недоступен"))
+
+    assert (await combine_backends(MODE_PRIMARY, local, remote)(make_request()))["content"] == "локально"
+    assert (await combine_backends(MODE_PRIMARY, failing, remote)(make_request()))["content"] == "API"
+    assert (await combine_backends(MODE_FALLBACK, local, remote)(make_request()))["content"] == "API"
+    assert (await combine_backends(MODE_FALLBACK, local, failing)(make_request()))["content"] == "локально"
+
+    with patch.dict("src.llm.routes", {"fast": {"model": "small-model"}}):
+        cheap = combine_backends(MODE_CHEAP, local, remote)
+        assert (await cheap(make_request(model="small-model")))["content"] == "локально"
+        assert (await cheap(make_request(model="large-model")))["content"] == "API"
+
+    with pytest.raises(ValueError):
+        combine_backends("unknown", local, remote)
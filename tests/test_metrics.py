@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля metrics.py
+"""
+import pytest
+from src import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    """Фикстура для сброса метрик между тестами"""
+    metrics.reset_metrics()
+    yield
+    metrics.reset_metrics()
+
+
+def test_counters_with_labels():
+    """Тест счетчиков с метками"""
+    metrics.inc("requests_total", style="cat")
+    metrics.inc("requests_total", 2, style="cat")
+    metrics.inc("requests_total", style="villain")
+    
+    assert metrics.get_counter("requests_total", style="cat") == 3
+    assert metrics.get_counter("requests_total", style="villain") == 1
+    assert metrics.get_counter("requests_total") == 0
+
+
+def test_observations_summary():
+    """Тест сводной статистики по наблюдениям"""
+    for value in range(1, 101):
+        metrics.observe("latency_seconds", value / 100)
+    
+    summary = metrics.get_metrics()["summaries"]["latency_seconds"]
+    
+    assert summary["count"] == 100
+    assert summary["p50"] == 0.5
+    assert summary["p95"] == 0.95
+    assert summary["max"] == 1.0
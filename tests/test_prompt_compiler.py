@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля prompt_compiler.py
+"""
+import json
+import os
+import shutil
+
+from src import prompt_compiler
+from src.prompt_compiler import (
+    COMPILED_DIR, MANIFEST_FILE, PROMPTS_DIR, build, compile_prompts, load_compiled_prompt,
+    minify, read_sources, source_hash, split_sections
+)
+from src.prompts import load_system_prompt
+from src.styles import STYLE_CAT, STYLE_REGISTRY, load_style_prompt
+
+
+def test_minify_strips_markup_but_keeps_rules():
+    """Тест удаления разметки и пробелов без изменения текста правил"""
+    text = "# Заголовок\n\n\n**Важно**:   отвечайте  кратко   \n    - пункт\nНе используйте звездочки (*) и двойные звездочки (**)"
+    assert minify(text) == (
+        "Заголовок\nВажно: отвечайте кратко\n - пункт\nНе используйте звездочки (*) и двойные звездочки (**)"
+    )
+
+
+def test_compiled_prompts_preserve_sections():
+    """Тест сохранения всех разделов и строк исходных промптов"""
+    sources = read_sources()
+    result = compile_prompts(sources)
+    for name, source in sources.items():
+        compiled = result["prompts"][name]
+        for section in split_sections(source):
+            heading = section.splitlines()[0].strip()
+            assert heading in compiled, (name, heading)
+            for line in section.splitlines():
+                if line.strip():
+                    assert minify(line).strip() in compiled, (name, line)
+        assert len(compiled) < len(source)
+
+
+def test_shared_company_facts_factored_once():
+    """Тест выноса общих сведений о компании в один фрагмент"""
+    result = compile_prompts(read_sources())
+    [fragment] = result["fragments"]
+    assert fragment.startswith("Информация о компании и услугах:")
+    for name in ("cat_mode.txt", "villain_mode.txt", "dramatic_mode.txt"):
+        compiled = result["prompts"][name]
+        # Общий фрагмент стоит в начале и не повторяется
+        assert compiled.startswith(fragment) and compiled.count(fragment) == 1
+        assert result["report"][name]["fragments"] == [0]
+        assert result["report"][name]["shared_tokens"] > 0
+        # Файл промпта хранит только собственные разделы: фрагмент на диске один
+        assert fragment not in result["own"][name]
+        with open(os.path.join(PROMPTS_DIR, COMPILED_DIR, name), encoding="utf-8") as file:
+            assert fragment not in file.read()
+    assert result["report"]["system.txt"]["fragments"] == []
+
+
+def test_compiled_artifacts_are_up_to_date():
+    """Тест соответствия скомпилированных файлов исходным промптам"""
+    with open(os.path.join(PROMPTS_DIR, COMPILED_DIR, MANIFEST_FILE), encoding="utf-8") as file:
+        manifest = json.load(file)
+    sources = read_sources()
+    assert set(manifest) == set(sources)
+    for name, source in sources.items():
+        assert manifest[name]["source_hash"] == source_hash(source), f"Выполните python -m src.prompt_compiler ({name})"
+
+
+def test_stale_artifact_compiled_in_memory(tmp_path):
+    """Тест компиляции в памяти, если исходный промпт изменился после сборки"""
+    for name in read_sources():
+        shutil.copy(os.path.join(PROMPTS_DIR, name), tmp_path / name)
+    build(str(tmp_path))
+    (tmp_path / "cat_mode.txt").write_text("Новый   промпт\n\n\nМяу", encoding="utf-8")
+
+    prompt_compiler.compiled_cache.clear()
+    assert load_compiled_prompt("cat_mode.txt", str(tmp_path)) == "Новый промпт\nМяу"
+    assert load_compiled_prompt("system.txt", str(tmp_path)) == (tmp_path / COMPILED_DIR / "system.txt").read_text(encoding="utf-8")
+
+
+def test_style_prompt_served_compiled(monkeypatch):
+    """Тест выдачи скомпилированного промпта, собранного с общим фрагментом, в load_style_prompt"""
+    monkeypatch.setattr("src.styles.prompt_cache", {})
+    prompts = compile_prompts(read_sources())["prompts"]
+    assert load_style_prompt(STYLE_CAT) == prompts[STYLE_REGISTRY[STYLE_CAT]["prompt_file"]]
+    assert load_system_prompt() == prompts["system.txt"]
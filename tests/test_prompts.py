@@ -5,7 +5,7 @@
 """
 import pytest
 import os
-from unittest.mock import patch, mock_open
+from unittest.mock import patch
 from src.prompts import load_system_prompt, create_messages_for_llm
 
 
@@ -15,29 +15,35 @@ def mock_system_prompt():
     return "Это тестовый системный промпт"
 
 
-def test_load_system_prompt_success(mock_system_prompt):
+def test_load_system_prompt_success(mock_system_prompt, monkeypatch):
     """Тест успешной загрузки системного промпта"""
-    # Мокаем open для возврата тестового промпта
-    with patch("builtins.open", mock_open(read_data=mock_system_prompt)), \
-         patch("os.path.exists", return_value=True):
+    monkeypatch.setattr("src.styles.prompt_cache", {})
+    # Системный промпт загружается скомпилированным и кэшируется
+    with patch("src.styles.load_compiled_prompt", return_value=mock_system_prompt) as load_mock:
         
         result = load_system_prompt()
         
         # Проверяем результат
         assert result == mock_system_prompt
+        assert load_system_prompt() == mock_system_prompt
+        load_mock.assert_called_once()
+        assert load_mock.call_args.args[0] == "system.txt"
 
 
-def test_load_system_prompt_file_not_found():
+def test_load_system_prompt_file_not_found(monkeypatch):
     """Тест загрузки системного промпта, когда файл не найден"""
-    with patch("os.path.exists", return_value=False):
+    monkeypatch.setattr("src.styles.prompt_cache", {})
+    with patch("os.path.exists", return_value=False), \
+         patch("src.styles.load_compiled_prompt", side_effect=FileNotFoundError("system.txt")):
         result = load_system_prompt()
         
         # Проверяем, что был возвращен None
         assert result is None
 
 
-def test_load_system_prompt_exception():
+def test_load_system_prompt_exception(monkeypatch):
     """Тест обработки исключений при загрузке системного промпта"""
+    monkeypatch.setattr("src.styles.prompt_cache", {})
     with patch("os.path.exists", return_value=True), \
          patch("builtins.open", side_effect=Exception("Test exception")):
         
@@ -72,4 +78,17 @@ def test_create_messages_for_llm_without_system_prompt():
         # Проверяем, что создано только сообщение пользователя
         assert len(messages) == 1
         assert messages[0]["role"] == "user"
-        assert messages[0]["content"] == user_message
\ No newline at end of file
+        assert messages[0]["content"] == user_message
+
+def test_get_output_budget_merges_scenario_and_style():
+    """Тест объединения бюджетов сценария и стиля"""
+    from src.prompts import get_output_budget
+    
+    budgets = {
+        "scenarios": {"chat": {"max_tokens": 500}},
+        "styles": {"cat": {"max_tokens": 300, "stop": ["\nМяу"]}, "normal": {"max_tokens": 600}}
+    }
+    with patch("src.prompts.output_budgets", budgets):
+        assert get_output_budget("chat", "cat") == {"max_tokens": 300, "stop": ["\nМяу"]}
+        assert get_output_budget("chat", "normal") == {"max_tokens": 500, "stop": []}
+        assert get_output_budget("unknown") == {"max_tokens": None, "stop": []}
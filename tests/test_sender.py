@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля sender.py
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from aiogram.exceptions import TelegramRetryAfter
+from src import metrics, sender
+from src.rate_limit import create_bucket
+from src.sender import enqueue_send, split_message, start_sender, stop_sender
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """Фикстура для сброса состояния очередей и метрик"""
+    metrics.reset_metrics()
+    sender.chat_buckets.clear()
+    with patch("src.sender.global_bucket", create_bucket(rate=1000, capacity=1000)), \
+         patch("src.sender.background_sending", False), patch("src.sender.paused_until", 0.0):
+        yield
+    sender.chat_buckets.clear()
+
+
+def test_split_short_message():
+    """Тест короткого сообщения без разбиения"""
+    assert split_message("Привет!") == ["Привет!"]
+
+
+def test_split_message_by_paragraphs():
+    """Тест разбиения длинного сообщения по абзацам"""
+    text = "\n\n".join(["а" * 30, "б" * 30, "в" * 30])
+
+    chunks = split_message(text, limit=70)
+
+    assert chunks == ["а" * 30 + "\n\n" + "б" * 30, "в" * 30]
+
+
+def test_split_message_keeps_html_tags_intact():
+    """Тест разбиения без разрыва HTML-ссылок"""
+    link = '<a href="https://technoservice.ru">наш сайт компании</a>'
+    text = "Слово " * 5 + link + " конец"
+
+    chunks = split_message(text, limit=len(link) + 10)
+
+    assert all(chunk.count("<a ") == chunk.count("</a>") for chunk in chunks)
+    assert link in chunks[1]
+    assert "".join(chunks).replace(" ", "") == text.replace(" ", "")
+
+
+def test_split_message_reopens_tags_of_long_markup():
+    """Тест разбиения разметки, которая длиннее части сообщения"""
+    opening = '<a href="https://technoservice.ru"><b>'
+    text = opening + "очень длинная ссылка &amp; текст " * 5 + "</b></a>"
+
+    chunks = split_message(text, limit=80)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 80
+        assert chunk.startswith(opening)
+        assert chunk.count("<b>") == chunk.count("</b>")
+        assert chunk.count("<a ") == chunk.count("</a>")
+        assert "&amp;" in chunk
+    assert chunks[-1].endswith("</b></a>")
+
+def test_split_message_without_separators():
+    """Тест разбиения текста без пробелов"""
+    chunks = split_message("x" * 250, limit=100)
+
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+
+
+@pytest.mark.asyncio
+async def test_inline_send_without_background_mode():
+    """Тест немедленной отправки, если очередь не запущена"""
+    send = AsyncMock()
+
+    result = await enqueue_send(1, send, "Привет!", parse_mode="HTML")
+
+    assert result is True
+    send.assert_called_once_with("Привет!", parse_mode="HTML")
+
+
+@pytest.mark.asyncio
+async def test_background_send_returns_before_delivery():
+    """Тест возврата из обработчика сразу после постановки в очередь"""
+    delivered = []
+
+    async def slow_send(text, **kwargs):
+        await asyncio.sleep(0.05)
+        delivered.append(text)
+
+    start_sender()
+    await enqueue_send(1, slow_send, "Первое")
+    await enqueue_send(1, slow_send, "Второе")
+    assert delivered == []
+
+    await stop_sender()
+
+    # Сообщения одного чата отправлены по порядку
+    assert delivered == ["Первое", "Второе"]
+    assert metrics.get_metrics()["summaries"]["send_queue_latency_seconds"]["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_retry_after_does_not_resend_delivered_chunks():
+    """Тест повторной отправки после RetryAfter без дублирования частей"""
+    calls = []
+
+    async def flaky_send(text, **kwargs):
+        calls.append(text)
+        if len(calls) == 2:
+            raise TelegramRetryAfter(method=MagicMock(), message="flood", retry_after=0)
+
+    text = "а" * 60 + "\n\n" + "б" * 60
+    with patch("src.sender.MAX_MESSAGE_LENGTH", 70):
+        result = await enqueue_send(1, flaky_send, text)
+
+    assert result is True
+    assert calls == ["а" * 60, "б" * 60, "б" * 60]
+    assert metrics.get_counter("send_retry_total", reason="retry_after") == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_all_chats():
+    """Тест приостановки очередей всех чатов после RetryAfter"""
+    loop = asyncio.get_running_loop()
+    sent_at = {}
+
+    async def limited_send(text, **kwargs):
+        if text == "первый" and "первый" not in sent_at:
+            sent_at["первый"] = None
+            raise TelegramRetryAfter(method=MagicMock(), message="flood", retry_after=1)
+        sent_at[text] = loop.time()
+
+    with patch("src.sender.background_sending", True):
+        started = loop.time()
+        await enqueue_send(1, limited_send, "первый")
+        await asyncio.sleep(0.05)
+        await enqueue_send(2, limited_send, "второй")
+        await asyncio.gather(*sender.chat_workers.values())
+
+    assert sent_at["второй"] - started >= 0.9
+    assert sent_at["первый"] - started >= 0.9
+    assert metrics.get_counter("send_retry_total", reason="retry_after") == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_send_is_counted_as_dropped():
+    """Тест учета сообщений, которые не удалось отправить"""
+    send = AsyncMock(side_effect=Exception("Test exception"))
+
+    result = await enqueue_send(1, send, "Привет!")
+
+    assert result is False
+    assert metrics.get_counter("send_dropped_total", reason="send_failed") == 1
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_message():
+    """Тест переполнения очереди чата"""
+    send = AsyncMock()
+
+    start_sender()
+    with patch("src.sender.MAX_CHAT_QUEUE_SIZE", 2):
+        results = [await enqueue_send(1, send, f"Сообщение {i}") for i in range(3)]
+    await stop_sender()
+
+    assert results == [True, True, False]
+    assert send.call_count == 2
+    assert metrics.get_counter("send_dropped_total", reason="queue_full") == 1
+
+
+@pytest.mark.asyncio
+async def test_per_chat_rate_limit():
+    """Тест ограничения частоты отправки в один чат"""
+    send = AsyncMock()
+
+    with patch("src.sender.get_chat_bucket", return_value=create_bucket(rate=20, capacity=1)):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for i in range(3):
+            await enqueue_send(1, send, f"Сообщение {i}")
+        elapsed = loop.time() - started
+
+    # Первая отправка сразу, еще две - с интервалом 1/20 секунды
+    assert elapsed >= 0.09
+    assert send.call_count == 3
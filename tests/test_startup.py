@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк холодного запуска бота: время импорта и время до первого ответа
+
+Тесты запускают бота в отдельном процессе, поэтому учитывают полное
+время импорта модулей. Результаты печатаются (pytest -s).
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Максимальное время ожидания первого ответа бота (в секундах)
+STARTUP_TIMEOUT = 60
+
+
+def parse_importtime(output: str) -> dict:
+    """Разбирает вывод python -X importtime: {модуль: накопленное время в мс}"""
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|").split("|")]
+        times[name.strip()] = int(cumulative_us) / 1000
+    return times
+
+
+def test_import_time_breakdown():
+    """Тест отложенного импорта: пакет openai не загружается при импорте бота"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.main"],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    )
+    times = parse_importtime(result.stderr)
+
+    print(f"\nИмпорт src.main: {times['src.main']:.0f} мс")
+    top_level = {name: value for name, value in times.items() if "." not in name}
+    for name, value in sorted(top_level.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {name}: {value:.0f} мс")
+
+    assert not any(name == "openai" or name.startswith("openai.") for name in times)
+
+
+class FakeTelegramAPI(BaseHTTPRequestHandler):
+    """Фиктивный сервер Bot API: одно обновление /start и запись ответов"""
+
+    events = {}
+    update_sent = False
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        now = time.monotonic()
+        cls = type(self)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Тестовый бот", "username": "test_bot"}
+        elif method == "getUpdates":
+            cls.events.setdefault("first_get_updates", now)
+            if cls.update_sent:
+                time.sleep(0.2)
+                result = []
+            else:
+                cls.update_sent = True
+                result = [{
+                    "update_id": 1,
+                    "message": {
+                        "message_id": 1,
+                        "date": int(time.time()),
+                        "chat": {"id": 42, "type": "private"},
+                        "from": {"id": 42, "is_bot": False, "first_name": "Иван"},
+                        "text": "/start",
+                        "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+                    }
+                }]
+        elif method == "sendMessage":
+            cls.events.setdefault("first_message", now)
+            result = {"message_id": 2, "date": int(time.time()), "chat": {"id": 42, "type": "private"}}
+        else:
+            result = True
+
+        data = json.dumps({"ok": True, "result": result}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Процесс бота остановлен во время ожидания обновлений
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def test_time_to_first_update():
+    """Тест времени от запуска процесса до ответа на первое обновление"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegramAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN="123456:TEST",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{server.server_address[1]}",
+        OPENROUTER_API_KEY="",
+        LLM_BACKEND="synthetic",
+        LLM_LATENCY_SCALE="0",
+        GREETING_POOL_SIZE="0",
+        MESSAGE_COALESCE_WINDOW="0",
+        USAGE_LEDGER_PATH="",
+        LOG_LEVEL="WARNING"
+    )
+
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "src.main"], cwd=ROOT_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        while "first_message" not in FakeTelegramAPI.events:
+            if process.poll() is not None:
+                pytest.fail(f"Бот завершился: {process.stderr.read().decode()}")
+            if time.monotonic() - started > STARTUP_TIMEOUT:
+                pytest.fail("Бот не ответил на первое обновление")
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        server.shutdown()
+
+    events = FakeTelegramAPI.events
+    print(f"\nЗапуск polling: {events['first_get_updates'] - started:.2f} с, "
+          f"ответ на первое обновление: {events['first_message'] - started:.2f} с")
+    assert events["first_get_updates"] <= events["first_message"]
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля styles.py и реестра стилей
+"""
+import os
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from src.styles import (
+    PROMPTS_DIR, STYLE_REGISTRY, STYLE_BADGES, STYLE_COMMANDS, STYLE_HELP_TEXT, STYLE_CAT,
+    STYLE_NORMAL, detect_style_from_text, load_style_prompt, user_styles
+)
+
+
+def test_registry_prompt_files_exist():
+    """Тест наличия файлов промптов для всех стилей реестра"""
+    for style, info in STYLE_REGISTRY.items():
+        assert os.path.exists(os.path.join(PROMPTS_DIR, info["prompt_file"])), style
+
+
+def test_precomputed_tables_cover_all_styles():
+    """Тест построения таблиц из реестра"""
+    assert set(STYLE_BADGES) == set(STYLE_REGISTRY)
+    assert set(STYLE_COMMANDS.values()) == set(STYLE_REGISTRY)
+    for info in STYLE_REGISTRY.values():
+        assert f"/{info['command']}" in STYLE_HELP_TEXT
+
+
+def test_detect_style_from_text():
+    """Тест определения стиля по ключевым словам"""
+    assert detect_style_from_text("Расскажи о базах данных как КОТ") == STYLE_CAT
+    assert detect_style_from_text("Сколько стоит сайт?") == STYLE_NORMAL
+
+
+def test_load_style_prompt_is_cached():
+    """Тест чтения промпта с диска только один раз"""
+    with patch("src.styles.prompt_cache", {}):
+        first = load_style_prompt(STYLE_CAT)
+        with patch("builtins.open", side_effect=Exception("Test exception")):
+            second = load_style_prompt(STYLE_CAT)
+    
+    assert first and first == second
+
+
+@pytest.mark.asyncio
+async def test_cmd_set_style():
+    """Тест команды выбора стиля"""
+    from src.bot import cmd_set_style
+    
+    message = AsyncMock()
+    message.from_user = MagicMock()
+    message.from_user.id = 42
+    message.chat = MagicMock()
+    message.chat.id = 42
+    command = MagicMock()
+    command.command = "cat"
+    
+    await cmd_set_style(message, command)
+    
+    assert user_styles[42] == STYLE_CAT
+    message.answer.assert_called_once_with(STYLE_REGISTRY[STYLE_CAT]["command_reply"])
+    del user_styles[42]
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля tenants.py
+"""
+import asyncio
+import json
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src import chat_action, memory, sender, styles, tenants
+from src.bot import echo
+from src.scenarios import add_clickable_links
+from src.styles import STYLE_CAT, load_style_prompt
+from src.tenants import (
+    DEFAULT_TENANT, TenantMiddleware, current_tenant, get_tenant, load_tenants_config,
+    register_tenant, tenant_key
+)
+
+CHAT_ID = 4801
+BRAND_BOT_ID = 777
+
+
+@pytest.fixture(autouse=True)
+def brand_tenant():
+    """Фикстура для регистрации арендатора brand"""
+    register_tenant("brand", BRAND_BOT_ID, links={"наш сайт": "https://brand.example"})
+    yield
+    tenants.tenants.pop("brand", None)
+    tenants.bot_tenants.pop(BRAND_BOT_ID, None)
+    memory.clear_dialog_history(CHAT_ID)
+    memory.clear_dialog_history(("brand", CHAT_ID))
+
+
+@pytest.mark.asyncio
+async def test_middleware_sets_tenant_by_bot():
+    """Тест определения арендатора по боту обновления"""
+    seen = []
+
+    async def handler(event, data):
+        seen.append((current_tenant.get(), tenant_key(CHAT_ID)))
+
+    middleware = TenantMiddleware()
+    await middleware(handler, MagicMock(), {"bot": MagicMock(id=BRAND_BOT_ID)})
+    await middleware(handler, MagicMock(), {"bot": MagicMock(id=1)})
+    assert seen == [("brand", ("brand", CHAT_ID)), (DEFAULT_TENANT, CHAT_ID)]
+    # После обработки обновления арендатор возвращается к основному
+    assert current_tenant.get() == DEFAULT_TENANT
+
+
+@pytest.mark.asyncio
+async def test_tenant_history_kept_separately():
+    """Тест раздельной истории чата с одинаковым chat_id у разных арендаторов"""
+    message = AsyncMock()
+    message.from_user = MagicMock(id=CHAT_ID)
+    message.chat = MagicMock(id=CHAT_ID)
+    message.text = "Расскажите о себе"
+    brand_bot = AsyncMock()
+
+    token = current_tenant.set("brand")
+    try:
+        with patch.dict("src.bot.tenant_bots", {"brand": brand_bot}), \
+             patch("src.coalescer.coalesce_window", 0.0), \
+             patch("src.bot.generate_response", AsyncMock(return_value="Посетите наш сайт")):
+            await echo(message)
+    finally:
+        current_tenant.reset(token)
+
+    # Индикатор набора отправлен ботом арендатора в исходный чат
+    brand_bot.send_chat_action.assert_called_once_with(chat_id=CHAT_ID, action="typing")
+    assert [item["content"] for item in memory.get_dialog_history(("brand", CHAT_ID))] == [
+        "Расскажите о себе", "Посетите наш сайт"
+    ]
+    assert memory.get_dialog_history(CHAT_ID) == []
+    assert 'href="https://brand.example"' in message.answer.call_args[0][0]
+
+
+@pytest.mark.asyncio
+async def test_send_limits_and_typing_per_tenant():
+    """Тест раздельных корзин, очередей отправки и индикатора набора у ботов разных арендаторов"""
+    send = AsyncMock()
+    brand_bot = AsyncMock()
+
+    with patch.dict("src.sender.chat_buckets", clear=True), patch.dict("src.sender.chat_queues", clear=True), \
+         patch.dict("src.chat_action.last_action_sent", clear=True), patch("src.sender.background_sending", True):
+        token = current_tenant.set("brand")
+        try:
+            brand_bucket = sender.get_chat_bucket(CHAT_ID)
+            await sender.enqueue_send(CHAT_ID, send, "Ответ бота brand")
+            await chat_action.send_typing(brand_bot, CHAT_ID)
+            assert ("brand", CHAT_ID) in sender.chat_queues
+        finally:
+            current_tenant.reset(token)
+
+        assert sender.get_chat_bucket(CHAT_ID) is not brand_bucket
+        assert set(chat_action.last_action_sent) == {("brand", CHAT_ID)}
+        await sender.chat_workers[("brand", CHAT_ID)]
+
+    send.assert_called_once_with("Ответ бота brand")
+    brand_bot.send_chat_action.assert_called_once_with(chat_id=CHAT_ID, action="typing")
+
+
+@pytest.mark.asyncio
+async def test_keep_typing_clears_tenant_entry():
+    """Тест удаления отметки индикатора арендатора после выхода из keep_typing"""
+    brand_bot = AsyncMock()
+
+    with patch.dict("src.chat_action.last_action_sent", clear=True):
+        token = current_tenant.set("brand")
+        try:
+            async with chat_action.keep_typing(brand_bot, CHAT_ID):
+                await asyncio.sleep(0.01)
+                assert ("brand", CHAT_ID) in chat_action.last_action_sent
+        finally:
+            current_tenant.reset(token)
+
+        assert chat_action.last_action_sent == {}
+
+
+def test_links_and_prompts_per_tenant(tmp_path, monkeypatch):
+    """Тест таблицы ссылок и директории промптов арендатора"""
+    (tmp_path / "cat_mode.txt").write_text("Промпт   бренда", encoding="utf-8")
+    tenants.tenants["brand"]["prompts_dir"] = str(tmp_path)
+    monkeypatch.setattr(styles, "prompt_cache", {})
+
+    default_prompt = load_style_prompt(STYLE_CAT)
+    assert "наш сайт" in add_clickable_links("наш сайт") and "brand.example" not in add_clickable_links("наш сайт")
+
+    token = current_tenant.set("brand")
+    try:
+        assert get_tenant()["prompts_dir"] == str(tmp_path)
+        assert load_style_prompt(STYLE_CAT) == "Промпт бренда"
+        assert add_clickable_links("наш сайт") == '<a href="https://brand.example">наш сайт</a>'
+    finally:
+        current_tenant.reset(token)
+    assert load_style_prompt(STYLE_CAT) == default_prompt != "Промпт бренда"
+
+
+def test_load_tenants_config_validation(tmp_path):
+    """Тест проверки файла арендаторов"""
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps([{"name": "a", "token": "1:A"}, {"name": "b", "token": "2:B", "prompts_dir": "p"}]))
+    assert [config["name"] for config in load_tenants_config(str(path))] == ["a", "b"]
+
+    for configs in ([{"name": "a"}], [{"name": "a", "token": "1:A"}, {"name": "a", "token": "2:B"}],
+                    [{"name": DEFAULT_TENANT, "token": "1:A"}]):
+        path.write_text(json.dumps(configs))
+        with pytest.raises(ValueError):
+            load_tenants_config(str(path))
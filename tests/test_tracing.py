@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля tracing.py
+"""
+import asyncio
+import json
+import socket
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from aiohttp import web
+
+from src import coalescer, llm, memory, metrics, tracing
+from src.bot import echo
+from src.tracing import TracingMiddleware, span, start_trace, start_tracing, stop_tracing
+
+
+@pytest.fixture(autouse=True)
+def clean_tracing():
+    """Фикстура для восстановления параметров трассировки и сброса метрик"""
+    saved = dict(tracing.trace_config)
+    metrics.reset_metrics()
+    yield
+    tracing.trace_config.update(saved)
+    memory.clear_dialog_history(4401)
+
+
+def message_mock(text="Расскажите о себе", chat_id=4401):
+    """Мок сообщения пользователя"""
+    message = AsyncMock()
+    message.from_user = MagicMock()
+    message.from_user.id = chat_id
+    message.text = text
+    message.chat = MagicMock()
+    message.chat.id = chat_id
+    return message
+
+
+def read_spans(path):
+    """Читает интервалы сохраненных трасс: [[интервалы трассы], ...]"""
+    with open(path, encoding="utf-8") as file:
+        return [
+            json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+            for line in file
+        ]
+
+
+def attributes(encoded_span):
+    """Атрибуты интервала OTLP в виде словаря"""
+    return {item["key"]: list(item["value"].values())[0] for item in encoded_span["attributes"]}
+
+
+@pytest.mark.asyncio
+async def test_update_trace_records_stages(tmp_path):
+    """Тест трассы сообщения с интервалами этапов обработки"""
+    path = tmp_path / "traces.jsonl"
+    start_tracing({"path": str(path), "slow_seconds": 0.0})
+    message = message_mock()
+    with patch("src.bot.bot", AsyncMock()), \
+         patch("src.coalescer.coalesce_window", 0.0), \
+         patch("src.bot.generate_response", AsyncMock(return_value="Ответ")):
+        await TracingMiddleware()(lambda event, data: echo(event), message, {})
+    await stop_tracing()
+
+    [spans] = read_spans(path)
+    names = [encoded["name"] for encoded in spans]
+    assert names[0] == "update"
+    for stage in ("detect_service_type", "get_user_style", "create_messages_for_llm",
+                  "generate_response", "add_clickable_links", "send_answer"):
+        assert stage in names
+    root_id = spans[0]["spanId"]
+    assert all(encoded["traceId"] == spans[0]["traceId"] for encoded in spans)
+    assert all(encoded.get("parentSpanId") == root_id for encoded in spans[1:] if encoded["name"] != "lane_wait")
+    prompt = next(encoded for encoded in spans if encoded["name"] == "create_messages_for_llm")
+    assert int(attributes(prompt)["history_size"]) >= 2
+
+
+@pytest.mark.asyncio
+async def test_tail_sampling_keeps_slow_and_failed(tmp_path):
+    """Тест сохранения медленных и ошибочных трасс и отбрасывания быстрых"""
+    path = tmp_path / "traces.jsonl"
+    start_tracing({"path": str(path), "slow_seconds": 0.05, "sample_rate": 0.0})
+
+    with start_trace("fast"):
+        pass
+    with start_trace("slow"):
+        await asyncio.sleep(0.06)
+    with pytest.raises(ValueError):
+        with start_trace("failed"):
+            with span("stage"):
+                raise ValueError("сбой")
+    await stop_tracing()
+
+    traces = read_spans(path)
+    assert [trace[0]["name"] for trace in traces] == ["slow", "failed"]
+    assert traces[1][1]["status"]["code"] == tracing.STATUS_ERROR
+    assert metrics.get_counter("traces_total", decision="dropped") == 1
+
+
+@pytest.mark.asyncio
+async def test_llm_span_has_model_and_tokens(tmp_path):
+    """Тест атрибутов интервала запроса к LLM"""
+    path = tmp_path / "traces.jsonl"
+    start_tracing({"path": str(path), "slow_seconds": 0.0})
+    backend = AsyncMock(return_value={
+        "content": "Ответ", "usage": {"prompt_tokens": 12, "completion_tokens": 3, "cached_tokens": 0}
+    })
+    with patch("src.llm.completion_backend", backend), patch("src.llm.client", None):
+        with start_trace("update"):
+            await llm.generate_response([{"role": "user", "content": "Привет"}])
+    await stop_tracing()
+
+    [spans] = read_spans(path)
+    request = attributes(spans[1])
+    assert spans[1]["name"] == "llm_request"
+    assert request["model"] == backend.call_args.args[0]["model"]
+    assert request["prompt_tokens"] == "12" and request["completion_tokens"] == "3"
+
+
+@pytest.mark.asyncio
+async def test_trace_continues_after_coalescing_window(tmp_path):
+    """Тест продолжения трассы в задаче, запущенной после окна объединения"""
+    path = tmp_path / "traces.jsonl"
+    start_tracing({"path": str(path), "slow_seconds": 0.0})
+    handler = AsyncMock()
+    with patch("src.coalescer.coalesce_window", 0.05):
+        with start_trace("first"):
+            await coalescer.coalesce_message(4402, "Привет", handler)
+        await asyncio.sleep(0.01)
+        with start_trace("second"):
+            await coalescer.coalesce_message(4402, "Как дела?", handler)
+        # Трассы еще не завершены: их продолжают задачи обработки
+        assert tracing.export_queue.qsize() == 0
+        await asyncio.sleep(0.1)
+    await stop_tracing()
+
+    handler.assert_called_once_with("Привет\nКак дела?")
+    traces = {trace[0]["name"]: trace for trace in read_spans(path)}
+    assert attributes(traces["first"][1]).get("cancelled") is True
+    assert attributes(traces["second"][0])["coalesced_messages"] == "2"
+
+
+@pytest.mark.asyncio
+async def test_otlp_export_to_collector():
+    """Тест отправки трасс коллектору OTLP/HTTP"""
+    received = []
+
+    async def collect(request):
+        received.append(await request.json())
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post("/v1/traces", collect)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        start_tracing({
+            "exporter": tracing.EXPORT_OTLP,
+            "endpoint": f"http://127.0.0.1:{port}/v1/traces",
+            "slow_seconds": 0.0
+        })
+        with start_trace("update", chat_id=1):
+            with span("stage"):
+                pass
+        await stop_tracing()
+    finally:
+        await runner.cleanup()
+
+    [payload] = received
+    spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [encoded["name"] for encoded in spans] == ["update", "stage"]
+    assert len(spans[0]["traceId"]) == 32 and len(spans[0]["spanId"]) == 16
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Тесты для модуля usage.py
+"""
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from src import llm, usage
+from src.usage import flush_usage, get_chat_tokens, get_usage, record_usage, start_usage_ledger, stop_usage_ledger
+
+
+@pytest.fixture(autouse=True)
+def clean_ledger():
+    """Фикстура для сброса журнала и квот"""
+    saved = dict(usage.quota_config)
+    usage.usage_totals.clear()
+    usage.chat_daily_tokens.clear()
+    usage.pending_records.clear()
+    usage.ledger_path = None
+    yield
+    usage.quota_config.update(saved)
+    usage.usage_totals.clear()
+    usage.chat_daily_tokens.clear()
+    usage.pending_records.clear()
+    usage.ledger_path = None
+
+
+def tokens(prompt, completion, cached=0):
+    """Расход токенов в формате бэкенда"""
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "cached_tokens": cached}
+
+
+def test_aggregates_by_dimensions():
+    """Тест итогов по стилям и чатам"""
+    record_usage(tokens(100, 50, 20), 1.0, chat_id=1, style="cat", scenario="chat", model="fast")
+    record_usage(tokens(200, 80), 2.0, chat_id=1, style="normal", scenario="service", model="full")
+    record_usage(tokens(10, 5), 0.5, chat_id=2, style="cat", scenario="chat", model="fast")
+
+    by_style = get_usage(("style",))
+    assert by_style[("cat",)] == {
+        "requests": 2, "prompt_tokens": 110, "completion_tokens": 55, "cached_tokens": 20, "latency": 1.5
+    }
+    assert by_style[("normal",)]["completion_tokens"] == 80
+    assert get_usage(("chat_id", "model"))[(1, "full")]["requests"] == 1
+    assert get_chat_tokens(1) == 430
+
+
+@pytest.mark.asyncio
+async def test_ledger_flush_and_restore(tmp_path):
+    """Тест записи журнала в файл и восстановления итогов дня после перезапуска"""
+    path = str(tmp_path / "usage.jsonl")
+    await start_usage_ledger(path, interval=3600)
+    record_usage(tokens(100, 50), 1.0, chat_id=1, style="cat", scenario="chat", model="fast")
+    record_usage(tokens(10, 5), 0.5, chat_id=2, style="cat", scenario="chat", model="fast")
+    await stop_usage_ledger()
+
+    with open(path, encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert [record["chat_id"] for record in records] == [1, 2]
+    assert await flush_usage() == 0
+
+    # Перезапуск: итоги текущего дня восстанавливаются из файла
+    usage.usage_totals.clear()
+    usage.chat_daily_tokens.clear()
+    await start_usage_ledger(path, interval=3600)
+    await stop_usage_ledger()
+    assert get_chat_tokens(1) == 150
+
+
+@pytest.mark.asyncio
+async def test_empty_ledger_path_keeps_totals_in_memory(tmp_path, monkeypatch):
+    """Тест пустого пути журнала: записи не копятся, остановка не обращается к файлу"""
+    monkeypatch.chdir(tmp_path)
+    await start_usage_ledger("", interval=3600)
+    record_usage(tokens(100, 50), 1.0, chat_id=1, style="cat", scenario="chat", model="fast")
+
+    assert usage.ledger_path is None and not usage.pending_records
+    await stop_usage_ledger()
+    assert get_chat_tokens(1) == 150
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio
+async def test_quota_switches_chat_to_degraded_mode():
+    """Тест экономного режима после исчерпания дневной квоты чата"""
+    usage.quota_config.update({"daily_tokens": 100, "degraded_max_tokens": 50})
+    backend = AsyncMock(return_value={"content": "Ответ", "usage": tokens(90, 30)})
+    messages = [{"role": "user", "content": "Расскажите подробно о разработке мобильного приложения " * 5}]
+
+    with patch("src.llm.completion_backend", backend), patch("src.llm.client", None):
+        assert await llm.generate_response(messages, chat_id=7) == "Ответ"
+        assert backend.call_args.args[0]["model"] == llm.routes[llm.ROUTE_FULL]["model"]
+
+        # Квота исчерпана: ответ не отклоняется, а генерируется быстрой моделью с коротким лимитом
+        assert await llm.generate_response(messages, chat_id=7) == "Ответ"
+        request = backend.call_args.args[0]
+        assert request["model"] == llm.routes[llm.ROUTE_FAST]["model"]
+        assert request["max_tokens"] == 50
+
+        # Другие чаты не затронуты
+        await llm.generate_response(messages, chat_id=8)
+        assert backend.call_args.args[0]["model"] == llm.routes[llm.ROUTE_FULL]["model"]